@@ -3,43 +3,85 @@ import asyncio
 import time
 from channels.generic.websocket import AsyncWebsocketConsumer
 import traceback
-from typing import Any, Dict
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import parse_qs
+from channels.db import database_sync_to_async
+from diagram_backend.tracing import iniciar_traza, traza, trazado
+from .realtime import obtener_fanout, obtener_gestor_interes, obtener_historial, obtener_secuenciador
+from .realtime.limites import (
+    CONTROL, ESTADISTICAS, GEOMETRIA, LimitadorConexion, clasificar, clave_fusion, fusionar_pendiente,
+    obtener_cubetas_sala,
+)
 
 # Consumidor WebSocket para colaboración en diagramas
 class CollaborationConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         """Acepta la conexión y se une al grupo de colaboración."""
-        try:
-            self.diagram_id = self.scope['url_route']['kwargs'].get('diagram_id')
-            self.room_group_name = f'collaboration_{self.diagram_id}'
+        diagram_id = self.scope['url_route']['kwargs'].get('diagram_id')
+        with iniciar_traza('ws connect', diagram_id=diagram_id):
+            try:
+                self.diagram_id = self.scope['url_route']['kwargs'].get('diagram_id')
+                self.room_group_name = f'collaboration_{self.diagram_id}'
+                # Modo node: una suscripción por sala y proceso en lugar de un canal por socket
+                self.fanout = obtener_fanout()
+                # Rejilla de interés de la sala: filtra eventos de geometría por viewport
+                self.interes = obtener_gestor_interes()
+                self.rejilla = self.interes.entrar(self.room_group_name)
+                # Números de secuencia por sala y fusión de ediciones concurrentes
+                self.secuenciador = obtener_secuenciador()
+                if self.secuenciador:
+                    self.secuenciador.entrar(self.room_group_name)
+                # Búfer de eventos recientes para reanudar sesiones sin estado completo
+                self.historial = obtener_historial() if self.secuenciador else None
+                # Control de inundación: cubetas por conexión (locales) y por sala (compartidas con Redis)
+                self.cubetas_sala = obtener_cubetas_sala()
+                self.limitador = LimitadorConexion() if self.cubetas_sala is not None else None
+                self._pendientes: Dict[str, Tuple[str, dict]] = {}
+                self._avisos: Dict[str, float] = {}
+                self._vaciado = None
+
+                if self.fanout:
+                    await self.fanout.join(self.room_group_name, self)
+                elif not self.channel_layer:
+                    pass  # modo local sin multiproceso
+                else:
+                    await self.channel_layer.group_add(self.room_group_name, self.channel_name)
 
-            if not self.channel_layer:
-                pass  # modo local sin multiproceso
-            else:
-                await self.channel_layer.group_add(self.room_group_name, self.channel_name)
+                await self.accept()
 
-            await self.accept()
+                # Punto de partida: el cliente envía este seq como base_seq hasta recibir eventos
+                if self.secuenciador:
+                    await self._enviar_secuencia()
 
-            # Inicializar control de logging para rate-limit
-            self._last_log_ts = 0.0
-            self._log_counter = 0
+                # Inicializar control de logging para rate-limit
+                self._last_log_ts = 0.0
+                self._log_counter = 0
 
-            # Anunciar que un usuario se unió
-            await self._broadcast_internal('user_joined', {"userId": self.channel_name})
+                # Anunciar que un usuario se unió
+                await self._broadcast_internal('user_joined', {"userId": self.channel_name})
 
-            # Iniciar heartbeat usando asyncio
-            self.heartbeat_task = asyncio.create_task(self._heartbeat())
-        except Exception as e:
-            await self.close(code=4400)
+                # Iniciar heartbeat usando asyncio
+                self.heartbeat_task = asyncio.create_task(self._heartbeat())
+            except Exception as e:
+                await self.close(code=4400)
 
     async def disconnect(self, close_code):
         try:
             if hasattr(self, 'heartbeat_task'):
                 self.heartbeat_task.cancel()
+            if getattr(self, '_vaciado', None):
+                self._vaciado.cancel()
             # Avisar salida sólo si hubo connect exitoso
             if getattr(self, 'diagram_id', None):
                 await self._broadcast_internal('user_left', {"userId": self.channel_name})
-            if hasattr(self, 'room_group_name') and self.channel_layer:
+            if getattr(self, 'rejilla', None) is not None:
+                self.interes.salir(self.room_group_name, self)
+            if getattr(self, 'secuenciador', None):
+                if self.secuenciador.salir(self.room_group_name) and self.historial is not None:
+                    self.historial.olvidar(self.room_group_name)
+            if getattr(self, 'fanout', None):
+                await self.fanout.leave(self.room_group_name, self)
+            elif hasattr(self, 'room_group_name') and self.channel_layer:
                 await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
         except Exception:
             pass
@@ -54,6 +96,15 @@ class CollaborationConsumer(AsyncWebsocketConsumer):
         event_type = data.get('type')
         # Aceptar tanto 'payload' como 'data' (flexibilidad con el frontend)
         payload = data.get('payload') or data.get('data') or {}
+        with iniciar_traza(f'ws {event_type}', room=self.room_group_name, bytes=len(text_data)):
+            await self._recibir(event_type, payload)
+
+    async def _recibir(self, event_type: str, payload):
+        """Filtra, limita y difunde un mensaje ya decodificado."""
+        # Registro del viewport: no se redistribuye, solo ajusta qué eventos recibe este socket
+        if event_type == 'viewport':
+            await self._registrar_viewport(payload)
+            return
         
         # Rate limiting del log para eventos muy frecuentes
         if event_type == 'class_update':
@@ -88,23 +139,128 @@ class CollaborationConsumer(AsyncWebsocketConsumer):
             if to_user == self.channel_name:
                 return
 
+        # Control de inundación: la geometría en exceso se funde y aplaza, el resto se rechaza con aviso
+        if self.limitador is not None and isinstance(payload, dict):
+            payload = await self._limitar(event_type, payload)
+            if payload is None:
+                return
+        await self._difundir(event_type, payload)
+
+    @trazado('CollaborationConsumer._difundir')
+    async def _difundir(self, event_type: str, payload: dict):
+        """Secuencia y reparte a la sala un evento del cliente ya admitido."""
+        # El estado lo aporta un par: se sella con el seq que refleja
+        if event_type == 'initial_state' and self.secuenciador:
+            payload['seq'], payload['epoch'] = await self.secuenciador.posicion(self.room_group_name)
+
         translate_map = {
             'class_update': 'class_updated',
             'relationship_update': 'relationship_updated',
         }
         outbound_type = translate_map.get(event_type, event_type)
-        envelope = {
-            'type': 'collaboration_event',
-            'event_type': outbound_type,
-            'payload': {**payload, 'timestamp': payload.get('timestamp') or __import__('time').time()},
-        }
+        payload = {**payload, 'timestamp': payload.get('timestamp') or __import__('time').time()}
 
-        if self.channel_layer:
-            await self.channel_layer.group_send(self.room_group_name, envelope)
-        else:  # modo local sin capa -> envío directo
-            await self.collaboration_event(envelope)
+        async def emitir(payload):
+            envelope = {'type': 'collaboration_event', 'event_type': outbound_type, 'payload': payload}
+            interes = self.rejilla.marcar(outbound_type, payload)
+            if interes is not None:
+                envelope['interest'] = interes
+            await self._emitir(envelope)
+
+        # Handshake fuera de la secuencia: no es una operación de la sala
+        if self.secuenciador and event_type not in ('initial_state', 'request_initial_state'):
+            with traza('secuenciar', event_type=event_type):
+                await self.secuenciador.secuenciar(self.room_group_name, event_type, payload, self.channel_name, emitir)
+        else:
+            await emitir(payload)
+
+    @trazado('CollaborationConsumer._limitar')
+    async def _limitar(self, event_type: str, payload: dict) -> Optional[dict]:
+        """Payload a difundir ya, o None si se aplazó (geometría) o se rechazó."""
+        clase = clasificar(event_type, payload)
+        clave = clave_fusion(event_type, payload) if clase != CONTROL else None
+        pendiente = self._pendientes.get(clave) if clave else None
+        if pendiente is not None and clase == GEOMETRIA:
+            # Ya hay una versión aplazada de la entidad: se funde con ella para no adelantarla
+            self._pendientes[clave] = (event_type, fusionar_pendiente(pendiente[1], payload))
+            ESTADISTICAS['coalesced'] += 1
+            return None
+        espera, alcance = await self._tomar(clase)
+        if not espera:
+            ESTADISTICAS['allowed'] += 1
+            if pendiente is not None:
+                # La edición estructural arrastra la geometría aplazada de la misma entidad
+                del self._pendientes[clave]
+                payload = fusionar_pendiente(pendiente[1], payload)
+            return payload
+        if clase == GEOMETRIA:
+            self._pendientes[clave] = (event_type, payload)
+            ESTADISTICAS['coalesced'] += 1
+            if self._vaciado is None or self._vaciado.done():
+                self._vaciado = asyncio.create_task(self._vaciar_pendientes(espera))
+            await self._avisar(clase, alcance, espera, 'coalesced', event_type, payload)
+            return None
+        ESTADISTICAS['rejected'] += 1
+        # Con op_id el cliente necesita saber qué edición reintentar; sin él basta un aviso por segundo
+        await self._avisar(clase, alcance, espera, 'rejected', event_type, payload, siempre=bool(payload.get('op_id')))
+        return None
+
+    async def _tomar(self, clase: str) -> Tuple[float, str]:
+        """(espera, alcance): 0 si la conexión y la sala tienen tokens para esta clase."""
+        espera = self.limitador.tomar(clase)
+        if espera:
+            ESTADISTICAS['throttled_connection'] += 1
+            return espera, 'connection'
+        espera = await self.cubetas_sala.tomar(self.room_group_name, clase)
+        if espera:
+            ESTADISTICAS['throttled_room'] += 1
+            return espera, 'room'
+        return 0.0, ''
+
+    async def _vaciar_pendientes(self, espera: float):
+        """Envía la geometría aplazada (última versión de cada entidad) a medida que hay tokens."""
+        try:
+            while self._pendientes:
+                await asyncio.sleep(espera)
+                while self._pendientes:
+                    espera, _ = await self._tomar(GEOMETRIA)
+                    if espera:
+                        break
+                    clave = next(iter(self._pendientes))
+                    event_type, payload = self._pendientes.pop(clave)
+                    ESTADISTICAS['flushed'] += 1
+                    await self._difundir(event_type, payload)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            pass
+
+    async def _avisar(self, clase: str, alcance: str, espera: float, accion: str, event_type: str,
+                      payload: dict, siempre: bool = False):
+        """Aviso 'throttled' solo al emisor (como mucho uno por segundo y clase salvo rechazos con op_id)."""
+        ahora = time.monotonic()
+        if not siempre and ahora - self._avisos.get(clase, 0.0) < 1.0:
+            return
+        self._avisos[clase] = ahora
+        ESTADISTICAS['notices'] += 1
+        try:
+            await self.send(text_data=json.dumps({'type': 'throttled', 'payload': {
+                'class': clase, 'scope': alcance, 'action': accion, 'event_type': event_type,
+                'op_id': payload.get('op_id'), 'retry_after': round(espera, 3),
+            }}))
+        except Exception:
+            pass
 
     async def collaboration_event(self, event):
+        # Eventos de otros procesos: el primer socket local que los recibe los guarda en el historial
+        if getattr(self, 'historial', None) is not None:
+            self.historial.registrar(self.room_group_name, event['event_type'], event['payload'])
+        # Modo group: cada socket descarta la geometría fuera de su viewport
+        interes = event.get('interest')
+        if interes is not None:
+            self.rejilla.aplicar(interes)
+            if not self.rejilla.le_interesa(self, interes.get('bbox')):
+                return
         try:
             await self.send(text_data=json.dumps({
                 'type': event['event_type'],
@@ -113,6 +269,35 @@ class CollaborationConsumer(AsyncWebsocketConsumer):
         except Exception:
             pass
     
+    @trazado('CollaborationConsumer._registrar_viewport')
+    async def _registrar_viewport(self, payload):
+        """Registra (o con payload vacío, quita) el rectángulo visible del cliente."""
+        # Importación diferida: este módulo se carga antes de que las apps estén listas (asgi.py)
+        from .services.viewport_service import Rectangulo
+        if not isinstance(payload, dict) or not payload:
+            self.rejilla.quitar_viewport(self)
+            return
+        try:
+            rect = Rectangulo.desde_parametros(payload, padding=int(payload.get('padding') or 0))
+        except (TypeError, ValueError):
+            return
+        if not self.rejilla.sembrada:
+            self.rejilla.sembrar(await self._posiciones_clases())
+        self.rejilla.registrar_viewport(self, rect)
+
+    @database_sync_to_async
+    @trazado('CollaborationConsumer._posiciones_clases')
+    def _posiciones_clases(self):
+        """Posiciones persistidas de la sala para ubicar clases aún no vistas en eventos."""
+        from .models import EntidadClase
+        try:
+            return list(
+                EntidadClase.objects.filter(diagram_id=self.diagram_id)
+                .values_list('id', 'position_x', 'position_y')
+            )
+        except Exception:  # salas que no corresponden a un diagrama (id no UUID)
+            return []
+
     async def _heartbeat(self):
         """Envía un ping cada 25s."""
         try:
@@ -124,12 +309,44 @@ class CollaborationConsumer(AsyncWebsocketConsumer):
 
     async def _broadcast_internal(self, event_type: str, payload: dict):
         """Utilidad para emitir eventos internos (user_joined / user_left)."""
-        envelope = {
-            'type': 'collaboration_event',
-            'event_type': event_type,
-            'payload': {**payload, 'timestamp': __import__('time').time()},
-        }
-        if self.channel_layer:
-            await self.channel_layer.group_send(self.room_group_name, envelope)
+        payload = {**payload, 'timestamp': __import__('time').time()}
+
+        async def emitir(payload):
+            await self._emitir({'type': 'collaboration_event', 'event_type': event_type, 'payload': payload})
+
+        if getattr(self, 'secuenciador', None):
+            await self.secuenciador.secuenciar(self.room_group_name, event_type, payload, self.channel_name, emitir)
         else:
+            await emitir(payload)
+
+    @trazado('CollaborationConsumer._enviar_secuencia')
+    async def _enviar_secuencia(self):
+        """Envía el seq de partida; con ?last_seq=&epoch= repone los eventos perdidos desde el historial."""
+        params = parse_qs(self.scope.get('query_string', b'').decode())
+        ultimo = (params.get('last_seq') or [''])[0]
+        epoch_cliente = (params.get('epoch') or [''])[0]
+        # Con el lock de la sala no se publica nada entre la lectura del historial y la reposición
+        async with self.secuenciador.lock(self.room_group_name):
+            seq, epoch = await self.secuenciador.posicion(self.room_group_name)
+            estado = {'seq': seq, 'epoch': epoch}
+            perdidos = None
+            if self.historial is not None and ultimo.isdigit():
+                perdidos = self.historial.reanudar(self.room_group_name, epoch_cliente, int(ultimo), epoch, seq)
+                # resumed=False: el cliente debe pedir request_initial_state como en una conexión nueva
+                estado['resumed'] = perdidos is not None
+                estado['replayed'] = len(perdidos or ())
+            await self.send(text_data=json.dumps({'type': 'sequence', 'payload': estado}))
+            for texto in perdidos or ():
+                await self.send(text_data=texto)
+
+    @trazado('CollaborationConsumer._emitir')
+    async def _emitir(self, envelope: dict):
+        """Envía el sobre a la sala según el modo de fan-out configurado."""
+        if getattr(self, 'historial', None) is not None:
+            self.historial.registrar(self.room_group_name, envelope['event_type'], envelope['payload'])
+        if getattr(self, 'fanout', None):
+            await self.fanout.broadcast(self.room_group_name, envelope)
+        elif self.channel_layer:
+            await self.channel_layer.group_send(self.room_group_name, envelope)
+        else:  # modo local sin capa -> envío directo
             await self.collaboration_event(envelope)
@@ -0,0 +1,20 @@
+from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def _asegurar_indice_busqueda(sender, using, **kwargs):
+    """Las reconstrucciones de tabla de SQLite eliminan los triggers del índice de búsqueda"""
+    from django.db import connections
+
+    from .services.search_service import instalar_indice
+
+    if connections[using].vendor == 'sqlite':
+        instalar_indice(connections[using])
+
+
+class DiagramsConfig(AppConfig):
+    name = 'apps.diagrams'
+    label = 'diagrams'
+
+    def ready(self):
+        post_migrate.connect(_asegurar_indice_busqueda, sender=self)
@@ -0,0 +1,205 @@
+"""
+Comando de gestión para comparar los dos almacenamientos de atributos de clase.
+Siembra diagramas en una base de prueba aislada con atributos en filas
+(class_attributes), mide espacio, lecturas (retrieve, listado de clases, viewport)
+y escrituras (PUT documento-completo, agregar/eliminar atributo, lote de
+operaciones); los convierte con la misma rutina que migrate_attribute_storage y
+repite las medidas con CLASS_ATTRIBUTE_STORAGE='inline'. Al final los devuelve a
+filas y comprueba que el retrieve no cambia en ningún sentido.
+"""
+import json
+import logging
+import statistics
+import time
+from typing import Any, Callable, Dict, List
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection
+from django.test.utils import override_settings
+
+from apps.diagrams.models.atributo_en_linea import EN_LINEA, FILAS
+from apps.diagrams.repositories import RepositorioAtributos
+from apps.diagrams.services import GeneradorDiagramas
+from apps.diagrams.services.diagram_generator import PerfilGeneracion
+
+from .bench_http import BASE, _documento
+
+# Tablas cuyo tamaño depende del almacenamiento (incluye el índice FTS de atributos en SQLite)
+TABLAS = ('class_entities', 'class_attributes', 'search_attributes')
+
+
+def _espacio() -> Dict[str, int]:
+    """Bytes por tabla (con sus índices); vacío si el motor no permite medirlo"""
+    with connection.cursor() as cursor:
+        try:
+            if connection.vendor == 'sqlite':
+                cursor.execute('VACUUM')
+                cursor.execute(
+                    "SELECT COALESCE(m.tbl_name, s.name), SUM(s.pgsize) FROM dbstat s "
+                    "LEFT JOIN sqlite_master m ON m.name = s.name GROUP BY 1"
+                )
+            elif connection.vendor == 'postgresql':
+                cursor.execute('SELECT relname, pg_total_relation_size(relid) FROM pg_stat_user_tables')
+            else:
+                return {}
+        except DatabaseError:
+            return {}
+        filas = cursor.fetchall()
+    espacio = {tabla: 0 for tabla in TABLAS}
+    for nombre, bytes_ in filas:
+        tabla = next((t for t in TABLAS if nombre == t or nombre.startswith(f'{t}_')), None)
+        if tabla:
+            espacio[tabla] += int(bytes_ or 0)
+    return espacio
+
+
+class _Contador:
+    """execute_wrapper que cuenta las consultas SQL"""
+
+    def __init__(self):
+        self.consultas = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.consultas += 1
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    help = "Compara espacio, lecturas y escrituras de atributos en filas frente a en línea"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--diagrams', type=int, default=5, help='Diagramas sembrados')
+        parser.add_argument('--classes', type=int, default=500, help='Clases por diagrama')
+        parser.add_argument('--attributes', default='3-8', help='Rango de atributos por clase (min-max)')
+        parser.add_argument('--requests', type=int, default=10, help='Repeticiones por medida')
+        parser.add_argument('--json', action='store_true', help='Salida JSON para seguimiento de regresiones')
+
+    def handle(self, *args, **options):
+        try:
+            minimo, maximo = (int(x) for x in options['attributes'].split('-'))
+        except ValueError:
+            raise CommandError('--attributes debe tener la forma min-max, p.ej. 3-8')
+
+        # Sin una línea de log por request lenta (PerformanceMiddleware)
+        logging.disable(logging.WARNING)
+        nombre_original = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        repositorio = RepositorioAtributos()
+        resultados: List[Dict[str, Any]] = []
+        conversiones: Dict[str, Any] = {}
+        try:
+            generador = GeneradorDiagramas(seed=0)
+            perfil = PerfilGeneracion(classes=options['classes'], attributes_min=minimo, attributes_max=maximo)
+            with override_settings(ALLOWED_HOSTS=['testserver'], DEBUG=False, CLASS_ATTRIBUTE_STORAGE=FILAS):
+                ids = [str(generador.generar_diagrama(perfil, nombre=f'bench-attrs-{n}')[0].id)
+                       for n in range(max(1, options['diagrams']))]
+                resultados.append(self._medir(FILAS, ids, options))
+                antes = self._retrieves(ids)
+
+            with override_settings(ALLOWED_HOSTS=['testserver'], DEBUG=False, CLASS_ATTRIBUTE_STORAGE=EN_LINEA):
+                t0 = time.perf_counter()
+                totales = repositorio.convertir_a_en_linea()
+                conversiones['to_inline'] = {**totales, 'ms': round((time.perf_counter() - t0) * 1000, 1)}
+                conversiones['identical_after_to_inline'] = self._retrieves(ids) == antes
+                resultados.append(self._medir(EN_LINEA, ids, options))
+                intermedio = self._retrieves(ids)
+
+            with override_settings(ALLOWED_HOSTS=['testserver'], DEBUG=False, CLASS_ATTRIBUTE_STORAGE=FILAS):
+                t0 = time.perf_counter()
+                totales = repositorio.convertir_a_filas()
+                conversiones['to_rows'] = {**totales, 'ms': round((time.perf_counter() - t0) * 1000, 1)}
+                conversiones['identical_after_to_rows'] = self._retrieves(ids) == intermedio
+        finally:
+            connection.creation.destroy_test_db(nombre_original, verbosity=0)
+
+        if options['json']:
+            self.stdout.write(json.dumps({'benchmark': 'attributes', 'classes': options['classes'],
+                                          'diagrams': options['diagrams'], 'results': resultados,
+                                          'conversion': conversiones}, indent=2))
+            return
+        self.stdout.write(f"{options['diagrams']} diagramas x {options['classes']} clases, "
+                          f"atributos {options['attributes']} por clase")
+        espacio = ' '.join(f'{t}_KB' for t in TABLAS)
+        self.stdout.write(f"{'modo':<7} {espacio} total_KB")
+        for r in resultados:
+            valores = ' '.join(f"{r['storage'].get(t, 0) / 1024:>{len(t) + 3}.1f}" for t in TABLAS)
+            self.stdout.write(f"{r['mode']:<7} {valores} {sum(r['storage'].values()) / 1024:>8.1f}")
+        self.stdout.write(f"\n{'modo':<7} {'medida':<22} {'p50_ms':>8} {'p95_ms':>8} {'queries':>8}")
+        for r in resultados:
+            for medida, m in r['timings'].items():
+                self.stdout.write(f"{r['mode']:<7} {medida:<22} {m['p50_ms']:>8.2f} {m['p95_ms']:>8.2f} "
+                                  f"{m['queries']:>8}")
+        for sentido in ('to_inline', 'to_rows'):
+            c = conversiones[sentido]
+            self.stdout.write(f"\nconversión {sentido}: {c['classes']} clases, {c['attributes']} atributos en "
+                              f"{c['ms']:.1f} ms")
+        iguales = conversiones['identical_after_to_inline'] and conversiones['identical_after_to_rows']
+        linea = f"retrieve idéntico tras convertir en ambos sentidos: {'sí' if iguales else 'NO'}"
+        self.stdout.write(self.style.SUCCESS(linea) if iguales else self.style.ERROR(linea))
+
+    def _retrieves(self, ids: List[str]) -> List[Any]:
+        from rest_framework.test import APIClient
+
+        cliente = APIClient()
+        return [cliente.get(f'{BASE}/diagrams/{diagrama_id}/').json() for diagrama_id in ids]
+
+    def _medir(self, modo: str, ids: List[str], options) -> Dict[str, Any]:
+        from rest_framework.test import APIClient
+        from apps.diagrams.models import Diagrama
+
+        cliente = APIClient()
+        n = options['requests']
+
+        def medida(peticion: Callable[[int], Any]) -> Dict[str, Any]:
+            tiempos, consultas = [], 0
+            for i in range(n):
+                # execute_wrapper y no CaptureQueriesContext: su registro se satura en 9000 consultas
+                contador = _Contador()
+                with connection.execute_wrapper(contador):
+                    t0 = time.perf_counter()
+                    respuesta = peticion(i)
+                    tiempos.append((time.perf_counter() - t0) * 1000)
+                if respuesta.status_code >= 400:
+                    raise CommandError(f'[{modo}] respondió {respuesta.status_code}: {respuesta.content[:200]!r}')
+                consultas = max(consultas, contador.consultas)
+            tiempos.sort()
+            return {'p50_ms': round(statistics.median(tiempos), 3),
+                    'p95_ms': round(tiempos[min(len(tiempos) - 1, int(len(tiempos) * 0.95))], 3),
+                    'queries': consultas}
+
+        diagrama_id = ids[0]
+        documento = _documento(Diagrama.objects.get(id=diagrama_id))
+        clases = [c['id'] for c in documento['classes']]
+        # PUT con el 10% de las clases cambiando un atributo (el resto igual: lo habitual en autoguardado)
+        editado = json.loads(json.dumps(documento))
+        for clase in editado['classes'][::10]:
+            clase['attributes'] = clase['attributes'][1:] + [f"{clase['attributes'][0]}_v"] \
+                if clase['attributes'] else ['nuevo']
+
+        def agregar_y_quitar(i: int):
+            clase_id = clases[i % len(clases)]
+            cliente.post(f'{BASE}/classes/{clase_id}/agregar_atributo/',
+                         {'name': f'bench{i}', 'data_type': 'int', 'visibility': 'private'}, format='json')
+            return cliente.delete(f'{BASE}/classes/{clase_id}/attributes/bench{i}/')
+
+        def lote(i: int):
+            # Nombres propios del modo: la mitad de los atributos del lote se queda en el diagrama
+            operaciones = [{'op': 'add_attribute', 'class_id': c, 'name': f'lote-{modo}-{i}'} for c in clases[:50]]
+            operaciones += [{'op': 'remove_attribute', 'class_id': c, 'name': f'lote-{modo}-{i}'}
+                            for c in clases[25:50]]
+            return cliente.post(f'{BASE}/diagrams/{diagrama_id}/operations/', {'operations': operaciones},
+                                format='json')
+
+        timings = {
+            'retrieve': medida(lambda i: cliente.get(f'{BASE}/diagrams/{ids[i % len(ids)]}/')),
+            'classes_page': medida(lambda i: cliente.get(f'{BASE}/diagrams/{diagrama_id}/classes/')),
+            'viewport': medida(lambda i: cliente.get(f'{BASE}/diagrams/{diagrama_id}/viewport/',
+                                                     {'x0': 0, 'y0': 0, 'x1': 2000, 'y1': 1200})),
+            'put_unchanged': medida(lambda i: cliente.put(f'{BASE}/diagrams/{diagrama_id}/', documento,
+                                                          format='json')),
+            'put_10pct_attrs': medida(lambda i: cliente.put(f'{BASE}/diagrams/{diagrama_id}/',
+                                                            editado if i % 2 == 0 else documento, format='json')),
+            'add_remove_attribute': medida(agregar_y_quitar),
+            'operations_50_attrs': medida(lote),
+        }
+        return {'mode': modo, 'storage': _espacio(), 'timings': timings}
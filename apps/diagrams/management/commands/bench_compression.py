@@ -0,0 +1,143 @@
+"""
+Comando de gestión para medir la compresión de respuestas de la API.
+Crea una base de datos de prueba aislada, siembra diagramas de varios tamaños y
+pide el GET del diagrama sin compresión, con gzip y con brotli: tamaño
+transferido, ratio, latencia en frío (comprime) y en caliente (cuerpo ya
+comprimido en la cache) y tiempo total estimado con varios anchos de banda.
+Añade el coste de CPU de otros niveles de compresión sobre el mismo cuerpo.
+"""
+import gzip
+import json
+import statistics
+import time
+from typing import Any, Dict, List
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+
+from diagram_backend import compresion
+
+from .bench_http import BASE
+
+CODIFICACIONES = ('identity', compresion.GZIP, compresion.BROTLI)
+NIVELES = {compresion.GZIP: (1, 6, 9), compresion.BROTLI: (1, 5, 9)}
+
+
+def _cpu_ms(funcion) -> float:
+    t0 = time.thread_time()
+    funcion()
+    return (time.thread_time() - t0) * 1000
+
+
+class Command(BaseCommand):
+    help = 'Mide tamaño transferido, ratio, CPU y latencia del GET de diagramas con gzip y brotli'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='100,500,2000', help='Tamaños de diagrama (clases)')
+        parser.add_argument('--repeat', type=int, default=5, help='Peticiones en caliente por codificación')
+        parser.add_argument('--mbps', default='10,100', help='Anchos de banda (Mbit/s) para estimar la transferencia')
+        parser.add_argument('--json', action='store_true', help='Salida JSON para seguimiento de regresiones')
+
+    def handle(self, *args, **options):
+        try:
+            tamanos = [int(x) for x in options['sizes'].split(',') if x.strip()]
+            anchos = [float(x) for x in options['mbps'].split(',') if x.strip()]
+        except ValueError:
+            raise CommandError('--sizes y --mbps deben ser listas de números')
+        if compresion._brotli() is None:
+            self.stderr.write('brotli no está instalado: solo se mide gzip')
+
+        nombre_original = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            with override_settings(ALLOWED_HOSTS=['testserver'], DEBUG=False, COMPRESSION_ENABLED=True):
+                resultados, niveles = self._medir(tamanos, max(1, options['repeat']), anchos)
+        finally:
+            connection.creation.destroy_test_db(nombre_original, verbosity=0)
+
+        if options['json']:
+            self.stdout.write(json.dumps({'benchmark': 'compression', 'results': resultados, 'levels': niveles},
+                                         indent=2))
+            return
+
+        columnas_transferencia = ''.join(f" {f'total@{a:g}Mbps':>15}" for a in anchos)
+        self.stdout.write(f"{'size':>5} {'encoding':<9} {'bytes':>10} {'ratio':>6} {'cold_ms':>8} {'warm_ms':>8}"
+                          f" {'cold_cpu':>8} {'warm_cpu':>8}{columnas_transferencia}")
+        for r in resultados:
+            transferencia = ''.join(f" {r['total_ms'][str(a)]:>15.1f}" for a in anchos)
+            self.stdout.write(f"{r['size']:>5} {r['encoding']:<9} {r['bytes']:>10} {r['ratio']:>6.2f} "
+                              f"{r['cold_ms']:>8.1f} {r['warm_ms']:>8.1f} {r['cold_compress_ms']:>8.1f} "
+                              f"{r['warm_compress_ms']:>8.1f}{transferencia}")
+        self.stdout.write('')
+        self.stdout.write(f"{'size':>5} {'encoding':<9} {'level':>5} {'bytes':>10} {'ratio':>6} {'cpu_ms':>8} "
+                          f"{'MB/s':>7}")
+        for n in niveles:
+            self.stdout.write(f"{n['size']:>5} {n['encoding']:<9} {n['level']:>5} {n['bytes']:>10} "
+                              f"{n['ratio']:>6.2f} {n['cpu_ms']:>8.1f} {n['mb_per_s']:>7.1f}")
+
+    def _medir(self, tamanos: List[int], repeticiones: int, anchos: List[float]):
+        from rest_framework.test import APIClient
+        from apps.diagrams.models import Diagrama
+        from apps.diagrams.services.diagram_generator import GeneradorDiagramas, PerfilGeneracion
+
+        cliente = APIClient()
+        generador = GeneradorDiagramas(seed=0)
+        codificaciones = [c for c in CODIFICACIONES if c != compresion.BROTLI or compresion._brotli() is not None]
+        resultados: List[Dict[str, Any]] = []
+        niveles: List[Dict[str, Any]] = []
+        for tamano in tamanos:
+            diagrama, _ = generador.generar_diagrama(PerfilGeneracion(classes=tamano), nombre=f'bench-{tamano}')
+            url = f'{BASE}/diagrams/{diagrama.id}/'
+            original = None
+            for codificacion in codificaciones:
+                compresion.cache_comprimidos().vaciar()
+                tiempos, cpu = [], []
+                contadores = compresion.ESTADISTICAS.get(codificacion, {'cpu_ms': 0.0})
+                for _ in range(repeticiones + 1):
+                    cpu0 = contadores['cpu_ms']
+                    t0 = time.perf_counter()
+                    respuesta = cliente.get(url, HTTP_ACCEPT_ENCODING=codificacion)
+                    tiempos.append((time.perf_counter() - t0) * 1000)
+                    cpu.append(contadores['cpu_ms'] - cpu0)
+                    if respuesta.status_code != 200:
+                        raise CommandError(f'{tamano}/{codificacion} respondió {respuesta.status_code}')
+                if respuesta.get('Content-Encoding', 'identity') != codificacion:
+                    raise CommandError(f"{tamano}/{codificacion}: Content-Encoding={respuesta.get('Content-Encoding')}")
+                cuerpo = respuesta.content
+                if original is None:
+                    original = cuerpo
+                bytes_ = len(cuerpo)
+                caliente = statistics.median(tiempos[1:])
+                resultados.append({
+                    'size': tamano,
+                    'encoding': codificacion,
+                    'bytes': bytes_,
+                    'ratio': round(len(original) / bytes_, 2),
+                    'cold_ms': round(tiempos[0], 2),
+                    'warm_ms': round(caliente, 2),
+                    # CPU de compresión en el servidor: en caliente el cuerpo sale de la cache
+                    'cold_compress_ms': round(cpu[0], 2),
+                    'warm_compress_ms': round(statistics.median(cpu[1:]), 2),
+                    # Latencia en caliente + transferencia del cuerpo al ancho de banda dado
+                    'total_ms': {str(a): round(caliente + bytes_ * 8 / (a * 1e6) * 1000, 2) for a in anchos},
+                })
+            for codificacion, valores in NIVELES.items():
+                if codificacion not in codificaciones:
+                    continue
+                for nivel in valores:
+                    if codificacion == compresion.GZIP:
+                        def comprimir():
+                            return gzip.compress(original, compresslevel=nivel, mtime=0)
+                    else:
+                        def comprimir():
+                            return compresion._brotli().compress(original, quality=nivel)
+                    cpu_ms = _cpu_ms(comprimir)
+                    comprimido = comprimir()
+                    niveles.append({
+                        'size': tamano, 'encoding': codificacion, 'level': nivel, 'bytes': len(comprimido),
+                        'ratio': round(len(original) / len(comprimido), 2), 'cpu_ms': round(cpu_ms, 2),
+                        'mb_per_s': round(len(original) / 1e6 / (cpu_ms / 1000), 1) if cpu_ms else 0.0,
+                    })
+            Diagrama.objects.all().delete()
+        return resultados, niveles
@@ -0,0 +1,108 @@
+"""
+Comando de gestión para medir el fan-out de salas de colaboración.
+Compara el modo 'group' (un mensaje de Redis por socket miembro) con el modo
+'node' (una publicación por broadcast y una entrega por nodo con miembros),
+variando el tamaño de sala y el número de nodos.
+"""
+import asyncio
+import json
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.diagrams.realtime.fanout import BrokerMemoria, BrokerRedis, FanoutNodo
+
+
+class _SocketSimulado:
+    """Consumidor falso que registra la latencia de cada entrega"""
+
+    def __init__(self, latencias):
+        self._latencias = latencias
+
+    async def collaboration_event(self, evento):
+        self._latencias.append(time.perf_counter() - evento['payload']['t0'])
+
+
+class Command(BaseCommand):
+    help = 'Mide operaciones de Redis y latencia de fan-out según tamaño de sala y número de nodos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--room-sizes', default='10,100,1000', help='Tamaños de sala separados por coma')
+        parser.add_argument('--nodes', default='1,2,4,8', help='Números de nodos separados por coma')
+        parser.add_argument('--messages', type=int, default=50, help='Broadcasts por escenario')
+        parser.add_argument('--redis-url', default='', help='Usar Redis real en lugar del sustituto en memoria')
+        parser.add_argument('--json', action='store_true', help='Salida JSON para seguimiento de regresiones')
+
+    def handle(self, *args, **options):
+        try:
+            tamanos = [int(x) for x in options['room_sizes'].split(',') if x.strip()]
+            nodos = [int(x) for x in options['nodes'].split(',') if x.strip()]
+        except ValueError:
+            raise CommandError('--room-sizes y --nodes deben ser listas de enteros')
+
+        resultados = []
+        for tamano in tamanos:
+            for n in nodos:
+                resultados.append(asyncio.run(
+                    self._escenario(tamano, n, options['messages'], options['redis_url'])
+                ))
+
+        if options['json']:
+            self.stdout.write(json.dumps({'benchmark': 'fanout', 'results': resultados}, indent=2))
+            return
+
+        self.stdout.write(f"{'sala':>6} {'nodos':>5} {'ops_group':>10} {'ops_node':>9} {'p50_ms':>8} {'p99_ms':>8}")
+        for r in resultados:
+            self.stdout.write(
+                f"{r['room_size']:>6} {r['nodes']:>5} {r['redis_ops_group']:>10} "
+                f"{r['redis_ops_node']:>9} {r['latency_p50_ms']:>8.3f} {r['latency_p99_ms']:>8.3f}"
+            )
+
+    async def _escenario(self, tamano: int, n_nodos: int, mensajes: int, redis_url: str):
+        latencias = []
+        if redis_url:
+            fanouts = [FanoutNodo(BrokerRedis(redis_url)) for _ in range(n_nodos)]
+        else:
+            broker = BrokerMemoria()
+            fanouts = [FanoutNodo(broker) for _ in range(n_nodos)]
+
+        sala = f'bench_{tamano}_{n_nodos}'
+        # Reparto round-robin de sockets entre nodos, como un balanceador
+        for i in range(tamano):
+            await fanouts[i % n_nodos].join(sala, _SocketSimulado(latencias))
+        nodos_con_miembros = sum(1 for f in fanouts if f.miembros_locales(sala))
+        # Con el sustituto en memoria todos los nodos comparten el mismo broker
+        brokers = list({id(f.broker): f.broker for f in fanouts}.values())
+
+        publicaciones_previas = sum(b.stats['publish'] for b in brokers)
+        for _ in range(mensajes):
+            await fanouts[0].broadcast(sala, {
+                'type': 'collaboration_event',
+                'event_type': 'cursor_move',
+                'payload': {'t0': time.perf_counter()},
+            })
+        esperadas = tamano * mensajes
+        for _ in range(500):
+            if len(latencias) >= esperadas:
+                break
+            await asyncio.sleep(0.01)
+
+        publicaciones = sum(b.stats['publish'] for b in brokers) - publicaciones_previas
+        for b in brokers:
+            await b.close()
+
+        latencias.sort()
+        ms = [x * 1000 for x in latencias] or [0.0]
+        return {
+            'room_size': tamano,
+            'nodes': n_nodos,
+            'messages': mensajes,
+            'delivered': len(latencias),
+            # group_send empuja un mensaje por canal miembro
+            'redis_ops_group': tamano * mensajes,
+            # node: una publicación + una entrega por nodo con miembros
+            'redis_ops_node': publicaciones * (1 + nodos_con_miembros),
+            'latency_p50_ms': statistics.median(ms),
+            'latency_p99_ms': ms[min(len(ms) - 1, int(len(ms) * 0.99))],
+        }
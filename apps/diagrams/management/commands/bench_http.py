@@ -0,0 +1,290 @@
+"""
+Comando de gestión para medir los endpoints REST de diagramas.
+Crea una base de datos de prueba aislada, siembra diagramas de varios tamaños
+y mide latencia y número de consultas por endpoint. Cada endpoint declara un
+presupuesto de consultas; si se excede, el comando termina con error.
+"""
+import json
+import statistics
+import subprocess
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+
+from apps.diagrams.repositories import RepositorioAtributos
+
+
+@dataclass(frozen=True)
+class Presupuesto:
+    """Consultas permitidas: fijo + por_clase * tamaño del diagrama"""
+    fijo: int
+    por_clase: float = 0
+
+    def limite(self, tamano: int) -> int:
+        return int(self.fijo + self.por_clase * tamano)
+
+
+# Presupuestos declarados por endpoint. Las lecturas deben ser O(1) en consultas
+# y las escrituras, incluido el PUT documento-completo, por lotes. Los lotes de
+# bulk_create/bulk_update (acotados por los 999 parámetros de SQLite) se
+# cuentan en por_clase.
+PRESUPUESTOS: Dict[str, Presupuesto] = {
+    'diagram.create': Presupuesto(9, 0.08),
+    'diagram.retrieve': Presupuesto(4),
+    'diagram.list': Presupuesto(4),
+    'diagram.update': Presupuesto(20, 0.03),
+    'diagram.positions': Presupuesto(9, 0.01),
+    'diagram.duplicar': Presupuesto(13, 0.08),
+    'diagram.debug': Presupuesto(4),
+    'diagram.debug_state': Presupuesto(4),
+    'diagram.debug_relationships': Presupuesto(4),
+    # Índice de grafo: revisión + (en frío) clases y relaciones
+    'diagram.graph_neighbors': Presupuesto(3),
+    'diagram.graph_cycles': Presupuesto(3),
+    'diagram.viewport': Presupuesto(5),
+    # Lote mixto: una escritura por tipo de operación, no por operación
+    'diagram.operations': Presupuesto(12),
+    # Rutas anidadas: count + página (+ prefetch de atributos)
+    'diagram.classes.list': Presupuesto(3),
+    'diagram.relationships.list': Presupuesto(2),
+    # Alta en bloque de 50 relaciones validadas contra el índice del diagrama
+    'diagram.relationships.bulk': Presupuesto(7),
+    'class.list': Presupuesto(3),
+    # Listado plano con ?page_size=: count + página (+ prefetch de atributos)
+    'class.list.page': Presupuesto(3),
+    'class.retrieve': Presupuesto(2),
+    'class.actualizar_posicion': Presupuesto(5),
+    'class.agregar_atributo': Presupuesto(4),
+    'relationship.list': Presupuesto(2),
+    'relationship.list.page': Presupuesto(2),
+    'relationship.retrieve': Presupuesto(1),
+}
+
+BASE = '/api/app/diagrams'
+
+
+def _documento(diagrama) -> Dict[str, Any]:
+    """Documento completo del diagrama con el formato que usa el frontend en PUT."""
+    return {
+        'name': diagrama.name,
+        'classes': [
+            {
+                'id': str(c.id),
+                'name': c.name,
+                'position': {'x': c.position_x + 1, 'y': c.position_y},
+                'attributes': [a.name for a in c.lista_atributos],
+            }
+            for c in diagrama.classes.prefetch_related(*RepositorioAtributos().prefetch())
+        ],
+        'relationships': [
+            {
+                'from': str(r.from_class_id),
+                'to': str(r.to_class_id),
+                'type': r.relationship_type,
+                'cardinality': {'from': r.cardinality_from, 'to': r.cardinality_to},
+            }
+            for r in diagrama.relationships.all()
+        ],
+    }
+
+
+def _commit_actual() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return 'desconocido'
+
+
+class _ContadorConsultas:
+    """execute_wrapper que cuenta consultas sin el límite de connection.queries"""
+
+    def __init__(self):
+        self.total = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.total += 1
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    help = 'Mide latencia y consultas de los endpoints de diagramas con presupuestos de consultas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10,100,1000,5000', help='Tamaños de diagrama (clases)')
+        parser.add_argument('--repeat', type=int, default=3, help='Repeticiones por endpoint')
+        parser.add_argument('--only', default='', help='Prefijo de endpoints a medir (p.ej. diagram.)')
+        parser.add_argument('--output', default='', help='Archivo donde guardar el resultado JSON')
+        parser.add_argument('--compare', default='', help='Resultado JSON previo contra el que comparar')
+
+    def handle(self, *args, **options):
+        try:
+            tamanos = [int(x) for x in options['sizes'].split(',') if x.strip()]
+        except ValueError:
+            raise CommandError('--sizes debe ser una lista de enteros')
+
+        nombre_original = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            with override_settings(ALLOWED_HOSTS=['testserver'], DEBUG=False):
+                resultados = self._medir(tamanos, options['repeat'], options['only'])
+        finally:
+            connection.creation.destroy_test_db(nombre_original, verbosity=0)
+
+        salida = {'benchmark': 'http', 'commit': _commit_actual(), 'results': resultados}
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(salida, f, indent=2)
+
+        previos = {}
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as f:
+                previos = {(r['endpoint'], r['size']): r for r in json.load(f)['results']}
+
+        self.stdout.write(f"{'endpoint':<30} {'size':>5} {'queries':>8} {'budget':>7} {'p50_ms':>9} {'Δp50':>8}")
+        excedidos = []
+        for r in resultados:
+            previo = previos.get((r['endpoint'], r['size']))
+            delta = f"{r['p50_ms'] - previo['p50_ms']:+.1f}" if previo else ''
+            linea = (f"{r['endpoint']:<30} {r['size']:>5} {r['queries']:>8} {r['budget']:>7} "
+                     f"{r['p50_ms']:>9.1f} {delta:>8}")
+            if r['queries'] > r['budget']:
+                excedidos.append(r)
+                self.stdout.write(self.style.ERROR(linea))
+            else:
+                self.stdout.write(linea)
+
+        if excedidos:
+            nombres = ', '.join(f"{r['endpoint']}@{r['size']}" for r in excedidos)
+            raise CommandError(f'Presupuesto de consultas excedido: {nombres}')
+        self.stdout.write(self.style.SUCCESS('Todos los endpoints dentro de presupuesto'))
+
+    def _medir(self, tamanos: List[int], repeticiones: int, solo: str) -> List[Dict[str, Any]]:
+        from rest_framework.test import APIClient
+        from apps.diagrams.models import Diagrama
+        from apps.diagrams.services.diagram_generator import GeneradorDiagramas, PerfilGeneracion
+
+        cliente = APIClient()
+        generador = GeneradorDiagramas(seed=0)
+        resultados = []
+        for tamano in tamanos:
+            diagrama, _ = generador.generar_diagrama(PerfilGeneracion(classes=tamano), nombre=f'bench-{tamano}')
+            # Diagramas extra para que el listado no sea trivial
+            generador.generar(3, PerfilGeneracion(classes=10), prefijo='bench-extra')
+            documento = _documento(diagrama)
+            clase = diagrama.classes.first()
+            relacion = diagrama.relationships.first()
+            crear = {
+                'name': f'nuevo-{tamano}',
+                'classes': [
+                    {'name': c['name'], 'position': c['position'], 'attributes': c['attributes']}
+                    for c in documento['classes']
+                ],
+                'relationships': [
+                    {'from': origen['name'], 'to': destino['name'], 'type': 'association'}
+                    for origen, destino in zip(documento['classes'][1:], documento['classes'])
+                ],
+            }
+            posiciones = {'classes': [
+                {'id': c['id'], 'position': {'x': c['position']['x'] + 5, 'y': c['position']['y']}}
+                for c in documento['classes']
+            ]}
+
+            ids_clases = [c['id'] for c in documento['classes']]
+
+            def operaciones():
+                sufijo = time.perf_counter_ns()
+                ops = [{'op': 'move_class', 'id': cid, 'position': {'x': 7, 'y': 7}} for cid in ids_clases[:20]]
+                ops += [
+                    {'op': 'add_class', 'ref': 'nueva', 'name': f'Lote{sufijo}', 'attributes': ['id']},
+                    {'op': 'add_attribute', 'class_id': ids_clases[0], 'name': f'a{sufijo}'},
+                    {'op': 'add_relationship', 'from': 'nueva', 'to': ids_clases[0], 'type': 'association'},
+                    {'op': 'rename_class', 'id': ids_clases[-1], 'name': f'Renombrada{sufijo}'},
+                ]
+                return cliente.post(f'{BASE}/diagrams/{diagrama.id}/operations/', {'operations': ops}, format='json')
+
+            # Pares libres (sin relación 'aggregation') para altas en bloque repetidas
+            existentes = set(diagrama.relationships.filter(relationship_type='aggregation')
+                             .values_list('from_class_id', 'to_class_id'))
+            libres = (
+                {'from_class': origen, 'to_class': destino, 'relationship_type': 'aggregation'}
+                for origen in ids_clases for destino in ids_clases
+                if origen != destino and (uuid.UUID(origen), uuid.UUID(destino)) not in existentes
+            )
+
+            def alta_en_bloque():
+                filas = [fila for _, fila in zip(range(50), libres)]
+                return cliente.post(f'{BASE}/diagrams/{diagrama.id}/relationships/', filas, format='json')
+
+            # El PUT documento-completo recrea las relaciones: se miden antes
+            casos: List[tuple] = [
+                ('relationship.list', lambda: cliente.get(f'{BASE}/relationships/')),
+                ('relationship.list.page', lambda: cliente.get(f'{BASE}/relationships/', {'page_size': 100})),
+                ('relationship.retrieve', lambda: cliente.get(f'{BASE}/relationships/{relacion.id}/')),
+                ('diagram.create', lambda: cliente.post(f'{BASE}/diagrams/', crear, format='json')),
+                ('diagram.retrieve', lambda: cliente.get(f'{BASE}/diagrams/{diagrama.id}/')),
+                ('diagram.list', lambda: cliente.get(f'{BASE}/diagrams/')),
+                ('diagram.update', lambda: cliente.put(f'{BASE}/diagrams/{diagrama.id}/', documento, format='json')),
+                ('diagram.positions', lambda: cliente.patch(f'{BASE}/diagrams/{diagrama.id}/positions/',
+                                                            posiciones, format='json')),
+                ('diagram.duplicar', lambda: cliente.post(f'{BASE}/diagrams/{diagrama.id}/duplicar/')),
+                ('diagram.debug', lambda: cliente.get(f'{BASE}/diagrams/{diagrama.id}/debug/')),
+                ('diagram.debug_state', lambda: cliente.get(f'{BASE}/diagrams/{diagrama.id}/debug_state/')),
+                ('diagram.debug_relationships',
+                 lambda: cliente.get(f'{BASE}/diagrams/{diagrama.id}/debug_relationships/')),
+                ('diagram.graph_neighbors', lambda: cliente.get(
+                    f'{BASE}/diagrams/{diagrama.id}/graph/neighbors/', {'class_id': str(clase.id)})),
+                ('diagram.graph_cycles', lambda: cliente.get(f'{BASE}/diagrams/{diagrama.id}/graph/cycles/')),
+                ('diagram.viewport', lambda: cliente.get(
+                    f'{BASE}/diagrams/{diagrama.id}/viewport/', {'x': 0, 'y': 0, 'width': 1920, 'height': 1080})),
+                ('diagram.operations', operaciones),
+                ('diagram.classes.list', lambda: cliente.get(f'{BASE}/diagrams/{diagrama.id}/classes/')),
+                ('diagram.relationships.list', lambda: cliente.get(f'{BASE}/diagrams/{diagrama.id}/relationships/')),
+                ('diagram.relationships.bulk', alta_en_bloque),
+                ('class.list', lambda: cliente.get(f'{BASE}/classes/')),
+                ('class.list.page', lambda: cliente.get(f'{BASE}/classes/', {'page_size': 100})),
+                ('class.retrieve', lambda: cliente.get(f'{BASE}/classes/{clase.id}/')),
+                ('class.actualizar_posicion', lambda: cliente.patch(
+                    f'{BASE}/classes/{clase.id}/actualizar_posicion/',
+                    {'position': {'x': 10, 'y': 20}}, format='json')),
+                ('class.agregar_atributo', lambda: cliente.post(
+                    f'{BASE}/classes/{clase.id}/agregar_atributo/',
+                    {'name': f'nuevo{time.perf_counter_ns()}'}, format='json')),
+            ]
+            for nombre, llamada in casos:
+                if solo and not nombre.startswith(solo):
+                    continue
+                resultados.append(self._medir_caso(nombre, tamano, llamada, repeticiones))
+
+            # Limpiar antes del siguiente tamaño para que los listados sean comparables
+            Diagrama.objects.all().delete()
+        return resultados
+
+    def _medir_caso(self, nombre: str, tamano: int, llamada: Callable, repeticiones: int) -> Dict[str, Any]:
+        tiempos = []
+        consultas: Optional[int] = None
+        for _ in range(max(1, repeticiones)):
+            contador = _ContadorConsultas()
+            with connection.execute_wrapper(contador):
+                t0 = time.perf_counter()
+                respuesta = llamada()
+                tiempos.append((time.perf_counter() - t0) * 1000)
+            if respuesta.status_code >= 400:
+                raise CommandError(f'{nombre}@{tamano} respondió {respuesta.status_code}')
+            consultas = max(consultas or 0, contador.total)
+        tiempos.sort()
+        return {
+            'endpoint': nombre,
+            'size': tamano,
+            'status': respuesta.status_code,
+            'queries': consultas,
+            'budget': PRESUPUESTOS[nombre].limite(tamano),
+            'p50_ms': round(statistics.median(tiempos), 2),
+            'max_ms': round(tiempos[-1], 2),
+            'bytes': len(respuesta.content),
+        }
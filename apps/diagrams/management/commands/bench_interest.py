@@ -0,0 +1,150 @@
+"""
+Comando de gestión para medir la gestión de interés en salas de colaboración.
+Simula una sala grande (por defecto 200 usuarios y 5.000 clases) sobre
+FanoutNodo y cuenta los mensajes que recibe cada cliente con y sin viewports
+registrados, además del coste de enrutado por evento.
+"""
+import asyncio
+import json
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.diagrams.realtime.fanout import BrokerMemoria, FanoutNodo
+from apps.diagrams.realtime.interes import GestorInteres
+from apps.diagrams.services.viewport_service import Rectangulo
+
+# Mismo espaciado que el generador sintético (services/diagram_generator.py)
+PASO_X, PASO_Y = 240, 180
+
+
+class _SocketSimulado:
+    """Consumidor falso que solo cuenta entregas por tipo de evento"""
+
+    def __init__(self):
+        self.recibidos = 0
+        self.geometria = 0
+
+    async def collaboration_event(self, evento):
+        self.recibidos += 1
+        if evento['event_type'] in ('class_updated', 'relationship_updated'):
+            self.geometria += 1
+
+
+class Command(BaseCommand):
+    help = 'Cuenta mensajes por cliente con y sin filtrado por viewport en una sala grande'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200, help='Sockets en la sala')
+        parser.add_argument('--classes', type=int, default=5000, help='Clases en el diagrama')
+        parser.add_argument('--events', type=int, default=5000, help='Eventos emitidos')
+        parser.add_argument('--structural', type=float, default=0.05,
+                            help='Fracción de eventos estructurales (se reparten a todos)')
+        parser.add_argument('--relationships', type=float, default=0.2,
+                            help='Fracción de relationship_update entre los eventos de geometría')
+        parser.add_argument('--viewport', default='1920x1080', help='Tamaño del viewport ANCHOxALTO')
+        parser.add_argument('--nodes', type=int, default=1, help='Nodos entre los que se reparten los sockets')
+        parser.add_argument('--seed', type=int, default=1, help='Semilla para reproducibilidad')
+        parser.add_argument('--json', action='store_true', help='Salida JSON para seguimiento de regresiones')
+
+    def handle(self, *args, **options):
+        ancho, _, alto = options['viewport'].partition('x')
+        options['vw'], options['vh'] = int(ancho), int(alto)
+
+        resultados = [
+            asyncio.run(self._escenario(options, filtrar=False)),
+            asyncio.run(self._escenario(options, filtrar=True)),
+        ]
+
+        if options['json']:
+            self.stdout.write(json.dumps({'benchmark': 'interest', 'results': resultados}, indent=2))
+            return
+
+        self.stdout.write(
+            f"usuarios={options['users']} clases={options['classes']} eventos={options['events']} "
+            f"viewport={options['viewport']} nodos={options['nodes']}"
+        )
+        self.stdout.write(
+            f"{'modo':>8} {'entregas':>9} {'media':>8} {'p50':>6} {'p99':>6} {'max':>6} "
+            f"{'geom_media':>10} {'us/evento':>9}"
+        )
+        for r in resultados:
+            self.stdout.write(
+                f"{r['mode']:>8} {r['deliveries']:>9} {r['per_client_mean']:>8.1f} {r['per_client_p50']:>6} "
+                f"{r['per_client_p99']:>6} {r['per_client_max']:>6} {r['geometry_per_client_mean']:>10.1f} "
+                f"{r['route_us_per_event']:>9.1f}"
+            )
+        base, filtrado = resultados
+        if filtrado['deliveries']:
+            self.stdout.write(f"reducción de entregas: {base['deliveries'] / filtrado['deliveries']:.1f}x")
+
+    async def _escenario(self, options, filtrar: bool):
+        rnd = random.Random(options['seed'])
+        n_clases = options['classes']
+        columnas = max(1, int(n_clases ** 0.5))
+        posiciones = [((i % columnas) * PASO_X, (i // columnas) * PASO_Y) for i in range(n_clases)]
+        ancho_lienzo = columnas * PASO_X
+        alto_lienzo = (n_clases // columnas + 1) * PASO_Y
+
+        broker = BrokerMemoria()
+        fanouts = [FanoutNodo(broker, interes=GestorInteres()) for _ in range(max(1, options['nodes']))]
+        sala = 'bench_interest'
+        # El nodo emisor marca los eventos con su propia rejilla, como hace el consumidor
+        emisor = fanouts[0].interes.entrar(sala)
+        emisor.sembrar((f'c{i}', x, y) for i, (x, y) in enumerate(posiciones))
+
+        sockets = []
+        for i in range(options['users']):
+            fanout = fanouts[i % len(fanouts)]
+            socket = _SocketSimulado()
+            rejilla = fanout.interes.entrar(sala)
+            if not rejilla.sembrada:
+                rejilla.sembrar((f'c{j}', x, y) for j, (x, y) in enumerate(posiciones))
+            if filtrar:
+                x0 = rnd.randint(0, max(0, ancho_lienzo - options['vw']))
+                y0 = rnd.randint(0, max(0, alto_lienzo - options['vh']))
+                rejilla.registrar_viewport(socket, Rectangulo(x0, y0, x0 + options['vw'], y0 + options['vh']))
+            await fanout.join(sala, socket)
+            sockets.append(socket)
+
+        rnd = random.Random(options['seed'] + 1)
+        t_ruta = 0.0
+        for n in range(options['events']):
+            if rnd.random() < options['structural']:
+                event_type, payload = 'class_created', {'id': f'nueva-{n}'}
+            elif rnd.random() < options['relationships']:
+                a = rnd.randrange(n_clases)
+                b = min(n_clases - 1, a + rnd.choice((1, columnas)))
+                event_type = 'relationship_updated'
+                payload = {'id': f'r{a}-{b}', 'from_class': f'c{a}', 'to_class': f'c{b}', 'type': 'association'}
+            else:
+                i = rnd.randrange(n_clases)
+                x, y = posiciones[i]
+                posiciones[i] = (x + rnd.randint(-80, 80), y + rnd.randint(-80, 80))
+                event_type = 'class_updated'
+                payload = {'id': f'c{i}', 'position': {'x': posiciones[i][0], 'y': posiciones[i][1]}}
+            evento = {'type': 'collaboration_event', 'event_type': event_type, 'payload': payload}
+            t0 = time.perf_counter()
+            interes = emisor.marcar(event_type, payload)
+            if interes is not None:
+                evento['interest'] = interes
+            await fanouts[0].broadcast(sala, evento)
+            t_ruta += time.perf_counter() - t0
+
+        await broker.close()
+        por_cliente = sorted(s.recibidos for s in sockets)
+        return {
+            'mode': 'interest' if filtrar else 'room',
+            'users': options['users'],
+            'classes': n_clases,
+            'events': options['events'],
+            'deliveries': sum(por_cliente),
+            'per_client_mean': statistics.mean(por_cliente),
+            'per_client_p50': por_cliente[len(por_cliente) // 2],
+            'per_client_p99': por_cliente[min(len(por_cliente) - 1, int(len(por_cliente) * 0.99))],
+            'per_client_max': por_cliente[-1],
+            'geometry_per_client_mean': statistics.mean(s.geometria for s in sockets),
+            'route_us_per_event': t_ruta / max(1, options['events']) * 1e6,
+        }
@@ -0,0 +1,70 @@
+"""
+Comando de gestión para medir el motor de auto-layout.
+Siembra diagramas sintéticos en una base de prueba aislada y mide el cálculo
+(fuerzas y capas) y la escritura masiva de posiciones según el número de clases.
+"""
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from apps.diagrams.services import GeneradorDiagramas, ServicioLayout
+from apps.diagrams.services.diagram_generator import PerfilGeneracion
+
+
+class Command(BaseCommand):
+    help = 'Mide el auto-layout (force/layered) para diagramas de distintos tamaños'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='100,500,1000,5000', help='Número de clases por diagrama')
+        parser.add_argument('--modes', default='force,layered', help='Modos a medir')
+        parser.add_argument('--iterations', type=int, default=300, help='Tope de iteraciones (force)')
+        parser.add_argument('--deadline-ms', type=float, default=5000, help='Tiempo máximo por layout')
+        parser.add_argument('--json', action='store_true', help='Salida JSON')
+
+    def handle(self, *args, **options):
+        try:
+            tamanos = [int(x) for x in options['sizes'].split(',') if x.strip()]
+        except ValueError:
+            raise CommandError('--sizes debe ser una lista de enteros')
+        modos = [m.strip() for m in options['modes'].split(',') if m.strip()]
+
+        nombre_original = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        resultados = []
+        try:
+            generador = GeneradorDiagramas(seed=0)
+            servicio = ServicioLayout()
+            for tamano in tamanos:
+                diagrama, filas = generador.generar_diagrama(PerfilGeneracion(classes=tamano, shape='mixed'))
+                for modo in modos:
+                    t0 = time.perf_counter()
+                    clases, resultado = servicio.aplicar(
+                        str(diagrama.id), modo=modo, iteraciones=options['iterations'],
+                        deadline_ms=options['deadline_ms'],
+                    )
+                    total_ms = (time.perf_counter() - t0) * 1000
+                    resultados.append({
+                        'classes': tamano,
+                        'relationships': filas['relationships'],
+                        'mode': modo,
+                        'iterations': resultado.iteraciones,
+                        'converged': resultado.convergio,
+                        'deadline_reached': resultado.deadline_alcanzado,
+                        'compute_ms': round(resultado.ms, 1),
+                        'total_ms': round(total_ms, 1),
+                        'ms_per_iteration': round(resultado.ms / max(1, resultado.iteraciones), 2),
+                    })
+        finally:
+            connection.creation.destroy_test_db(nombre_original, verbosity=0)
+
+        if options['json']:
+            self.stdout.write(json.dumps({'benchmark': 'layout', 'results': resultados}, indent=2))
+            return
+        self.stdout.write(f"{'clases':>7} {'modo':>8} {'iter':>5} {'calc_ms':>9} {'total_ms':>9} {'ms/iter':>8} {'deadline':>8}")
+        for r in resultados:
+            self.stdout.write(
+                f"{r['classes']:>7} {r['mode']:>8} {r['iterations']:>5} {r['compute_ms']:>9.1f} "
+                f"{r['total_ms']:>9.1f} {r['ms_per_iteration']:>8.2f} {str(r['deadline_reached']):>8}"
+            )
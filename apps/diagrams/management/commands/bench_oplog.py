@@ -0,0 +1,102 @@
+"""
+Comando de gestión para medir el coste del registro secuenciado de colaboración.
+Lanza ediciones de clase (class_update con base_seq) y movimientos de cursor
+sobre varias salas a la vez y mide operaciones por segundo y latencia de
+secuenciar() (número de secuencia + fusión + envío dentro del lock de sala).
+"""
+import asyncio
+import json
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.diagrams.realtime.secuencia import AlmacenMemoria, AlmacenRedis, SecuenciadorSalas
+
+
+class Command(BaseCommand):
+    help = 'Mide ops/s y latencia de secuenciar() por número de salas y clientes concurrentes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rooms', default='1,10,100', help='Números de salas separados por coma')
+        parser.add_argument('--clients', type=int, default=8, help='Clientes concurrentes por sala')
+        parser.add_argument('--ops', type=int, default=200, help='Eventos por cliente')
+        parser.add_argument('--attributes', type=int, default=20, help='Atributos por clase editada')
+        parser.add_argument('--redis-url', default='', help='Usar AlmacenRedis en lugar del almacén en memoria')
+        parser.add_argument('--json', action='store_true', help='Salida JSON para seguimiento de regresiones')
+
+    def handle(self, *args, **options):
+        try:
+            salas = [int(x) for x in options['rooms'].split(',') if x.strip()]
+        except ValueError:
+            raise CommandError('--rooms debe ser una lista de enteros')
+
+        resultados = [asyncio.run(self._escenario(n, options)) for n in salas]
+
+        if options['json']:
+            self.stdout.write(json.dumps({'benchmark': 'oplog', 'results': resultados}, indent=2))
+            return
+
+        self.stdout.write(f"{'salas':>6} {'eventos':>8} {'ops_s':>9} "
+                          f"{'p50_ms':>8} {'p99_ms':>8} {'concurrentes':>12}")
+        for r in resultados:
+            self.stdout.write(
+                f"{r['rooms']:>6} {r['events']:>8} {r['ops_per_s']:>9.0f} "
+                f"{r['latency_p50_ms']:>8.3f} {r['latency_p99_ms']:>8.3f} {r['concurrent_fields']:>12}"
+            )
+
+    async def _escenario(self, n_salas: int, options):
+        almacen = AlmacenRedis(options['redis_url']) if options['redis_url'] else AlmacenMemoria()
+        secuenciador = SecuenciadorSalas(almacen)
+        salas = [f'bench_oplog_{n_salas}_{i}_{time.time_ns()}' for i in range(n_salas)]
+        for sala in salas:
+            secuenciador.entrar(sala)
+        latencias = []
+        enviados = []
+
+        async def enviar(payload):
+            enviados.append(payload['seq'])
+
+        async def cliente(sala: str, n: int, rnd: random.Random):
+            base = 0
+            for i in range(options['ops']):
+                if rnd.random() < 0.5:
+                    event_type, payload = 'cursor_move', {'x': i, 'y': n}
+                else:
+                    clase = f'c{rnd.randrange(4)}'
+                    attrs = [{'name': f'a{j}', 'type': 'String'} for j in range(options['attributes'])]
+                    payload = {
+                        'id': clase, 'base_seq': base,
+                        'name': f'{clase}-{n}-{i}', 'position': {'x': i, 'y': n}, 'attributes': attrs,
+                    }
+                    event_type = 'class_update'
+                t0 = time.perf_counter()
+                saliente = await secuenciador.secuenciar(sala, event_type, payload, f'u{n}', enviar)
+                latencias.append(time.perf_counter() - t0)
+                base = saliente['seq']
+                # Cede el bucle como lo haría un socket real entre mensajes
+                await asyncio.sleep(0)
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(
+            cliente(sala, n, random.Random(hash((sala, n))))
+            for sala in salas for n in range(options['clients'])
+        ))
+        transcurrido = time.perf_counter() - t0
+        eventos = len(latencias)
+
+        for sala in salas:
+            secuenciador.salir(sala)
+
+        ms = sorted(x * 1000 for x in latencias) or [0.0]
+        return {
+            'rooms': n_salas,
+            'clients_per_room': options['clients'],
+            'events': eventos,
+            'ops_per_s': eventos / transcurrido if transcurrido else 0.0,
+            'latency_p50_ms': statistics.median(ms),
+            'latency_p99_ms': ms[min(len(ms) - 1, int(len(ms) * 0.99))],
+            'concurrent_fields': secuenciador.stats['concurrent_fields'],
+            'stale_fields_kept': secuenciador.stats['stale_fields_kept'],
+        }
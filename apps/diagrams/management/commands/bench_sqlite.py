@@ -0,0 +1,196 @@
+"""
+Comando de gestión para medir SQLite bajo carga concurrente mixta.
+Para cada modo ('default': configuración de siempre; 'concurrent': SQLITE_CONCURRENT)
+lanza un proceso con una base de datos SQLite nueva en un directorio temporal,
+siembra diagramas y ejecuta durante --duration segundos hilos lectores (GET del
+diagrama) y escritores (PUT documento-completo o PATCH de posiciones, como los
+autoguardados) contra la API. Informa de throughput, latencias y errores
+("database is locked") de cada modo.
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from .bench_http import BASE, _documento
+
+MODOS = ('default', 'concurrent')
+
+
+def _percentil(valores: List[float], p: float) -> float:
+    if not valores:
+        return 0.0
+    return valores[min(len(valores) - 1, int(len(valores) * p))]
+
+
+class Command(BaseCommand):
+    help = 'Compara SQLite por defecto y SQLITE_CONCURRENT con lecturas y escrituras concurrentes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--modes', default=','.join(MODOS), help='Modos a comparar (default,concurrent)')
+        parser.add_argument('--readers', type=int, default=8, help='Hilos que leen diagramas')
+        parser.add_argument('--writers', type=int, default=4, help='Hilos que guardan diagramas')
+        parser.add_argument('--duration', type=float, default=5.0, help='Segundos de carga por modo')
+        parser.add_argument('--diagrams', type=int, default=8, help='Diagramas sembrados')
+        parser.add_argument('--classes', type=int, default=30, help='Clases por diagrama')
+        parser.add_argument('--write', choices=('update', 'positions'), default='update',
+                            help='Escritura: PUT documento-completo o PATCH de posiciones')
+        parser.add_argument('--json', action='store_true', help='Salida JSON para seguimiento de regresiones')
+        # Uso interno: el proceso que mide un modo
+        parser.add_argument('--worker', default='', help=argparse.SUPPRESS)
+        parser.add_argument('--result', default='', help=argparse.SUPPRESS)
+
+    def handle(self, *args, **options):
+        if options['worker']:
+            self._trabajador(options)
+            return
+        modos = [m.strip() for m in options['modes'].split(',') if m.strip()]
+        desconocidos = set(modos) - set(MODOS)
+        if desconocidos:
+            raise CommandError(f"Modos desconocidos: {', '.join(sorted(desconocidos))}")
+
+        resultados = []
+        with tempfile.TemporaryDirectory(prefix='bench-sqlite-') as carpeta:
+            for modo in modos:
+                resultados.append(self._lanzar(modo, carpeta, options))
+
+        if options['json']:
+            self.stdout.write(json.dumps({'benchmark': 'sqlite', 'results': resultados}, indent=2))
+            return
+
+        self.stdout.write(f"{'modo':<11} {'tipo':<6} {'ops':>6} {'ops/s':>8} {'errores':>8} {'locked':>7} "
+                          f"{'p50_ms':>8} {'p95_ms':>8} {'p99_ms':>8} {'max_ms':>8}")
+        for r in resultados:
+            for tipo in ('read', 'write'):
+                t = r[tipo]
+                linea = (f"{r['mode']:<11} {tipo:<6} {t['ops']:>6} {t['ops_per_s']:>8.1f} {t['errors']:>8} "
+                         f"{t['locked']:>7} {t['p50_ms']:>8.1f} {t['p95_ms']:>8.1f} {t['p99_ms']:>8.1f} "
+                         f"{t['max_ms']:>8.1f}")
+                self.stdout.write(self.style.ERROR(linea) if t['errors'] else linea)
+            if r.get('write_queue'):
+                cola = r['write_queue']
+                self.stdout.write(f"{'':<11} cola de escritura: turnos={cola['acquired']} esperas={cola['waited']} "
+                                  f"espera_max={cola['wait_ms_max']:.1f}ms retención_max={cola['held_ms_max']:.1f}ms")
+
+    def _lanzar(self, modo: str, carpeta: str, options: Dict[str, Any]) -> Dict[str, Any]:
+        """Mide un modo en un proceso aparte: la configuración de la BD se fija al arrancar Django"""
+        ruta_bd = os.path.join(carpeta, f'{modo}.sqlite3')
+        ruta_resultado = os.path.join(carpeta, f'{modo}.json')
+        entorno = {**os.environ, 'DATABASE_URL': f'sqlite:///{ruta_bd}',
+                   'SQLITE_CONCURRENT': '1' if modo == 'concurrent' else '0'}
+        comando = [
+            sys.executable, os.path.join(settings.BASE_DIR, 'manage.py'), 'bench_sqlite', '--worker', modo,
+            '--result', ruta_resultado, '--readers', str(options['readers']), '--writers', str(options['writers']),
+            '--duration', str(options['duration']), '--diagrams', str(options['diagrams']),
+            '--classes', str(options['classes']), '--write', options['write'],
+        ]
+        if not options['json']:
+            self.stdout.write(f"[bench_sqlite] midiendo '{modo}'...")
+        proceso = subprocess.run(comando, env=entorno, capture_output=True, text=True)
+        if proceso.returncode != 0:
+            raise CommandError(f"El modo '{modo}' falló:\n{proceso.stderr[-2000:]}")
+        with open(ruta_resultado, encoding='utf-8') as f:
+            return json.load(f)
+
+    def _trabajador(self, options: Dict[str, Any]):
+        from django.core.management import call_command
+        from django.db import connection, connections
+        from django.test.utils import override_settings
+        from apps.diagrams.services.diagram_generator import GeneradorDiagramas, PerfilGeneracion
+
+        # Sin una línea de log por request (PerformanceMiddleware): los errores se cuentan aparte
+        logging.disable(logging.ERROR)
+        call_command('migrate', verbosity=0, interactive=False)
+        generador = GeneradorDiagramas(seed=0)
+        documentos = {}
+        for n in range(max(1, options['diagrams'])):
+            diagrama, _ = generador.generar_diagrama(PerfilGeneracion(classes=options['classes']),
+                                                     nombre=f'bench-sqlite-{n}')
+            documentos[str(diagrama.id)] = _documento(diagrama)
+        cola = getattr(connection, 'cola_escritura', None)
+        connections.close_all()
+
+        muestras: Dict[str, List[float]] = {'read': [], 'write': []}
+        errores = {'read': [], 'write': []}
+        lock = threading.Lock()
+        fin = time.perf_counter() + options['duration']
+        ids = list(documentos)
+
+        def escribir(cliente, diagrama_id):
+            documento = documentos[diagrama_id]
+            if options['write'] == 'positions':
+                posiciones = {'classes': [
+                    {'id': c['id'], 'position': {'x': c['position']['x'] + random.randint(-5, 5),
+                                                 'y': c['position']['y']}}
+                    for c in documento['classes']
+                ]}
+                return cliente.patch(f'{BASE}/diagrams/{diagrama_id}/positions/', posiciones, format='json')
+            return cliente.put(f'{BASE}/diagrams/{diagrama_id}/', documento, format='json')
+
+        def bucle(tipo: str, semilla: int):
+            from rest_framework.test import APIClient
+
+            azar = random.Random(semilla)
+            cliente = APIClient()
+            propias, fallos = [], []
+            try:
+                while time.perf_counter() < fin:
+                    diagrama_id = azar.choice(ids)
+                    t0 = time.perf_counter()
+                    try:
+                        if tipo == 'read':
+                            respuesta = cliente.get(f'{BASE}/diagrams/{diagrama_id}/')
+                        else:
+                            respuesta = escribir(cliente, diagrama_id)
+                        if respuesta.status_code >= 400:
+                            fallos.append(f'HTTP {respuesta.status_code}: {respuesta.content[:200]!r}')
+                    except Exception as e:
+                        fallos.append(f'{type(e).__name__}: {e}')
+                    propias.append((time.perf_counter() - t0) * 1000)
+            finally:
+                connections.close_all()
+                with lock:
+                    muestras[tipo].extend(propias)
+                    errores[tipo].extend(fallos)
+
+        hilos = [threading.Thread(target=bucle, args=('read', n)) for n in range(options['readers'])]
+        hilos += [threading.Thread(target=bucle, args=('write', 1000 + n)) for n in range(options['writers'])]
+        with override_settings(ALLOWED_HOSTS=['testserver'], DEBUG=False):
+            inicio = time.perf_counter()
+            for hilo in hilos:
+                hilo.start()
+            for hilo in hilos:
+                hilo.join()
+            transcurrido = time.perf_counter() - inicio
+
+        resultado: Dict[str, Any] = {'mode': options['worker'], 'readers': options['readers'],
+                                     'writers': options['writers'], 'write': options['write'],
+                                     'duration_s': round(transcurrido, 3)}
+        for tipo in ('read', 'write'):
+            tiempos = sorted(muestras[tipo])
+            resultado[tipo] = {
+                'ops': len(tiempos),
+                'ops_per_s': round(len(tiempos) / transcurrido, 1),
+                'errors': len(errores[tipo]),
+                'locked': sum('locked' in e for e in errores[tipo]),
+                'error_samples': sorted(set(errores[tipo]))[:5],
+                'p50_ms': round(statistics.median(tiempos), 2) if tiempos else 0.0,
+                'p95_ms': round(_percentil(tiempos, 0.95), 2),
+                'p99_ms': round(_percentil(tiempos, 0.99), 2),
+                'max_ms': round(tiempos[-1], 2) if tiempos else 0.0,
+            }
+        if cola is not None:
+            resultado['write_queue'] = cola.estado()
+        with open(options['result'], 'w', encoding='utf-8') as f:
+            json.dump(resultado, f)
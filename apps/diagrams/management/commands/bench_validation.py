@@ -0,0 +1,120 @@
+"""
+Comando de gestión para medir el motor de validación.
+Compara la validación incremental (solo la relación tocada, contra el índice
+cacheado) con la validación completa bajo demanda en diagramas grandes.
+"""
+import json
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+
+from apps.diagrams.services import GeneradorDiagramas, ServicioGrafo, ServicioValidacion
+from apps.diagrams.services.diagram_generator import PerfilGeneracion
+
+_TIPOS = ['inheritance', 'association', 'composition', 'aggregation']
+
+
+def _percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p))]
+
+
+class Command(BaseCommand):
+    help = 'Mide la validación incremental y completa de diagramas de distintos tamaños'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1000,5000,20000', help='Número de clases por diagrama')
+        parser.add_argument('--checks', type=int, default=20000, help='Relaciones candidatas a validar por tamaño')
+        parser.add_argument('--requests', type=int, default=50,
+                            help='POST /relationships/ de extremo a extremo por tamaño (0 para omitir)')
+        parser.add_argument('--seed', type=int, default=0, help='Semilla de datos y candidatas')
+        parser.add_argument('--json', action='store_true', help='Salida JSON')
+
+    def handle(self, *args, **options):
+        try:
+            tamanos = [int(x) for x in options['sizes'].split(',') if x.strip()]
+        except ValueError:
+            raise CommandError('--sizes debe ser una lista de enteros')
+
+        nombre_original = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        resultados = []
+        try:
+            generador = GeneradorDiagramas(seed=options['seed'])
+            for tamano in tamanos:
+                diagrama, filas = generador.generar_diagrama(PerfilGeneracion(classes=tamano, shape='mixed'))
+                resultado = self._medir(str(diagrama.id), options)
+                resultado.update({'classes': tamano, 'relationships': filas['relationships']})
+                resultados.append(resultado)
+        finally:
+            connection.creation.destroy_test_db(nombre_original, verbosity=0)
+
+        if options['json']:
+            self.stdout.write(json.dumps({'benchmark': 'validation', 'results': resultados}, indent=2))
+            return
+        self.stdout.write(f"{'clases':>7} {'rels':>7} {'build_ms':>9} {'full_ms':>8} {'checks/s':>10} "
+                          f"{'p50_us':>7} {'p99_us':>7} {'post_p50_ms':>11}")
+        for r in resultados:
+            self.stdout.write(
+                f"{r['classes']:>7} {r['relationships']:>7} {r['index_build_ms']:>9.1f} {r['full_ms']:>8.1f} "
+                f"{r['checks_per_s']:>10.0f} {r['check_p50_us']:>7.1f} {r['check_p99_us']:>7.1f} "
+                f"{r.get('post_p50_ms', 0):>11.1f}"
+            )
+
+    def _medir(self, diagrama_id: str, options) -> dict:
+        grafo = ServicioGrafo()
+        validacion = ServicioValidacion()
+        rnd = random.Random(options['seed'])
+
+        grafo.cache.invalidar(diagrama_id)
+        t0 = time.perf_counter()
+        indice = grafo.obtener_indice(diagrama_id)
+        construccion_ms = (time.perf_counter() - t0) * 1000
+
+        completa = validacion.validar_diagrama(diagrama_id)
+
+        clases = sorted(indice.nodos)
+        tiempos = []
+        rechazadas = 0
+        for _ in range(options['checks']):
+            desde, hasta = rnd.choice(clases), rnd.choice(clases)
+            t0 = time.perf_counter_ns()
+            diagnosticos = validacion.validar_relacion(indice, desde, hasta, rnd.choice(_TIPOS))
+            tiempos.append((time.perf_counter_ns() - t0) / 1000)
+            rechazadas += bool(diagnosticos)
+
+        resultado = {
+            'index_build_ms': round(construccion_ms, 1),
+            'full_ms': completa['elapsed_ms'],
+            'full_diagnostics': len(completa['diagnostics']),
+            'checks': len(tiempos),
+            'rejected': rechazadas,
+            'checks_per_s': round(len(tiempos) / (sum(tiempos) / 1e6), 0) if tiempos else 0,
+            'check_p50_us': round(statistics.median(tiempos), 1) if tiempos else 0,
+            'check_p99_us': round(_percentil(tiempos, 0.99), 1) if tiempos else 0,
+        }
+        if options['requests']:
+            resultado['post_p50_ms'] = self._medir_api(clases, options['requests'], rnd)
+        return resultado
+
+    def _medir_api(self, clases, cantidad: int, rnd: random.Random) -> float:
+        """Alta de relaciones de asociación vía API: validación + escritura + índice incremental"""
+        from rest_framework.test import APIClient
+
+        cliente = APIClient()
+        tiempos = []
+        for _ in range(cantidad):
+            t0 = time.perf_counter()
+            with override_settings(ALLOWED_HOSTS=['testserver']):
+                respuesta = cliente.post('/api/app/diagrams/relationships/', {
+                    'from_class': rnd.choice(clases), 'to_class': rnd.choice(clases),
+                    'relationship_type': 'association', 'cardinality_from': '1', 'cardinality_to': '*',
+                }, format='json')
+            tiempos.append((time.perf_counter() - t0) * 1000)
+            if respuesta.status_code != 201:
+                raise CommandError(f'POST /relationships/ respondió {respuesta.status_code}: {respuesta.content[:200]}')
+        return round(statistics.median(tiempos), 2)
@@ -0,0 +1,118 @@
+"""
+Comando de gestión para medir las consultas por viewport.
+Siembra diagramas en una base de prueba aislada y compara la latencia de leer
+una ventana del lienzo (GET /viewport/) contra el retrieve completo según el tamaño.
+"""
+import json
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Max
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from apps.diagrams.models import EntidadClase
+from apps.diagrams.services import GeneradorDiagramas
+from apps.diagrams.services.diagram_generator import PerfilGeneracion
+
+BASE = '/api/app/diagrams/diagrams'
+
+
+def _percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p))]
+
+
+class Command(BaseCommand):
+    help = 'Mide GET /viewport/ frente al retrieve completo para diagramas de distintos tamaños'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1000,5000,20000', help='Número de clases por diagrama')
+        parser.add_argument('--width', type=int, default=1920, help='Ancho de la ventana')
+        parser.add_argument('--height', type=int, default=1080, help='Alto de la ventana')
+        parser.add_argument('--padding', type=int, default=200, help='Margen alrededor de la ventana')
+        parser.add_argument('--requests', type=int, default=50, help='Ventanas aleatorias por tamaño')
+        parser.add_argument('--retrieve-max', type=int, default=5000,
+                            help='No medir el retrieve completo por encima de este tamaño')
+        parser.add_argument('--no-index', action='store_true',
+                            help='Eliminar el índice de viewport para comparar')
+        parser.add_argument('--json', action='store_true', help='Salida JSON')
+
+    def handle(self, *args, **options):
+        try:
+            tamanos = [int(x) for x in options['sizes'].split(',') if x.strip()]
+        except ValueError:
+            raise CommandError('--sizes debe ser una lista de enteros')
+
+        nombre_original = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        resultados = []
+        try:
+            if options['no_index']:
+                with connection.schema_editor() as editor:
+                    for indice in EntidadClase._meta.indexes:
+                        editor.remove_index(EntidadClase, indice)
+            generador = GeneradorDiagramas(seed=0)
+            with override_settings(ALLOWED_HOSTS=['testserver']):
+                for tamano in tamanos:
+                    diagrama, filas = generador.generar_diagrama(PerfilGeneracion(classes=tamano, shape='mixed'))
+                    resultado = self._medir(str(diagrama.id), tamano, options)
+                    resultado.update({'classes': tamano, 'relationships': filas['relationships']})
+                    resultados.append(resultado)
+        finally:
+            connection.creation.destroy_test_db(nombre_original, verbosity=0)
+
+        if options['json']:
+            self.stdout.write(json.dumps({'benchmark': 'viewport', 'index': not options['no_index'],
+                                          'results': resultados}, indent=2))
+            return
+        self.stdout.write(f"{'clases':>7} {'visibles':>8} {'p50_ms':>7} {'p99_ms':>7} {'queries':>7} "
+                          f"{'KB':>6} {'retrieve_ms':>11} {'retrieve_KB':>11}")
+        for r in resultados:
+            self.stdout.write(
+                f"{r['classes']:>7} {r['visible_p50']:>8} {r['p50_ms']:>7.1f} {r['p99_ms']:>7.1f} "
+                f"{r['queries']:>7} {r['kb_p50']:>6.1f} {r.get('retrieve_ms', 0):>11.1f} "
+                f"{r.get('retrieve_kb', 0):>11.1f}"
+            )
+
+    def _medir(self, diagrama_id: str, tamano: int, options) -> dict:
+        from rest_framework.test import APIClient
+
+        cliente = APIClient()
+        rnd = random.Random(tamano)
+        limites = EntidadClase.objects.filter(diagram_id=diagrama_id).aggregate(x=Max('position_x'),
+                                                                                y=Max('position_y'))
+        ancho_max, alto_max = limites['x'] or 0, limites['y'] or 0
+
+        tiempos, visibles, tamanos_kb, consultas = [], [], [], 0
+        for _ in range(options['requests']):
+            x = rnd.randint(0, max(0, ancho_max - options['width']))
+            y = rnd.randint(0, max(0, alto_max - options['height']))
+            with CaptureQueriesContext(connection) as capturadas:
+                t0 = time.perf_counter()
+                respuesta = cliente.get(f'{BASE}/{diagrama_id}/viewport/', {
+                    'x': x, 'y': y, 'width': options['width'], 'height': options['height'],
+                    'padding': options['padding'],
+                })
+                tiempos.append((time.perf_counter() - t0) * 1000)
+            if respuesta.status_code != 200:
+                raise CommandError(f'GET /viewport/ respondió {respuesta.status_code}: {respuesta.content[:200]}')
+            consultas = max(consultas, len(capturadas))
+            visibles.append(len(respuesta.json()['classes']))
+            tamanos_kb.append(len(respuesta.content) / 1024)
+
+        resultado = {
+            'p50_ms': round(statistics.median(tiempos), 2),
+            'p99_ms': round(_percentil(tiempos, 0.99), 2),
+            'queries': consultas,
+            'visible_p50': int(statistics.median(visibles)),
+            'kb_p50': round(statistics.median(tamanos_kb), 1),
+        }
+        if tamano <= options['retrieve_max']:
+            t0 = time.perf_counter()
+            respuesta = cliente.get(f'{BASE}/{diagrama_id}/')
+            resultado['retrieve_ms'] = round((time.perf_counter() - t0) * 1000, 1)
+            resultado['retrieve_kb'] = round(len(respuesta.content) / 1024, 1)
+        return resultado
@@ -0,0 +1,39 @@
+"""
+Comando de gestión para exportar diagramas a NDJSON.
+Recorre el corpus con consultas por lotes (.iterator) y escribe una línea por
+fila, por lo que la memoria se mantiene constante.
+"""
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.diagrams.services import ServicioExportacion
+
+
+class Command(BaseCommand):
+    help = 'Exporta diagramas (clases, atributos y relaciones) como NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default='-', help='Archivo destino (- para stdout)')
+        parser.add_argument('--ids', default='', help='IDs de diagramas separados por coma (por defecto todos)')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Filas por lote de lectura')
+
+    def handle(self, *args, **options):
+        ids = [i for i in options['ids'].split(',') if i.strip()] or None
+        exportador = ServicioExportacion(chunk_size=options['chunk_size'])
+
+        t0 = time.perf_counter()
+        lineas = 0
+        destino = sys.stdout if options['output'] == '-' else open(options['output'], 'w', encoding='utf-8')
+        try:
+            for linea in exportador.exportar(ids):
+                destino.write(linea)
+                lineas += 1
+        finally:
+            if destino is not sys.stdout:
+                destino.close()
+
+        if options['output'] != '-':
+            dt = time.perf_counter() - t0
+            self.stdout.write(self.style.SUCCESS(f"✓ {lineas} filas exportadas en {dt:.2f}s a {options['output']}"))
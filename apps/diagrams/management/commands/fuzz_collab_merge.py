@@ -0,0 +1,254 @@
+"""
+Comando de gestión para fuzzing de convergencia del registro secuenciado.
+Simula C clientes editando las mismas clases a la vez (renombrar, mover, alta,
+baja y cambio de tipo de atributos) con entregas intercaladas al azar. Cada
+cliente muestra su edición al instante: su réplica es el estado confirmado por
+los eventos del servidor (aplicados en orden de seq) más sus ediciones aún sin
+eco (op_id). Al final comprueba:
+
+- convergencia: todas las réplicas son iguales entre sí y al estado del servidor;
+- determinismo: reproducir el registro en un almacén nuevo da el mismo estado;
+- intención: ninguna edición deliberada se pierde salvo frente a otra edición
+  deliberada posterior o concurrente del mismo campo (las instantáneas
+  desfasadas no revierten nada).
+
+Con --mode relay los clientes no envían base_seq (comportamiento anterior:
+gana el último en llegar) para comparar las ediciones perdidas.
+
+Convergencia, determinismo y huecos son obligatorios (CommandError). Las
+pérdidas se informan: con `previous` la intención es exacta, pero una
+instantánea sin `previous` no distingue una edición nueva de un valor propio
+aún sin eco que el servidor ya descartó, así que con --snapshot alto puede
+quedar alguna residual (frente a miles en relay).
+"""
+import asyncio
+import copy
+import json
+import random
+from collections import deque
+from typing import Any, Dict, List
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.diagrams.realtime.secuencia import AlmacenMemoria, SecuenciadorSalas
+
+SALA = 'fuzz'
+TIPOS = ['String', 'Integer', 'Boolean', 'Date', 'Float']
+
+
+def _clave_attr(attr: Dict) -> str:
+    return attr['name']
+
+
+class _Cliente:
+    """Réplica = estado confirmado por el servidor + ediciones propias aún sin eco"""
+
+    def __init__(self, nombre: str, inicial: Dict[str, Dict], secuencia: bool):
+        self.nombre = nombre
+        self.confirmado = copy.deepcopy(inicial)
+        self.pendientes: List[tuple] = []
+        self.secuencia = secuencia
+        self.ultimo_seq = 0
+        self.salida: deque = deque()
+        self.entrada: deque = deque()
+        self.huecos = 0
+        self.ops = 0
+
+    @property
+    def replica(self) -> Dict[str, Dict]:
+        replica = copy.deepcopy(self.confirmado)
+        for _, clase_id, editar in self.pendientes:
+            editar(replica[clase_id])
+        return replica
+
+    def aplicar(self, evento: Dict[str, Any]):
+        payload = evento['payload']
+        if payload['seq'] != self.ultimo_seq + 1:
+            self.huecos += 1
+        self.ultimo_seq = payload['seq']
+        clase = self.confirmado[payload['id']]
+        for campo in ('name', 'position', 'attributes'):
+            if campo in payload:
+                clase[campo] = copy.deepcopy(payload[campo])
+        # Eco de una edición propia: deja de estar pendiente
+        self.pendientes = [p for p in self.pendientes if p[0] != payload.get('op_id')]
+
+
+class Command(BaseCommand):
+    help = 'Fuzz de convergencia e intención para la fusión de ediciones concurrentes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seeds', type=int, default=200, help='Semillas a probar')
+        parser.add_argument('--clients', type=int, default=4, help='Clientes por sala')
+        parser.add_argument('--classes', type=int, default=3, help='Clases editadas (pocas = más conflictos)')
+        parser.add_argument('--ops', type=int, default=200, help='Ediciones por semilla')
+        parser.add_argument('--snapshot', type=float, default=0.5,
+                            help='Fracción de ediciones enviadas como instantánea completa (sin previous)')
+        parser.add_argument('--mode', choices=['merge', 'relay', 'both'], default='both')
+        parser.add_argument('--json', action='store_true', help='Salida JSON')
+
+    def handle(self, *args, **options):
+        modos = ['merge', 'relay'] if options['mode'] == 'both' else [options['mode']]
+        resumen = {}
+        for modo in modos:
+            totales = {'seeds': 0, 'diverged': 0, 'replay_mismatch': 0, 'gaps': 0, 'ops': 0,
+                       'intentional': 0, 'lost': 0}
+            for semilla in range(options['seeds']):
+                r = asyncio.run(self._semilla(semilla, options, secuencia=(modo == 'merge')))
+                totales['seeds'] += 1
+                for clave in ('diverged', 'replay_mismatch', 'gaps', 'ops', 'intentional', 'lost'):
+                    totales[clave] += r[clave]
+            resumen[modo] = totales
+
+        if options['json']:
+            self.stdout.write(json.dumps({'benchmark': 'collab_merge_fuzz', 'results': resumen}, indent=2))
+        else:
+            self.stdout.write(f"{'modo':>6} {'semillas':>8} {'ops':>7} {'divergen':>8} {'replay':>6} "
+                              f"{'huecos':>6} {'deliberadas':>11} {'perdidas':>8}")
+            for modo, t in resumen.items():
+                self.stdout.write(f"{modo:>6} {t['seeds']:>8} {t['ops']:>7} {t['diverged']:>8} "
+                                  f"{t['replay_mismatch']:>6} {t['gaps']:>6} {t['intentional']:>11} {t['lost']:>8}")
+        fallos = resumen.get('merge', {})
+        if fallos.get('diverged') or fallos.get('replay_mismatch') or fallos.get('gaps'):
+            raise CommandError('La fusión secuenciada no converge')
+
+    async def _semilla(self, semilla: int, options, secuencia: bool) -> Dict[str, int]:
+        rnd = random.Random(semilla)
+        inicial = {
+            f'c{i}': {
+                'id': f'c{i}', 'name': f'Clase{i}', 'position': {'x': i * 240, 'y': 0},
+                'attributes': [{'name': f'a{j}', 'type': 'String'} for j in range(3)],
+            }
+            for i in range(options['classes'])
+        }
+        servidor = SecuenciadorSalas(AlmacenMemoria())
+        servidor.entrar(SALA)
+        clientes = [_Cliente(f'u{n}', inicial, secuencia) for n in range(options['clients'])]
+        registro: List[tuple] = []
+        # Ediciones deliberadas: (seq, base_seq, campo lógico, valor) con campo lógico clase.campo[.attr]
+        deliberadas: List[Dict[str, Any]] = []
+        generadas = 0
+
+        async def procesar(cliente: _Cliente):
+            event_type, payload, intencion = cliente.salida.popleft()
+            saliente = await servidor.secuenciar(SALA, event_type, payload, cliente.nombre)
+            registro.append((event_type, payload, cliente.nombre))
+            intencion['seq'] = saliente['seq']
+            deliberadas.append(intencion)
+            for c in clientes:
+                c.entrada.append({'type': 'class_updated', 'payload': saliente})
+
+        while generadas < options['ops'] or any(c.salida or c.entrada for c in clientes):
+            cliente = rnd.choice(clientes)
+            accion = rnd.random()
+            if accion < 0.35 and generadas < options['ops']:
+                cliente.salida.append(self._editar(rnd, cliente, options['snapshot']))
+                generadas += 1
+            elif accion < 0.65 and cliente.salida:
+                await procesar(cliente)
+            elif cliente.entrada:
+                cliente.aplicar(cliente.entrada.popleft())
+
+        # Convergencia
+        referencia = clientes[0].replica
+        divergen = int(any(c.replica != referencia for c in clientes[1:]))
+        estado = self._estado_servidor(servidor.almacen, referencia)
+        divergen |= int(estado != {k: {c: v[c] for c in estado[k]} for k, v in referencia.items() if k in estado})
+
+        # Determinismo: el mismo registro en un almacén nuevo produce el mismo estado
+        otro = SecuenciadorSalas(AlmacenMemoria())
+        for event_type, payload, autor in registro:
+            await otro.secuenciar(SALA, event_type, payload, autor)
+        replay = int(self._estado_servidor(otro.almacen, referencia) != estado)
+
+        return {
+            'diverged': divergen, 'replay_mismatch': replay, 'gaps': sum(c.huecos for c in clientes),
+            'ops': generadas, 'intentional': len(deliberadas),
+            'lost': self._perdidas(deliberadas, referencia),
+        }
+
+    def _editar(self, rnd: random.Random, cliente: _Cliente, fraccion_instantanea: float):
+        """Una edición sobre la réplica (posiblemente desfasada) del cliente; se aplica en local al momento"""
+        replica = cliente.replica
+        clase_id = rnd.choice(sorted(replica))
+        previa = replica[clase_id]
+        tipo = rnd.choice(['rename', 'move', 'add', 'remove', 'retype'])
+        attrs = previa['attributes']
+        if tipo == 'rename':
+            valor = f'{clase_id}-{cliente.nombre}-{rnd.randrange(10 ** 6)}'
+            editar = lambda c, v=valor: c.__setitem__('name', v)  # noqa: E731
+            intencion = {'campo': f'{clase_id}.name', 'valor': valor}
+        elif tipo == 'move' or (tipo in ('remove', 'retype') and not attrs):
+            valor = {'x': rnd.randrange(5000), 'y': rnd.randrange(5000)}
+            editar = lambda c, v=valor: c.__setitem__('position', dict(v))  # noqa: E731
+            intencion = {'campo': f'{clase_id}.position', 'valor': valor}
+        elif tipo == 'add':
+            nuevo = {'name': f'{cliente.nombre}_{rnd.randrange(10 ** 6)}', 'type': rnd.choice(TIPOS)}
+            editar = lambda c, v=nuevo: c['attributes'].append(dict(v))  # noqa: E731
+            intencion = {'campo': f'{clase_id}.attributes.{nuevo["name"]}', 'valor': nuevo}
+        elif tipo == 'remove':
+            nombre = rnd.choice(attrs)['name']
+            editar = lambda c, n=nombre: c.__setitem__(  # noqa: E731
+                'attributes', [a for a in c['attributes'] if a['name'] != n])
+            intencion = {'campo': f'{clase_id}.attributes.{nombre}', 'valor': None}
+        else:
+            attr = copy.deepcopy(rnd.choice(attrs))
+            attr['type'] = rnd.choice([t for t in TIPOS if t != attr['type']])
+            # Como en el servidor, editar un atributo borrado por otro lo vuelve a dar de alta
+            editar = lambda c, v=attr: c.__setitem__(  # noqa: E731
+                'attributes', [a for a in c['attributes'] if a['name'] != v['name']] + [dict(v)])
+            intencion = {'campo': f'{clase_id}.attributes.{attr["name"]}', 'valor': attr}
+
+        actual = copy.deepcopy(previa)
+        editar(actual)
+        cliente.ops += 1
+        op_id = f'{cliente.nombre}:{cliente.ops}'
+        cliente.pendientes.append((op_id, clase_id, editar))
+        payload: Dict[str, Any] = {**copy.deepcopy(actual), 'op_id': op_id}
+        if cliente.secuencia:
+            payload['base_seq'] = cliente.ultimo_seq
+        if rnd.random() >= fraccion_instantanea:
+            # Igual que el consumidor: previous + delta de los campos cambiados
+            payload['previous'] = previa
+            payload['delta'] = {k: v for k, v in actual.items() if previa.get(k) != v}
+        intencion['base_seq'] = cliente.ultimo_seq
+        return 'class_update', payload, intencion
+
+    @staticmethod
+    def _estado_servidor(almacen: AlmacenMemoria, referencia: Dict[str, Dict]) -> Dict[str, Dict]:
+        estado = almacen._salas.get(SALA, {'reg': {}, 'set': {}})
+        vista: Dict[str, Dict] = {}
+        for clave, (valor, _, _) in estado['reg'].items():
+            _, clase_id, campo = clave.split(':', 2)
+            vista.setdefault(clase_id, {})[campo] = valor
+        for clave, elementos in estado['set'].items():
+            _, clase_id, campo = clave.split(':', 2)
+            vivos = sorted((e for e in elementos.values() if not e[2]), key=lambda e: (e[0], e[1]['name']))
+            vista.setdefault(clase_id, {})[campo] = [e[1] for e in vivos]
+        return vista
+
+    @staticmethod
+    def _perdidas(deliberadas: List[Dict[str, Any]], final: Dict[str, Dict]) -> int:
+        """Ediciones deliberadas cuyo efecto no está en el estado final sin otra deliberada que lo explique"""
+        def valor_final(campo: str):
+            partes = campo.split('.')
+            clase = final[partes[0]]
+            if len(partes) == 2:
+                return clase[partes[1]]
+            return next((a for a in clase['attributes'] if _clave_attr(a) == partes[2]), None)
+
+        perdidas = 0
+        por_campo: Dict[str, List[Dict]] = {}
+        for d in deliberadas:
+            por_campo.setdefault(d['campo'], []).append(d)
+        for campo, ediciones in por_campo.items():
+            for d in ediciones:
+                if valor_final(campo) == d['valor']:
+                    continue
+                # Otra edición deliberada posterior o concurrente del mismo campo justifica el cambio
+                explicada = any(
+                    o is not d and (o['seq'] > d['seq'] or o['seq'] > d['base_seq'] and d['seq'] > o['base_seq'])
+                    for o in ediciones
+                )
+                perdidas += int(not explicada)
+        return perdidas
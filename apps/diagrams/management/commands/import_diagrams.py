@@ -0,0 +1,52 @@
+"""
+Comando de gestión para importar diagramas desde NDJSON.
+Conserva los ids, carga por lotes (COPY en PostgreSQL, INSERT por lotes en
+SQLite) y es reanudable: guarda la última línea volcada en un checkpoint.
+"""
+import json
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.diagrams.services import ServicioExportacion
+
+
+class Command(BaseCommand):
+    help = 'Importa diagramas desde un archivo NDJSON generado por export_diagrams'
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', help='Archivo NDJSON de origen')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Filas por volcado')
+        parser.add_argument('--checkpoint', default='', help='Archivo de checkpoint (por defecto <input>.checkpoint)')
+        parser.add_argument('--restart', action='store_true', help='Ignorar el checkpoint y empezar desde el inicio')
+
+    def handle(self, *args, **options):
+        origen = options['input']
+        if not os.path.exists(origen):
+            raise CommandError(f'No existe el archivo {origen}')
+        checkpoint = options['checkpoint'] or f'{origen}.checkpoint'
+
+        saltar = 0
+        if os.path.exists(checkpoint) and not options['restart']:
+            with open(checkpoint, encoding='utf-8') as f:
+                saltar = json.load(f).get('line', 0)
+            self.stdout.write(self.style.WARNING(f'Reanudando desde la línea {saltar + 1}'))
+
+        def guardar_checkpoint(linea: int):
+            with open(checkpoint, 'w', encoding='utf-8') as f:
+                json.dump({'line': linea}, f)
+
+        t0 = time.perf_counter()
+        with open(origen, encoding='utf-8') as f:
+            try:
+                totales = ServicioExportacion().importar(
+                    f, batch_size=options['batch_size'], saltar=saltar, on_checkpoint=guardar_checkpoint
+                )
+            except ValueError as e:
+                raise CommandError(str(e))
+        dt = time.perf_counter() - t0
+
+        for modelo, cantidad in totales.items():
+            self.stdout.write(f'  {modelo}: {cantidad}')
+        self.stdout.write(self.style.SUCCESS(f'✓ Importación completa en {dt:.2f}s (checkpoint: {checkpoint})'))
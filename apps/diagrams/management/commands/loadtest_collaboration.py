@@ -0,0 +1,245 @@
+"""
+Comando de gestión para generar carga WebSocket sobre las salas de colaboración.
+Simula R salas x U usuarios contra diagram_backend.asgi.application usando
+WebsocketCommunicator (en proceso, sin Daphne) y reporta latencia de fan-out,
+mensajes por segundo, CPU y memoria por conexión. Las reconexiones (rejoin)
+presentan el último seq visto y se mide cuántas se reanudan sin estado completo.
+"""
+import asyncio
+import json
+import random
+import resource
+import time
+import tracemalloc
+from typing import Dict, List
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+MEZCLA_POR_DEFECTO = 'class_update=0.7,relationship_update=0.2,rejoin=0.1'
+
+
+def _percentil(valores: List[float], p: float) -> float:
+    if not valores:
+        return 0.0
+    return valores[min(len(valores) - 1, int(len(valores) * p))]
+
+
+class _Usuario:
+    """Cliente simulado: emite eventos a ritmo fijo y mide lo que recibe"""
+
+    def __init__(self, app, sala: str, indice: int, stats: Dict):
+        self.app = app
+        self.sala = sala
+        self.indice = indice
+        self.stats = stats
+        self.comunicador = None
+        self._lector = None
+        # Último seq y época vistos: se presentan al reconectar para reanudar la sesión
+        self.ultimo_seq = None
+        self.epoch = ''
+        self._repuestos = 0
+
+    async def conectar(self):
+        from channels.testing import WebsocketCommunicator
+        ruta = f'/ws/collaboration/{self.sala}/'
+        if self.ultimo_seq is not None:
+            ruta += f'?last_seq={self.ultimo_seq}&epoch={self.epoch}'
+        self.comunicador = WebsocketCommunicator(self.app, ruta)
+        conectado, _ = await self.comunicador.connect()
+        if not conectado:
+            raise RuntimeError(f'No se pudo conectar a la sala {self.sala}')
+        self.stats['joins'] += 1
+        self._lector = asyncio.create_task(self._leer())
+
+    async def desconectar(self):
+        if self._lector:
+            self._lector.cancel()
+        if self.comunicador:
+            await self.comunicador.disconnect()
+            self.stats['leaves'] += 1
+        self.comunicador = None
+
+    async def _leer(self):
+        while True:
+            try:
+                texto = await self.comunicador.receive_from(timeout=3600)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                return
+            mensaje = json.loads(texto)
+            payload = mensaje.get('payload') or {}
+            if mensaje.get('type') == 'sequence':
+                if 'resumed' in payload:
+                    self.stats['resumed' if payload['resumed'] else 'full_state'] += 1
+                    self.stats['replayed'] += payload.get('replayed', 0)
+                    # Los eventos repuestos llegan justo detrás: no cuentan como latencia de fan-out
+                    self._repuestos = payload.get('replayed', 0)
+                self.ultimo_seq, self.epoch = payload.get('seq'), payload.get('epoch', '')
+            elif isinstance(payload.get('seq'), int) and payload.get('epoch') == self.epoch:
+                self.ultimo_seq = max(self.ultimo_seq or 0, payload['seq'])
+            enviado = payload.get('sentAt')
+            if enviado is not None and self._repuestos:
+                self._repuestos -= 1
+            elif enviado is not None:
+                self.stats['received'] += 1
+                self.stats['latencias'].append(time.perf_counter() - enviado)
+
+    async def emitir(self, tipo: str):
+        n = self.stats['sent']
+        if tipo == 'class_update':
+            payload = {
+                'id': f'class-{n % 50}',
+                'position': {'x': random.randint(0, 4000), 'y': random.randint(0, 4000)},
+            }
+        else:
+            payload = {'id': f'rel-{n % 20}', 'type': 'association', 'cardinality': {'from': '1', 'to': '*'}}
+        payload['sentAt'] = time.perf_counter()
+        await self.comunicador.send_to(text_data=json.dumps({'type': tipo, 'payload': payload}))
+        self.stats['sent'] += 1
+
+
+class Command(BaseCommand):
+    help = 'Genera carga de colaboración WebSocket (R salas x U usuarios) y mide latencia de fan-out'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rooms', type=int, default=5, help='Número de salas (R)')
+        parser.add_argument('--users', type=int, default=10, help='Usuarios por sala (U)')
+        parser.add_argument('--duration', type=float, default=10.0, help='Duración en segundos')
+        parser.add_argument('--rate', type=float, default=2.0, help='Eventos por segundo por usuario')
+        parser.add_argument('--mix', default=MEZCLA_POR_DEFECTO,
+                            help='Pesos de eventos: class_update, relationship_update, rejoin')
+        parser.add_argument('--layer', choices=['memory', 'redis'], default='memory', help='Capa de canales')
+        parser.add_argument('--redis-url', default='', help='URL de Redis para --layer redis')
+        parser.add_argument('--fanout', choices=['group', 'node'], default='group', help='Modo de fan-out')
+        parser.add_argument('--offline', type=float, default=0.5,
+                            help='Segundos desconectado en cada rejoin (eventos que se pierde el cliente)')
+        parser.add_argument('--seed', type=int, default=1, help='Semilla para reproducibilidad')
+        parser.add_argument('--output', default='', help='Archivo donde guardar el resultado JSON')
+
+    def handle(self, *args, **options):
+        try:
+            mezcla = {}
+            for parte in options['mix'].split(','):
+                clave, peso = parte.split('=')
+                mezcla[clave.strip()] = float(peso)
+        except ValueError:
+            raise CommandError('--mix debe tener la forma tipo=peso,tipo=peso')
+        desconocidos = set(mezcla) - {'class_update', 'relationship_update', 'rejoin'}
+        if desconocidos:
+            raise CommandError(f'Tipos de evento no soportados en --mix: {sorted(desconocidos)}')
+
+        if options['layer'] == 'redis':
+            if not options['redis_url']:
+                raise CommandError('--layer redis requiere --redis-url')
+            capas = {'default': {
+                'BACKEND': 'channels_redis.core.RedisChannelLayer',
+                'CONFIG': {'hosts': [options['redis_url']]},
+            }}
+            redis_url = options['redis_url']
+        else:
+            capas = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+            redis_url = ''
+
+        random.seed(options['seed'])
+        with override_settings(CHANNEL_LAYERS=capas, COLLAB_FANOUT_MODE=options['fanout'], REDIS_URL=redis_url):
+            resultado = asyncio.run(self._ejecutar(options, mezcla))
+
+        texto = json.dumps(resultado, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(texto)
+            self.stdout.write(self.style.SUCCESS(f"Resultado guardado en {options['output']}"))
+        self.stdout.write(texto)
+
+    async def _ejecutar(self, options, mezcla: Dict[str, float]) -> Dict:
+        from apps.diagrams.realtime import obtener_historial
+        from apps.diagrams.realtime.limites import ESTADISTICAS as limites
+        from diagram_backend.asgi import application
+
+        stats = {'sent': 0, 'received': 0, 'joins': 0, 'leaves': 0, 'latencias': [],
+                 'resumed': 0, 'full_state': 0, 'replayed': 0}
+        usuarios = [
+            _Usuario(application, f'loadtest-{r}', u, stats)
+            for r in range(options['rooms'])
+            for u in range(options['users'])
+        ]
+
+        tracemalloc.start()
+        memoria_inicial = tracemalloc.get_traced_memory()[0]
+        await asyncio.gather(*(u.conectar() for u in usuarios))
+        memoria_conexiones = tracemalloc.get_traced_memory()[0] - memoria_inicial
+        tracemalloc.stop()
+
+        tipos = list(mezcla)
+        pesos = [mezcla[t] for t in tipos]
+        intervalo = 1.0 / options['rate'] if options['rate'] > 0 else options['duration']
+        fin = time.perf_counter() + options['duration']
+
+        async def ciclo(usuario: _Usuario):
+            # Desfase inicial para no sincronizar todos los emisores
+            await asyncio.sleep(random.random() * intervalo)
+            while time.perf_counter() < fin:
+                tipo = random.choices(tipos, pesos)[0]
+                if tipo == 'rejoin':
+                    await usuario.desconectar()
+                    await asyncio.sleep(options['offline'])
+                    await usuario.conectar()
+                else:
+                    await usuario.emitir(tipo)
+                await asyncio.sleep(intervalo)
+
+        uso_inicial = resource.getrusage(resource.RUSAGE_SELF)
+        t0 = time.perf_counter()
+        await asyncio.gather(*(ciclo(u) for u in usuarios))
+        # Margen para que terminen de llegar los últimos mensajes
+        await asyncio.sleep(0.5)
+        transcurrido = time.perf_counter() - t0
+        uso_final = resource.getrusage(resource.RUSAGE_SELF)
+
+        await asyncio.gather(*(u.desconectar() for u in usuarios), return_exceptions=True)
+
+        historial = obtener_historial()
+        cpu = (uso_final.ru_utime - uso_inicial.ru_utime) + (uso_final.ru_stime - uso_inicial.ru_stime)
+        latencias = sorted(x * 1000 for x in stats['latencias'])
+        return {
+            'benchmark': 'loadtest_collaboration',
+            'config': {
+                'rooms': options['rooms'],
+                'users_per_room': options['users'],
+                'duration_s': options['duration'],
+                'rate_per_user': options['rate'],
+                'mix': mezcla,
+                'layer': options['layer'],
+                'fanout': options['fanout'],
+                'offline_s': options['offline'],
+                'seed': options['seed'],
+            },
+            'connections': len(usuarios),
+            'sent': stats['sent'],
+            'delivered': stats['received'],
+            'joins': stats['joins'],
+            'leaves': stats['leaves'],
+            'elapsed_s': round(transcurrido, 3),
+            'sent_per_s': round(stats['sent'] / transcurrido, 1),
+            'delivered_per_s': round(stats['received'] / transcurrido, 1),
+            'latency_ms': {
+                'p50': round(_percentil(latencias, 0.50), 3),
+                'p90': round(_percentil(latencias, 0.90), 3),
+                'p99': round(_percentil(latencias, 0.99), 3),
+                'max': round(latencias[-1], 3) if latencias else 0.0,
+            },
+            'cpu_s': round(cpu, 3),
+            'cpu_utilization': round(cpu / transcurrido, 3),
+            'memory_per_connection_bytes': memoria_conexiones // max(1, len(usuarios)),
+            'resume': {
+                'attempts': stats['resumed'] + stats['full_state'],
+                'resumed': stats['resumed'],
+                'full_state': stats['full_state'],
+                'hit_rate': round(stats['resumed'] / max(1, stats['resumed'] + stats['full_state']), 4),
+                'events_replayed': stats['replayed'],
+                'server': historial.estadisticas() if historial is not None else None,
+            },
+            'rate_limit': dict(limites),
+        }
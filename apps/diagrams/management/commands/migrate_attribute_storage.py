@@ -0,0 +1,46 @@
+"""
+Comando de gestión para convertir los atributos de las clases existentes entre
+filas de class_attributes ('rows') y la lista compacta de
+class_entities.attributes_inline ('inline'), por lotes de clases, cada uno en su
+transacción (se puede interrumpir y relanzar). Conviene ejecutarlo junto al cambio
+de CLASS_ATTRIBUTE_STORAGE: las clases nuevas ya usan el formato del ajuste.
+"""
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from apps.diagrams.models.atributo_en_linea import EN_LINEA, FILAS
+from apps.diagrams.repositories import RepositorioAtributos
+
+
+class Command(BaseCommand):
+    help = "Convierte los atributos de las clases existentes a filas ('rows') o en línea ('inline')"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--to', choices=(EN_LINEA, FILAS), required=True, help='Formato de destino')
+        parser.add_argument('--batch', type=int, default=500, help='Clases por transacción')
+        parser.add_argument('--dry-run', action='store_true', help='Solo muestra el estado actual')
+
+    def handle(self, *args, **options):
+        repositorio = RepositorioAtributos()
+        antes = repositorio.contar()
+        self.stdout.write(f"Clases en filas: {antes['classes_rows']}  Clases en línea: {antes['classes_inline']}  "
+                          f"Filas de atributos: {antes['attribute_rows']}")
+        if options['dry_run']:
+            return
+        t0 = time.perf_counter()
+        if options['to'] == EN_LINEA:
+            totales = repositorio.convertir_a_en_linea(lote=options['batch'])
+        else:
+            totales = repositorio.convertir_a_filas(lote=options['batch'])
+        dt = time.perf_counter() - t0
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ {totales['classes']} clases y {totales['attributes']} atributos pasados a '{options['to']}' "
+            f"en {dt:.2f}s"
+        ))
+        if getattr(settings, 'CLASS_ATTRIBUTE_STORAGE', FILAS) != options['to']:
+            self.stdout.write(self.style.WARNING(
+                f"CLASS_ATTRIBUTE_STORAGE='{getattr(settings, 'CLASS_ATTRIBUTE_STORAGE', FILAS)}': las clases "
+                f"nuevas seguirán usando ese formato; cámbialo a '{options['to']}'"
+            ))
@@ -0,0 +1,19 @@
+"""
+Comando de gestión para emitir un token de perfilado de requests.
+Con el token en la cabecera `X-Profile` (o en `?profile=<token>`) PerformanceMiddleware
+perfila la request con cProfile y guarda el perfil descargable en
+health/profiles/<id>/?download=1 (ahí el token va en `X-Profile-Token`). Caduca a los PERF_PROFILE_TOKEN_TTL segundos.
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from diagram_backend.profiling import emitir_token
+
+
+class Command(BaseCommand):
+    help = 'Emite un token firmado para perfilar requests con la cabecera X-Profile'
+
+    def handle(self, *args, **options):
+        self.stdout.write(emitir_token())
+        self.stderr.write(f"Válido durante {settings.PERF_PROFILE_TOKEN_TTL}s. "
+                          f"Uso: curl -H 'X-Profile: <token>' ... y consulta la cabecera X-Profile-Id")
@@ -0,0 +1,41 @@
+"""
+Comando de gestión para purgar diagramas marcados como borrados.
+Elimina por lotes las filas de atributos, relaciones y clases de cada diagrama
+pendiente (ver services/purge_service.py). Útil con DIAGRAM_PURGE_MODE=manual
+o desde cron para recoger purgas interrumpidas.
+"""
+import json
+
+from django.core.management.base import BaseCommand
+
+from apps.diagrams.services.purge_service import ServicioPurga
+
+
+class Command(BaseCommand):
+    help = 'Purga por lotes las filas de los diagramas marcados como borrados'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=None, help='Máximo de diagramas a purgar')
+        parser.add_argument('--batch-size', type=int, default=None, help='Filas por DELETE (por defecto DIAGRAM_PURGE_BATCH)')
+        parser.add_argument('--json', action='store_true', help='Salida JSON')
+
+    def handle(self, *args, **options):
+        servicio = ServicioPurga(batch_size=options['batch_size'])
+        resultados = servicio.purgar_pendientes(limite=options['limit'])
+        estado = servicio.estado()
+
+        if options['json']:
+            self.stdout.write(json.dumps({'purged': resultados, **estado}, indent=2))
+            return
+
+        for r in resultados:
+            if 'error' in r:
+                self.stdout.write(self.style.ERROR(f"✗ {r['id']}: {r['error']}"))
+            else:
+                filas = '  '.join(f'{tabla}={n}' for tabla, n in r['rows'].items())
+                self.stdout.write(f"✓ {r['id']}  {filas}")
+        m = estado['metrics']
+        self.stdout.write(
+            f"Purgados: {len([r for r in resultados if 'error' not in r])}  Pendientes: {estado['pending']}  "
+            f"Lotes: {m['batches']}  Última purga: {m['last_purge_ms']} ms"
+        )
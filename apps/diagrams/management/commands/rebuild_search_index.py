@@ -0,0 +1,31 @@
+"""
+Comando de gestión para (re)construir el índice de búsqueda.
+Crea tablas FTS5/triggers (SQLite) o índices GIN pg_trgm (PostgreSQL) si faltan
+y los reconstruye desde las tablas de diagramas, clases y atributos.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from apps.diagrams.models import AtributoClase, Diagrama, EntidadClase
+from apps.diagrams.services.search_service import instalar_indice
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye el índice de búsqueda de diagramas, clases y atributos'
+
+    def handle(self, *args, **options):
+        t0 = time.perf_counter()
+        reconstruido = instalar_indice(connection, reconstruir=True)
+        dt = time.perf_counter() - t0
+        if not reconstruido:
+            self.stdout.write(self.style.WARNING(
+                f'Motor {connection.vendor}: sin índice dedicado, la búsqueda usa LIKE sin índice'
+            ))
+            return
+        self.stdout.write(
+            f'Diagramas: {Diagrama.objects.count()}  Clases: {EntidadClase.objects.count()}  '
+            f'Atributos: {AtributoClase.objects.count()}'
+        )
+        self.stdout.write(self.style.SUCCESS(f'✓ Índice de búsqueda ({connection.vendor}) reconstruido en {dt:.2f}s'))
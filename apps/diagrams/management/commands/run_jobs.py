@@ -0,0 +1,38 @@
+"""
+Comando de gestión para ejecutar la cola de trabajos en segundo plano.
+Arranca un conjunto de hilos que reclaman trabajos de la tabla `jobs`; se puede
+lanzar en varios procesos o máquinas a la vez (JOBS_AUTOSTART=false en la web).
+"""
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+
+from apps.diagrams.services.job_service import EjecutorTrabajos, ServicioTrabajos
+
+
+class Command(BaseCommand):
+    help = 'Ejecuta trabajos en segundo plano (duplicar, layout, exportar, importar, purgar)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None, help='Hilos (por defecto JOBS_WORKERS)')
+        parser.add_argument('--interval', type=float, default=None, help='Segundos entre sondeos de la cola')
+        parser.add_argument('--once', action='store_true', help='Procesar los trabajos listos y salir')
+
+    def handle(self, *args, **options):
+        ejecutor = EjecutorTrabajos(hilos=options['workers'], intervalo=options['interval'])
+        if options['once']:
+            ServicioTrabajos().recuperar_huerfanos()
+            procesados = ejecutor.procesar_pendientes()
+            self.stdout.write(self.style.SUCCESS(f'✓ {procesados} trabajos procesados'))
+            return
+
+        parar = threading.Event()
+        for senal in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(senal, lambda *_: parar.set())
+        ejecutor.iniciar()
+        self.stdout.write(f'Ejecutando trabajos con {ejecutor.hilos} hilos (Ctrl+C para salir)')
+        parar.wait()
+        self.stdout.write('Esperando a que terminen los trabajos en curso...')
+        ejecutor.detener()
+        self.stdout.write(self.style.SUCCESS('✓ Detenido'))
@@ -0,0 +1,351 @@
+"""
+Comando de gestión para servir la app ASGI con varios procesos Daphne.
+
+Un supervisor arranca N workers (intérpretes independientes) que comparten el puerto:
+con ``--mode reuseport`` cada worker abre su propio socket con SO_REUSEPORT y el
+kernel reparte las conexiones; con ``--mode prefork`` el supervisor abre un único
+socket y lo hereda cada worker. Antes de aceptar conexiones cada worker importa
+diagram_backend.asgi, comprueba las bases de datos, precarga los índices de grafo de
+los diagramas más recientes y pasa una request de calentamiento por la app ASGI (con
+SO_REUSEPORT el socket ni siquiera se abre hasta entonces).
+
+Señales del supervisor:
+- SIGTERM / SIGINT: parada ordenada. Cada worker deja de aceptar conexiones, cierra
+  los WebSocket con 4012 (reinicio del servicio: el cliente reconecta y reanuda) y
+  espera a las requests en curso hasta --graceful-timeout.
+- SIGHUP: reinicio escalonado. Arranca un worker nuevo, espera a que esté listo y
+  drena uno antiguo, de uno en uno, sin dejar de atender.
+Un worker que termina inesperadamente se vuelve a arrancar.
+
+Con más de un worker las salas de colaboración solo son coherentes si la capa de
+canales usa Redis (y con ella el secuenciador, el fan-out y las cubetas de sala): sin
+Redis el comando se niega salvo con --allow-local-layer (útil para medir solo HTTP).
+"""
+# daphne.server instala el reactor asyncio de Twisted: tiene que importarse antes que nada de Twisted
+import daphne.server  # isort:skip
+import logging
+import os
+import select
+import signal
+import socket
+import subprocess
+import sys
+import time
+from typing import List, Optional
+
+from asgiref.compatibility import guarantee_single_callable
+from daphne.access import AccessLogGenerator
+from daphne.server import Server
+from daphne.ws_protocol import WebSocketProtocol
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from twisted.internet import reactor
+
+logger = logging.getLogger(__name__)
+
+# Código de cierre de los WebSocket al drenar: el cliente reconecta (a otro worker) y reanuda.
+# Equivale a 1012 (reinicio del servicio), que Autobahn no deja enviar desde el servidor
+CIERRE_REINICIO = 4012
+# Arranques fallidos seguidos (worker que muere antes de estar listo) antes de rendirse
+MAX_FALLOS = 5
+
+
+def _socket_escucha(host: str, puerto: int, reuseport: bool, backlog: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuseport:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, puerto))
+    sock.listen(backlog)
+    sock.setblocking(False)
+    return sock
+
+
+class _Worker:
+    __slots__ = ('proceso', 'listo_fd', 'listo')
+
+    def __init__(self, proceso: subprocess.Popen, listo_fd: int):
+        self.proceso = proceso
+        self.listo_fd = listo_fd
+        self.listo = False
+
+    @property
+    def pid(self) -> int:
+        return self.proceso.pid
+
+    def esperar_listo(self, espera: float) -> bool:
+        """True cuando el worker avisa por su pipe de que ya acepta conexiones"""
+        if not self.listo:
+            legibles, _, _ = select.select([self.listo_fd], [], [], espera)
+            self.listo = bool(legibles) and os.read(self.listo_fd, 1) == b'1'
+        return self.listo
+
+    def cerrar(self):
+        try:
+            os.close(self.listo_fd)
+        except OSError:
+            pass
+
+
+class Command(BaseCommand):
+    help = 'Sirve diagram_backend.asgi con N procesos Daphne que comparten el puerto (SO_REUSEPORT o prefork)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None, help='Procesos (por defecto, uno por CPU)')
+        parser.add_argument('--bind', default='0.0.0.0', help='Dirección de escucha')
+        parser.add_argument('--port', type=int, default=int(os.environ.get('PORT', 8000)), help='Puerto')
+        parser.add_argument('--mode', choices=['reuseport', 'prefork'],
+                            default='reuseport' if hasattr(socket, 'SO_REUSEPORT') else 'prefork',
+                            help='Un socket por worker con SO_REUSEPORT, o uno compartido abierto por el supervisor')
+        parser.add_argument('--backlog', type=int, default=2048, help='Cola de conexiones pendientes del socket')
+        parser.add_argument('--graceful-timeout', type=float, default=30.0,
+                            help='Segundos que un worker espera a sus requests en curso al drenar')
+        parser.add_argument('--ready-timeout', type=float, default=60.0,
+                            help='Segundos que se espera a que un worker nuevo termine de calentar')
+        parser.add_argument('--warm-diagrams', type=int, default=20,
+                            help='Diagramas recientes cuyo índice de grafo se precarga en cada worker')
+        parser.add_argument('--allow-local-layer', action='store_true',
+                            help='Permitir varios workers sin Redis (las salas no se comparten entre procesos)')
+        parser.add_argument('--no-access-log', action='store_true', help='No escribir el log de accesos de Daphne')
+        # Uso interno: el supervisor se relanza a sí mismo con --worker
+        parser.add_argument('--worker', action='store_true', help='(interno) ejecutar como worker')
+        parser.add_argument('--fd', type=int, default=None, help='(interno) socket heredado en modo prefork')
+        parser.add_argument('--ready-fd', type=int, default=None, help='(interno) pipe de aviso al supervisor')
+
+    def handle(self, *args, **options):
+        if options['worker']:
+            self._worker(options)
+        else:
+            self._supervisar(options)
+
+    # ------------------------------------------------------------------ supervisor
+
+    def _supervisar(self, options):
+        n = options['workers'] or os.cpu_count() or 1
+        if ':' in options['bind']:
+            # El endpoint `fd:` de Twisted solo adopta sockets AF_INET
+            raise CommandError('Solo se admiten direcciones IPv4 en --bind')
+        if options['mode'] == 'reuseport' and not hasattr(socket, 'SO_REUSEPORT'):
+            raise CommandError('SO_REUSEPORT no está disponible en esta plataforma: usa --mode prefork')
+        capa = settings.CHANNEL_LAYERS.get('default', {}).get('BACKEND', '')
+        if n > 1 and 'InMemoryChannelLayer' in capa and not options['allow_local_layer']:
+            raise CommandError(
+                'Con varios workers las salas de colaboración necesitan una capa de canales compartida: '
+                'configura CHANNELS_ENABLE_REDIS y REDIS_URL (o usa --allow-local-layer solo para HTTP)'
+            )
+        if n > 1 and 'InMemoryChannelLayer' in capa:
+            self.stderr.write(self.style.WARNING('Capa de canales en memoria: cada worker tendrá sus propias salas'))
+
+        self._compartido = None
+        if options['mode'] == 'prefork':
+            self._compartido = _socket_escucha(options['bind'], options['port'], False, options['backlog'])
+            self._compartido.set_inheritable(True)
+
+        self._senal: Optional[str] = None
+        signal.signal(signal.SIGTERM, lambda *_: self._marcar('stop'))
+        signal.signal(signal.SIGINT, lambda *_: self._marcar('stop'))
+        signal.signal(signal.SIGHUP, lambda *_: self._marcar('reload'))
+
+        workers: List[_Worker] = [self._lanzar(options) for _ in range(n)]
+        listos = sum(w.esperar_listo(options['ready_timeout']) for w in workers)
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ {listos}/{n} workers en {options['bind']}:{options['port']} (modo {options['mode']}, "
+            f"pids {' '.join(str(w.pid) for w in workers)})"
+        ))
+
+        fallos = 0
+        while True:
+            if self._senal == 'stop':
+                break
+            if self._senal == 'reload':
+                self._senal = None
+                workers = self._reiniciar(workers, options)
+                continue
+            for i, worker in enumerate(workers):
+                codigo = worker.proceso.poll()
+                if codigo is None:
+                    continue
+                worker.cerrar()
+                # Muere antes de estar listo (puerto ocupado, BD inaccesible...): no reintentar sin fin
+                fallos = fallos + 1 if not worker.listo else 0
+                if fallos > MAX_FALLOS:
+                    self._parar(workers, options)
+                    raise CommandError(f'Los workers fallan al arrancar (último código {codigo})')
+                self.stderr.write(self.style.WARNING(f'Worker {worker.pid} terminó con código {codigo}; relanzando'))
+                time.sleep(min(30.0, 0.5 * 2 ** fallos) if fallos else 0)
+                workers[i] = self._lanzar(options)
+                workers[i].esperar_listo(options['ready_timeout'])
+            time.sleep(0.5)
+
+        self.stdout.write('Drenando workers...')
+        self._parar(workers, options)
+        self.stdout.write(self.style.SUCCESS('✓ Detenido'))
+
+    def _marcar(self, senal: str):
+        # Una parada pendiente no la anula un reinicio posterior
+        if self._senal != 'stop':
+            self._senal = senal
+
+    def _lanzar(self, options) -> _Worker:
+        lectura, escritura = os.pipe()
+        comando = [
+            sys.executable, os.path.join(settings.BASE_DIR, 'manage.py'), 'serve_asgi', '--worker',
+            '--bind', options['bind'], '--port', str(options['port']), '--backlog', str(options['backlog']),
+            '--graceful-timeout', str(options['graceful_timeout']),
+            '--warm-diagrams', str(options['warm_diagrams']), '--ready-fd', str(escritura),
+        ]
+        heredados = [escritura]
+        if self._compartido is not None:
+            comando += ['--fd', str(self._compartido.fileno())]
+            heredados.append(self._compartido.fileno())
+        if options['no_access_log']:
+            comando.append('--no-access-log')
+        proceso = subprocess.Popen(comando, pass_fds=heredados)
+        os.close(escritura)
+        return _Worker(proceso, lectura)
+
+    def _reiniciar(self, workers: List[_Worker], options) -> List[_Worker]:
+        """Sustituye los workers de uno en uno: el nuevo tiene que estar listo antes de drenar el viejo"""
+        self.stdout.write(f'Reinicio escalonado de {len(workers)} workers')
+        nuevos: List[_Worker] = []
+        for i, viejo in enumerate(workers):
+            if self._senal == 'stop':
+                return nuevos + workers[i:]
+            nuevo = self._lanzar(options)
+            if not nuevo.esperar_listo(options['ready_timeout']):
+                self.stderr.write(self.style.ERROR(
+                    f'El worker nuevo {nuevo.pid} no llegó a estar listo: se conservan los actuales'
+                ))
+                self._parar([nuevo], options)
+                return nuevos + workers[i:]
+            self._parar([viejo], options)
+            nuevos.append(nuevo)
+        self.stdout.write(self.style.SUCCESS(f"✓ Reiniciados (pids {' '.join(str(w.pid) for w in nuevos)})"))
+        return nuevos
+
+    def _parar(self, workers: List[_Worker], options):
+        for worker in workers:
+            if worker.proceso.poll() is None:
+                worker.proceso.send_signal(signal.SIGTERM)
+        limite = time.monotonic() + options['graceful_timeout'] + 5
+        for worker in workers:
+            try:
+                worker.proceso.wait(max(0.0, limite - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                self.stderr.write(self.style.WARNING(f'Worker {worker.pid} no terminó a tiempo; se mata'))
+                worker.proceso.kill()
+                worker.proceso.wait()
+            worker.cerrar()
+
+    # ------------------------------------------------------------------ worker
+
+    def _worker(self, options):
+        from diagram_backend.asgi import application
+
+        t0 = time.perf_counter()
+        self._calentar(application, options, daphne.server.twisted_loop)
+
+        fd = options['fd']
+        if fd is None:
+            # SO_REUSEPORT: el kernel empieza a repartir conexiones a este worker desde el bind.
+            # El descriptor pasa a Twisted, que lo cierra al dejar de escuchar
+            fd = _socket_escucha(options['bind'], options['port'], True, options['backlog']).detach()
+
+        def listo():
+            if options['ready_fd'] is not None:
+                os.write(options['ready_fd'], b'1')
+                os.close(options['ready_fd'])
+            self.stdout.write(f'[worker {os.getpid()}] listo en {(time.perf_counter() - t0) * 1000:.0f}ms')
+
+        servidor = ServidorDrenable(
+            guarantee_single_callable(application),
+            endpoints=[f'fd:fileno={fd}'],
+            signal_handlers=False,
+            action_logger=None if options['no_access_log'] else AccessLogGenerator(sys.stdout),
+            ready_callable=listo,
+        )
+        for senal in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(senal, lambda *_: reactor.callFromThread(servidor.drenar, options['graceful_timeout']))
+        servidor.run()
+
+    def _calentar(self, application, options, loop):
+        """Deja el proceso listo antes de aceptar tráfico: imports, BD, índices y una request de prueba"""
+        from asgiref.testing import ApplicationCommunicator
+        from django.db import connections
+        from django.urls import resolve
+
+        from apps.diagrams.models import Diagrama
+        from apps.diagrams.services import ServicioGrafo
+
+        # Falla pronto si la BD no responde; Daphne abre conexiones por hilo de request, así que
+        # aquí se paga la importación del driver y el primer handshake, no se reserva la conexión
+        for alias in connections:
+            with connections[alias].cursor() as cursor:
+                cursor.execute('SELECT 1')
+        resolve('/api/app/diagrams/health/')
+
+        grafo = ServicioGrafo()
+        recientes = list(Diagrama.objects.values_list('id', flat=True)[:max(0, options['warm_diagrams'])])
+        for diagrama_id in recientes:
+            grafo.obtener_indice(str(diagrama_id))
+        connections.close_all()
+
+        async def peticion(ruta: str):
+            comunicador = ApplicationCommunicator(application, {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+                'scheme': 'http', 'path': ruta, 'raw_path': ruta.encode(), 'query_string': b'', 'root_path': '',
+                'headers': [(b'host', settings.ALLOWED_HOSTS[0].encode() if settings.ALLOWED_HOSTS else b'localhost')],
+                'client': ('127.0.0.1', 0), 'server': ('127.0.0.1', options['port']),
+            })
+            await comunicador.send_input({'type': 'http.request', 'body': b'', 'more_body': False})
+            inicio = await comunicador.receive_output(30)
+            while (await comunicador.receive_output(30)).get('more_body'):
+                pass
+            await comunicador.send_input({'type': 'http.disconnect'})
+            await comunicador.wait(5)
+            return inicio['status']
+
+        # Recorre middleware, resolución de URLs, DRF y serializadores como lo hará el primer cliente
+        rutas = ['/api/app/diagrams/health/'] + [f'/api/app/diagrams/diagrams/{recientes[0]}/'] * bool(recientes)
+        estados = [loop.run_until_complete(peticion(ruta)) for ruta in rutas]
+        self.stdout.write(f'[worker {os.getpid()}] calentado: índices={len(recientes)} requests={estados}')
+
+
+class ServidorDrenable(Server):
+    """Server de Daphne que puede dejar de aceptar y esperar a sus conexiones antes de parar"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.puertos = []
+        self.drenando = False
+
+    def listen_success(self, port):
+        self.puertos.append(port)
+        return super().listen_success(port)
+
+    def drenar(self, espera: float):
+        if self.drenando:
+            return
+        self.drenando = True
+        for puerto in self.puertos:
+            puerto.stopListening()
+        sockets = 0
+        for protocolo, datos in list(self.connections.items()):
+            if isinstance(protocolo, WebSocketProtocol) and 'disconnected' not in datos:
+                sockets += 1
+                try:
+                    protocolo.serverClose(code=CIERRE_REINICIO)
+                except Exception:
+                    # Aún en el handshake: no admite cierre ordenado
+                    protocolo.transport.loseConnection()
+        logger.info(f"[serve] worker {os.getpid()} drenando: conexiones={len(self.connections)} websockets={sockets}")
+        limite = time.monotonic() + espera
+
+        def comprobar():
+            activas = sum(1 for datos in self.connections.values() if 'disconnected' not in datos)
+            if not activas or time.monotonic() >= limite:
+                self.stop()
+            else:
+                reactor.callLater(0.1, comprobar)
+
+        comprobar()
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-19 13:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diagrams', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='diagrama',
+            name='revision',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='relacion',
+            name='created_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -0,0 +1,79 @@
+from django.db import DatabaseError, migrations, transaction
+
+# DDL congelado de esta migración: no depende de services/search_service (que puede cambiar
+# después; el índice vigente lo reinstala el post_migrate o `rebuild_search_index`)
+
+# tabla FTS -> (tabla de contenido, columnas indexadas)
+FTS = {
+    'search_diagrams': ('diagrams', ['name', 'description']),
+    'search_classes': ('class_entities', ['name']),
+    'search_attributes': ('class_attributes', ['name']),
+}
+GIN = {
+    'diagrams_name_trgm': ('diagrams', 'name'),
+    'diagrams_description_trgm': ('diagrams', 'description'),
+    'class_entities_name_trgm': ('class_entities', 'name'),
+    'class_attributes_name_trgm': ('class_attributes', 'name'),
+}
+
+
+def _sentencias_sqlite():
+    sentencias = []
+    for fts, (tabla, columnas) in FTS.items():
+        cols = ', '.join(columnas)
+        nuevos = ', '.join(f'new.{c}' for c in columnas)
+        viejos = ', '.join(f'old.{c}' for c in columnas)
+        borrar = f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.rowid, {viejos});"
+        insertar = f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.rowid, {nuevos});"
+        sentencias += [
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({cols}, content='{tabla}', "
+            f"content_rowid='rowid', tokenize='trigram')",
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {tabla} BEGIN {insertar} END",
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {tabla} BEGIN {borrar} END",
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {cols} ON {tabla} BEGIN {borrar} {insertar} END",
+        ]
+    return sentencias
+
+
+def instalar(apps, schema_editor):
+    conexion = schema_editor.connection
+    with conexion.cursor() as cursor:
+        if conexion.vendor == 'sqlite':
+            for sentencia in _sentencias_sqlite():
+                cursor.execute(sentencia)
+            for fts in FTS:
+                cursor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+        elif conexion.vendor == 'postgresql':
+            try:
+                with transaction.atomic(using=conexion.alias):
+                    cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+            except DatabaseError:
+                # Sin permisos para la extensión: la búsqueda cae a ILIKE sin índice
+                return
+            for indice, (tabla, columna) in GIN.items():
+                cursor.execute(f'CREATE INDEX IF NOT EXISTS {indice} ON {tabla} USING gin ({columna} gin_trgm_ops)')
+
+
+def desinstalar(apps, schema_editor):
+    conexion = schema_editor.connection
+    with conexion.cursor() as cursor:
+        if conexion.vendor == 'sqlite':
+            for fts in FTS:
+                for sufijo in ('ai', 'ad', 'au'):
+                    cursor.execute(f'DROP TRIGGER IF EXISTS {fts}_{sufijo}')
+                cursor.execute(f'DROP TABLE IF EXISTS {fts}')
+        elif conexion.vendor == 'postgresql':
+            for indice in GIN:
+                cursor.execute(f'DROP INDEX IF EXISTS {indice}')
+
+
+class Migration(migrations.Migration):
+    """Índice de búsqueda: FTS5 + triggers en SQLite, GIN pg_trgm en PostgreSQL"""
+
+    dependencies = [
+        ('diagrams', '0002_diagrama_revision'),
+    ]
+
+    operations = [
+        migrations.RunPython(instalar, desinstalar),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.6 on 2026-10-19 13:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diagrams', '0003_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='entidadclase',
+            index=models.Index(fields=['diagram', 'position_x', 'position_y'], name='class_entities_viewport_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-19 14:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diagrams', '0004_class_viewport_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='diagrama',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
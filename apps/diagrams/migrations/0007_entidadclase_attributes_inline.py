@@ -0,0 +1,54 @@
+# Generated by Django 5.2.6 on 2026-10-19 18:40
+
+import apps.diagrams.models.atributo_en_linea
+from datetime import datetime, timedelta, timezone
+from django.db import migrations, models
+
+
+def atributos_a_filas(apps, schema_editor):
+    """Al revertir: las clases en línea vuelven a filas de class_attributes antes de quitar la columna"""
+    EntidadClase = apps.get_model('diagrams', 'EntidadClase')
+    AtributoClase = apps.get_model('diagrams', 'AtributoClase')
+    epoca = datetime(1970, 1, 1, tzinfo=timezone.utc)
+    clases = EntidadClase.objects.filter(attributes_inline__isnull=False).values_list('id', 'attributes_inline')
+    for clase_id, entradas in clases.iterator(chunk_size=500):
+        filas = [
+            AtributoClase(id=id_hex, class_entity_id=clase_id, name=nombre, data_type=tipo, visibility=visibilidad)
+            for nombre, tipo, visibilidad, id_hex, _ in entradas
+        ]
+        AtributoClase.objects.bulk_create(filas, ignore_conflicts=True)
+        # auto_now_add pisa created_at al insertar: se restaura la fecha original
+        for fila, entrada in zip(filas, entradas):
+            fila.created_at = epoca + timedelta(microseconds=entrada[4])
+        AtributoClase.objects.bulk_update(filas, ['created_at'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diagrams', '0006_jobs'),
+    ]
+
+    operations = [
+        # La columna nace NULL para las filas existentes (atributos en class_attributes) sea cual sea
+        # CLASS_ATTRIBUTE_STORAGE; el valor por defecto del modelo solo aplica a las clases nuevas
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.AddField(
+                    model_name='entidadclase',
+                    name='attributes_inline',
+                    field=models.JSONField(blank=True, null=True),
+                ),
+            ],
+            state_operations=[
+                migrations.AddField(
+                    model_name='entidadclase',
+                    name='attributes_inline',
+                    field=models.JSONField(
+                        blank=True, default=apps.diagrams.models.atributo_en_linea.almacenamiento_inicial,
+                        null=True),
+                ),
+            ],
+        ),
+        migrations.RunPython(migrations.RunPython.noop, atributos_a_filas),
+    ]
@@ -0,0 +1,57 @@
+from django.db import migrations
+
+# DDL congelado de esta migración (ver 0003): índice de búsqueda de los atributos en línea.
+# SQLite: tabla FTS5 con una fila por entrada de attributes_inline, rowid = rowid de la clase << 16
+# + posición en la lista, mantenida por triggers. PostgreSQL: GIN pg_trgm sobre la lista de nombres.
+FTS = 'search_attributes_inline'
+GIN = 'class_entities_attributes_inline_trgm'
+INSERTAR = (
+    f"INSERT INTO {FTS}(rowid, name, attr_id) "
+    "SELECT ({c}.rowid << 16) + j.key, json_extract(j.value, '$[0]'), json_extract(j.value, '$[3]') "
+    "FROM {origen}json_each({c}.attributes_inline) j WHERE j.key < 65536"
+)
+
+
+def instalar(apps, schema_editor):
+    conexion = schema_editor.connection
+    with conexion.cursor() as cursor:
+        if conexion.vendor == 'sqlite':
+            borrar = f"DELETE FROM {FTS} WHERE rowid BETWEEN (old.rowid << 16) AND (old.rowid << 16) + 65535;"
+            insertar = INSERTAR.format(c='new', origen='') + ';'
+            cursor.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS} USING fts5(name, attr_id UNINDEXED, tokenize='trigram')")
+            cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {FTS}_ai AFTER INSERT ON class_entities BEGIN {insertar} END")
+            cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {FTS}_ad AFTER DELETE ON class_entities BEGIN {borrar} END")
+            cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {FTS}_au AFTER UPDATE OF attributes_inline ON class_entities "
+                           f"BEGIN {borrar} {insertar} END")
+            cursor.execute(f'DELETE FROM {FTS}')
+            cursor.execute(INSERTAR.format(c='c', origen='class_entities c, '))
+        elif conexion.vendor == 'postgresql':
+            cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            if cursor.fetchone() is None:
+                # 0003 no pudo crear la extensión: la búsqueda cae a ILIKE sin índice
+                return
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {GIN} ON class_entities USING gin "
+                           f"((jsonb_path_query_array(attributes_inline, '$[*][0]')::text) gin_trgm_ops)")
+
+
+def desinstalar(apps, schema_editor):
+    conexion = schema_editor.connection
+    with conexion.cursor() as cursor:
+        if conexion.vendor == 'sqlite':
+            for sufijo in ('ai', 'ad', 'au'):
+                cursor.execute(f'DROP TRIGGER IF EXISTS {FTS}_{sufijo}')
+            cursor.execute(f'DROP TABLE IF EXISTS {FTS}')
+        elif conexion.vendor == 'postgresql':
+            cursor.execute(f'DROP INDEX IF EXISTS {GIN}')
+
+
+class Migration(migrations.Migration):
+    """Índice de búsqueda de los atributos en línea (class_entities.attributes_inline)"""
+
+    dependencies = [
+        ('diagrams', '0007_entidadclase_attributes_inline'),
+    ]
+
+    operations = [
+        migrations.RunPython(instalar, desinstalar),
+    ]
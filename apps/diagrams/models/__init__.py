@@ -4,11 +4,16 @@ Models module for diagram management
 from .diagrama import Diagrama
 from .entidad_clase import EntidadClase
 from .atributo_clase import AtributoClase
+from .atributo_en_linea import AtributoEnLinea, InlineAttribute
 from .relacion import Relacion
+from .trabajo import Trabajo
 
 __all__ = [
     'Diagrama',
     'EntidadClase', 
     'AtributoClase',
-    'Relacion'
+    'AtributoEnLinea',
+    'InlineAttribute',
+    'Relacion',
+    'Trabajo'
 ]
\ No newline at end of file
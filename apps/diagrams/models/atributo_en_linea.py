@@ -0,0 +1,73 @@
+"""
+Almacenamiento compacto de atributos dentro de la propia clase.
+
+Con CLASS_ATTRIBUTE_STORAGE='inline' la lista ordenada de atributos se guarda en
+la columna JSON ``class_entities.attributes_inline``, una entrada por atributo:
+
+    [name, data_type, visibility, id_hex, created_at_us]
+
+(``created_at_us``: microsegundos desde 1970 en UTC). NULL en la columna indica
+que los atributos de esa clase siguen siendo filas de ``class_attributes``.
+"""
+import uuid
+from datetime import datetime, timedelta, timezone as dt_timezone
+from typing import List, Optional
+
+from django.conf import settings
+from django.utils import timezone
+
+FILAS, EN_LINEA = 'rows', 'inline'
+EPOCA = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def modo_almacenamiento() -> str:
+    return EN_LINEA if getattr(settings, 'CLASS_ATTRIBUTE_STORAGE', FILAS) == EN_LINEA else FILAS
+
+
+def almacenamiento_inicial() -> Optional[list]:
+    """Valor por defecto de attributes_inline para las clases nuevas según el modo"""
+    return [] if modo_almacenamiento() == EN_LINEA else None
+
+
+def microsegundos(momento: Optional[datetime]) -> int:
+    momento = momento or timezone.now()
+    if timezone.is_naive(momento):
+        momento = timezone.make_aware(momento, dt_timezone.utc)
+    return (momento - EPOCA) // timedelta(microseconds=1)
+
+
+def empaquetar(atributo) -> list:
+    """Entrada compacta de un AtributoClase (guardado o no) o de un AtributoEnLinea"""
+    id_ = atributo.id or uuid.uuid4()
+    return [atributo.name, atributo.data_type or 'String', atributo.visibility or 'public',
+            uuid.UUID(str(id_)).hex, microsegundos(atributo.created_at)]
+
+
+class AtributoEnLinea:
+    """Vista de solo lectura de una entrada compacta con la interfaz de AtributoClase que usa la API"""
+    __slots__ = ('class_entity_id', 'name', 'data_type', 'visibility', '_id', '_creado')
+
+    def __init__(self, class_entity_id, entrada: list):
+        self.class_entity_id = class_entity_id
+        self.name, self.data_type, self.visibility, self._id, self._creado = entrada
+
+    @property
+    def id(self) -> uuid.UUID:
+        return uuid.UUID(self._id)
+
+    pk = id
+
+    @property
+    def created_at(self) -> datetime:
+        return EPOCA + timedelta(microseconds=self._creado)
+
+    def __repr__(self):
+        return f'<AtributoEnLinea {self.name}: {self.data_type}>'
+
+
+def desempaquetar(clase_id, entradas: List[list]) -> List[AtributoEnLinea]:
+    return [AtributoEnLinea(clase_id, entrada) for entrada in entradas]
+
+
+# Alias en inglés para compatibilidad
+InlineAttribute = AtributoEnLinea
@@ -6,6 +6,13 @@ from django.contrib.auth.models import User
 import uuid
 
 
+class DiagramaManager(models.Manager):
+    """Excluye los diagramas marcados para borrado (pendientes de purga)"""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
 class Diagrama(models.Model):
     """Modelo de diagrama que representa un diagrama de clases"""
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -15,6 +22,14 @@ class Diagrama(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     is_public = models.BooleanField(default=False)
+    # Se incrementa en cada escritura; invalida caches derivados (índice de grafo)
+    revision = models.PositiveIntegerField(default=0)
+    # Borrado en dos fases: se marca al instante y la purga elimina las filas hijas por lotes
+    deleted_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    objects = DiagramaManager()
+    # Incluye los marcados para borrado (purga, administración)
+    todos = models.Manager()
     
     class Meta:
         db_table = 'diagrams'
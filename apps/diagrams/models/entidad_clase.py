@@ -4,6 +4,7 @@ Modelo de entidad de clase que representa clases UMLe
 from django.db import models
 import uuid
 from .diagrama import Diagrama
+from .atributo_en_linea import almacenamiento_inicial, desempaquetar
 
 
 class EntidadClase(models.Model):
@@ -15,10 +16,23 @@ class EntidadClase(models.Model):
     position_y = models.IntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Atributos compactos (ver atributo_en_linea); NULL = filas en class_attributes
+    attributes_inline = models.JSONField(null=True, blank=True, default=almacenamiento_inicial)
     
     class Meta:
         db_table = 'class_entities'
         unique_together = ['diagram', 'name']
+        indexes = [
+            # Consultas por rectángulo visible (viewport) dentro de un diagrama
+            models.Index(fields=['diagram', 'position_x', 'position_y'], name='class_entities_viewport_idx'),
+        ]
     
+    @property
+    def lista_atributos(self) -> list:
+        """Atributos de la clase, estén en línea o en filas (usa el prefetch de `attributes` si lo hay)"""
+        if self.attributes_inline is not None:
+            return desempaquetar(self.id, self.attributes_inline)
+        return list(self.attributes.all())
+
     def __str__(self):
         return f"{self.diagram.name} - {self.name}"
\ No newline at end of file
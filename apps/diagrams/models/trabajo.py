@@ -0,0 +1,53 @@
+"""
+Modelo de trabajo en segundo plano (cola persistente en la base de datos)
+"""
+from django.db import models
+from django.contrib.auth.models import User
+from django.utils import timezone
+import uuid
+
+
+class Trabajo(models.Model):
+    """Operación pesada encolada (duplicar, layout, exportar, importar...)"""
+    STATUSES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+        ('cancelled', 'Cancelled'),
+    ]
+    TERMINALES = ('succeeded', 'failed', 'cancelled')
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    kind = models.CharField(max_length=64)
+    status = models.CharField(max_length=16, choices=STATUSES, default='pending')
+    params = models.JSONField(default=dict, blank=True)
+    # Resultado final; mientras corre guarda el estado reanudable del trabajo (p. ej. checkpoint)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True, default='')
+    progress = models.FloatField(default=0.0)
+    message = models.CharField(max_length=255, blank=True, default='')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    # No se reclama antes de esta hora (reintentos con espera exponencial)
+    run_after = models.DateTimeField(default=timezone.now)
+    cancel_requested = models.BooleanField(default=False)
+    worker = models.CharField(max_length=128, blank=True, default='')
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    # Sin FK: el trabajo sobrevive al diagrama (purga, duplicados de uno ya borrado)
+    diagram_id = models.UUIDField(null=True, blank=True, db_index=True)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'jobs'
+        ordering = ['-created_at']
+        indexes = [
+            # Reclamar: WHERE status = 'pending' AND run_after <= now ORDER BY run_after
+            models.Index(fields=['status', 'run_after'], name='jobs_status_run_after_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} ({self.status})"
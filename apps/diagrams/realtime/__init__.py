@@ -0,0 +1,28 @@
+"""
+Componentes de tiempo real para las salas de colaboración
+"""
+from .fanout import FanoutNodo, BrokerMemoria, BrokerRedis, obtener_fanout
+from .historial import HistorialSalas, obtener_historial
+from .limites import LimitadorConexion, CubetasMemoria, CubetasRedis, obtener_cubetas_sala
+from .interes import RejillaInteres, GestorInteres, obtener_gestor_interes
+from .secuencia import SecuenciadorSalas, AlmacenMemoria, AlmacenRedis, obtener_secuenciador
+
+__all__ = [
+    'FanoutNodo',
+    'BrokerMemoria',
+    'BrokerRedis',
+    'obtener_fanout',
+    'RejillaInteres',
+    'GestorInteres',
+    'obtener_gestor_interes',
+    'SecuenciadorSalas',
+    'AlmacenMemoria',
+    'AlmacenRedis',
+    'obtener_secuenciador',
+    'HistorialSalas',
+    'obtener_historial',
+    'LimitadorConexion',
+    'CubetasMemoria',
+    'CubetasRedis',
+    'obtener_cubetas_sala',
+]
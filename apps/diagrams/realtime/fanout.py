@@ -0,0 +1,205 @@
+"""
+Fan-out local por nodo para las salas de colaboración.
+
+Con ``group_send`` de channels_redis cada broadcast empuja un mensaje por cada
+canal miembro del grupo. En modo ``node`` cada proceso se suscribe una sola vez
+por sala activa (pub/sub); el broadcast se publica una vez y se reparte en
+memoria a los sockets locales.
+"""
+import asyncio
+import json
+import logging
+import uuid
+import weakref
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+from django.conf import settings
+
+from .historial import HistorialSalas, obtener_historial
+from .interes import GestorInteres, obtener_gestor_interes
+
+logger = logging.getLogger(__name__)
+
+Callback = Callable[[str, bytes], Awaitable[None]]
+
+PREFIJO_CANAL = 'collab:fanout:'
+
+
+class BrokerMemoria:
+    """Sustituto local de Redis pub/sub (un proceso, varios nodos simulados)"""
+
+    def __init__(self):
+        self._suscriptores: Dict[str, Set[Callback]] = {}
+        self.stats = {'publish': 0, 'subscribe': 0, 'unsubscribe': 0, 'deliveries': 0}
+
+    async def publish(self, canal: str, mensaje: bytes) -> int:
+        self.stats['publish'] += 1
+        callbacks = list(self._suscriptores.get(canal, ()))
+        for cb in callbacks:
+            self.stats['deliveries'] += 1
+            await cb(canal, mensaje)
+        return len(callbacks)
+
+    async def subscribe(self, canal: str, callback: Callback):
+        self.stats['subscribe'] += 1
+        self._suscriptores.setdefault(canal, set()).add(callback)
+
+    async def unsubscribe(self, canal: str, callback: Callback):
+        self.stats['unsubscribe'] += 1
+        callbacks = self._suscriptores.get(canal)
+        if callbacks is not None:
+            callbacks.discard(callback)
+            if not callbacks:
+                del self._suscriptores[canal]
+
+    async def close(self):
+        self._suscriptores.clear()
+
+
+class BrokerRedis:
+    """Broker pub/sub sobre Redis (una conexión de publicación y una de suscripción por proceso)"""
+
+    def __init__(self, url: str):
+        import redis.asyncio as aioredis  # solo necesario en modo node con Redis
+        self._cliente = aioredis.from_url(url)
+        self._pubsub = self._cliente.pubsub()
+        self._callbacks: Dict[str, Callback] = {}
+        self._lector: Optional[asyncio.Task] = None
+        self.stats = {'publish': 0, 'subscribe': 0, 'unsubscribe': 0, 'deliveries': 0}
+
+    async def publish(self, canal: str, mensaje: bytes) -> int:
+        self.stats['publish'] += 1
+        return await self._cliente.publish(canal, mensaje)
+
+    async def subscribe(self, canal: str, callback: Callback):
+        self.stats['subscribe'] += 1
+        self._callbacks[canal] = callback
+        await self._pubsub.subscribe(canal)
+        if self._lector is None or self._lector.done():
+            self._lector = asyncio.create_task(self._leer())
+
+    async def unsubscribe(self, canal: str, callback: Callback):
+        self.stats['unsubscribe'] += 1
+        self._callbacks.pop(canal, None)
+        await self._pubsub.unsubscribe(canal)
+
+    async def _leer(self):
+        """Lee mensajes del pub/sub y los despacha al callback de la sala."""
+        while True:
+            try:
+                mensaje = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"[fanout.redis] error leyendo pub/sub: {e}")
+                await asyncio.sleep(0.5)
+                continue
+            if not mensaje:
+                if not self._callbacks:
+                    await asyncio.sleep(0.1)
+                continue
+            canal = mensaje['channel']
+            if isinstance(canal, bytes):
+                canal = canal.decode()
+            cb = self._callbacks.get(canal)
+            if cb is not None:
+                self.stats['deliveries'] += 1
+                try:
+                    await cb(canal, mensaje['data'])
+                except Exception as e:
+                    logger.warning(f"[fanout.redis] error entregando en {canal}: {e}")
+
+    async def close(self):
+        if self._lector is not None:
+            self._lector.cancel()
+        await self._pubsub.aclose()
+        await self._cliente.aclose()
+
+
+class FanoutNodo:
+    """Registro de sockets locales por sala con una suscripción por sala activa"""
+
+    def __init__(self, broker, node_id: Optional[str] = None, interes: Optional[GestorInteres] = None,
+                 historial: Optional[HistorialSalas] = None):
+        self.broker = broker
+        self.node_id = node_id or uuid.uuid4().hex[:12]
+        # Rejillas de interés del proceso: filtran eventos de geometría por viewport
+        self.interes = interes
+        # Historial para reanudar sesiones: guarda también lo que no se entrega a ningún socket local
+        self.historial = historial
+        self._salas: Dict[str, Set[Any]] = {}
+        self._lock = asyncio.Lock()
+
+    @staticmethod
+    def canal(sala: str) -> str:
+        return f'{PREFIJO_CANAL}{sala}'
+
+    def miembros_locales(self, sala: str) -> int:
+        return len(self._salas.get(sala, ()))
+
+    def salas_activas(self) -> int:
+        return len(self._salas)
+
+    async def join(self, sala: str, consumer):
+        """Registra el socket; la primera entrada local suscribe el nodo a la sala."""
+        async with self._lock:
+            miembros = self._salas.get(sala)
+            if miembros is None:
+                miembros = self._salas[sala] = set()
+                await self.broker.subscribe(self.canal(sala), self._on_message)
+                logger.debug(f"[fanout] nodo={self.node_id} suscrito sala={sala}")
+            miembros.add(consumer)
+
+    async def leave(self, sala: str, consumer):
+        """Quita el socket; al salir el último miembro local se cancela la suscripción."""
+        async with self._lock:
+            miembros = self._salas.get(sala)
+            if miembros is None:
+                return
+            miembros.discard(consumer)
+            if not miembros:
+                del self._salas[sala]
+                await self.broker.unsubscribe(self.canal(sala), self._on_message)
+                logger.debug(f"[fanout] nodo={self.node_id} desuscrito sala={sala}")
+
+    async def broadcast(self, sala: str, evento: Dict[str, Any]):
+        """Publica el evento una sola vez para todos los nodos de la sala."""
+        mensaje = json.dumps(evento, separators=(',', ':'), default=str).encode()
+        await self.broker.publish(self.canal(sala), mensaje)
+
+    async def _on_message(self, canal: str, mensaje: bytes):
+        sala = canal[len(PREFIJO_CANAL):]
+        miembros = self._salas.get(sala)
+        if not miembros:
+            return
+        evento = json.loads(mensaje)
+        if self.historial is not None:
+            self.historial.registrar(sala, evento.get('event_type'), evento.get('payload'))
+        destinatarios = list(miembros)
+        interes = evento.pop('interest', None)
+        rejilla = self.interes.rejilla(sala) if (interes and self.interes) else None
+        if rejilla is not None:
+            rejilla.aplicar(interes)
+            destinatarios = rejilla.filtrar(destinatarios, interes)
+        await asyncio.gather(
+            *(c.collaboration_event(evento) for c in destinatarios),
+            return_exceptions=True,
+        )
+
+
+# Un fan-out por event loop: Daphne usa uno por proceso, los tests pueden crear varios
+_fanouts: 'weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, FanoutNodo]' = weakref.WeakKeyDictionary()
+
+
+def obtener_fanout() -> Optional[FanoutNodo]:
+    """Devuelve el fan-out del proceso o None si el modo configurado es 'group'."""
+    if getattr(settings, 'COLLAB_FANOUT_MODE', 'group') != 'node':
+        return None
+    loop = asyncio.get_running_loop()
+    fanout = _fanouts.get(loop)
+    if fanout is None:
+        redis_url = getattr(settings, 'REDIS_URL', '')
+        broker = BrokerRedis(redis_url) if redis_url else BrokerMemoria()
+        fanout = _fanouts[loop] = FanoutNodo(broker, interes=obtener_gestor_interes(), historial=obtener_historial())
+        logger.info(f"[fanout] modo node broker={type(broker).__name__} nodo={fanout.node_id}")
+    return fanout
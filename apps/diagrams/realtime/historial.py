@@ -0,0 +1,179 @@
+"""
+Historial reciente de eventos por sala para reanudar sesiones.
+
+Cada sala guarda en un búfer circular los últimos eventos salientes ya
+serializados (el mismo texto que recibe el socket) junto a su seq. Un cliente
+que se reconecta con ``?last_seq=N&epoch=E`` recibe solo los eventos N+1..actual
+en lugar de pedir un ``initial_state`` completo; si la época no coincide o el
+hueco ya no está en el búfer, se le indica que haga la transferencia completa.
+
+El búfer solo admite seq contiguos: un hueco (eventos de otro nodo que no
+pasaron por este proceso) lo reinicia, así que nunca se reproduce una secuencia
+incompleta. La memoria está acotada por sala (eventos y bytes) y en total (se
+descartan primero los eventos más antiguos de las salas con menos actividad).
+
+Opcional (COLLAB_RESUME=True, requiere también COLLAB_SEQUENCING=True): añade
+campos al handshake y reserva hasta COLLAB_RESUME_TOTAL_BYTES por proceso.
+"""
+import json
+import logging
+from collections import OrderedDict, deque
+from itertools import islice
+from typing import Any, Dict, List, Optional
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class _BufferSala:
+    __slots__ = ('epoch', 'eventos', 'bytes')
+
+    def __init__(self, epoch: str):
+        self.epoch = epoch
+        # (seq, texto JSON del mensaje tal como se envía al socket)
+        self.eventos: deque = deque()
+        self.bytes = 0
+
+    @property
+    def primero(self) -> int:
+        return self.eventos[0][0] if self.eventos else 0
+
+    @property
+    def ultimo(self) -> int:
+        return self.eventos[-1][0] if self.eventos else 0
+
+
+class HistorialSalas:
+    """Búferes circulares por sala con límites de eventos y memoria"""
+
+    def __init__(self, max_eventos: Optional[int] = None, max_bytes_sala: Optional[int] = None,
+                 max_bytes_total: Optional[int] = None):
+        self.max_eventos = max_eventos or getattr(settings, 'COLLAB_RESUME_EVENTS', 512)
+        self.max_bytes_sala = max_bytes_sala or getattr(settings, 'COLLAB_RESUME_ROOM_BYTES', 256 * 1024)
+        self.max_bytes_total = max_bytes_total or getattr(settings, 'COLLAB_RESUME_TOTAL_BYTES', 64 * 1024 * 1024)
+        # Orden de uso: las salas al principio son las que menos tiempo llevan sin eventos
+        self._salas: 'OrderedDict[str, _BufferSala]' = OrderedDict()
+        self.bytes_total = 0
+        self.stats = {
+            'recorded': 0, 'duplicates': 0, 'resets': 0, 'evicted_events': 0,
+            'resume_attempts': 0, 'resume_hits': 0, 'resume_misses': 0,
+            'events_replayed': 0, 'bytes_replayed': 0,
+        }
+        self.motivos: Dict[str, int] = {}
+
+    def registrar(self, sala: str, event_type: str, payload: Dict[str, Any]) -> bool:
+        """Guarda un evento secuenciado; ignora duplicados (ya visto por otro socket del nodo)"""
+        seq = payload.get('seq') if isinstance(payload, dict) else None
+        if not isinstance(seq, int):
+            return False
+        epoch = payload.get('epoch', '')
+        buffer = self._salas.get(sala)
+        if buffer is not None and buffer.epoch == epoch and seq <= buffer.ultimo:
+            self.stats['duplicates'] += 1
+            return False
+        if buffer is None or buffer.epoch != epoch or (buffer.eventos and seq != buffer.ultimo + 1):
+            # Nueva época o hueco: lo anterior ya no sirve para reanudar de forma contigua
+            if buffer is not None:
+                self.stats['resets'] += 1
+                self._vaciar(buffer)
+            buffer = self._salas[sala] = _BufferSala(epoch)
+        texto = json.dumps({'type': event_type, 'payload': payload}, default=str)
+        buffer.eventos.append((seq, texto))
+        buffer.bytes += len(texto)
+        self.bytes_total += len(texto)
+        self._salas.move_to_end(sala)
+        self.stats['recorded'] += 1
+        while buffer.eventos and (len(buffer.eventos) > self.max_eventos or buffer.bytes > self.max_bytes_sala):
+            self._descartar(buffer)
+        self._recortar_total()
+        return True
+
+    def reanudar(self, sala: str, epoch_cliente: str, ultimo_seq: int, epoch: str, seq: int) -> Optional[List[str]]:
+        """Mensajes que faltan al cliente (vacío si no se perdió nada) o None si necesita el estado completo"""
+        self.stats['resume_attempts'] += 1
+        buffer = self._salas.get(sala)
+        if epoch_cliente != epoch:
+            return self._fallo('epoch')
+        if ultimo_seq > seq:
+            return self._fallo('ahead')
+        if ultimo_seq == seq:
+            return self._acierto([])
+        if buffer is None or buffer.epoch != epoch or not buffer.eventos:
+            return self._fallo('empty')
+        if buffer.primero > ultimo_seq + 1:
+            return self._fallo('gap')
+        if buffer.ultimo < seq:
+            # Eventos publicados por otro nodo que este proceso no llegó a ver
+            return self._fallo('incomplete')
+        inicio = ultimo_seq + 1 - buffer.primero
+        return self._acierto([texto for s, texto in islice(buffer.eventos, inicio, None) if s <= seq])
+
+    def olvidar(self, sala: str):
+        buffer = self._salas.pop(sala, None)
+        if buffer is not None:
+            self.bytes_total -= buffer.bytes
+
+    def estadisticas(self) -> Dict[str, Any]:
+        intentos = self.stats['resume_attempts']
+        return {
+            **self.stats,
+            'resume_hit_rate': round(self.stats['resume_hits'] / intentos, 4) if intentos else None,
+            'miss_reasons': dict(self.motivos),
+            'rooms': len(self._salas),
+            'buffered_events': sum(len(b.eventos) for b in self._salas.values()),
+            'buffered_bytes': self.bytes_total,
+            'limits': {
+                'events_per_room': self.max_eventos,
+                'bytes_per_room': self.max_bytes_sala,
+                'bytes_total': self.max_bytes_total,
+            },
+        }
+
+    def _acierto(self, mensajes: List[str]) -> List[str]:
+        self.stats['resume_hits'] += 1
+        self.stats['events_replayed'] += len(mensajes)
+        self.stats['bytes_replayed'] += sum(len(m) for m in mensajes)
+        return mensajes
+
+    def _fallo(self, motivo: str) -> None:
+        self.stats['resume_misses'] += 1
+        self.motivos[motivo] = self.motivos.get(motivo, 0) + 1
+        return None
+
+    def _descartar(self, buffer: _BufferSala):
+        _, texto = buffer.eventos.popleft()
+        buffer.bytes -= len(texto)
+        self.bytes_total -= len(texto)
+        self.stats['evicted_events'] += 1
+
+    def _vaciar(self, buffer: _BufferSala):
+        self.bytes_total -= buffer.bytes
+        buffer.eventos.clear()
+        buffer.bytes = 0
+
+    def _recortar_total(self):
+        """Por encima del límite global se recortan primero las salas menos activas"""
+        while self.bytes_total > self.max_bytes_total and self._salas:
+            sala, buffer = next(iter(self._salas.items()))
+            if buffer.eventos:
+                self._descartar(buffer)
+            if not buffer.eventos:
+                del self._salas[sala]
+
+
+# Un historial por proceso: solo contiene datos (sin objetos del bucle de eventos), así que
+# también lo pueden leer las vistas HTTP del mismo proceso
+_historial: Optional[HistorialSalas] = None
+
+
+def obtener_historial() -> Optional[HistorialSalas]:
+    """Devuelve el historial del proceso, o None si COLLAB_RESUME está desactivado"""
+    global _historial
+    if not getattr(settings, 'COLLAB_RESUME', False) or not getattr(settings, 'COLLAB_SEQUENCING', False):
+        return None
+    if _historial is None:
+        _historial = HistorialSalas()
+        logger.info(f"[historial] eventos/sala={_historial.max_eventos} bytes/sala={_historial.max_bytes_sala} "
+                    f"bytes totales={_historial.max_bytes_total}")
+    return _historial
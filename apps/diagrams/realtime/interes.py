@@ -0,0 +1,279 @@
+"""
+Gestión de interés para las salas de colaboración.
+
+Cada sala mantiene una rejilla espacial con la última posición conocida de sus
+clases y los viewports registrados por los sockets. Los eventos de geometría
+(``class_updated`` / ``relationship_updated`` que solo mueven o redimensionan,
+con la misma distinción que el control de inundación) se marcan en origen con
+el rectángulo que afectan y solo se entregan a los sockets cuyo viewport lo
+intersecta. Los estructurales (nombre, atributos, tipo o cardinalidad...) y los
+de sockets sin viewport se siguen repartiendo a toda la sala.
+"""
+import asyncio
+import logging
+import weakref
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from django.conf import settings
+
+from .limites import CAMPOS_GEOMETRIA, GEOMETRIA, clasificar
+from .secuencia import CAMPOS_META
+
+logger = logging.getLogger(__name__)
+
+# Evento saliente -> evento entrante que lo origina (el que entiende `clasificar`)
+EVENTOS_GEOMETRIA = {'class_updated': 'class_update', 'relationship_updated': 'relationship_update'}
+
+Caja = Tuple[int, int, int, int]
+Celda = Tuple[int, int]
+
+
+def _numero(valor) -> Optional[int]:
+    try:
+        return int(float(valor))
+    except (TypeError, ValueError):
+        return None
+
+
+def _posicion(datos: Dict) -> Optional[Tuple[int, int]]:
+    """Extrae la posición de un payload de clase ({position: {x, y}}, x/y o position_x/position_y)"""
+    pos = datos.get('position')
+    if isinstance(pos, dict):
+        x, y = _numero(pos.get('x')), _numero(pos.get('y'))
+    elif 'position_x' in datos:
+        x, y = _numero(datos.get('position_x')), _numero(datos.get('position_y'))
+    else:
+        x, y = _numero(datos.get('x')), _numero(datos.get('y'))
+    if x is None or y is None:
+        return None
+    return x, y
+
+
+def _primero(datos: Dict, claves: Iterable[str]) -> Optional[str]:
+    for clave in claves:
+        valor = datos.get(clave)
+        if valor not in (None, ''):
+            return str(valor)
+    return None
+
+
+def _solo_geometria(event_type: str, payload: Dict) -> bool:
+    """True si el evento solo mueve o redimensiona: por su delta/set o, sin ellos, por los campos que trae"""
+    if clasificar(EVENTOS_GEOMETRIA[event_type], payload) == GEOMETRIA:
+        return True
+    if payload.get('delta') or payload.get('set'):
+        return False
+    datos = payload.get('current') if isinstance(payload.get('current'), dict) else payload
+    campos = set(datos) - CAMPOS_META
+    return bool(campos) and campos <= CAMPOS_GEOMETRIA
+
+
+def _intersecta(a: Caja, b: Caja) -> bool:
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+class RejillaInteres:
+    """Rejilla espacial de una sala: posiciones de clases y viewports de los sockets locales"""
+
+    def __init__(self, tam_celda: int = 512, margen: int = 300, max_celdas: int = 1024):
+        self.tam_celda = tam_celda
+        # Las posiciones son la esquina superior izquierda; el margen cubre el tamaño de la caja
+        self.margen = margen
+        # Viewports que ocupan más celdas se tratan como globales (se comprueban siempre)
+        self.max_celdas = max_celdas
+        self._posiciones: Dict[str, Tuple[int, int]] = {}
+        self._extremos: Dict[str, Tuple[str, str]] = {}
+        self._viewports: Dict[Any, Caja] = {}
+        self._celdas: Dict[Celda, Set[Any]] = {}
+        self._globales: Set[Any] = set()
+        self.sembrada = False
+
+    # --- posiciones -------------------------------------------------------
+    def sembrar(self, posiciones: Iterable[Tuple[Any, int, int]]):
+        """Carga posiciones iniciales (p. ej. desde la base de datos) sin pisar las ya conocidas."""
+        for entidad, x, y in posiciones:
+            self._posiciones.setdefault(str(entidad), (x, y))
+        self.sembrada = True
+
+    def entidades(self) -> int:
+        return len(self._posiciones)
+
+    def aplicar(self, interes: Dict):
+        """Actualiza posiciones y extremos con lo que trae un evento ya marcado (idempotente)."""
+        for entidad, (x, y) in (interes.get('pos') or {}).items():
+            self._posiciones[entidad] = (x, y)
+        for relacion, (origen, destino) in (interes.get('links') or {}).items():
+            self._extremos[relacion] = (origen, destino)
+
+    def marcar(self, event_type: str, payload: Dict) -> Optional[Dict]:
+        """Calcula el bloque de interés de un evento saliente y actualiza la rejilla.
+
+        Sin caja (o None) si el evento es estructural o no se puede ubicar; en ese
+        caso se reparte a toda la sala. Un evento estructural conserva las
+        posiciones y extremos nuevos para que las demás rejillas sigan al día.
+        """
+        if event_type not in EVENTOS_GEOMETRIA or not isinstance(payload, dict):
+            return None
+        datos = payload.get('current') if isinstance(payload.get('current'), dict) else payload
+        if event_type == 'class_updated':
+            interes = self._marcar_clase(datos, payload)
+        else:
+            interes = self._marcar_relacion(datos)
+        if interes is not None and not _solo_geometria(event_type, payload):
+            interes.pop('bbox', None)
+            return interes or None
+        return interes
+
+    def _marcar_clase(self, datos: Dict, payload: Dict) -> Optional[Dict]:
+        entidad = _primero(datos, ('id', 'classId', 'class_id')) or _primero(payload, ('id', 'classId'))
+        nueva = _posicion(datos)
+        puntos: List[Tuple[int, int]] = []
+        anterior = self._posiciones.get(entidad) if entidad else None
+        if anterior is None and isinstance(payload.get('previous'), dict):
+            anterior = _posicion(payload['previous'])
+        # Caja vieja y nueva: quien veía la clase debe enterarse de que se fue
+        if anterior is not None:
+            puntos.append(anterior)
+        if nueva is not None:
+            puntos.append(nueva)
+        if not puntos:
+            return None
+        interes: Dict[str, Any] = {'bbox': self._caja(puntos)}
+        if entidad and nueva is not None:
+            self._posiciones[entidad] = nueva
+            interes['pos'] = {entidad: list(nueva)}
+        return interes
+
+    def _marcar_relacion(self, datos: Dict) -> Optional[Dict]:
+        relacion = _primero(datos, ('id', 'relationshipId', 'relationship_id'))
+        origen = _primero(datos, ('from_class', 'source', 'sourceId', 'from'))
+        destino = _primero(datos, ('to_class', 'target', 'targetId', 'to'))
+        interes: Dict[str, Any] = {}
+        if origen and destino:
+            if relacion:
+                self._extremos[relacion] = (origen, destino)
+                interes['links'] = {relacion: [origen, destino]}
+        elif relacion in self._extremos:
+            origen, destino = self._extremos[relacion]
+        puntos = [self._posiciones[e] for e in (origen, destino) if e in self._posiciones]
+        if not puntos:
+            return None
+        interes['bbox'] = self._caja(puntos)
+        return interes
+
+    def _caja(self, puntos: List[Tuple[int, int]]) -> Caja:
+        xs = [p[0] for p in puntos]
+        ys = [p[1] for p in puntos]
+        return (min(xs), min(ys), max(xs) + self.margen, max(ys) + self.margen)
+
+    # --- viewports --------------------------------------------------------
+    def _rango_celdas(self, caja: Caja) -> Tuple[range, range]:
+        t = self.tam_celda
+        return range(caja[0] // t, caja[2] // t + 1), range(caja[1] // t, caja[3] // t + 1)
+
+    def registrar_viewport(self, socket, rect):
+        """`rect` es un Rectangulo del servicio de viewport (x0, y0, x1, y1)."""
+        self.quitar_viewport(socket)
+        caja = (rect.x0, rect.y0, rect.x1, rect.y1)
+        self._viewports[socket] = caja
+        cols, filas = self._rango_celdas(caja)
+        if len(cols) * len(filas) > self.max_celdas:
+            self._globales.add(socket)
+            return
+        for cx in cols:
+            for cy in filas:
+                self._celdas.setdefault((cx, cy), set()).add(socket)
+
+    def quitar_viewport(self, socket):
+        caja = self._viewports.pop(socket, None)
+        if caja is None:
+            return
+        if socket in self._globales:
+            self._globales.discard(socket)
+            return
+        cols, filas = self._rango_celdas(caja)
+        for cx in cols:
+            for cy in filas:
+                sockets = self._celdas.get((cx, cy))
+                if sockets is not None:
+                    sockets.discard(socket)
+                    if not sockets:
+                        del self._celdas[(cx, cy)]
+
+    def viewports(self) -> int:
+        return len(self._viewports)
+
+    def le_interesa(self, socket, caja: Optional[Iterable[int]]) -> bool:
+        """True si el socket debe recibir un evento con esa caja (sin caja o sin viewport: siempre)."""
+        vista = self._viewports.get(socket)
+        if vista is None or caja is None:
+            return True
+        return _intersecta(vista, tuple(caja))
+
+    def interesados(self, caja: Iterable[int]) -> Set[Any]:
+        """Sockets con viewport que intersecta la caja, vía celdas de la rejilla."""
+        caja = tuple(caja)
+        cols, filas = self._rango_celdas(caja)
+        if len(cols) * len(filas) > len(self._viewports):
+            # Caja enorme (p. ej. relación entre extremos lejanos): más barato recorrer los viewports
+            return {s for s, v in self._viewports.items() if _intersecta(v, caja)}
+        candidatos = set(self._globales)
+        for cx in cols:
+            for cy in filas:
+                candidatos.update(self._celdas.get((cx, cy), ()))
+        return {s for s in candidatos if _intersecta(self._viewports[s], caja)}
+
+    def filtrar(self, miembros: Iterable[Any], interes: Optional[Dict]) -> List[Any]:
+        """Destinatarios de un evento entre los miembros locales de la sala."""
+        if not interes or interes.get('bbox') is None or not self._viewports:
+            return list(miembros)
+        interesados = self.interesados(interes['bbox'])
+        return [m for m in miembros if m not in self._viewports or m in interesados]
+
+
+class GestorInteres:
+    """Rejillas por sala de un proceso, vivas mientras la sala tenga sockets locales"""
+
+    def __init__(self):
+        self._rejillas: Dict[str, RejillaInteres] = {}
+        self._miembros: Dict[str, int] = {}
+
+    @staticmethod
+    def _nueva_rejilla() -> RejillaInteres:
+        return RejillaInteres(
+            tam_celda=getattr(settings, 'COLLAB_INTEREST_CELL', 512),
+            margen=getattr(settings, 'COLLAB_INTEREST_MARGIN', 300),
+        )
+
+    def entrar(self, sala: str) -> RejillaInteres:
+        self._miembros[sala] = self._miembros.get(sala, 0) + 1
+        rejilla = self._rejillas.get(sala)
+        if rejilla is None:
+            rejilla = self._rejillas[sala] = self._nueva_rejilla()
+        return rejilla
+
+    def salir(self, sala: str, socket):
+        rejilla = self._rejillas.get(sala)
+        if rejilla is not None:
+            rejilla.quitar_viewport(socket)
+        restantes = self._miembros.get(sala, 0) - 1
+        if restantes > 0:
+            self._miembros[sala] = restantes
+            return
+        self._miembros.pop(sala, None)
+        self._rejillas.pop(sala, None)
+
+    def rejilla(self, sala: str) -> Optional[RejillaInteres]:
+        return self._rejillas.get(sala)
+
+
+# Igual que el fan-out: un gestor por event loop
+_gestores: 'weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, GestorInteres]' = weakref.WeakKeyDictionary()
+
+
+def obtener_gestor_interes() -> GestorInteres:
+    loop = asyncio.get_running_loop()
+    gestor = _gestores.get(loop)
+    if gestor is None:
+        gestor = _gestores[loop] = GestorInteres()
+    return gestor
@@ -0,0 +1,231 @@
+"""
+Control de inundación para las salas de colaboración.
+
+Cubetas de tokens por conexión y por sala con presupuestos separados para tres
+clases de evento:
+
+- ``geometry``: cursores y ediciones que solo mueven/redimensionan (el delta
+  solo toca posición o tamaño). El exceso no se descarta: se funde con la
+  última edición pendiente de la misma entidad y se envía cuando hay tokens.
+- ``structural``: el resto de ediciones de clases y relaciones. El exceso se
+  rechaza con un aviso ``throttled`` (lleva op_id para que el cliente reintente).
+- ``control``: todo lo demás (handshake de estado inicial, chat, selección...).
+  El viewport no se limita: no se redistribuye.
+
+Cada comprobación cuesta O(1): una cubeta es (tokens, instante) y se recarga de
+forma perezosa. Las cubetas de conexión viven en el consumidor; las de sala se
+comparten entre procesos con Redis mediante un script Lua atómico que usa el
+reloj del servidor Redis (sin desfase entre nodos).
+
+Opcional (COLLAB_RATE_LIMIT=True): rechaza ediciones que hoy se difunden, así
+que solo debe activarse con clientes que manejen el aviso. Solo lo recibe el
+emisor, como mucho uno por segundo y clase (siempre, si la edición rechazada
+traía ``op_id``)::
+
+    {"type": "throttled", "payload": {
+        "class": "structural",        # geometry | structural | control
+        "scope": "connection",        # connection | room: qué cubeta se agotó
+        "action": "rejected",         # rejected: no se difundió; coalesced: se enviará después
+        "event_type": "class_update",
+        "op_id": "...",               # el de la edición, o null
+        "retry_after": 0.1            # segundos hasta que haya un token
+    }}
+
+Con ``rejected`` el cliente debe reenviar la edición (o el estado de esa
+entidad) tras ``retry_after``; con ``coalesced`` no tiene que hacer nada.
+"""
+import asyncio
+import logging
+import time
+import weakref
+from typing import Any, Dict, Optional, Tuple
+
+from django.conf import settings
+
+from .secuencia import CAMPOS_META
+
+logger = logging.getLogger(__name__)
+
+GEOMETRIA, ESTRUCTURA, CONTROL = 'geometry', 'structural', 'control'
+
+EVENTOS_GEOMETRIA = frozenset({'cursor_move'})
+EVENTOS_ESTRUCTURA = frozenset({'class_update', 'relationship_update'})
+# Un class_update cuyo delta solo toca estos campos es un arrastre o redimensionado
+CAMPOS_GEOMETRIA = frozenset({'position', 'position_x', 'position_y', 'x', 'y', 'width', 'height', 'size',
+                              'points', 'vertices', 'waypoints'})
+
+# (tokens por segundo, ráfaga) por clase
+LIMITES_CONEXION = {GEOMETRIA: (30.0, 60.0), ESTRUCTURA: (10.0, 30.0), CONTROL: (5.0, 20.0)}
+LIMITES_SALA = {GEOMETRIA: (300.0, 600.0), ESTRUCTURA: (60.0, 120.0), CONTROL: (50.0, 200.0)}
+
+# Contadores del proceso (los lee health/realtime/)
+ESTADISTICAS: Dict[str, int] = {
+    'allowed': 0, 'coalesced': 0, 'flushed': 0, 'rejected': 0, 'notices': 0,
+    'throttled_connection': 0, 'throttled_room': 0,
+}
+
+
+def clasificar(event_type: str, payload: Any) -> str:
+    """Clase de presupuesto de un evento entrante"""
+    if event_type in EVENTOS_GEOMETRIA:
+        return GEOMETRIA
+    if event_type in EVENTOS_ESTRUCTURA:
+        cambios = (payload.get('delta') or payload.get('set')) if isinstance(payload, dict) else None
+        if isinstance(cambios, dict) and cambios:
+            # Los metadatos (previous, op_id, userId...) no cuentan como cambio
+            campos = set(cambios) - CAMPOS_META
+            if campos and campos <= CAMPOS_GEOMETRIA:
+                return GEOMETRIA
+        return ESTRUCTURA
+    return CONTROL
+
+
+def clave_fusion(event_type: str, payload: Dict[str, Any]) -> str:
+    """Entidad a la que afecta un evento de geometría: solo cuenta su último estado"""
+    datos = payload.get('current') if isinstance(payload.get('current'), dict) else payload
+    entidad = datos.get('id') or payload.get('id') or payload.get('userId') or ''
+    return f'{event_type}:{entidad}'
+
+
+def fusionar_pendiente(anterior: Dict[str, Any], nuevo: Dict[str, Any]) -> Dict[str, Any]:
+    """El último payload gana, pero los cambios explícitos (delta/set) se acumulan"""
+    fusionado = dict(nuevo)
+    for clave in ('delta', 'set'):
+        if isinstance(anterior.get(clave), dict) or isinstance(nuevo.get(clave), dict):
+            fusionado[clave] = {**(anterior.get(clave) or {}), **(nuevo.get(clave) or {})}
+    if isinstance(anterior.get('previous'), dict):
+        # El estado de partida es el de la primera edición fundida
+        fusionado['previous'] = anterior['previous']
+    # El eco confirma también las ediciones absorbidas (el cliente las tiene pendientes por op_id)
+    absorbidas = list(anterior.get('merged_op_ids') or [])
+    if anterior.get('op_id'):
+        absorbidas.append(anterior['op_id'])
+    if absorbidas:
+        fusionado['merged_op_ids'] = absorbidas
+    return fusionado
+
+
+def _limites(nombre: str, por_defecto: Dict[str, Tuple[float, float]]) -> Dict[str, Tuple[float, float]]:
+    configurados = getattr(settings, nombre, None) or {}
+    return {clase: tuple(configurados.get(clase, valor)) for clase, valor in por_defecto.items()}
+
+
+class Cubeta:
+    """Cubeta de tokens local (sin locks: la usa un solo bucle de eventos)"""
+
+    __slots__ = ('tasa', 'rafaga', 'tokens', 'instante')
+
+    def __init__(self, tasa: float, rafaga: float):
+        self.tasa = tasa
+        self.rafaga = rafaga
+        self.tokens = rafaga
+        self.instante = time.monotonic()
+
+    def tomar(self, coste: float = 1.0) -> float:
+        """0 si hay tokens (y los consume); si no, segundos hasta que los haya"""
+        ahora = time.monotonic()
+        self.tokens = min(self.rafaga, self.tokens + (ahora - self.instante) * self.tasa)
+        self.instante = ahora
+        if self.tokens >= coste:
+            self.tokens -= coste
+            return 0.0
+        return (coste - self.tokens) / self.tasa
+
+
+class LimitadorConexion:
+    """Cubetas de una conexión, una por clase de evento"""
+
+    def __init__(self, limites: Optional[Dict[str, Tuple[float, float]]] = None):
+        limites = limites or _limites('COLLAB_RATE_CONNECTION', LIMITES_CONEXION)
+        self._cubetas = {clase: Cubeta(*valor) for clase, valor in limites.items()}
+
+    def tomar(self, clase: str) -> float:
+        return self._cubetas[clase].tomar()
+
+
+class CubetasMemoria:
+    """Cubetas de sala en el proceso (un solo nodo)"""
+
+    # Cada tantas comprobaciones se quitan las cubetas ya llenas (equivalen a no tener cubeta)
+    BARRIDO = 4096
+
+    def __init__(self, limites: Dict[str, Tuple[float, float]]):
+        self.limites = limites
+        self._cubetas: Dict[Tuple[str, str], Cubeta] = {}
+        self._llamadas = 0
+
+    async def tomar(self, sala: str, clase: str) -> float:
+        self._llamadas += 1
+        if self._llamadas % self.BARRIDO == 0:
+            self._barrer()
+        cubeta = self._cubetas.get((sala, clase))
+        if cubeta is None:
+            cubeta = self._cubetas[(sala, clase)] = Cubeta(*self.limites[clase])
+        return cubeta.tomar()
+
+    def _barrer(self):
+        ahora = time.monotonic()
+        llenas = [clave for clave, c in self._cubetas.items()
+                  if c.tokens + (ahora - c.instante) * c.tasa >= c.rafaga]
+        for clave in llenas:
+            del self._cubetas[clave]
+
+
+class CubetasRedis:
+    """Cubetas de sala compartidas entre procesos: recarga y consumo atómicos en Redis"""
+
+    PREFIJO = 'collab:rate:'
+    # Devuelve {1, 0} si consume un token o {0, segundos de espera}
+    SCRIPT = """
+-- TIME no es determinista: en Redis < 7 hay que replicar efectos en lugar del script
+if redis.replicate_commands then redis.replicate_commands() end
+local tasa = tonumber(ARGV[1])
+local rafaga = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local ahora = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local estado = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(estado[1]) or rafaga
+local ts = tonumber(estado[2]) or ahora
+tokens = math.min(rafaga, tokens + math.max(0, ahora - ts) * tasa)
+local ok = 0
+local espera = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    ok = 1
+else
+    espera = (1 - tokens) / tasa
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(ahora))
+-- La clave caduca cuando la cubeta ya estaría llena
+redis.call('PEXPIRE', KEYS[1], math.ceil(rafaga / tasa * 1000) + 1000)
+return {ok, tostring(espera)}
+"""
+
+    def __init__(self, url: str, limites: Dict[str, Tuple[float, float]]):
+        import redis.asyncio as aioredis  # solo necesario con Redis
+        self._cliente = aioredis.from_url(url)
+        self._script = self._cliente.register_script(self.SCRIPT)
+        self.limites = limites
+
+    async def tomar(self, sala: str, clase: str) -> float:
+        tasa, rafaga = self.limites[clase]
+        ok, espera = await self._script(keys=[f'{self.PREFIJO}{sala}:{clase}'], args=[tasa, rafaga])
+        return 0.0 if int(ok) else float(espera)
+
+
+# Cubetas de sala por event loop (el cliente Redis asíncrono pertenece a un bucle)
+_cubetas_sala: 'weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Any]' = weakref.WeakKeyDictionary()
+
+
+def obtener_cubetas_sala():
+    """Cubetas de sala del proceso (Redis si REDIS_URL), o None si COLLAB_RATE_LIMIT está desactivado"""
+    if not getattr(settings, 'COLLAB_RATE_LIMIT', False):
+        return None
+    loop = asyncio.get_running_loop()
+    cubetas = _cubetas_sala.get(loop)
+    if cubetas is None:
+        limites = _limites('COLLAB_RATE_ROOM', LIMITES_SALA)
+        redis_url = getattr(settings, 'REDIS_URL', '')
+        cubetas = _cubetas_sala[loop] = CubetasRedis(redis_url, limites) if redis_url else CubetasMemoria(limites)
+        logger.info(f"[limites] cubetas de sala={type(cubetas).__name__} límites={limites}")
+    return cubetas
@@ -0,0 +1,387 @@
+"""
+Registro de operaciones secuenciado por sala.
+
+Opcional (COLLAB_SEQUENCING=True): cambia el protocolo, así que los clientes que
+no lo conocen siguen recibiendo los eventos tal como llegan. Activado, el
+consumidor no reenvía las ediciones tal como llegan: cada evento saliente
+recibe un número de secuencia por sala (``seq``) y las ediciones de clases y
+relaciones se fusionan contra el estado de la sala antes de repartirse:
+
+- Campos escalares (nombre, posición, tipo...): registro LWW por campo, gana el
+  ``seq`` mayor. Los campos que el cliente cambió de forma explícita (``delta``
+  calculado desde ``previous`` o ``set``) siempre se aplican; los que solo
+  venían en una instantánea completa no pisan una escritura de otro usuario que
+  el cliente aún no había visto (``seq`` del registro > ``base_seq``).
+- Listas (``attributes``, ``methods``): OR-Set. La lista enviada es la que el
+  cliente veía en ``base_seq``: se quitan solo los elementos que ya había
+  observado, se conservan las altas concurrentes de otros y una lista
+  desfasada no resucita ni revierte elementos tocados después de ``base_seq``
+  (salvo que ``previous`` muestre que el cliente los cambió a propósito).
+
+El evento repartido lleva los valores fusionados, de modo que los clientes que
+aplican los eventos en orden de ``seq`` convergen sin volver a pedir el estado
+completo. Los clientes que no envían ``base_seq`` conservan el comportamiento
+anterior (el último en llegar al servidor gana), ahora con orden global. Con
+varios procesos (Redis) el número es único por sala pero dos eventos pueden
+llegar desordenados: el cliente los aplica por ``seq``.
+"""
+import asyncio
+import json
+import logging
+import sys
+import uuid
+import weakref
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Tipo de evento entrante -> entidad cuyo estado se fusiona
+EVENTOS_FUSIONABLES = {'class_update': 'class', 'relationship_update': 'relationship'}
+# Listas que se fusionan como conjuntos (OR-Set) en lugar de sobrescribirse
+CAMPOS_CONJUNTO = frozenset({'attributes', 'methods'})
+# Claves del payload que describen el mensaje y no el estado de la entidad
+CAMPOS_META = frozenset({
+    'id', 'classId', 'class_id', 'relationshipId', 'relationship_id', 'userId', 'timestamp', 'sentAt',
+    'previous', 'current', 'data', 'delta', 'set', 'base_seq', 'op_id', 'merged_op_ids', 'seq', 'epoch',
+    'concurrent',
+})
+
+# Registro LWW: (valor, seq, autor)
+Registro = Tuple[Any, int, str]
+# Elemento de OR-Set: (seq de alta, valor, seq de baja o 0, seq de última edición, autor de la edición)
+Elemento = Tuple[int, Any, int, int, str]
+
+_AUSENTE = object()
+
+
+def _clave_elemento(valor: Any) -> str:
+    """Identidad de un elemento de lista: id o nombre si es un objeto, el propio valor si es texto"""
+    if isinstance(valor, dict):
+        for clave in ('id', 'name'):
+            if valor.get(clave) not in (None, ''):
+                return str(valor[clave])
+    return json.dumps(valor, sort_keys=True, default=str) if not isinstance(valor, str) else valor
+
+
+@dataclass
+class Operacion:
+    """Edición normalizada de una entidad"""
+    entidad: str
+    id: str
+    autor: str
+    base_seq: int
+    # Campos cambiados de forma explícita (LWW incondicional) y de instantánea (no pisan lo no observado)
+    explicitos: Dict[str, Any] = field(default_factory=dict)
+    instantanea: Dict[str, Any] = field(default_factory=dict)
+    # Estado que el cliente tenía antes de editar (``previous``), si lo envió
+    previo: Dict[str, Any] = field(default_factory=dict)
+
+    def clave(self, campo: str) -> str:
+        return f'{self.entidad}:{self.id}:{campo}'
+
+    def campos(self) -> Dict[str, Any]:
+        return {**self.instantanea, **self.explicitos}
+
+
+def normalizar(event_type: str, payload: Dict[str, Any], autor: str) -> Optional[Operacion]:
+    """Convierte un class_update / relationship_update en Operacion (None si no se puede ubicar)"""
+    entidad = EVENTOS_FUSIONABLES.get(event_type)
+    if entidad is None or not isinstance(payload, dict):
+        return None
+    actual = payload.get('current') if isinstance(payload.get('current'), dict) else payload
+    entidad_id = None
+    for clave in ('id', 'classId', 'class_id', 'relationshipId', 'relationship_id'):
+        entidad_id = actual.get(clave) or payload.get(clave)
+        if entidad_id not in (None, ''):
+            break
+    if entidad_id in (None, ''):
+        return None
+    campos = {k: v for k, v in actual.items() if k not in CAMPOS_META}
+    if 'base_seq' not in payload:
+        # Cliente que no sigue la secuencia: todo es explícito (LWW en orden del servidor, como antes)
+        return Operacion(entidad, str(entidad_id), autor, sys.maxsize, explicitos=campos)
+    try:
+        base_seq = int(payload.get('base_seq') or 0)
+    except (TypeError, ValueError):
+        base_seq = 0
+
+    op = Operacion(entidad, str(entidad_id), autor, base_seq)
+    explicitos = payload.get('set') if isinstance(payload.get('set'), dict) else payload.get('delta')
+    if isinstance(explicitos, dict):
+        op.explicitos = {k: v for k, v in explicitos.items() if k not in CAMPOS_META}
+    op.instantanea = {k: v for k, v in campos.items() if k not in op.explicitos}
+    if isinstance(payload.get('previous'), dict):
+        op.previo = payload['previous']
+    return op
+
+
+def fusionar(op: Operacion, seq: int, registros: Dict[str, Optional[Registro]],
+             conjuntos: Dict[str, Dict[str, Elemento]]):
+    """Aplica `op` con número `seq` sobre el estado leído (función pura).
+
+    Devuelve (escrituras de registros, conjuntos resultantes, resultado para el evento).
+    """
+    escrituras: Dict[str, Registro] = {}
+    valores: Dict[str, Any] = {}
+    concurrentes: List[str] = []
+    for campo, valor in op.campos().items():
+        if campo in CAMPOS_CONJUNTO and isinstance(valor, list):
+            continue
+        actual = registros.get(op.clave(campo))
+        no_observado = actual is not None and actual[1] > op.base_seq and actual[2] != op.autor
+        if no_observado and actual[0] != valor:
+            if campo not in op.explicitos:
+                # Instantánea desfasada: se conserva la escritura que el cliente no había visto
+                valores[campo] = actual[0]
+                continue
+            concurrentes.append(campo)
+        if actual is None or actual[0] != valor:
+            escrituras[op.clave(campo)] = (valor, seq, op.autor)
+        valores[campo] = valor
+
+    nuevos: Dict[str, Dict[str, Elemento]] = {}
+    for campo, lista in op.campos().items():
+        if campo not in CAMPOS_CONJUNTO or not isinstance(lista, list):
+            continue
+        elementos = {k: list(e) for k, e in (conjuntos.get(op.clave(campo)) or {}).items()}
+        enviados = {_clave_elemento(v): v for v in lista}
+        # Con `previous` se sabe qué elementos tocó el cliente; sin él, la lista es una instantánea
+        previa = op.previo.get(campo)
+        antes = {_clave_elemento(v): v for v in previa} if isinstance(previa, list) else None
+        for clave, elemento in elementos.items():
+            # Solo se quitan los elementos que el cliente ya había observado (OR-Set): los propios
+            # aunque su eco aún no haya llegado y los que figuran en su `previous`
+            observado = (elemento[0] <= op.base_seq or elemento[4] == op.autor
+                         or (antes is not None and clave in antes))
+            if clave not in enviados and not elemento[2] and observado:
+                elemento[2] = seq
+        # Baja de un elemento que el servidor aún no conocía (la sala arranca del estado en BD):
+        # la lápida impide que una instantánea desfasada lo resucite
+        for clave, valor in (antes or {}).items():
+            if clave not in enviados and clave not in elementos:
+                elementos[clave] = [0, valor, seq, seq, op.autor]
+        for clave, valor in enviados.items():
+            elemento = elementos.get(clave)
+            intencional = antes is not None and antes.get(clave, _AUSENTE) != valor
+            if elemento is None:
+                elementos[clave] = [seq, valor, 0, seq, op.autor]
+            elif elemento[2]:
+                # Borrado que el cliente no había visto (o que arrastra sin tocar en su `previous`):
+                # su lista está desfasada, no es una nueva alta
+                if (elemento[2] > op.base_seq or antes is not None) and not intencional:
+                    continue
+                elementos[clave] = [seq, valor, 0, seq, op.autor]
+            elif elemento[1] != valor:
+                # Edición del elemento: misma regla que los campos escalares
+                no_observado = elemento[3] > op.base_seq and elemento[4] != op.autor
+                if no_observado and not intencional:
+                    continue
+                if no_observado:
+                    concurrentes.append(f'{campo}.{clave}')
+                elemento[1], elemento[3], elemento[4] = valor, seq, op.autor
+        nuevos[op.clave(campo)] = {k: tuple(e) for k, e in elementos.items()}
+        vivos = sorted((e for e in elementos.values() if not e[2]), key=lambda e: (e[0], _clave_elemento(e[1])))
+        valores[campo] = [e[1] for e in vivos]
+
+    return escrituras, nuevos, {'fields': valores, 'concurrent': concurrentes}
+
+
+class AlmacenMemoria:
+    """Estado de las salas en el proceso (un solo nodo o modo node con BrokerMemoria)"""
+
+    def __init__(self):
+        self._salas: Dict[str, Dict[str, Any]] = {}
+
+    def _sala(self, sala: str) -> Dict[str, Any]:
+        estado = self._salas.get(sala)
+        if estado is None:
+            estado = self._salas[sala] = {'seq': 0, 'epoch': uuid.uuid4().hex[:12], 'reg': {}, 'set': {}}
+        return estado
+
+    async def actual(self, sala: str) -> Tuple[int, str]:
+        estado = self._sala(sala)
+        return estado['seq'], estado['epoch']
+
+    async def siguiente(self, sala: str, op: Optional[Operacion] = None) -> Tuple[int, str, Optional[Dict]]:
+        estado = self._sala(sala)
+        estado['seq'] += 1
+        seq = estado['seq']
+        if op is None:
+            return seq, estado['epoch'], None
+        claves = [op.clave(c) for c in op.campos()]
+        escrituras, conjuntos, resultado = fusionar(
+            op, seq, {c: estado['reg'].get(c) for c in claves},
+            {c: estado['set'].get(c) for c in claves if c.rsplit(':', 1)[1] in CAMPOS_CONJUNTO},
+        )
+        estado['reg'].update(escrituras)
+        estado['set'].update(conjuntos)
+        return seq, estado['epoch'], resultado
+
+    def olvidar(self, sala: str) -> bool:
+        """Sala sin miembros: el siguiente cliente cargará el estado completo (nueva época)"""
+        return self._salas.pop(sala, None) is not None
+
+    def salas(self) -> int:
+        return len(self._salas)
+
+
+class AlmacenRedis:
+    """Estado compartido entre procesos: seq y fusión atómicos con WATCH/MULTI sobre la sala"""
+
+    PREFIJO = 'collab:oplog:'
+
+    def __init__(self, url: str, ttl: int = 86400):
+        import redis.asyncio as aioredis  # solo necesario con Redis
+        self._cliente = aioredis.from_url(url)
+        self.ttl = ttl
+
+    def _claves(self, sala: str) -> Dict[str, str]:
+        base = f'{self.PREFIJO}{sala}'
+        return {'seq': f'{base}:seq', 'epoch': f'{base}:epoch', 'reg': f'{base}:reg', 'set': f'{base}:set'}
+
+    async def _epoch(self, claves: Dict[str, str]) -> str:
+        await self._cliente.set(claves['epoch'], uuid.uuid4().hex[:12], nx=True, ex=self.ttl)
+        epoch = await self._cliente.get(claves['epoch'])
+        return epoch.decode() if isinstance(epoch, bytes) else str(epoch)
+
+    async def actual(self, sala: str) -> Tuple[int, str]:
+        claves = self._claves(sala)
+        epoch = await self._epoch(claves)
+        return int(await self._cliente.get(claves['seq']) or 0), epoch
+
+    async def siguiente(self, sala: str, op: Optional[Operacion] = None) -> Tuple[int, str, Optional[Dict]]:
+        from redis.exceptions import WatchError
+
+        claves = self._claves(sala)
+        epoch = await self._epoch(claves)
+        if op is None:
+            seq = await self._cliente.incr(claves['seq'])
+            await self._cliente.expire(claves['seq'], self.ttl)
+            return seq, epoch, None
+        campos = [op.clave(c) for c in op.campos()]
+        de_conjunto = [c for c in campos if c.rsplit(':', 1)[1] in CAMPOS_CONJUNTO]
+        while True:
+            async with self._cliente.pipeline() as pipe:
+                try:
+                    # Cualquier operación concurrente en la sala cambia seq y obliga a reintentar
+                    await pipe.watch(claves['seq'])
+                    seq = int(await pipe.get(claves['seq']) or 0) + 1
+                    leidos = await pipe.hmget(claves['reg'], campos) if campos else []
+                    registros = {c: tuple(json.loads(v)) if v else None for c, v in zip(campos, leidos)}
+                    conjuntos = {}
+                    for c in de_conjunto:
+                        crudo = await pipe.hget(claves['set'], c)
+                        conjuntos[c] = {k: tuple(v) for k, v in json.loads(crudo).items()} if crudo else None
+                    escrituras, nuevos, resultado = fusionar(op, seq, registros, conjuntos)
+                    pipe.multi()
+                    pipe.set(claves['seq'], seq, ex=self.ttl)
+                    if escrituras:
+                        pipe.hset(claves['reg'], mapping={c: json.dumps(r, default=str) for c, r in escrituras.items()})
+                    if nuevos:
+                        pipe.hset(claves['set'], mapping={c: json.dumps(e, default=str) for c, e in nuevos.items()})
+                    pipe.expire(claves['reg'], self.ttl)
+                    pipe.expire(claves['set'], self.ttl)
+                    await pipe.execute()
+                    return seq, epoch, resultado
+                except WatchError:
+                    continue
+
+    def olvidar(self, sala: str) -> bool:
+        """El estado compartido caduca por TTL; otros nodos pueden seguir en la sala"""
+        return False
+
+    def salas(self) -> int:
+        return 0
+
+
+class SecuenciadorSalas:
+    """Numera los eventos salientes de cada sala y fusiona las ediciones concurrentes"""
+
+    def __init__(self, almacen=None):
+        self.almacen = almacen or AlmacenMemoria()
+        self._miembros: Dict[str, int] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self.stats = {'events': 0, 'merged': 0, 'concurrent_fields': 0, 'stale_fields_kept': 0}
+
+    def entrar(self, sala: str):
+        self._miembros[sala] = self._miembros.get(sala, 0) + 1
+
+    def salir(self, sala: str) -> bool:
+        """True si la sala quedó vacía y su época se descartó (el historial ya no sirve)"""
+        restantes = self._miembros.get(sala, 0) - 1
+        if restantes > 0:
+            self._miembros[sala] = restantes
+            return False
+        self._miembros.pop(sala, None)
+        self._locks.pop(sala, None)
+        return bool(self.almacen.olvidar(sala))
+
+    def lock(self, sala: str) -> asyncio.Lock:
+        """Lock de la sala: mientras se tiene, no se secuencia ni publica ningún evento en ella"""
+        lock = self._locks.get(sala)
+        if lock is None:
+            lock = self._locks[sala] = asyncio.Lock()
+        return lock
+
+    async def posicion(self, sala: str) -> Tuple[int, str]:
+        """(último seq, época) de la sala sin consumir número"""
+        return await self.almacen.actual(sala)
+
+    async def secuenciar(self, sala: str, event_type: str, payload: Dict[str, Any], autor: str,
+                         enviar: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None) -> Dict[str, Any]:
+        """Asigna seq al evento y, si es una edición, sustituye los campos por los fusionados.
+
+        `enviar` se espera dentro del lock de la sala para que el orden de publicación
+        coincida con el de secuencia.
+        """
+        op = normalizar(event_type, payload, autor)
+        async with self.lock(sala):
+            seq, epoch, resultado = await self.almacen.siguiente(sala, op)
+            payload = self._payload(payload, seq, epoch, op, resultado)
+            if enviar is not None:
+                await enviar(payload)
+        return payload
+
+    def _payload(self, payload: Dict[str, Any], seq: int, epoch: str, op: Optional[Operacion],
+                 resultado: Optional[Dict]) -> Dict[str, Any]:
+        self.stats['events'] += 1
+        payload = {**payload, 'seq': seq, 'epoch': epoch}
+        if resultado is None:
+            return payload
+        self.stats['merged'] += 1
+        self.stats['concurrent_fields'] += len(resultado['concurrent'])
+        fusionados = resultado['fields']
+        self.stats['stale_fields_kept'] += sum(
+            1 for c, v in op.instantanea.items() if c in fusionados and fusionados[c] != v and c not in CAMPOS_CONJUNTO
+        )
+        payload.update(fusionados)
+        if isinstance(payload.get('current'), dict):
+            payload['current'] = {**payload['current'], **fusionados}
+        for clave in ('delta', 'set'):
+            if isinstance(payload.get(clave), dict):
+                payload[clave] = {c: fusionados.get(c, v) for c, v in payload[clave].items()}
+        if resultado['concurrent']:
+            payload['concurrent'] = resultado['concurrent']
+        return payload
+
+
+# Un secuenciador por event loop (como el fan-out y la rejilla de interés)
+_secuenciadores: 'weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, SecuenciadorSalas]' = weakref.WeakKeyDictionary()
+
+
+def obtener_secuenciador() -> Optional[SecuenciadorSalas]:
+    """Devuelve el secuenciador del proceso, o None si COLLAB_SEQUENCING está desactivado"""
+    if not getattr(settings, 'COLLAB_SEQUENCING', False):
+        return None
+    loop = asyncio.get_running_loop()
+    secuenciador = _secuenciadores.get(loop)
+    if secuenciador is None:
+        redis_url = getattr(settings, 'REDIS_URL', '')
+        almacen = (AlmacenRedis(redis_url, ttl=getattr(settings, 'COLLAB_OPLOG_TTL', 86400))
+                   if redis_url else AlmacenMemoria())
+        secuenciador = _secuenciadores[loop] = SecuenciadorSalas(almacen)
+        logger.info(f"[secuencia] almacén={type(almacen).__name__}")
+    return secuenciador
@@ -4,6 +4,7 @@ Repositories module for diagram management
 from .diagrama_repository import DiagramRepository, RepositorioDiagrama
 from .entidad_clase_repository import ClassEntityRepository, RepositorioEntidadClase
 from .relacion_repository import RelationshipRepository, RepositorioRelacion
+from .atributo_repository import AttributeRepository, RepositorioAtributos
 
 __all__ = [
     'DiagramRepository',
@@ -11,5 +12,7 @@ __all__ = [
     'ClassEntityRepository',
     'RepositorioEntidadClase',
     'RelationshipRepository',
-    'RepositorioRelacion'
+    'RepositorioRelacion',
+    'AttributeRepository',
+    'RepositorioAtributos'
 ]
\ No newline at end of file
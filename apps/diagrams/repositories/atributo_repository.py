@@ -0,0 +1,253 @@
+"""
+Repositorio para acceso a datos de atributos de clase.
+
+Los atributos viven en filas de class_attributes o, en modo compacto, como lista
+dentro de la propia clase (class_entities.attributes_inline, ver
+models/atributo_en_linea). Cada clase indica el suyo (NULL = filas) y las
+escrituras lo respetan; CLASS_ATTRIBUTE_STORAGE decide el de las clases nuevas y
+si las lecturas hacen prefetch de las filas. `convertir_a_en_linea` y
+`convertir_a_filas` pasan las clases existentes de un formato al otro.
+"""
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Q
+
+from diagram_backend.tracing import trazado
+from ..models import AtributoClase, EntidadClase
+from ..models.atributo_en_linea import EN_LINEA, AtributoEnLinea, empaquetar, modo_almacenamiento
+
+# Condiciones (clase, nombres) por DELETE de atributos: evita cadenas de OR demasiado profundas en SQLite
+_CLASES_POR_BORRADO = 200
+
+
+class RepositorioAtributos:
+    """Lectura, escritura y conversión de atributos en filas o en línea"""
+
+    @property
+    def en_linea(self) -> bool:
+        return modo_almacenamiento() == EN_LINEA
+
+    def prefetch(self, prefijo: str = '') -> List[str]:
+        """Lookups de prefetch para leer atributos: ninguno en modo en línea (viajan con la clase)"""
+        return [] if self.en_linea else [f'{prefijo}attributes']
+
+    def nombres_por_clase(self, clase_ids: Iterable) -> Dict[str, Set[str]]:
+        """Nombres de atributos actuales por clase, en una consulta para ambos formatos"""
+        nombres: Dict[str, Set[str]] = defaultdict(set)
+        filas = (EntidadClase.objects.filter(id__in=list(clase_ids))
+                 .values_list('id', 'attributes_inline', 'attributes__name'))
+        for clase_id, entradas, nombre in filas:
+            if entradas is not None:
+                nombres[str(clase_id)].update(e[0] for e in entradas)
+            elif nombre is not None:
+                nombres[str(clase_id)].add(nombre)
+        return nombres
+
+    # --- escritura de una clase ------------------------------------------
+    def _bloquear(self, clase: EntidadClase) -> Optional[list]:
+        """attributes_inline vigente con la fila bloqueada (lectura-modificación-escritura sin pisar otra)"""
+        return (EntidadClase.objects.select_for_update().filter(pk=clase.pk)
+                .values_list('attributes_inline', flat=True).get())
+
+    def _guardar(self, clase: EntidadClase, entradas: list):
+        EntidadClase.objects.filter(pk=clase.pk).update(attributes_inline=entradas)
+        clase.attributes_inline = entradas
+
+    @staticmethod
+    def _escribir_listas(listas: Dict[Any, list]):
+        """Un UPDATE parametrizado con executemany por lote: bulk_update arma un CASE por fila en Python"""
+        if not listas:
+            return
+        campo, pk = EntidadClase._meta.get_field('attributes_inline'), EntidadClase._meta.pk
+        tabla = connection.ops.quote_name(EntidadClase._meta.db_table)
+        sql = (f'UPDATE {tabla} SET {connection.ops.quote_name(campo.column)} = %s '
+               f'WHERE {connection.ops.quote_name(pk.column)} = %s')
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, [(campo.get_db_prep_save(entradas, connection),
+                                      pk.get_db_prep_save(pk.to_python(clase_id), connection))
+                                     for clase_id, entradas in listas.items()])
+
+    @trazado('RepositorioAtributos.agregar')
+    def agregar(self, clase: EntidadClase, datos: Dict[str, Any]):
+        """Crea un atributo; IntegrityError si la clase ya tiene uno con ese nombre"""
+        atributo = AtributoClase(class_entity=clase, **datos)
+        if clase.attributes_inline is None:
+            # Clase en filas: el INSERT de siempre, sin bloqueo ni savepoint (lo cubre el UNIQUE)
+            atributo.save(force_insert=True)
+            return atributo
+        with transaction.atomic():
+            entradas = self._bloquear(clase)
+            if entradas is None:
+                atributo.save(force_insert=True)
+                return atributo
+            if any(e[0] == atributo.name for e in entradas):
+                raise IntegrityError(f"UNIQUE: la clase ya tiene un atributo '{atributo.name}'")
+            entrada = empaquetar(atributo)
+            self._guardar(clase, entradas + [entrada])
+        return AtributoEnLinea(clase.id, entrada)
+
+    @trazado('RepositorioAtributos.quitar')
+    def quitar(self, clase: EntidadClase, nombre: str) -> bool:
+        """Elimina el atributo por nombre; False si la clase no lo tiene"""
+        if clase.attributes_inline is None:
+            return AtributoClase.objects.filter(class_entity_id=clase.pk, name=nombre).delete()[0] > 0
+        with transaction.atomic():
+            entradas = self._bloquear(clase)
+            if entradas is None:
+                return AtributoClase.objects.filter(class_entity_id=clase.pk, name=nombre).delete()[0] > 0
+            restantes = [e for e in entradas if e[0] != nombre]
+            if len(restantes) == len(entradas):
+                return False
+            self._guardar(clase, restantes)
+        return True
+
+    @trazado('RepositorioAtributos.sincronizar_nombres')
+    def sincronizar_nombres(self, clase: EntidadClase, nombres: List[str]):
+        """Deja en la clase exactamente los atributos `nombres` (documento completo del PUT).
+
+        Los que siguen conservan id, tipo y visibilidad; los nuevos se crean como String.
+        """
+        nombres = list(dict.fromkeys(nombres))
+        conservar = set(nombres)
+        if clase.attributes_inline is not None:
+            actuales = {e[0] for e in clase.attributes_inline}
+            entradas = [e for e in clase.attributes_inline if e[0] in conservar] + [
+                empaquetar(AtributoClase(name=n, data_type='String')) for n in nombres if n not in actuales
+            ]
+            if entradas != clase.attributes_inline:
+                self._guardar(clase, entradas)
+            return
+        existentes = {a.name: a for a in clase.attributes.all()}
+        sobrantes = [a.pk for n, a in existentes.items() if n not in conservar]
+        if sobrantes:
+            AtributoClase.objects.filter(pk__in=sobrantes).delete()
+        nuevos = [AtributoClase(class_entity=clase, name=n, data_type='String') for n in nombres if n not in existentes]
+        if nuevos:
+            AtributoClase.objects.bulk_create(nuevos)
+
+    # --- escritura masiva ------------------------------------------------
+    def empaquetar_en_clases(self, clases: Iterable[EntidadClase],
+                             atributos: Iterable[AtributoClase]) -> List[AtributoClase]:
+        """Antes del bulk_create de clases nuevas: mete en cada clase en línea sus atributos.
+
+        Devuelve los atributos que siguen necesitando filas (clases en modo filas).
+        """
+        por_id = {str(clase.id): clase for clase in clases if clase.attributes_inline is not None}
+        filas = []
+        for atributo in atributos:
+            clase = por_id.get(str(atributo.class_entity_id))
+            if clase is None:
+                filas.append(atributo)
+            else:
+                clase.attributes_inline.append(empaquetar(atributo))
+        return filas
+
+    @trazado('RepositorioAtributos.aplicar_cambios')
+    def aplicar_cambios(self, eliminados: Dict[str, Iterable[str]], nuevos: Iterable[AtributoClase],
+                        batch_size: int = 500):
+        """Borra y crea atributos de clases existentes: un DELETE/INSERT para las de filas y un
+        UPDATE de attributes_inline (executemany) para las que están en línea. Primero los borrados."""
+        nuevos = list(nuevos)
+        clase_ids = set(map(str, eliminados)) | {str(a.class_entity_id) for a in nuevos}
+        if not clase_ids:
+            return
+        en_linea = {
+            str(cid): entradas for cid, entradas in
+            EntidadClase.objects.select_for_update().filter(id__in=clase_ids).values_list('id', 'attributes_inline')
+            if entradas is not None
+        }
+        borrar_filas = [(cid, list(n)) for cid, n in eliminados.items() if str(cid) not in en_linea]
+        for i in range(0, len(borrar_filas), _CLASES_POR_BORRADO):
+            condicion = Q()
+            for clase_id, nombres in borrar_filas[i:i + _CLASES_POR_BORRADO]:
+                condicion |= Q(class_entity_id=clase_id, name__in=nombres)
+            AtributoClase.objects.filter(condicion).delete()
+        AtributoClase.objects.bulk_create([a for a in nuevos if str(a.class_entity_id) not in en_linea],
+                                          batch_size=batch_size)
+        if not en_linea:
+            return
+        for clase_id, nombres in eliminados.items():
+            if str(clase_id) in en_linea:
+                quitar = set(nombres)
+                en_linea[str(clase_id)] = [e for e in en_linea[str(clase_id)] if e[0] not in quitar]
+        for atributo in nuevos:
+            entradas = en_linea.get(str(atributo.class_entity_id))
+            if entradas is not None:
+                if any(e[0] == atributo.name for e in entradas):
+                    raise IntegrityError(f"UNIQUE: la clase ya tiene un atributo '{atributo.name}'")
+                entradas.append(empaquetar(atributo))
+        self._escribir_listas(en_linea)
+
+    # --- conversión entre formatos ---------------------------------------
+    def contar(self) -> Dict[str, int]:
+        return {
+            'classes_rows': EntidadClase.objects.filter(attributes_inline__isnull=True).count(),
+            'classes_inline': EntidadClase.objects.filter(attributes_inline__isnull=False).count(),
+            'attribute_rows': AtributoClase.objects.count(),
+        }
+
+    @staticmethod
+    def _lotes(clase_ids: List, lote: int) -> Iterable[List]:
+        for i in range(0, len(clase_ids), lote):
+            yield clase_ids[i:i + lote]
+
+    @trazado('RepositorioAtributos.convertir_a_en_linea')
+    def convertir_a_en_linea(self, clase_ids: Optional[Iterable] = None, lote: int = 500) -> Dict[str, int]:
+        """Pasa a lista compacta las clases indicadas (o todas las que están en filas), un lote por
+        transacción. Las filas de clases que ya estaban en línea (p. ej. recién importadas) se fusionan
+        con la lista, salvo nombres repetidos."""
+        if clase_ids is None:
+            clase_ids = EntidadClase.objects.filter(attributes_inline__isnull=True).values_list('id', flat=True)
+        clase_ids = list(clase_ids)
+        totales = {'classes': 0, 'attributes': 0}
+        for ids in self._lotes(clase_ids, lote):
+            with transaction.atomic():
+                listas = {cid: list(entradas or []) for cid, entradas in
+                          EntidadClase.objects.select_for_update().filter(id__in=ids)
+                          .values_list('id', 'attributes_inline')}
+                nombres = {cid: {e[0] for e in entradas} for cid, entradas in listas.items()}
+                filas = (AtributoClase.objects.filter(class_entity_id__in=ids).order_by('class_entity_id', 'created_at'))
+                for fila in filas:
+                    if fila.name not in nombres[fila.class_entity_id]:
+                        nombres[fila.class_entity_id].add(fila.name)
+                        listas[fila.class_entity_id].append(empaquetar(fila))
+                        totales['attributes'] += 1
+                self._escribir_listas(listas)
+                AtributoClase.objects.filter(class_entity_id__in=ids).delete()
+                totales['classes'] += len(listas)
+        return totales
+
+    @trazado('RepositorioAtributos.convertir_a_filas')
+    def convertir_a_filas(self, clase_ids: Optional[Iterable] = None, lote: int = 500) -> Dict[str, int]:
+        """Devuelve a filas de class_attributes las clases en línea indicadas (o todas), conservando
+        id, created_at y orden; un lote por transacción"""
+        consulta = EntidadClase.objects.filter(attributes_inline__isnull=False)
+        if clase_ids is not None:
+            consulta = consulta.filter(id__in=list(clase_ids))
+        ids_en_linea = list(consulta.values_list('id', flat=True))
+        totales = {'classes': 0, 'attributes': 0}
+        for ids in self._lotes(ids_en_linea, lote):
+            with transaction.atomic():
+                atributos = [
+                    atributo
+                    for clase_id, entradas in (EntidadClase.objects.select_for_update().filter(id__in=ids)
+                                               .values_list('id', 'attributes_inline'))
+                    for atributo in (AtributoEnLinea(clase_id, e) for e in entradas or [])
+                ]
+                filas = [AtributoClase(id=a.id, class_entity_id=a.class_entity_id, name=a.name,
+                                       data_type=a.data_type, visibility=a.visibility) for a in atributos]
+                AtributoClase.objects.bulk_create(filas, batch_size=lote, ignore_conflicts=True)
+                # auto_now_add pisa created_at al insertar: se restaura la fecha original
+                for fila, atributo in zip(filas, atributos):
+                    fila.created_at = atributo.created_at
+                AtributoClase.objects.bulk_update(filas, ['created_at'], batch_size=lote)
+                EntidadClase.objects.filter(id__in=ids).update(attributes_inline=None)
+                totales['classes'] += len(ids)
+                totales['attributes'] += len(filas)
+        return totales
+
+
+# Alias en inglés para compatibilidad
+AttributeRepository = RepositorioAtributos
@@ -2,32 +2,26 @@
 Repositorio para acceso a datos de diagramas
 """
 from typing import List, Dict, Any, Optional
+from django.db import connection
 from django.db.models import Prefetch
-from ..models import Diagrama, EntidadClase
+from django.utils import timezone
+from diagram_backend.tracing import trazado
+from ..models import Diagrama, EntidadClase, Relacion
+from .atributo_repository import RepositorioAtributos
 
 
 class RepositorioDiagrama:
     """Repositorio para acceso a datos de diagramas"""
     
+    @trazado('RepositorioDiagrama.create')
     def create(self, data: Dict[str, Any]) -> Diagrama:
         """Crear un nuevo diagrama"""
-        # Separar los campos relacionados de los campos básicos
-        classes_data = data.pop('classes', [])
-        relationships_data = data.pop('relationships', [])
-        
-        # Crear el diagrama sin los campos relacionados
-        diagrama = Diagrama.objects.create(**data)
-        
-        # Asignar las clases si existen
-        if classes_data:
-            diagrama.classes.set(classes_data)
-        
-        # Asignar las relaciones si existen
-        if relationships_data:
-            diagrama.relationships.set(relationships_data)
-        
-        return diagrama
+        # Las clases y relaciones llegan como dicts y las crea el servicio;
+        # aquí solo se usan los campos básicos (sin mutar `data`)
+        campos = {k: v for k, v in data.items() if k not in ('classes', 'relationships')}
+        return Diagrama.objects.create(**campos)
     
+    @trazado('RepositorioDiagrama.get_by_id')
     def get_by_id(self, diagram_id: str) -> Optional[Diagrama]:
         """Obtener diagrama por ID"""
         try:
@@ -35,17 +29,21 @@ class RepositorioDiagrama:
         except Diagrama.DoesNotExist:
             return None
     
+    @trazado('RepositorioDiagrama.get_with_details')
     def get_with_details(self, diagram_id: str) -> Optional[Diagrama]:
         """Obtener diagrama con todos los datos relacionados"""
         try:
             return Diagrama.objects.prefetch_related(
-                Prefetch('classes', queryset=EntidadClase.objects.prefetch_related('attributes')),
-                'relationships__from_class',
-                'relationships__to_class'
+                Prefetch('classes', queryset=EntidadClase.objects.prefetch_related(*RepositorioAtributos().prefetch())),
+                # JOIN en lugar de prefetch por FK: en SQLite el prefetch de 1000+
+                # clases genera una cadena de OR que excede la profundidad máxima
+                Prefetch('relationships', queryset=Relacion.objects.select_related('from_class', 'to_class')
+                         .defer('from_class__attributes_inline', 'to_class__attributes_inline')),
             ).get(id=diagram_id)
         except Diagrama.DoesNotExist:
             return None
     
+    @trazado('RepositorioDiagrama.list_diagrams')
     def list_diagrams(self, user=None, is_public=None) -> List[Diagrama]:
         """Listar diagramas con filtrado opcional"""
         queryset = Diagrama.objects.all()
@@ -55,6 +53,7 @@ class RepositorioDiagrama:
             queryset = queryset.filter(is_public=is_public)
         return list(queryset)
     
+    @trazado('RepositorioDiagrama.update')
     def update(self, diagram: Diagrama, data: Dict[str, Any]) -> Diagrama:
         """Actualizar diagrama"""
         for field, value in data.items():
@@ -62,14 +61,30 @@ class RepositorioDiagrama:
         diagram.save()
         return diagram
     
+    @trazado('RepositorioDiagrama.get_revision')
+    def get_revision(self, diagram_id: str) -> Optional[int]:
+        """Revisión actual del diagrama (None si no existe)"""
+        return Diagrama.objects.filter(id=diagram_id).values_list('revision', flat=True).first()
+
+    @trazado('RepositorioDiagrama.bump_revision')
+    def bump_revision(self, diagram_id: str) -> Optional[int]:
+        """Incrementar la revisión de forma atómica y devolver el nuevo valor"""
+        # UPDATE ... RETURNING (PostgreSQL, SQLite >= 3.35): una sola consulta
+        tabla = connection.ops.quote_name(Diagrama._meta.db_table)
+        campo = Diagrama._meta.get_field('id')
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'UPDATE {tabla} SET revision = revision + 1 WHERE id = %s RETURNING revision',
+                [campo.get_db_prep_value(campo.to_python(diagram_id), connection)],
+            )
+            fila = cursor.fetchone()
+        return fila[0] if fila else None
+
+    @trazado('RepositorioDiagrama.delete')
     def delete(self, diagram_id: str) -> bool:
-        """Eliminar diagrama"""
-        try:
-            diagram = Diagrama.objects.get(id=diagram_id)
-            diagram.delete()
-            return True
-        except Diagrama.DoesNotExist:
-            return False
+        """Marcar el diagrama como borrado (un UPDATE); las filas hijas las elimina ServicioPurga"""
+        # diagram.delete() cargaría en memoria cada clase, atributo y relación para emular la cascada
+        return Diagrama.objects.filter(id=diagram_id).update(deleted_at=timezone.now()) > 0
 
 
 # Alias en inglés para compatibilidad
@@ -2,12 +2,18 @@
 Repositorio para acceso a datos de entidades de clase
 """
 from typing import List, Dict, Any, Optional
+from diagram_backend.tracing import trazado
 from ..models import Diagrama, EntidadClase, AtributoClase
+from .atributo_repository import RepositorioAtributos
 
 
 class RepositorioEntidadClase:
     """Repositorio para acceso a datos de entidades de clase"""
+
+    def __init__(self):
+        self.atributos = RepositorioAtributos()
     
+    @trazado('RepositorioEntidadClase.create_with_attributes')
     def create_with_attributes(self, diagram: Diagrama, class_data: Dict[str, Any]) -> EntidadClase:
         """Crear entidad de clase con atributos"""
         attributes_data = class_data.pop('attributes', [])
@@ -19,14 +25,32 @@ class RepositorioEntidadClase:
             **class_data
         )
         # Crear atributos
-        for attr_name in attributes_data:
-            AtributoClase.objects.create(
-                class_entity=class_entity,
-                name=attr_name,
-                data_type='String'
-            )
+        self.atributos.sincronizar_nombres(class_entity, attributes_data)
         return class_entity
+
+    @trazado('RepositorioEntidadClase.bulk_create_with_attributes')
+    def bulk_create_with_attributes(self, diagram: Diagrama, classes_data: List[Dict[str, Any]]) -> Dict[str, EntidadClase]:
+        """Crear varias clases con sus atributos en inserciones masivas; devuelve mapeo nombre -> clase"""
+        clases = []
+        atributos = []
+        for class_data in classes_data:
+            position = class_data.get('position') or {'x': 0, 'y': 0}
+            clase = EntidadClase(
+                diagram=diagram,
+                name=class_data['name'],
+                position_x=position.get('x', 0),
+                position_y=position.get('y', 0),
+            )
+            clases.append(clase)
+            for attr_name in class_data.get('attributes', []):
+                atributos.append(AtributoClase(class_entity=clase, name=attr_name, data_type='String'))
+        # En modo en línea los atributos viajan en la propia clase
+        atributos = self.atributos.empaquetar_en_clases(clases, atributos)
+        EntidadClase.objects.bulk_create(clases, batch_size=500)
+        AtributoClase.objects.bulk_create(atributos, batch_size=500)
+        return {clase.name: clase for clase in clases}
     
+    @trazado('RepositorioEntidadClase.get_by_id')
     def get_by_id(self, class_id: str) -> Optional[EntidadClase]:
         """Obtener entidad de clase por ID"""
         try:
@@ -34,6 +58,7 @@ class RepositorioEntidadClase:
         except EntidadClase.DoesNotExist:
             return None
     
+    @trazado('RepositorioEntidadClase.update_class')
     def update_class(self, class_entity: EntidadClase, class_data: Dict[str, Any]) -> EntidadClase:
         """Actualizar entidad de clase"""
         # Update basic fields
@@ -57,22 +82,7 @@ class RepositorioEntidadClase:
     
     def _update_attributes(self, class_entity: EntidadClase, attributes_data: List[str]):
         """Actualizar atributos de clase"""
-        existing_attrs = {attr.name: attr for attr in class_entity.attributes.all()}
-        new_attr_names = set(attributes_data)
-        
-        # Remove deleted attributes
-        for name, attr in existing_attrs.items():
-            if name not in new_attr_names:
-                attr.delete()
-        
-        # Add new attributes
-        for attr_name in new_attr_names:
-            if attr_name not in existing_attrs:
-                AtributoClase.objects.create(
-                    class_entity=class_entity,
-                    name=attr_name,
-                    data_type='String'
-                )
+        self.atributos.sincronizar_nombres(class_entity, attributes_data)
 
 
 # Alias en inglés para compatibilidad
@@ -1,13 +1,15 @@
 """
 Repositorio para acceso a datos de relaciones
 """
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
+from diagram_backend.tracing import trazado
 from ..models import Diagrama, EntidadClase, Relacion
 
 
 class RepositorioRelacion:
     """Repositorio para acceso a datos de relaciones"""
     
+    @trazado('RepositorioRelacion.create')
     def create(self, diagram: Diagrama, relation_data: Dict[str, Any], class_mapping: Dict[str, EntidadClase]) -> Optional[Relacion]:
         """Crear relación entre clases"""
         from_class_name = relation_data.get('from')
@@ -27,6 +29,27 @@ class RepositorioRelacion:
             cardinality_to=cardinality['to']
         )
     
+    @trazado('RepositorioRelacion.bulk_create')
+    def bulk_create(self, diagram: Diagrama, relations_data: List[Dict[str, Any]], class_mapping: Dict[str, EntidadClase]) -> List[Relacion]:
+        """Crear varias relaciones en inserciones masivas (omite las de clases desconocidas)"""
+        relaciones = []
+        for relation_data in relations_data:
+            from_class = class_mapping.get(relation_data.get('from'))
+            to_class = class_mapping.get(relation_data.get('to'))
+            if from_class is None or to_class is None:
+                continue
+            cardinality = relation_data.get('cardinality') or {}
+            relaciones.append(Relacion(
+                diagram=diagram,
+                from_class=from_class,
+                to_class=to_class,
+                relationship_type=relation_data.get('type', 'association'),
+                cardinality_from=cardinality.get('from', '1'),
+                cardinality_to=cardinality.get('to', '1'),
+            ))
+        return Relacion.objects.bulk_create(relaciones, batch_size=500)
+
+    @trazado('RepositorioRelacion.get_by_id')
     def get_by_id(self, relation_id: str) -> Optional[Relacion]:
         """Obtener relación por ID"""
         try:
@@ -34,6 +57,7 @@ class RepositorioRelacion:
         except Relacion.DoesNotExist:
             return None
     
+    @trazado('RepositorioRelacion.update')
     def update(self, relation: Relacion, data: Dict[str, Any]) -> Relacion:
         """Actualizar relación"""
         for field, value in data.items():
@@ -45,6 +69,7 @@ class RepositorioRelacion:
         relation.save()
         return relation
     
+    @trazado('RepositorioRelacion.delete')
     def delete(self, relation_id: str) -> bool:
         """Eliminar relación"""
         try:
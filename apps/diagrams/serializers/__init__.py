@@ -3,14 +3,17 @@ Serializers module for diagram management
 """
 from .atributo_clase_serializer import SerializadorAtributoClase
 from .entidad_clase_serializer import SerializadorEntidadClase  
-from .relacion_serializer import SerializadorRelacion
+from .relacion_serializer import SerializadorRelacion, SerializadorRelacionDiagrama
 from .diagrama_serializer import SerializadorDiagrama
 from .crear_diagrama_serializer import SerializadorCrearDiagrama
+from .trabajo_serializer import SerializadorTrabajo
 
 __all__ = [
     'SerializadorAtributoClase',
     'SerializadorEntidadClase',
     'SerializadorRelacion', 
+    'SerializadorRelacionDiagrama',
     'SerializadorDiagrama',
-    'SerializadorCrearDiagrama'
+    'SerializadorCrearDiagrama',
+    'SerializadorTrabajo'
 ]
\ No newline at end of file
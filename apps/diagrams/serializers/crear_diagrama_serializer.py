@@ -2,7 +2,8 @@
 Serializador para crear diagramas
 """
 from rest_framework import serializers
-from ..models import Diagrama, EntidadClase, AtributoClase, Relacion
+from ..models import Diagrama, EntidadClase, Relacion
+from ..repositories import RepositorioAtributos
 
 
 class SerializadorCrearDiagrama(serializers.ModelSerializer):
@@ -36,12 +37,7 @@ class SerializadorCrearDiagrama(serializers.ModelSerializer):
             class_mapping[class_data['name']] = entidad_clase
             
             # Crear atributos
-            for attr_data in attributes_data:
-                AtributoClase.objects.create(
-                    class_entity=entidad_clase,
-                    name=attr_data,
-                    data_type='String'
-                )
+            RepositorioAtributos().sincronizar_nombres(entidad_clase, attributes_data)
         
         # Crear relaciones
         for rel_data in relationships_data:
@@ -16,6 +16,6 @@ class SerializadorDiagrama(serializers.ModelSerializer):
         model = Diagrama
         fields = [
             'id', 'name', 'description', 'classes', 'relationships',
-            'is_public', 'created_at', 'updated_at'
+            'is_public', 'revision', 'created_at', 'updated_at'
         ]
-        read_only_fields = ['id', 'created_at', 'updated_at']
\ No newline at end of file
+        read_only_fields = ['id', 'revision', 'created_at', 'updated_at']
\ No newline at end of file
@@ -8,7 +8,8 @@ from .atributo_clase_serializer import SerializadorAtributoClase
 
 class SerializadorEntidadClase(serializers.ModelSerializer):
     """Serializador para entidades de clase"""
-    attributes = SerializadorAtributoClase(many=True, read_only=True)
+    # Filas de class_attributes o entradas de attributes_inline, con la misma forma
+    attributes = SerializadorAtributoClase(source='lista_atributos', many=True, read_only=True)
     position = serializers.SerializerMethodField()
     
     class Meta:
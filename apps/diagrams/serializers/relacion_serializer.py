@@ -7,8 +7,11 @@ from ..models import Relacion, EntidadClase
 
 class SerializadorRelacion(serializers.ModelSerializer):
     """Serializador para relaciones"""
-    from_class = serializers.PrimaryKeyRelatedField(queryset=EntidadClase.objects.all())
-    to_class = serializers.PrimaryKeyRelatedField(queryset=EntidadClase.objects.all())
+    # Sin desplegable en la API navegable: renderizarlo carga todas las clases
+    from_class = serializers.PrimaryKeyRelatedField(queryset=EntidadClase.objects.all(),
+                                                    style={'base_template': 'input.html'})
+    to_class = serializers.PrimaryKeyRelatedField(queryset=EntidadClase.objects.all(),
+                                                  style={'base_template': 'input.html'})
     cardinality = serializers.SerializerMethodField()
 
     class Meta:
@@ -23,4 +26,56 @@ class SerializadorRelacion(serializers.ModelSerializer):
         return {
             'from': obj.cardinality_from,
             'to': obj.cardinality_to
-        }
\ No newline at end of file
+        }
+
+
+class CampoCardinalidad(serializers.Field):
+    """{from, to} <-> cardinality_from / cardinality_to"""
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('source', '*')
+        super().__init__(**kwargs)
+
+    def to_representation(self, obj):
+        return {'from': obj.cardinality_from, 'to': obj.cardinality_to}
+
+    def to_internal_value(self, data):
+        if not isinstance(data, dict):
+            raise serializers.ValidationError('cardinality debe ser {from, to}')
+        campos = {}
+        for extremo in ('from', 'to'):
+            if extremo in data:
+                valor = str(data[extremo])
+                if len(valor) > 10:
+                    raise serializers.ValidationError(f'cardinality.{extremo} supera 10 caracteres')
+                campos[f'cardinality_{extremo}'] = valor
+        return campos
+
+
+class SerializadorRelacionDiagrama(serializers.ModelSerializer):
+    """Relaciones de un diagrama: from/to se validan contra las clases del diagrama en memoria.
+
+    Espera en el contexto `clases`: el conjunto de ids (str) de clases del diagrama.
+    """
+    from_class = serializers.UUIDField(source='from_class_id')
+    to_class = serializers.UUIDField(source='to_class_id')
+    cardinality = CampoCardinalidad(required=False)
+
+    class Meta:
+        model = Relacion
+        fields = [
+            'id', 'from_class', 'to_class', 'relationship_type',
+            'cardinality', 'created_at'
+        ]
+        read_only_fields = ['id', 'created_at']
+
+    def validate(self, attrs):
+        clases = self.context['clases']
+        faltantes = {
+            campo: 'La clase no pertenece al diagrama'
+            for campo, fuente in (('from_class', 'from_class_id'), ('to_class', 'to_class_id'))
+            if fuente in attrs and str(attrs[fuente]) not in clases
+        }
+        if faltantes:
+            raise serializers.ValidationError(faltantes)
+        return attrs
@@ -0,0 +1,18 @@
+"""
+Serializador para trabajos en segundo plano
+"""
+from rest_framework import serializers
+from ..models import Trabajo
+
+
+class SerializadorTrabajo(serializers.ModelSerializer):
+    """Estado de un trabajo (solo lectura)"""
+
+    class Meta:
+        model = Trabajo
+        fields = [
+            'id', 'kind', 'status', 'progress', 'message', 'params', 'result', 'error',
+            'attempts', 'max_attempts', 'run_after', 'cancel_requested', 'diagram_id',
+            'created_at', 'started_at', 'finished_at',
+        ]
+        read_only_fields = fields
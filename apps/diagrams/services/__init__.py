@@ -1,4 +1,28 @@
 from .diagram_service import DiagramService, ServicioDiagrama
 from .class_entity_service import ClassEntityService
+from .diagram_generator import DiagramGenerator, GeneradorDiagramas
+from .export_service import ExportService, ServicioExportacion
+from .layout_service import LayoutService, ServicioLayout
+from .graph_index import GraphIndex, GraphService, IndiceGrafo, ServicioGrafo
+from .validation_service import ServicioValidacion, ValidationService
+from .search_service import SearchService, ServicioBusqueda
+from .viewport_service import Rectangulo, ServicioViewport, ViewportService
+from .batch_service import BatchOperationsService, OperacionInvalida, ServicioOperaciones
+from .purge_service import PurgeService, ServicioPurga
+from .job_service import (
+    ContextoTrabajo, EjecutorTrabajos, JobRunner, JobService, ServicioTrabajos, TrabajoCancelado, TrabajoFallido,
+)
+from .health_service import DependencyMonitor, MonitorDependencias, iniciar_monitor
+# Registra los tipos de trabajo (@tarea)
+from . import job_tasks  # noqa: F401
 
-__all__ = ["DiagramService", "ServicioDiagrama", "ClassEntityService"]
\ No newline at end of file
+__all__ = [
+    "DiagramService", "ServicioDiagrama", "ClassEntityService",
+    "DiagramGenerator", "GeneradorDiagramas", "ExportService", "ServicioExportacion",
+    "LayoutService", "ServicioLayout", "GraphIndex", "GraphService", "IndiceGrafo", "ServicioGrafo",
+    "ServicioValidacion", "ValidationService", "SearchService", "ServicioBusqueda",
+    "Rectangulo", "ServicioViewport", "ViewportService",
+    "BatchOperationsService", "OperacionInvalida", "ServicioOperaciones", "PurgeService", "ServicioPurga",
+    "ContextoTrabajo", "EjecutorTrabajos", "JobRunner", "JobService", "ServicioTrabajos",
+    "TrabajoCancelado", "TrabajoFallido", "DependencyMonitor", "MonitorDependencias", "iniciar_monitor",
+]
@@ -0,0 +1,397 @@
+"""
+Servicio de operaciones por lotes sobre un diagrama.
+Recibe una lista ordenada de operaciones tipadas (clases, atributos y
+relaciones), las valida en orden contra una copia del índice de grafo y las
+escribe en una sola transacción agrupadas por tipo: un DELETE/UPDATE/INSERT por
+grupo en lugar de una escritura por operación, y una sola revisión nueva.
+"""
+import logging
+import time
+import uuid
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from ..models import AtributoClase, EntidadClase, Relacion
+from ..repositories import RepositorioAtributos
+from .graph_index import IndiceGrafo, ServicioGrafo
+from .validation_service import Diagnostico, ServicioValidacion, hay_errores
+
+logger = logging.getLogger(__name__)
+
+MAX_OPERACIONES = 5000
+TIPOS_RELACION = {tipo for tipo, _ in Relacion.RELATIONSHIP_TYPES}
+VISIBILIDADES = {v for v, _ in AtributoClase._meta.get_field('visibility').choices}
+
+
+class OperacionInvalida(ValueError):
+    """Una operación del lote no se puede aplicar; no se escribe nada"""
+
+    def __init__(self, mensaje: str, resultados: List[Dict], conflicto: bool = False):
+        super().__init__(mensaje)
+        self.resultados = resultados
+        self.conflicto = conflicto
+
+
+class _ErrorOp(Exception):
+    def __init__(self, mensaje: str, diagnosticos: Optional[List[Diagnostico]] = None):
+        super().__init__(mensaje)
+        self.diagnosticos = diagnosticos or []
+
+
+def _posicion(op: Dict) -> Tuple[int, int]:
+    pos = op.get('position')
+    if not isinstance(pos, dict) or 'x' not in pos or 'y' not in pos:
+        raise _ErrorOp('position debe ser {x, y}')
+    try:
+        return int(pos['x']), int(pos['y'])
+    except (TypeError, ValueError):
+        raise _ErrorOp('position.x y position.y deben ser enteros')
+
+
+def _nombre(op: Dict, campo: str = 'name', maximo: int = 100) -> str:
+    nombre = op.get(campo)
+    if not isinstance(nombre, str) or not nombre.strip():
+        raise _ErrorOp(f'{campo} es obligatorio')
+    if len(nombre) > maximo:
+        raise _ErrorOp(f'{campo} supera {maximo} caracteres')
+    return nombre
+
+
+class _Lote:
+    """Estado simulado del diagrama y escrituras pendientes agrupadas por tipo"""
+
+    def __init__(self, diagrama_id: str, indice: IndiceGrafo, atributos: Dict[str, Set[str]]):
+        self.diagrama_id = diagrama_id
+        self.indice = indice
+        self.atributos = atributos
+        self.refs: Dict[str, str] = {}
+        self.clases_nuevas: Dict[str, EntidadClase] = {}
+        self.clases_editadas: Dict[str, Dict[str, Any]] = defaultdict(dict)
+        self.clases_eliminadas: Set[str] = set()
+        self.atributos_nuevos: Dict[Tuple[str, str], AtributoClase] = {}
+        self.atributos_eliminados: Set[Tuple[str, str]] = set()
+        self.relaciones_nuevas: Dict[str, Relacion] = {}
+        self.relaciones_editadas: Dict[str, Dict[str, Any]] = defaultdict(dict)
+        self.relaciones_eliminadas: Set[str] = set()
+        # Se reaplican sobre el índice cacheado al confirmar
+        self.cambios_grafo: List[Callable[[IndiceGrafo], None]] = []
+
+    def resolver(self, valor) -> str:
+        valor = str(valor or '').strip()
+        return self.refs.get(valor, valor)
+
+    def clase(self, op: Dict, campo: str = 'id') -> str:
+        clase = self.resolver(op.get(campo))
+        if clase not in self.indice.nodos:
+            raise _ErrorOp(f'{campo}: la clase no existe en el diagrama')
+        return clase
+
+    def relacion(self, op: Dict) -> str:
+        rel_id = self.resolver(op.get('id'))
+        if rel_id not in self.indice.aristas:
+            raise _ErrorOp('id: la relación no existe en el diagrama')
+        return rel_id
+
+    def registrar_ref(self, op: Dict, nuevo_id: str):
+        ref = op.get('ref')
+        if ref is not None:
+            if str(ref) in self.refs:
+                raise _ErrorOp(f"ref '{ref}' repetida en el lote")
+            self.refs[str(ref)] = nuevo_id
+
+
+class ServicioOperaciones:
+    """Aplica listas de operaciones de edición en una transacción"""
+
+    def __init__(self):
+        self.grafo = ServicioGrafo()
+        self.validacion = ServicioValidacion()
+        self.atributos = RepositorioAtributos()
+        self._aplicadores = {
+            'add_class': self._add_class,
+            'rename_class': self._rename_class,
+            'move_class': self._move_class,
+            'delete_class': self._delete_class,
+            'add_attribute': self._add_attribute,
+            'remove_attribute': self._remove_attribute,
+            'add_relationship': self._add_relationship,
+            'update_relationship': self._update_relationship,
+            'remove_relationship': self._remove_relationship,
+        }
+
+    def aplicar(self, diagrama_id: str, operaciones: List[Dict]) -> Optional[Dict]:
+        """Valida y escribe el lote; None si el diagrama no existe.
+
+        Lanza OperacionInvalida con el resultado por operación si alguna falla.
+        """
+        t0 = time.perf_counter()
+        if not isinstance(operaciones, list) or not operaciones:
+            raise OperacionInvalida('operations debe ser una lista no vacía', [])
+        if len(operaciones) > MAX_OPERACIONES:
+            raise OperacionInvalida(f'Máximo {MAX_OPERACIONES} operaciones por lote', [])
+        diagrama_id = str(diagrama_id)
+
+        with transaction.atomic():
+            indice = self.grafo.obtener_indice(diagrama_id)
+            if indice is None:
+                return None
+            lote = _Lote(diagrama_id, indice.copiar(), self._atributos_existentes(indice, operaciones))
+            nombres_previos = dict(indice.nombres)
+            resultados = self._simular(lote, operaciones)
+            try:
+                self._escribir(lote, nombres_previos)
+            except IntegrityError as e:
+                logger.warning(f"[lote] conflicto id={diagrama_id}: {e}")
+                raise OperacionInvalida('Conflicto con datos existentes al escribir el lote',
+                                        resultados, conflicto=True)
+            revision = self.grafo.lote_aplicado(diagrama_id, lote.cambios_grafo)
+
+        ms = (time.perf_counter() - t0) * 1000
+        logger.debug(f"[lote] id={diagrama_id} ops={len(operaciones)} rev={revision} ms={ms:.1f}")
+        return {
+            'revision': revision,
+            'applied': len(operaciones),
+            'results': resultados,
+            'elapsed_ms': round(ms, 1),
+        }
+
+    def _atributos_existentes(self, indice: IndiceGrafo, operaciones: List[Dict]) -> Dict[str, Set[str]]:
+        """Nombres de atributos actuales de las clases existentes que tocan operaciones de atributos"""
+        clases = {
+            str(op.get('class_id') or '').strip() for op in operaciones
+            if isinstance(op, dict) and op.get('op') in ('add_attribute', 'remove_attribute')
+        } & indice.nodos
+        return self.atributos.nombres_por_clase(clases) if clases else defaultdict(set)
+
+    def _simular(self, lote: _Lote, operaciones: List[Dict]) -> List[Dict]:
+        """Aplica las operaciones en orden sobre el estado en memoria; se detiene en el primer error"""
+        resultados = []
+        for posicion, op in enumerate(operaciones):
+            tipo = op.get('op') if isinstance(op, dict) else None
+            resultado = {'index': posicion, 'op': tipo}
+            try:
+                aplicador = self._aplicadores.get(tipo)
+                if aplicador is None:
+                    raise _ErrorOp(f"op desconocida; válidas: {', '.join(self._aplicadores)}")
+                resultado.update(aplicador(lote, op, f'operations[{posicion}]') or {})
+                resultado['status'] = 'ok'
+                resultados.append(resultado)
+            except _ErrorOp as e:
+                resultado.update(status='error', error=str(e))
+                if e.diagnosticos:
+                    resultado['diagnostics'] = [d.as_dict() for d in e.diagnosticos]
+                resultados.append(resultado)
+                resultados.extend({'index': i, 'op': o.get('op') if isinstance(o, dict) else None,
+                                   'status': 'skipped'}
+                                  for i, o in enumerate(operaciones[posicion + 1:], start=posicion + 1))
+                raise OperacionInvalida(f'operations[{posicion}]: {e}', resultados)
+        return resultados
+
+    # --- clases -----------------------------------------------------------
+    def _validar_nombre(self, lote: _Lote, nombre: str, clase_id: Optional[str], ref: str):
+        diagnosticos = self.validacion.validar_nombre_clase(lote.indice, nombre, clase_id, ref=ref)
+        if hay_errores(diagnosticos):
+            raise _ErrorOp(diagnosticos[0].message, diagnosticos)
+
+    def _add_class(self, lote: _Lote, op: Dict, ref: str) -> Dict:
+        nombre = _nombre(op)
+        x, y = _posicion(op) if 'position' in op else (0, 0)
+        self._validar_nombre(lote, nombre, None, ref)
+        atributos = op.get('attributes') or []
+        if not isinstance(atributos, list) or len(set(map(str, atributos))) != len(atributos):
+            raise _ErrorOp('attributes debe ser una lista de nombres sin repetir')
+        clase_id = str(uuid.uuid4())
+        lote.registrar_ref(op, clase_id)
+        lote.clases_nuevas[clase_id] = EntidadClase(
+            id=clase_id, diagram_id=lote.diagrama_id, name=nombre, position_x=x, position_y=y)
+        lote.atributos[clase_id] = set()
+        for nombre_attr in atributos:
+            self._nuevo_atributo(lote, clase_id, {'name': nombre_attr})
+        lote.indice.agregar_nodo(clase_id, nombre)
+        lote.cambios_grafo.append(lambda indice: indice.agregar_nodo(clase_id, nombre))
+        return {'id': clase_id}
+
+    def _editar_clase(self, lote: _Lote, clase_id: str, **campos):
+        nueva = lote.clases_nuevas.get(clase_id)
+        if nueva is not None:
+            for campo, valor in campos.items():
+                setattr(nueva, campo, valor)
+        else:
+            lote.clases_editadas[clase_id].update(campos)
+
+    def _rename_class(self, lote: _Lote, op: Dict, ref: str) -> Dict:
+        clase_id = lote.clase(op)
+        nombre = _nombre(op)
+        self._validar_nombre(lote, nombre, clase_id, ref)
+        self._editar_clase(lote, clase_id, name=nombre)
+        lote.indice.renombrar(clase_id, nombre)
+        lote.cambios_grafo.append(lambda indice: indice.agregar_nodo(clase_id, nombre))
+        return {'id': clase_id}
+
+    def _move_class(self, lote: _Lote, op: Dict, ref: str) -> Dict:
+        clase_id = lote.clase(op)
+        x, y = _posicion(op)
+        self._editar_clase(lote, clase_id, position_x=x, position_y=y)
+        return {'id': clase_id}
+
+    def _delete_class(self, lote: _Lote, op: Dict, ref: str) -> Dict:
+        clase_id = lote.clase(op)
+        # Relaciones de la clase: la BD las borra en cascada, aquí se descartan las pendientes
+        for vecino in lote.indice.vecinos(clase_id):
+            lote.relaciones_nuevas.pop(vecino['relationship_id'], None)
+            lote.relaciones_editadas.pop(vecino['relationship_id'], None)
+        lote.indice.quitar_nodo(clase_id)
+        for clave in [k for k in lote.atributos_nuevos if k[0] == clase_id]:
+            del lote.atributos_nuevos[clave]
+        lote.atributos_eliminados = {k for k in lote.atributos_eliminados if k[0] != clase_id}
+        lote.atributos.pop(clase_id, None)
+        if lote.clases_nuevas.pop(clase_id, None) is None:
+            lote.clases_editadas.pop(clase_id, None)
+            lote.clases_eliminadas.add(clase_id)
+        lote.cambios_grafo.append(lambda indice: indice.quitar_nodo(clase_id))
+        return {'id': clase_id}
+
+    # --- atributos --------------------------------------------------------
+    def _nuevo_atributo(self, lote: _Lote, clase_id: str, op: Dict) -> str:
+        nombre = _nombre(op)
+        visibilidad = op.get('visibility', 'public')
+        if visibilidad not in VISIBILIDADES:
+            raise _ErrorOp(f"visibility debe ser una de: {', '.join(sorted(VISIBILIDADES))}")
+        if nombre in lote.atributos[clase_id]:
+            raise _ErrorOp(f"La clase ya tiene un atributo '{nombre}'")
+        lote.atributos[clase_id].add(nombre)
+        lote.atributos_nuevos[(clase_id, nombre)] = AtributoClase(
+            class_entity_id=clase_id, name=nombre,
+            data_type=str(op.get('data_type') or 'String')[:50], visibility=visibilidad,
+        )
+        return nombre
+
+    def _add_attribute(self, lote: _Lote, op: Dict, ref: str) -> Dict:
+        clase_id = lote.clase(op, 'class_id')
+        return {'class_id': clase_id, 'name': self._nuevo_atributo(lote, clase_id, op)}
+
+    def _remove_attribute(self, lote: _Lote, op: Dict, ref: str) -> Dict:
+        clase_id = lote.clase(op, 'class_id')
+        nombre = _nombre(op)
+        if nombre not in lote.atributos[clase_id]:
+            raise _ErrorOp(f"La clase no tiene un atributo '{nombre}'")
+        lote.atributos[clase_id].discard(nombre)
+        if lote.atributos_nuevos.pop((clase_id, nombre), None) is None:
+            lote.atributos_eliminados.add((clase_id, nombre))
+        return {'class_id': clase_id, 'name': nombre}
+
+    # --- relaciones -------------------------------------------------------
+    def _validar_relacion(self, lote: _Lote, desde: str, hasta: str, tipo: str, ref: str,
+                          rel_id: Optional[str] = None):
+        if tipo not in TIPOS_RELACION:
+            raise _ErrorOp(f"type debe ser uno de: {', '.join(sorted(TIPOS_RELACION))}")
+        diagnosticos = self.validacion.validar_relacion(lote.indice, desde, hasta, tipo, ref=ref, rel_id=rel_id)
+        if hay_errores(diagnosticos):
+            raise _ErrorOp(diagnosticos[0].message, diagnosticos)
+
+    @staticmethod
+    def _cardinalidad(op: Dict) -> Dict[str, str]:
+        """Campos de cardinalidad enviados (solo los extremos presentes)"""
+        cardinalidad = op.get('cardinality') or {}
+        if not isinstance(cardinalidad, dict):
+            raise _ErrorOp('cardinality debe ser {from, to}')
+        campos = {}
+        for extremo in ('from', 'to'):
+            if extremo in cardinalidad:
+                valor = str(cardinalidad[extremo])
+                if len(valor) > 10:
+                    raise _ErrorOp(f'cardinality.{extremo} supera 10 caracteres')
+                campos[f'cardinality_{extremo}'] = valor
+        return campos
+
+    def _add_relationship(self, lote: _Lote, op: Dict, ref: str) -> Dict:
+        desde, hasta = lote.resolver(op.get('from')), lote.resolver(op.get('to'))
+        tipo = op.get('type', 'association')
+        self._validar_relacion(lote, desde, hasta, tipo, ref)
+        cardinalidad = {'cardinality_from': '1', 'cardinality_to': '1', **self._cardinalidad(op)}
+        rel_id = str(uuid.uuid4())
+        lote.registrar_ref(op, rel_id)
+        lote.relaciones_nuevas[rel_id] = Relacion(
+            id=rel_id, diagram_id=lote.diagrama_id, from_class_id=desde, to_class_id=hasta,
+            relationship_type=tipo, **cardinalidad,
+        )
+        lote.indice.agregar(rel_id, desde, hasta, tipo)
+        lote.cambios_grafo.append(lambda indice: indice.agregar(rel_id, desde, hasta, tipo))
+        return {'id': rel_id}
+
+    def _update_relationship(self, lote: _Lote, op: Dict, ref: str) -> Dict:
+        rel_id = lote.relacion(op)
+        desde_actual, hasta_actual, tipo_actual = lote.indice.aristas[rel_id]
+        desde = lote.resolver(op['from']) if 'from' in op else desde_actual
+        hasta = lote.resolver(op['to']) if 'to' in op else hasta_actual
+        tipo = op.get('type', tipo_actual)
+        self._validar_relacion(lote, desde, hasta, tipo, ref, rel_id=rel_id)
+        campos = {'from_class_id': desde, 'to_class_id': hasta, 'relationship_type': tipo,
+                  **self._cardinalidad(op)}
+        nueva = lote.relaciones_nuevas.get(rel_id)
+        if nueva is not None:
+            for campo, valor in campos.items():
+                setattr(nueva, campo, valor)
+        else:
+            lote.relaciones_editadas[rel_id].update(campos)
+        lote.indice.agregar(rel_id, desde, hasta, tipo)
+        lote.cambios_grafo.append(lambda indice: indice.agregar(rel_id, desde, hasta, tipo))
+        return {'id': rel_id}
+
+    def _remove_relationship(self, lote: _Lote, op: Dict, ref: str) -> Dict:
+        rel_id = lote.relacion(op)
+        lote.indice.quitar(rel_id)
+        if lote.relaciones_nuevas.pop(rel_id, None) is None:
+            lote.relaciones_editadas.pop(rel_id, None)
+            lote.relaciones_eliminadas.add(rel_id)
+        lote.cambios_grafo.append(lambda indice: indice.quitar(rel_id))
+        return {'id': rel_id}
+
+    # --- escritura --------------------------------------------------------
+    @staticmethod
+    def _actualizar_por_campos(modelo, ediciones: Dict[str, Dict[str, Any]], extra: Dict[str, Any]):
+        """bulk_update agrupado por conjunto de campos (sin leer las filas)"""
+        grupos: Dict[Tuple[str, ...], List] = defaultdict(list)
+        for pk, campos in ediciones.items():
+            campos = {**campos, **extra}
+            grupos[tuple(sorted(campos))].append(modelo(id=pk, **campos))
+        for campos, objetos in grupos.items():
+            modelo.objects.bulk_update(objetos, list(campos), batch_size=500)
+
+    def _escribir(self, lote: _Lote, nombres_previos: Dict[str, str]):
+        """Borrados, ediciones e inserciones agrupados por tipo (los atributos, tras crear las clases)"""
+        ahora = timezone.now()
+        if lote.relaciones_eliminadas:
+            Relacion.objects.filter(id__in=lote.relaciones_eliminadas).delete()
+        if lote.clases_eliminadas:
+            EntidadClase.objects.filter(id__in=lote.clases_eliminadas).delete()
+
+        if lote.clases_editadas:
+            # Intercambios de nombre (A->B, B->A): nombres temporales para no violar unique (diagram, name)
+            renombradas = {cid for cid, campos in lote.clases_editadas.items() if 'name' in campos}
+            ocupados = {nombres_previos.get(cid) for cid in renombradas}
+            if any(lote.clases_editadas[cid]['name'] in ocupados for cid in renombradas):
+                self._actualizar_por_campos(EntidadClase, {cid: {'name': f'~{cid}'} for cid in renombradas}, {})
+            self._actualizar_por_campos(EntidadClase, lote.clases_editadas, {'updated_at': ahora})
+        atributos_nuevos = list(lote.atributos_nuevos.values())
+        if lote.clases_nuevas:
+            # Las clases nuevas en línea se insertan ya con sus atributos
+            atributos_nuevos = self.atributos.empaquetar_en_clases(lote.clases_nuevas.values(), atributos_nuevos)
+            EntidadClase.objects.bulk_create(lote.clases_nuevas.values(), batch_size=500)
+        if lote.atributos_eliminados or atributos_nuevos:
+            por_clase: Dict[str, List[str]] = defaultdict(list)
+            for clase_id, nombre in lote.atributos_eliminados:
+                por_clase[clase_id].append(nombre)
+            self.atributos.aplicar_cambios(por_clase, atributos_nuevos)
+        if lote.relaciones_editadas:
+            self._actualizar_por_campos(Relacion, lote.relaciones_editadas, {})
+        if lote.relaciones_nuevas:
+            Relacion.objects.bulk_create(lote.relaciones_nuevas.values(), batch_size=500)
+
+
+# Alias en inglés para compatibilidad
+BatchOperationsService = ServicioOperaciones
+InvalidOperation = OperacionInvalida
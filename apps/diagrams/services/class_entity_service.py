@@ -1,29 +1,29 @@
-from typing import Dict, Any
-from ..models import EntidadClase, AtributoClase
-from ..repositories import ClassEntityRepository
+from typing import Dict, Any, Union
+from ..models import EntidadClase, AtributoClase, AtributoEnLinea
+from ..repositories import AttributeRepository, ClassEntityRepository
+from .graph_index import ServicioGrafo
 
 class ClassEntityService:
     """Servicio para operaciones de entidades de clase"""
     def __init__(self):
         self.class_repo = ClassEntityRepository()
+        self.attribute_repo = AttributeRepository()
+        self.grafo = ServicioGrafo()
 
-    def add_attribute(self, class_id: str, attribute_data: Dict[str, Any]) -> AtributoClase:
-        """Agregar atributo a una clase"""
+    def add_attribute(self, class_id: str, attribute_data: Dict[str, Any]) -> Union[AtributoClase, AtributoEnLinea]:
+        """Agregar atributo a una clase (fila o entrada en línea, según el almacenamiento de la clase)"""
         class_entity = self.class_repo.get_by_id(class_id)
-        return AtributoClase.objects.create(
-            class_entity=class_entity,
-            **attribute_data
-        )
+        attribute = self.attribute_repo.agregar(class_entity, attribute_data)
+        self.grafo.sin_cambios_de_grafo(class_entity.diagram_id)
+        return attribute
 
     def remove_attribute(self, class_id: str, attribute_name: str) -> bool:
         """Eliminar atributo de una clase"""
-        try:
-            class_entity = self.class_repo.get_by_id(class_id)
-            attribute = class_entity.attributes.get(name=attribute_name)
-            attribute.delete()
-            return True
-        except AtributoClase.DoesNotExist:
+        class_entity = self.class_repo.get_by_id(class_id)
+        if not self.attribute_repo.quitar(class_entity, attribute_name):
             return False
+        self.grafo.sin_cambios_de_grafo(class_entity.diagram_id)
+        return True
 
     def update_class_position(self, class_id: str, position: Dict[str, int]) -> EntidadClase:
         """Actualizar posición de la clase"""
@@ -31,4 +31,5 @@ class ClassEntityService:
         class_entity.position_x = position['x']
         class_entity.position_y = position['y']
         class_entity.save()
+        self.grafo.sin_cambios_de_grafo(class_entity.diagram_id)
         return class_entity
\ No newline at end of file
@@ -0,0 +1,173 @@
+"""
+Generador sintético de diagramas grandes para siembra y profiling.
+Determinista a partir de una semilla (incluidos los UUID) y con inserciones masivas.
+"""
+import random
+import uuid
+from dataclasses import dataclass
+from typing import Dict, List, Set, Tuple
+
+from django.db import transaction
+
+from ..models import Diagrama, EntidadClase, AtributoClase, Relacion
+from ..repositories import RepositorioAtributos
+
+FORMAS = ('inheritance', 'dense', 'hub', 'mixed')
+
+_NOMBRES_CLASE = [
+    'Cliente', 'Factura', 'Producto', 'Pedido', 'Proveedor', 'Empleado', 'Sucursal',
+    'Inventario', 'Pago', 'Categoria', 'Usuario', 'Rol', 'Cuenta', 'Contrato', 'Envio',
+]
+_NOMBRES_ATRIBUTO = [
+    'id', 'nombre', 'nit', 'fecha', 'monto', 'estado', 'codigo', 'descripcion',
+    'email', 'telefono', 'direccion', 'cantidad', 'precio', 'total', 'activo',
+]
+_TIPOS_DATO = ['String', 'Integer', 'Date', 'Boolean', 'Decimal']
+_VISIBILIDADES = ['public', 'private', 'protected']
+_TIPOS_ASOCIACION = ['association', 'association', 'composition', 'aggregation']
+
+
+@dataclass
+class PerfilGeneracion:
+    """Distribución de clases, atributos y relaciones de cada diagrama"""
+    classes: int = 100
+    attributes_min: int = 3
+    attributes_max: int = 8
+    shape: str = 'mixed'
+    # Relaciones no jerárquicas por clase (forma dense/mixed)
+    density: float = 1.0
+    # Hijos por nodo en los árboles de herencia
+    branching: int = 3
+    # Clases hub que concentran asociaciones (forma hub/mixed)
+    hubs: int = 5
+
+
+class GeneradorDiagramas:
+    """Genera diagramas sintéticos deterministas con bulk_create"""
+
+    def __init__(self, seed: int = 0, batch_size: int = 2000):
+        self.rnd = random.Random(seed)
+        self.batch_size = batch_size
+
+    def _uuid(self) -> uuid.UUID:
+        return uuid.UUID(int=self.rnd.getrandbits(128), version=4)
+
+    def generar(self, cantidad: int, perfil: PerfilGeneracion, owner=None, prefijo: str = 'Sintético') -> Dict[str, int]:
+        """Genera `cantidad` diagramas; devuelve el número de filas insertadas por tabla"""
+        if perfil.shape not in FORMAS:
+            raise ValueError(f"Forma desconocida '{perfil.shape}', opciones: {', '.join(FORMAS)}")
+        totales = {'diagrams': 0, 'classes': 0, 'attributes': 0, 'relationships': 0}
+        with transaction.atomic():
+            for n in range(cantidad):
+                filas = self.generar_diagrama(perfil, owner=owner, nombre=f'{prefijo} {n + 1}')[1]
+                for clave, valor in filas.items():
+                    totales[clave] += valor
+        return totales
+
+    def generar_diagrama(self, perfil: PerfilGeneracion, owner=None,
+                         nombre: str = 'Sintético') -> Tuple[Diagrama, Dict[str, int]]:
+        """Genera un diagrama con sus clases, atributos y relaciones"""
+        diagrama = Diagrama(id=self._uuid(), name=nombre, description=f'forma={perfil.shape}',
+                            created_by=owner)
+        diagrama.save(force_insert=True)
+
+        clases = self._clases(diagrama, perfil.classes)
+        atributos = self._atributos(clases, perfil)
+        relaciones = self._relaciones(diagrama, clases, perfil)
+
+        filas_atributos = RepositorioAtributos().empaquetar_en_clases(clases, atributos)
+        EntidadClase.objects.bulk_create(clases, batch_size=self.batch_size)
+        AtributoClase.objects.bulk_create(filas_atributos, batch_size=self.batch_size)
+        Relacion.objects.bulk_create(relaciones, batch_size=self.batch_size)
+        return diagrama, {
+            'diagrams': 1,
+            'classes': len(clases),
+            'attributes': len(atributos),
+            'relationships': len(relaciones),
+        }
+
+    def _clases(self, diagrama: Diagrama, cantidad: int) -> List[EntidadClase]:
+        # Cuadrícula aproximadamente cuadrada para que el lienzo sea navegable
+        columnas = max(1, int(cantidad ** 0.5))
+        return [
+            EntidadClase(
+                id=self._uuid(),
+                diagram=diagrama,
+                name=f'{_NOMBRES_CLASE[i % len(_NOMBRES_CLASE)]}{i}',
+                position_x=(i % columnas) * 240,
+                position_y=(i // columnas) * 180,
+            )
+            for i in range(cantidad)
+        ]
+
+    def _atributos(self, clases: List[EntidadClase], perfil: PerfilGeneracion) -> List[AtributoClase]:
+        atributos = []
+        for clase in clases:
+            cantidad = self.rnd.randint(perfil.attributes_min, max(perfil.attributes_min, perfil.attributes_max))
+            for j in range(cantidad):
+                base = _NOMBRES_ATRIBUTO[j % len(_NOMBRES_ATRIBUTO)]
+                atributos.append(AtributoClase(
+                    id=self._uuid(),
+                    class_entity=clase,
+                    name=base if j < len(_NOMBRES_ATRIBUTO) else f'{base}{j}',
+                    data_type=self.rnd.choice(_TIPOS_DATO),
+                    visibility=self.rnd.choice(_VISIBILIDADES),
+                ))
+        return atributos
+
+    def _relaciones(self, diagrama: Diagrama, clases: List[EntidadClase], perfil: PerfilGeneracion) -> List[Relacion]:
+        n = len(clases)
+        if n < 2:
+            return []
+        aristas: Set[Tuple[int, int, str]] = set()
+
+        if perfil.shape in ('inheritance', 'mixed'):
+            # Bosque de árboles: la clase i hereda de (i-1)//branching
+            inicio = 1 if perfil.shape == 'inheritance' else max(1, n // 2)
+            for i in range(inicio, n):
+                padre = (i - 1) // max(1, perfil.branching)
+                if perfil.shape == 'mixed':
+                    padre = inicio - 1 + (i - inicio) // max(1, perfil.branching)
+                if padre != i:
+                    aristas.add((i, padre, 'inheritance'))
+
+        if perfil.shape in ('dense', 'mixed'):
+            objetivo = int(n * perfil.density)
+            # Cota fija: `objetivo` baja con cada arista colocada
+            max_intentos = objetivo * 4
+            intentos = 0
+            while objetivo > 0 and intentos < max_intentos:
+                intentos += 1
+                a, b = self.rnd.randrange(n), self.rnd.randrange(n)
+                if a == b:
+                    continue
+                arista = (a, b, self.rnd.choice(_TIPOS_ASOCIACION))
+                if arista not in aristas:
+                    aristas.add(arista)
+                    objetivo -= 1
+
+        if perfil.shape in ('hub', 'mixed'):
+            hubs = list(range(min(perfil.hubs, n)))
+            for i in range(len(hubs), n):
+                # Cada clase se asocia a 1-2 hubs
+                for hub in self.rnd.sample(hubs, min(len(hubs), self.rnd.randint(1, 2))):
+                    aristas.add((i, hub, 'association'))
+
+        cardinalidades = ['1', '0..1', '*', '1..*']
+        return [
+            Relacion(
+                id=self._uuid(),
+                diagram=diagrama,
+                from_class=clases[a],
+                to_class=clases[b],
+                relationship_type=tipo,
+                cardinality_from=self.rnd.choice(cardinalidades),
+                cardinality_to=self.rnd.choice(cardinalidades),
+            )
+            for a, b, tipo in sorted(aristas)
+        ]
+
+
+# Alias en inglés para compatibilidad
+DiagramGenerator = GeneradorDiagramas
+GenerationProfile = PerfilGeneracion
@@ -1,8 +1,14 @@
 from typing import List, Dict, Any, Optional
 import logging
 from django.db import transaction
-from ..models import Diagrama, EntidadClase, AtributoClase, Relacion
-from ..repositories import DiagramRepository, ClassEntityRepository, RelationshipRepository
+from django.db.models import F
+from django.utils import timezone
+from diagram_backend.tracing import trazado
+from ..models import AtributoClase, Diagrama, EntidadClase
+from ..repositories import AttributeRepository, DiagramRepository, ClassEntityRepository, RelationshipRepository
+from .graph_index import IndiceGrafo
+from .purge_service import ServicioPurga
+from .validation_service import Diagnostico, ServicioValidacion
 
 logger = logging.getLogger(__name__)
 
@@ -13,39 +19,65 @@ class ServicioDiagrama:
         self.repositorio_diagrama = DiagramRepository()
         self.repositorio_clase = ClassEntityRepository()
         self.repositorio_relacion = RelationshipRepository()
+        self.repositorio_atributos = AttributeRepository()
+        self.validacion = ServicioValidacion()
 
-    def crear_diagrama(self, datos: Dict[str, Any]) -> Diagrama:
-        """Crear un nuevo diagrama con clases y relaciones"""
+    def _sin_nombres_repetidos(self, datos_clases: List[Dict], diagnosticos: List[Diagnostico]) -> List[Dict]:
+        """Omite (e informa) las clases del payload cuyo nombre ya apareció antes"""
+        vistos = set()
+        unicas = []
+        for posicion, datos_clase in enumerate(datos_clases):
+            nombre = datos_clase.get('name')
+            if nombre in vistos:
+                diagnosticos.append(Diagnostico('duplicate_class_name', f"Nombre de clase repetido '{nombre}'",
+                                                'class', ref=f'classes[{posicion}]'))
+                continue
+            vistos.add(nombre)
+            unicas.append(datos_clase)
+        return unicas
+
+    @trazado('ServicioDiagrama.crear_diagrama')
+    def crear_diagrama(self, datos: Dict[str, Any], diagnosticos: Optional[List[Diagnostico]] = None) -> Diagrama:
+        """Crear un nuevo diagrama con clases y relaciones.
+
+        Las relaciones que violan reglas de validación se omiten y se informan en `diagnosticos`.
+        """
+        diagnosticos = [] if diagnosticos is None else diagnosticos
         try:
             with transaction.atomic():
                 diagrama = self.repositorio_diagrama.create(datos)
 
-                # Procesar clases
-                datos_clases = datos.get('classes', [])
-                mapeo_clases = {}
-
-                for datos_clase in datos_clases:
-                    clase = self.repositorio_clase.create_with_attributes(
-                        diagram=diagrama,
-                        class_data=datos_clase
-                    )
-                    mapeo_clases[datos_clase['name']] = clase
+                # Procesar clases (inserción masiva de clases y atributos)
+                mapeo_clases = self.repositorio_clase.bulk_create_with_attributes(
+                    diagram=diagrama,
+                    classes_data=self._sin_nombres_repetidos(datos.get('classes', []), diagnosticos)
+                )
 
-                # Procesar relaciones
+                # Validar y procesar relaciones
                 datos_relaciones = datos.get('relationships', [])
-                for datos_rel in datos_relaciones:
-                    self.repositorio_relacion.create(
-                        diagram=diagrama,
-                        relation_data=datos_rel,
-                        class_mapping=mapeo_clases
-                    )
+                indice = IndiceGrafo.construir(0, ((str(c.id), n) for n, c in mapeo_clases.items()), [])
+                id_de = {nombre: str(clase.id) for nombre, clase in mapeo_clases.items()}
+                candidatas = [
+                    (id_de.get(r.get('from'), r.get('from')), id_de.get(r.get('to'), r.get('to')),
+                     r.get('type', 'association'))
+                    for r in datos_relaciones
+                ]
+                aceptadas = self.validacion.filtrar_relaciones(indice, candidatas, diagnosticos)
+                self.repositorio_relacion.bulk_create(
+                    diagram=diagrama,
+                    relations_data=[datos_relaciones[i] for i in aceptadas],
+                    class_mapping=mapeo_clases
+                )
 
                 return diagrama
         finally:
             pass
 
-    def actualizar_diagrama(self, diagrama_id: str, datos: Dict[str, Any]) -> Diagrama:
+    @trazado('ServicioDiagrama.actualizar_diagrama')
+    def actualizar_diagrama(self, diagrama_id: str, datos: Dict[str, Any],
+                            diagnosticos: Optional[List[Diagnostico]] = None) -> Diagrama:
         """Actualizar diagrama con nueva información, incluyendo clases, atributos y relaciones"""
+        diagnosticos = [] if diagnosticos is None else diagnosticos
         import logging
         logger = logging.getLogger(__name__)
         
@@ -63,17 +95,20 @@ class ServicioDiagrama:
                         setattr(diagrama, campo, datos[campo])
                         logger.debug(f"[diagrama.actualizar] campo {campo}")
                 
+                diagrama.revision = F('revision') + 1
                 diagrama.save()
+                diagrama.refresh_from_db(fields=['revision'])
 
                 # Actualizar clases y atributos solo si están en los datos
                 if 'classes' in datos and datos['classes']:
                     logger.debug(f"[diagrama.actualizar] clases={len(datos['classes'])}")
-                    self._actualizar_clases_y_atributos(diagrama, datos['classes'])
+                    clases = self._sin_nombres_repetidos(datos['classes'], diagnosticos)
+                    self._actualizar_clases_y_atributos(diagrama, clases)
 
                 # Actualizar relaciones solo si están en los datos
                 if 'relationships' in datos and datos['relationships']:
                     logger.debug(f"[diagrama.actualizar] relaciones={len(datos['relationships'])}")
-                    self._actualizar_relaciones(diagrama, datos['relationships'])
+                    self._actualizar_relaciones(diagrama, datos['relationships'], diagnosticos)
 
                 logger.debug(f"[diagrama.actualizar] ok id={diagrama_id}")
                 return diagrama
@@ -84,134 +119,108 @@ class ServicioDiagrama:
         finally:
             pass
 
+    @trazado('ServicioDiagrama._actualizar_clases_y_atributos')
     def _actualizar_clases_y_atributos(self, diagrama: Diagrama, datos_clases: List[Dict]):
-        """Actualizar clases y atributos de un diagrama"""
-        existentes_por_id = {str(cls.id): cls for cls in diagrama.classes.all()}
-        existentes_por_nombre = {cls.name: cls for cls in diagrama.classes.all()}
-        ids_recibidos = set()
-        nombres_nuevos = set()
+        """Actualizar clases y atributos de un diagrama.
+
+        Escribe por lotes y no por clase: un DELETE de las clases que ya no están, un
+        bulk_update de las que cambian, un bulk_create de las nuevas y los cambios de
+        atributos de todas juntos (ver RepositorioAtributos.aplicar_cambios).
+        """
+        existentes = list(diagrama.classes.prefetch_related(*self.repositorio_atributos.prefetch()))
+        existentes_por_id = {str(cls.id): cls for cls in existentes}
+        existentes_por_nombre = {cls.name: cls for cls in existentes}
 
+        # Emparejar el payload con las clases existentes (por id y, si no, por nombre)
+        emparejadas = []
+        nuevas = []
         for datos_clase in datos_clases:
             id_clase = str(datos_clase.get('id', ''))
             nombre_clase = datos_clase.get('name')
-            # Asegurarse de que la posición se procesa correctamente
             pos = datos_clase.get('position', {})
             if isinstance(pos, dict) and 'x' in pos and 'y' in pos:
-                pos_x = pos.get('x', 0)
-                pos_y = pos.get('y', 0)
+                posicion = {'x': pos.get('x', 0), 'y': pos.get('y', 0)}
             else:
-                pos_x = 0
-                pos_y = 0
-                
-            nombres_nuevos.add(nombre_clase)
-            # Si existe por id, actualizar
+                posicion = {'x': 0, 'y': 0}
+
             if id_clase and id_clase in existentes_por_id:
-                clase = existentes_por_id[id_clase]
-                clase.name = nombre_clase
-                clase.position_x = pos_x
-                clase.position_y = pos_y
-                clase.save()
-                ids_recibidos.add(id_clase)
-            # Si no existe, crear
+                emparejadas.append((existentes_por_id[id_clase], nombre_clase, posicion, datos_clase))
             elif nombre_clase and nombre_clase not in existentes_por_nombre:
-                clase = EntidadClase.objects.create(
-                    diagram=diagrama,
-                    name=nombre_clase,
-                    position_x=pos_x,
-                    position_y=pos_y
-                )
-                ids_recibidos.add(str(clase.id))
-            else:
-                # Si existe por nombre pero no por id, actualizar
+                nuevas.append({'name': nombre_clase, 'position': posicion,
+                               'attributes': list(dict.fromkeys(datos_clase.get('attributes', [])))})
+            elif nombre_clase in existentes_por_nombre:
                 clase = existentes_por_nombre[nombre_clase]
-                clase.position_x = pos_x
-                clase.position_y = pos_y
-                clase.save()
-                ids_recibidos.add(str(clase.id))
-
-            # Actualizar atributos
-            if clase:
-                atributos = datos_clase.get('attributes', [])
-                existentes_atributos = {attr.name: attr for attr in clase.attributes.all()}
-                nuevos_nombres = set(atributos)
-                # Eliminar atributos que ya no están
-                for nombre, attr in existentes_atributos.items():
-                    if nombre not in nuevos_nombres:
-                        attr.delete()
-                # Crear nuevos atributos
-                for nombre_attr in nuevos_nombres:
-                    if nombre_attr not in existentes_atributos:
-                        AtributoClase.objects.create(
-                            class_entity=clase,
-                            name=nombre_attr,
-                            data_type='String'
-                        )
-
-        # Eliminar clases que ya no están
-        for cls in diagrama.classes.all():
-            if str(cls.id) not in ids_recibidos and cls.name not in nombres_nuevos:
-                cls.delete()
-
-    def _actualizar_relaciones(self, diagrama: Diagrama, datos_relaciones: List[Dict]):
-        """Actualizar relaciones de un diagrama"""
+                emparejadas.append((clase, clase.name, posicion, datos_clase))
+
+        # Eliminar primero las clases que ya no están (libera sus nombres para renombrados)
+        ids_recibidos = {str(clase.id) for clase, _, _, _ in emparejadas}
+        nombres_nuevos = {d.get('name') for d in datos_clases}
+        sobrantes = [cls.id for cls in existentes
+                     if str(cls.id) not in ids_recibidos and cls.name not in nombres_nuevos]
+        if sobrantes:
+            EntidadClase.objects.filter(id__in=sobrantes).delete()
+
+        # Un UPDATE por lote solo para las clases que cambian
+        ahora = timezone.now()
+        cambiadas = []
+        eliminados: Dict[str, List[str]] = {}
+        atributos_nuevos = []
+        for clase, nombre, posicion, datos_clase in emparejadas:
+            if (clase.name, clase.position_x, clase.position_y) != (nombre, posicion['x'], posicion['y']):
+                clase.name, clase.position_x, clase.position_y = nombre, posicion['x'], posicion['y']
+                clase.updated_at = ahora
+                cambiadas.append(clase)
+            # Atributos: solo la diferencia de nombres (los que siguen conservan id, tipo y visibilidad)
+            nombres = list(dict.fromkeys(datos_clase.get('attributes', [])))
+            actuales = {a.name for a in clase.lista_atributos}
+            quitar = actuales - set(nombres)
+            if quitar:
+                eliminados[str(clase.id)] = sorted(quitar)
+            atributos_nuevos += [AtributoClase(class_entity=clase, name=n, data_type='String')
+                                 for n in nombres if n not in actuales]
+        if cambiadas:
+            EntidadClase.objects.bulk_update(cambiadas, ['name', 'position_x', 'position_y', 'updated_at'],
+                                             batch_size=500)
+        if nuevas:
+            self.repositorio_clase.bulk_create_with_attributes(diagram=diagrama, classes_data=nuevas)
+        self.repositorio_atributos.aplicar_cambios(eliminados, atributos_nuevos)
+
+    @trazado('ServicioDiagrama._actualizar_relaciones')
+    def _actualizar_relaciones(self, diagrama: Diagrama, datos_relaciones: List[Dict],
+                               diagnosticos: List[Diagnostico]):
+        """Actualizar relaciones de un diagrama (las que violan reglas se omiten)"""
         import logging
         logger = logging.getLogger(__name__)
         
         try:
             # Solo eliminar relaciones si hay nuevas relaciones para crear
             if datos_relaciones:
-                logger.debug(f"[diagrama.relaciones] limpiar={diagrama.relationships.count()}")
-                diagrama.relationships.all().delete()
+                borradas, _ = diagrama.relationships.all().delete()
+                logger.debug(f"[diagrama.relaciones] eliminadas={borradas}")
 
                 # Crear mapeo de clases
-                mapeo_clases_id = {str(cls.id): cls for cls in diagrama.classes.all()}
+                mapeo_clases_id = {str(cls.id): cls for cls in diagrama.classes.defer('attributes_inline')}
                 logger.debug(f"[diagrama.relaciones] clases={len(mapeo_clases_id)}")
 
-                relaciones_creadas = 0
-                for i, rel_data in enumerate(datos_relaciones):
-                    try:
-                        logger.debug(f"[diagrama.relaciones] procesando {i}")
-                        
-                        # Obtener IDs de forma más robusta
-                        desde_id = str(rel_data.get('from', '')).strip()
-                        hasta_id = str(rel_data.get('to', '')).strip()
-                        
-                        if not desde_id or not hasta_id:
-                            logger.warning(f"IDs inválidos en relación {i}: from={desde_id}, to={hasta_id}")
-                            continue
-                        
-                        # Buscar clases
-                        desde_clase = mapeo_clases_id.get(desde_id)
-                        hasta_clase = mapeo_clases_id.get(hasta_id)
-                        
-                        if not desde_clase:
-                            logger.warning(f"Clase 'from' no encontrada: {desde_id}")
-                            continue
-                            
-                        if not hasta_clase:
-                            logger.warning(f"Clase 'to' no encontrada: {hasta_id}")
-                            continue
-                        
-                        # Crear relación
-                        tipo = rel_data.get('type', 'association')
-                        cardinalidad = rel_data.get('cardinality', {'from': '1', 'to': '1'})
-                        
-                        relacion = Relacion.objects.create(
-                            diagram=diagrama,
-                            from_class=desde_clase,
-                            to_class=hasta_clase,
-                            relationship_type=tipo,
-                            cardinality_from=cardinalidad.get('from', '1'),
-                            cardinality_to=cardinalidad.get('to', '1')
-                        )
-                        relaciones_creadas += 1
-                        logger.debug(f"[diagrama.relaciones] creada id={relacion.id}")
-                        
-                    except Exception as e:
-                        logger.error(f"Error procesando relación {i}: {str(e)}")
-                        continue
-                
-                logger.debug(f"[diagrama.relaciones] creadas={relaciones_creadas}/{len(datos_relaciones)}")
+                # Reglas sobre el conjunto nuevo (el PUT reemplaza todas las relaciones)
+                indice = IndiceGrafo.construir(0, ((cid, c.name) for cid, c in mapeo_clases_id.items()), [])
+                candidatas = [
+                    (str(r.get('from', '')).strip(), str(r.get('to', '')).strip(), r.get('type', 'association'))
+                    for r in datos_relaciones
+                ]
+                aceptadas = self.validacion.filtrar_relaciones(indice, candidatas, diagnosticos)
+                omitidas = len(datos_relaciones) - len(aceptadas)
+                if omitidas:
+                    logger.warning(f"{omitidas} relaciones omitidas por validación")
+
+                # Inserción masiva (omite las que apuntan a clases desconocidas)
+                creadas = self.repositorio_relacion.bulk_create(
+                    diagram=diagrama,
+                    relations_data=[{**datos_relaciones[i], 'from': candidatas[i][0], 'to': candidatas[i][1]}
+                                    for i in aceptadas],
+                    class_mapping=mapeo_clases_id
+                )
+                logger.debug(f"[diagrama.relaciones] creadas={len(creadas)}/{len(datos_relaciones)}")
             else:
                 logger.debug("[diagrama.relaciones] sin cambios")
                 
@@ -219,20 +228,53 @@ class ServicioDiagrama:
             logger.error(f"Error actualizando relaciones: {str(e)}", exc_info=True)
             raise
 
+    @trazado('ServicioDiagrama.obtener_diagrama_con_detalles')
     def obtener_diagrama_con_detalles(self, diagrama_id: str) -> Optional[Diagrama]:
         """Obtener diagrama con todos los datos relacionados"""
         diagrama = self.repositorio_diagrama.get_with_details(diagrama_id)
         if diagrama:
-            logger.debug(f"[diagram.service] relaciones_count={diagrama.relationships.count()} id={diagrama_id}")
+            logger.debug(f"[diagram.service] relaciones_count={len(diagrama.relationships.all())} id={diagrama_id}")
         return diagrama
 
+    @trazado('ServicioDiagrama.duplicar_diagrama')
+    def duplicar_diagrama(self, diagrama_id: str) -> Optional[Diagrama]:
+        """Copia privada de un diagrama (clases, atributos y relaciones); None si no existe"""
+        original = self.repositorio_diagrama.get_with_details(diagrama_id)
+        if original is None:
+            return None
+        datos_duplicado = {
+            'name': f"{original.name} (Copia)",
+            'description': original.description,
+            'is_public': False,
+            'classes': [
+                {
+                    'name': clase.name,
+                    'position': {'x': clase.position_x, 'y': clase.position_y},
+                    'attributes': [attr.name for attr in clase.lista_atributos]
+                }
+                for clase in original.classes.all()
+            ],
+            'relationships': [
+                {
+                    'from': relacion.from_class.name,
+                    'to': relacion.to_class.name,
+                    'type': relacion.relationship_type,
+                    'cardinality': {'from': relacion.cardinality_from, 'to': relacion.cardinality_to}
+                }
+                for relacion in original.relationships.all()
+            ]
+        }
+        return self.crear_diagrama(datos_duplicado)
+
+    @trazado('ServicioDiagrama.listar_diagramas')
     def listar_diagramas(self, usuario=None, es_publico=None) -> List[Diagrama]:
         """Listar diagramas con filtrado opcional"""
         return self.repositorio_diagrama.list_diagrams(user=usuario, is_public=es_publico)
 
+    @trazado('ServicioDiagrama.eliminar_diagrama')
     def eliminar_diagrama(self, diagrama_id: str) -> bool:
-        """Eliminar un diagrama"""
-        return self.repositorio_diagrama.delete(diagrama_id)
+        """Eliminar un diagrama: desaparece al instante y sus filas se purgan por lotes"""
+        return ServicioPurga().marcar(diagrama_id)
 
 
 # Alias en inglés para compatibilidad
@@ -0,0 +1,186 @@
+"""
+Servicio de exportación/importación masiva de diagramas en NDJSON.
+Una línea por fila (diagrama, clase, atributo, relación) en orden de dependencias,
+de modo que la memoria es constante sin importar el tamaño del corpus.
+"""
+import itertools
+import json
+import logging
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, Iterator, List, Optional, Set
+
+from django.db import connection, transaction
+from django.utils.dateparse import parse_datetime
+
+from ..models import Diagrama, EntidadClase, AtributoClase, Relacion
+from ..models.atributo_en_linea import desempaquetar
+from ..repositories import RepositorioAtributos
+
+logger = logging.getLogger(__name__)
+
+# modelo -> (clase, columnas exportadas); el orden es el de las dependencias FK
+MODELOS = {
+    'diagram': (Diagrama, ['id', 'name', 'description', 'created_by_id', 'is_public', 'revision',
+                           'created_at', 'updated_at']),
+    'class': (EntidadClase, ['id', 'diagram_id', 'name', 'position_x', 'position_y', 'created_at', 'updated_at']),
+    'attribute': (AtributoClase, ['id', 'class_entity_id', 'name', 'data_type', 'visibility', 'created_at']),
+    'relationship': (Relacion, ['id', 'diagram_id', 'from_class_id', 'to_class_id', 'relationship_type',
+                                'cardinality_from', 'cardinality_to', 'created_at']),
+}
+_FECHAS = {'created_at', 'updated_at'}
+
+
+def _linea(modelo: str, fila: Dict[str, Any]) -> str:
+    return json.dumps({'model': modelo, **fila}, default=str, separators=(',', ':')) + '\n'
+
+
+class ServicioExportacion:
+    """Exporta e importa diagramas en NDJSON por lotes"""
+
+    def __init__(self, chunk_size: int = 2000):
+        self.chunk_size = chunk_size
+        self.atributos = RepositorioAtributos()
+
+    def exportar(self, diagram_ids: Optional[List[str]] = None) -> Iterator[str]:
+        """Genera las líneas NDJSON de los diagramas indicados (o de todos)"""
+        diagramas = Diagrama.objects.order_by('id')
+        if diagram_ids:
+            diagramas = diagramas.filter(id__in=diagram_ids)
+        columnas = MODELOS['diagram'][1]
+        for diagrama in diagramas.values(*columnas).iterator(chunk_size=self.chunk_size):
+            diagram_id = diagrama['id']
+            yield _linea('diagram', diagrama)
+            for fila in (EntidadClase.objects.filter(diagram_id=diagram_id)
+                         .values(*MODELOS['class'][1]).iterator(chunk_size=self.chunk_size)):
+                yield _linea('class', fila)
+            for fila in (AtributoClase.objects.filter(class_entity__diagram_id=diagram_id)
+                         .values(*MODELOS['attribute'][1]).iterator(chunk_size=self.chunk_size)):
+                yield _linea('attribute', fila)
+            # Clases con atributos en línea: mismas líneas 'attribute' (el formato no depende del almacenamiento)
+            for clase_id, entradas in (EntidadClase.objects.filter(diagram_id=diagram_id, attributes_inline__isnull=False)
+                                       .values_list('id', 'attributes_inline').iterator(chunk_size=self.chunk_size)):
+                for a in desempaquetar(clase_id, entradas):
+                    yield _linea('attribute', {columna: getattr(a, columna) for columna in MODELOS['attribute'][1]})
+            for fila in (Relacion.objects.filter(diagram_id=diagram_id)
+                         .values(*MODELOS['relationship'][1]).iterator(chunk_size=self.chunk_size)):
+                yield _linea('relationship', fila)
+
+    async def exportar_async(self, diagram_ids: Optional[List[str]] = None, lote: int = 500) -> AsyncIterator[str]:
+        """Versión asíncrona para ASGI: Django consumiría en memoria un iterador síncrono"""
+        from asgiref.sync import sync_to_async
+
+        lineas = self.exportar(diagram_ids)
+        siguiente = sync_to_async(lambda: list(itertools.islice(lineas, lote)), thread_sensitive=True)
+        while True:
+            bloque = await siguiente()
+            if not bloque:
+                break
+            yield ''.join(bloque)
+
+    def importar(self, lineas: Iterable[str], batch_size: int = 5000, saltar: int = 0,
+                 on_checkpoint: Optional[Callable[[int], None]] = None) -> Dict[str, int]:
+        """Importa líneas NDJSON conservando ids.
+
+        Las filas se acumulan por modelo y se vuelcan juntas (en orden FK) cada
+        `batch_size` filas; tras cada volcado se notifica la línea alcanzada para
+        poder reanudar con `saltar`. Las filas ya existentes se ignoran. Con
+        CLASS_ATTRIBUTE_STORAGE='inline' los atributos de cada volcado se pasan a
+        la lista de su clase en la misma transacción.
+        """
+        buffers: Dict[str, List[Dict[str, Any]]] = {modelo: [] for modelo in MODELOS}
+        totales = {modelo: 0 for modelo in MODELOS}
+        pendientes = 0
+        numero = 0
+        for numero, linea in enumerate(lineas, start=1):
+            if numero <= saltar or not linea.strip():
+                continue
+            fila = json.loads(linea)
+            modelo = fila.pop('model', None)
+            if modelo not in buffers:
+                raise ValueError(f"Línea {numero}: modelo desconocido '{modelo}'")
+            buffers[modelo].append(fila)
+            pendientes += 1
+            if pendientes >= batch_size:
+                self._volcar(buffers, totales)
+                pendientes = 0
+                if on_checkpoint:
+                    on_checkpoint(numero)
+        if pendientes:
+            self._volcar(buffers, totales)
+        if on_checkpoint and numero:
+            on_checkpoint(numero)
+        return totales
+
+    def _volcar(self, buffers: Dict[str, List[Dict[str, Any]]], totales: Dict[str, int]):
+        # Modo 'inline': clases cuyos atributos pasan a la lista en línea al final del volcado
+        en_linea = self.atributos.en_linea
+        clases: Set[str] = set()
+        with transaction.atomic():
+            for modelo, filas in buffers.items():
+                if not filas:
+                    continue
+                model, columnas = MODELOS[modelo]
+                if modelo == 'diagram':
+                    self._anular_propietarios_inexistentes(filas)
+                if connection.vendor == 'postgresql':
+                    self._copiar_postgres(model, columnas, filas)
+                else:
+                    self._insertar_lotes(model, columnas, filas)
+                totales[modelo] += len(filas)
+                logger.debug(f"[importar] {modelo} filas={len(filas)}")
+                if en_linea and modelo in ('class', 'attribute'):
+                    clases.update(fila['id' if modelo == 'class' else 'class_entity_id'] for fila in filas)
+                filas.clear()
+            if clases:
+                # Incluye clases de volcados anteriores: sus filas se fusionan con la lista ya creada
+                self.atributos.convertir_a_en_linea(clases)
+
+    def _anular_propietarios_inexistentes(self, filas: List[Dict[str, Any]]):
+        """Los usuarios no se exportan: se anula created_by si no existe en el destino"""
+        from django.contrib.auth.models import User
+
+        ids = {fila.get('created_by_id') for fila in filas} - {None}
+        existentes = set(User.objects.filter(id__in=ids).values_list('id', flat=True)) if ids else set()
+        for fila in filas:
+            if fila.get('created_by_id') not in existentes:
+                fila['created_by_id'] = None
+
+    def _valores(self, model, columnas: List[str], filas: List[Dict[str, Any]]) -> Iterator[List[Any]]:
+        """Convierte las filas JSON a valores de base de datos (get_field acepta attnames como diagram_id)"""
+        campos = [model._meta.get_field(columna) for columna in columnas]
+        for fila in filas:
+            valores = []
+            for columna, campo in zip(columnas, campos):
+                # Archivos de versiones anteriores sin la columna: valor por defecto del modelo
+                valor = fila[columna] if columna in fila else (campo.get_default() if campo.has_default() else None)
+                if valor is not None:
+                    valor = parse_datetime(valor) if columna in _FECHAS else campo.to_python(valor)
+                valores.append(campo.get_db_prep_save(valor, connection))
+            yield valores
+
+    def _insertar_lotes(self, model, columnas: List[str], filas: List[Dict[str, Any]]):
+        """INSERT ... ON CONFLICT DO NOTHING con executemany (SQLite y otros)"""
+        tabla = connection.ops.quote_name(model._meta.db_table)
+        nombres = ', '.join(connection.ops.quote_name(c) for c in columnas)
+        marcadores = ', '.join(['%s'] * len(columnas))
+        sql = f'INSERT INTO {tabla} ({nombres}) VALUES ({marcadores}) ON CONFLICT DO NOTHING'
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, list(self._valores(model, columnas, filas)))
+
+    def _copiar_postgres(self, model, columnas: List[str], filas: List[Dict[str, Any]]):
+        """COPY a una tabla temporal y luego INSERT ... ON CONFLICT DO NOTHING"""
+        tabla = connection.ops.quote_name(model._meta.db_table)
+        temporal = connection.ops.quote_name(f'_import_{model._meta.db_table}')
+        nombres = ', '.join(connection.ops.quote_name(c) for c in columnas)
+        with connection.cursor() as cursor:
+            cursor.execute(f'CREATE TEMP TABLE IF NOT EXISTS {temporal} (LIKE {tabla} INCLUDING DEFAULTS) ON COMMIT DROP')
+            with cursor.cursor.copy(f'COPY {temporal} ({nombres}) FROM STDIN') as copia:
+                for valores in self._valores(model, columnas, filas):
+                    copia.write_row(valores)
+            cursor.execute(
+                f'INSERT INTO {tabla} ({nombres}) SELECT {nombres} FROM {temporal} ON CONFLICT DO NOTHING'
+            )
+            cursor.execute(f'TRUNCATE {temporal}')
+
+
+# Alias en inglés para compatibilidad
+ExportService = ServicioExportacion
@@ -0,0 +1,372 @@
+"""
+Índice de adyacencia de relaciones por diagrama.
+Se construye desde Relacion, se cachea en memoria por revisión del diagrama y
+se actualiza incrementalmente cuando cambian relaciones o clases individuales.
+Guarda también los nombres de clase: es el estado por diagrama del motor de validación.
+Convención: en 'inheritance' from_class es la subclase y to_class la superclase.
+"""
+import logging
+import threading
+import weakref
+from collections import OrderedDict, defaultdict, deque
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from django.conf import settings
+from django.db import transaction
+
+from ..models import EntidadClase, Relacion
+from ..repositories import DiagramRepository
+
+logger = logging.getLogger(__name__)
+
+HERENCIA = 'inheritance'
+
+
+class IndiceGrafo:
+    """Adyacencia saliente/entrante por tipo de relación y nombres de clase"""
+
+    def __init__(self, revision: int = 0):
+        self.revision = revision
+        self.nodos: Set[str] = set()
+        self.nombres: Dict[str, str] = {}
+        self.por_nombre: Dict[str, Set[str]] = defaultdict(set)
+        # clase -> tipo -> {rel_id: clase_vecina}; admite relaciones paralelas
+        self.salientes: Dict[str, Dict[str, Dict[str, str]]] = defaultdict(lambda: defaultdict(dict))
+        self.entrantes: Dict[str, Dict[str, Dict[str, str]]] = defaultdict(lambda: defaultdict(dict))
+        self.aristas: Dict[str, Tuple[str, str, str]] = {}
+        # Resultados globales (componentes, ciclos) válidos hasta el próximo cambio
+        self._memo: Dict[str, List[List[str]]] = {}
+
+    @classmethod
+    def construir(cls, revision: int, clases: Iterable[Tuple[str, str]],
+                  relaciones: Iterable[Tuple[str, str, str, str]]) -> 'IndiceGrafo':
+        indice = cls(revision)
+        for clase, nombre in clases:
+            indice.agregar_nodo(clase, nombre)
+        for rel_id, desde, hasta, tipo in relaciones:
+            indice.agregar(rel_id, desde, hasta, tipo)
+        return indice
+
+    def copiar(self) -> 'IndiceGrafo':
+        """Copia independiente (para simular escrituras sin tocar el índice cacheado)"""
+        return IndiceGrafo.construir(
+            self.revision,
+            [(c, self.nombres.get(c)) for c in self.nodos],
+            [(rel_id, *arista) for rel_id, arista in self.aristas.items()],
+        )
+
+    def agregar_nodo(self, clase: str, nombre: Optional[str] = None):
+        self._memo.clear()
+        self.nodos.add(clase)
+        if nombre is not None:
+            self.renombrar(clase, nombre)
+
+    def renombrar(self, clase: str, nombre: str):
+        anterior = self.nombres.get(clase)
+        if anterior is not None:
+            self.por_nombre[anterior].discard(clase)
+            if not self.por_nombre[anterior]:
+                del self.por_nombre[anterior]
+        self.nombres[clase] = nombre
+        self.por_nombre[nombre].add(clase)
+
+    def agregar(self, rel_id: str, desde: str, hasta: str, tipo: str):
+        if rel_id in self.aristas:
+            self.quitar(rel_id)
+        self._memo.clear()
+        self.aristas[rel_id] = (desde, hasta, tipo)
+        self.nodos.update((desde, hasta))
+        self.salientes[desde][tipo][rel_id] = hasta
+        self.entrantes[hasta][tipo][rel_id] = desde
+
+    def quitar(self, rel_id: str):
+        arista = self.aristas.pop(rel_id, None)
+        if arista is None:
+            return
+        self._memo.clear()
+        desde, hasta, tipo = arista
+        self.salientes[desde][tipo].pop(rel_id, None)
+        self.entrantes[hasta][tipo].pop(rel_id, None)
+
+    def quitar_nodo(self, clase: str):
+        ids = [rid for mapa in (self.salientes.get(clase, {}), self.entrantes.get(clase, {}))
+               for destinos in mapa.values() for rid in destinos]
+        for rel_id in ids:
+            self.quitar(rel_id)
+        self.salientes.pop(clase, None)
+        self.entrantes.pop(clase, None)
+        self.nodos.discard(clase)
+        nombre = self.nombres.pop(clase, None)
+        if nombre is not None:
+            self.por_nombre[nombre].discard(clase)
+            if not self.por_nombre[nombre]:
+                del self.por_nombre[nombre]
+        self._memo.clear()
+
+    def vecinos(self, clase: str, direccion: str = 'both', tipo: Optional[str] = None) -> List[Dict[str, str]]:
+        resultado = []
+        fuentes = []
+        if direccion in ('out', 'both'):
+            fuentes.append(('out', self.salientes.get(clase, {})))
+        if direccion in ('in', 'both'):
+            fuentes.append(('in', self.entrantes.get(clase, {})))
+        for sentido, por_tipo in fuentes:
+            tipos = [tipo] if tipo else list(por_tipo)
+            for t in tipos:
+                for rel_id, otra in por_tipo.get(t, {}).items():
+                    resultado.append({'class_id': otra, 'relationship_id': rel_id, 'type': t, 'direction': sentido})
+        return resultado
+
+    def _recorrer(self, clase: str, mapa) -> List[Dict]:
+        """BFS por aristas de herencia; devuelve nodos con su profundidad"""
+        vistos = {clase}
+        cola = deque([(clase, 0)])
+        resultado = []
+        while cola:
+            actual, profundidad = cola.popleft()
+            for otra in mapa.get(actual, {}).get(HERENCIA, {}).values():
+                if otra not in vistos:
+                    vistos.add(otra)
+                    resultado.append({'class_id': otra, 'depth': profundidad + 1})
+                    cola.append((otra, profundidad + 1))
+        return resultado
+
+    def alcanza(self, origen: str, destino: str) -> bool:
+        """¿Se llega de `origen` a `destino` subiendo por herencia? (BFS con salida temprana)"""
+        if origen == destino:
+            return True
+        vistos = {origen}
+        cola = deque([origen])
+        while cola:
+            for padre in self._padres(cola.popleft()):
+                if padre == destino:
+                    return True
+                if padre not in vistos:
+                    vistos.add(padre)
+                    cola.append(padre)
+        return False
+
+    def ancestros(self, clase: str) -> List[Dict]:
+        return self._recorrer(clase, self.salientes)
+
+    def descendientes(self, clase: str) -> List[Dict]:
+        return self._recorrer(clase, self.entrantes)
+
+    def componentes(self) -> List[List[str]]:
+        """Componentes conexas ignorando dirección y tipo"""
+        if 'componentes' not in self._memo:
+            self._memo['componentes'] = self._calcular_componentes()
+        return self._memo['componentes']
+
+    def _calcular_componentes(self) -> List[List[str]]:
+        vistos: Set[str] = set()
+        componentes = []
+        for inicio in self.nodos:
+            if inicio in vistos:
+                continue
+            vistos.add(inicio)
+            pila = [inicio]
+            componente = []
+            while pila:
+                actual = pila.pop()
+                componente.append(actual)
+                for mapa in (self.salientes.get(actual, {}), self.entrantes.get(actual, {})):
+                    for destinos in mapa.values():
+                        for otra in destinos.values():
+                            if otra not in vistos:
+                                vistos.add(otra)
+                                pila.append(otra)
+            componentes.append(componente)
+        componentes.sort(key=len, reverse=True)
+        return componentes
+
+    def _padres(self, clase: str) -> List[str]:
+        return list(self.salientes.get(clase, {}).get(HERENCIA, {}).values())
+
+    def ciclos_herencia(self) -> List[List[str]]:
+        """Componentes fuertemente conexas (Tarjan iterativo) con ciclo en herencia"""
+        if 'ciclos' not in self._memo:
+            self._memo['ciclos'] = self._calcular_ciclos()
+        return self._memo['ciclos']
+
+    def _calcular_ciclos(self) -> List[List[str]]:
+        indice_de: Dict[str, int] = {}
+        bajo: Dict[str, int] = {}
+        en_pila: Set[str] = set()
+        pila: List[str] = []
+        ciclos = []
+        contador = 0
+        nodos_herencia = [n for n, tipos in self.salientes.items() if tipos.get(HERENCIA)]
+        for raiz in nodos_herencia:
+            if raiz in indice_de:
+                continue
+            trabajo = [(raiz, iter(self._padres(raiz)))]
+            indice_de[raiz] = bajo[raiz] = contador
+            contador += 1
+            pila.append(raiz)
+            en_pila.add(raiz)
+            while trabajo:
+                nodo, hijos = trabajo[-1]
+                avanzado = False
+                for hijo in hijos:
+                    if hijo not in indice_de:
+                        indice_de[hijo] = bajo[hijo] = contador
+                        contador += 1
+                        pila.append(hijo)
+                        en_pila.add(hijo)
+                        trabajo.append((hijo, iter(self._padres(hijo))))
+                        avanzado = True
+                        break
+                    if hijo in en_pila:
+                        bajo[nodo] = min(bajo[nodo], indice_de[hijo])
+                if avanzado:
+                    continue
+                trabajo.pop()
+                if trabajo:
+                    padre = trabajo[-1][0]
+                    bajo[padre] = min(bajo[padre], bajo[nodo])
+                if bajo[nodo] == indice_de[nodo]:
+                    componente = []
+                    while True:
+                        miembro = pila.pop()
+                        en_pila.discard(miembro)
+                        componente.append(miembro)
+                        if miembro == nodo:
+                            break
+                    auto = nodo in self._padres(nodo)
+                    if len(componente) > 1 or auto:
+                        ciclos.append(componente)
+        return ciclos
+
+
+class CacheIndices:
+    """LRU en proceso de índices por diagrama, validado por revisión"""
+
+    # Todas las caches vivas: una escritura que no las afecta las avanza de revisión
+    _registro: 'weakref.WeakSet[CacheIndices]' = weakref.WeakSet()
+
+    def __init__(self, capacidad: int = 128):
+        self.capacidad = capacidad
+        self._indices: 'OrderedDict[str, IndiceGrafo]' = OrderedDict()
+        self._lock = threading.Lock()
+        CacheIndices._registro.add(self)
+
+    @classmethod
+    def avanzar_todas(cls, diagrama_id: str, revision: int, cambios: Optional[Dict] = None):
+        """Lleva cada cache a `revision` aplicando su cambio (o ninguno)"""
+        for cache in list(cls._registro):
+            cache.aplicar(diagrama_id, revision, (cambios or {}).get(cache, _sin_cambios))
+
+    def obtener(self, diagrama_id: str, revision: int) -> Optional[IndiceGrafo]:
+        with self._lock:
+            indice = self._indices.get(diagrama_id)
+            if indice is None or indice.revision != revision:
+                return None
+            self._indices.move_to_end(diagrama_id)
+            return indice
+
+    def guardar(self, diagrama_id: str, indice: IndiceGrafo):
+        with self._lock:
+            self._indices[diagrama_id] = indice
+            self._indices.move_to_end(diagrama_id)
+            while len(self._indices) > self.capacidad:
+                self._indices.popitem(last=False)
+
+    def aplicar(self, diagrama_id: str, revision_nueva: int, cambio) -> bool:
+        """Aplica `cambio(indice)` si el índice cacheado está justo una revisión atrás"""
+        with self._lock:
+            indice = self._indices.get(diagrama_id)
+            if indice is None:
+                return False
+            if indice.revision != revision_nueva - 1:
+                del self._indices[diagrama_id]
+                return False
+            cambio(indice)
+            indice.revision = revision_nueva
+            return True
+
+    def invalidar(self, diagrama_id: str):
+        with self._lock:
+            self._indices.pop(diagrama_id, None)
+
+
+def _sin_cambios(indice):
+    pass
+
+
+_cache = CacheIndices(getattr(settings, 'GRAPH_INDEX_CACHE_SIZE', 128))
+
+
+class ServicioGrafo:
+    """Consulta y mantenimiento del índice de relaciones"""
+
+    def __init__(self):
+        self.repositorio_diagrama = DiagramRepository()
+        self.cache = _cache
+
+    def obtener_indice(self, diagrama_id: str, revision: Optional[int] = None) -> Optional[IndiceGrafo]:
+        """Índice vigente del diagrama (1 consulta si está en cache); None si no existe"""
+        diagrama_id = str(diagrama_id)
+        if revision is None:
+            revision = self.repositorio_diagrama.get_revision(diagrama_id)
+        if revision is None:
+            return None
+        indice = self.cache.obtener(diagrama_id, revision)
+        if indice is not None:
+            return indice
+        clases = (
+            (str(cid), nombre)
+            for cid, nombre in EntidadClase.objects.filter(diagram_id=diagrama_id).values_list('id', 'name')
+        )
+        relaciones = (
+            (str(rid), str(desde), str(hasta), tipo)
+            for rid, desde, hasta, tipo in Relacion.objects.filter(diagram_id=diagrama_id)
+            .values_list('id', 'from_class_id', 'to_class_id', 'relationship_type')
+        )
+        indice = IndiceGrafo.construir(revision, clases, relaciones)
+        self.cache.guardar(diagrama_id, indice)
+        logger.debug(f"[grafo] construido id={diagrama_id} rev={revision} aristas={len(indice.aristas)}")
+        return indice
+
+    def _registrar(self, diagrama_id, cambio=None) -> int:
+        """Incrementa la revisión y, al confirmar la transacción, avanza las caches.
+
+        Solo la cache del grafo recibe `cambio`; las demás se avanzan sin cambios.
+        Si la transacción se revierte el índice queda una revisión atrás y se reconstruye.
+        """
+        diagrama_id = str(diagrama_id)
+        revision = self.repositorio_diagrama.bump_revision(diagrama_id)
+        cambios = {self.cache: cambio} if cambio else None
+        transaction.on_commit(lambda: CacheIndices.avanzar_todas(diagrama_id, revision, cambios))
+        return revision
+
+    def relacion_guardada(self, relacion: Relacion) -> int:
+        """Registrar alta/edición de una relación; devuelve la nueva revisión"""
+        datos = (str(relacion.id), str(relacion.from_class_id), str(relacion.to_class_id), relacion.relationship_type)
+        return self._registrar(relacion.diagram_id, lambda indice: indice.agregar(*datos))
+
+    def relacion_eliminada(self, diagrama_id: str, relacion_id: str) -> int:
+        return self._registrar(diagrama_id, lambda indice: indice.quitar(str(relacion_id)))
+
+    def clase_guardada(self, diagrama_id: str, clase_id: str, nombre: str) -> int:
+        """Alta o renombrado de una clase"""
+        return self._registrar(diagrama_id, lambda indice: indice.agregar_nodo(str(clase_id), nombre))
+
+    def clase_eliminada(self, diagrama_id: str, clase_id: str) -> int:
+        return self._registrar(diagrama_id, lambda indice: indice.quitar_nodo(str(clase_id)))
+
+    def lote_aplicado(self, diagrama_id: str, cambios: List[Callable[[IndiceGrafo], None]]) -> int:
+        """Varias escrituras en una sola revisión; los cambios se aplican en orden"""
+        def aplicar(indice):
+            for cambio in cambios:
+                cambio(indice)
+        return self._registrar(diagrama_id, aplicar if cambios else None)
+
+    def sin_cambios_de_grafo(self, diagrama_id: str) -> int:
+        """Escrituras que no tocan clases ni relaciones (posiciones, atributos)"""
+        return self._registrar(diagrama_id)
+
+
+# Alias en inglés para compatibilidad
+GraphIndex = IndiceGrafo
+GraphService = ServicioGrafo
@@ -0,0 +1,207 @@
+"""
+Estado de dependencias para las sondas de disponibilidad.
+
+Un hilo en segundo plano comprueba cada HEALTH_REFRESH_INTERVAL segundos:
+
+- ``database``: SELECT 1 por alias desde un hilo propio, que conserva su conexión
+  entre comprobaciones (y, con pool de PostgreSQL o la cola de escritura de SQLite,
+  informa de sus estadísticas);
+- ``channel_layer``: ida y vuelta de un mensaje por la capa de canales;
+- ``cache``: escritura y lectura en la caché de Django;
+- ``redis``: PING al Redis de REDIS_URL (secuenciador, fan-out, cubetas), si lo hay.
+
+Las sondas solo leen la última instantánea: nunca abren conexiones en el camino de
+la request. Una comprobación más antigua que HEALTH_MAX_STALENESS cuenta como
+fallida (el monitor se ha quedado colgado o el proceso no le deja correr).
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class MonitorDependencias:
+    """Comprueba las dependencias en segundo plano y guarda la última instantánea"""
+
+    def __init__(self, intervalo: Optional[float] = None, max_antiguedad: Optional[float] = None,
+                 timeout: Optional[float] = None):
+        self.intervalo = intervalo or getattr(settings, 'HEALTH_REFRESH_INTERVAL', 5.0)
+        self.max_antiguedad = max_antiguedad or getattr(settings, 'HEALTH_MAX_STALENESS', 30.0)
+        self.timeout = timeout or getattr(settings, 'HEALTH_CHECK_TIMEOUT', 2.0)
+        self._estado: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._parar = threading.Event()
+        self._hilo: Optional[threading.Thread] = None
+        # Un solo hilo para la BD: su conexión (thread-local en Django) se reutiliza entre comprobaciones
+        self._hilo_bd = ThreadPoolExecutor(max_workers=1, thread_name_prefix='salud-bd')
+        self._redis = None
+        self.ciclos = 0
+
+    @property
+    def activo(self) -> bool:
+        return self._hilo is not None and self._hilo.is_alive()
+
+    def iniciar(self):
+        if not self.activo:
+            self._parar.clear()
+            self._hilo = threading.Thread(target=lambda: asyncio.run(self._bucle()), name='salud', daemon=True)
+            self._hilo.start()
+
+    def detener(self):
+        self._parar.set()
+        if self._hilo is not None:
+            self._hilo.join(self.intervalo + self.timeout)
+
+    def estado(self) -> Dict[str, Any]:
+        """Instantánea para las sondas: ready solo si toda dependencia requerida está bien y reciente"""
+        ahora = time.time()
+        with self._lock:
+            dependencias = {nombre: dict(datos) for nombre, datos in self._estado.items()}
+        motivos = []
+        for nombre, datos in dependencias.items():
+            datos['age_s'] = round(ahora - datos['checked_at'], 3)
+            datos['stale'] = datos['age_s'] > self.max_antiguedad
+            if datos['required'] and (not datos['ok'] or datos['stale']):
+                motivos.append(f"{nombre}:{'stale' if datos['ok'] else 'down'}")
+        if not dependencias:
+            motivos.append('starting')
+        return {
+            'ready': not motivos,
+            'reasons': motivos,
+            'dependencies': dependencias,
+            'refresh_interval_s': self.intervalo,
+            'max_staleness_s': self.max_antiguedad,
+            'monitor_alive': self.activo,
+            'pid': os.getpid(),
+        }
+
+    async def _bucle(self):
+        while not self._parar.is_set():
+            await self.comprobar()
+            self.ciclos += 1
+            await asyncio.get_running_loop().run_in_executor(None, self._parar.wait, self.intervalo)
+        if self._redis is not None:
+            await self._redis.aclose()
+
+    async def comprobar(self):
+        """Una ronda de comprobaciones en paralelo, cada una acotada por HEALTH_CHECK_TIMEOUT"""
+        comprobaciones = {
+            'database': (True, self._en_hilo_bd(self._comprobar_bd)),
+            'channel_layer': (True, self._comprobar_capa()),
+            'cache': (True, self._en_hilo_bd(self._comprobar_cache)),
+        }
+        if getattr(settings, 'REDIS_URL', ''):
+            comprobaciones['redis'] = (True, self._comprobar_redis())
+        resultados = await asyncio.gather(*(self._medir(c) for _, c in comprobaciones.values()))
+        with self._lock:
+            for (nombre, (requerida, _)), resultado in zip(comprobaciones.items(), resultados):
+                anterior = self._estado.get(nombre)
+                if anterior is not None and anterior['ok'] != resultado['ok']:
+                    nivel = logging.INFO if resultado['ok'] else logging.WARNING
+                    logger.log(nivel, f"[salud] {nombre} {'recuperado' if resultado['ok'] else 'caído'}: "
+                                      f"{resultado.get('error') or ''}")
+                self._estado[nombre] = {**resultado, 'required': requerida}
+
+    async def _medir(self, comprobacion) -> Dict[str, Any]:
+        t0 = time.perf_counter()
+        try:
+            detalles = await asyncio.wait_for(comprobacion, self.timeout) or {}
+            resultado = {'ok': True, 'error': None, **detalles}
+        except asyncio.TimeoutError:
+            resultado = {'ok': False, 'error': f'timeout ({self.timeout}s)'}
+        except Exception as e:
+            resultado = {'ok': False, 'error': f'{type(e).__name__}: {e}'}
+        resultado['latency_ms'] = round((time.perf_counter() - t0) * 1000, 3)
+        resultado['checked_at'] = time.time()
+        return resultado
+
+    def _en_hilo_bd(self, funcion):
+        return asyncio.get_running_loop().run_in_executor(self._hilo_bd, funcion)
+
+    def _comprobar_bd(self) -> Dict[str, Any]:
+        from django.db import connections
+
+        alias = {}
+        for nombre in connections:
+            conexion = connections[nombre]
+            # Descarta la conexión si quedó rota o superó CONN_MAX_AGE; si no, se reutiliza
+            conexion.close_if_unusable_or_obsolete()
+            try:
+                with conexion.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+                    cursor.fetchone()
+                alias[nombre] = 'OK'
+            except Exception as e:
+                conexion.close()
+                alias[nombre] = f'ERROR: {e}'
+            cola = getattr(conexion, 'cola_escritura', None)
+            if cola is not None:
+                alias[f'{nombre}_write_queue'] = cola.estado()
+            pool = getattr(conexion, 'pool', None)
+            if pool is not None and hasattr(pool, 'get_stats'):
+                alias[f'{nombre}_pool'] = pool.get_stats()
+        fallidos = [n for n, v in alias.items() if isinstance(v, str) and v != 'OK']
+        if fallidos:
+            raise RuntimeError(', '.join(f'{n}: {alias[n]}' for n in fallidos))
+        return {'aliases': alias}
+
+    async def _comprobar_capa(self) -> Dict[str, Any]:
+        from channels.layers import get_channel_layer
+
+        capa = get_channel_layer()
+        if capa is None:
+            return {'backend': None}
+        # Canal normal (sin '!'): los canales de proceso de channels_redis comparten un búfer ligado a otro bucle
+        canal = f'salud.{os.getpid()}.{uuid.uuid4().hex}'
+        enviado = time.time()
+        await capa.send(canal, {'type': 'health.ping', 'sent': enviado})
+        mensaje = await capa.receive(canal)
+        if mensaje.get('sent') != enviado:
+            raise RuntimeError('respuesta inesperada de la capa de canales')
+        return {'backend': type(capa).__name__}
+
+    def _comprobar_cache(self) -> Dict[str, Any]:
+        from django.core.cache import caches
+
+        cache = caches['default']
+        clave = f'salud:{os.getpid()}'
+        valor = time.time()
+        cache.set(clave, valor, timeout=max(60, int(self.max_antiguedad * 2)))
+        if cache.get(clave) != valor:
+            raise RuntimeError('la caché no devolvió el valor escrito')
+        return {'backend': type(cache).__name__}
+
+    async def _comprobar_redis(self) -> Dict[str, Any]:
+        if self._redis is None:
+            import redis.asyncio as aioredis  # solo necesario con Redis
+            # Cliente del bucle del monitor: su conexión se reutiliza entre comprobaciones
+            self._redis = aioredis.from_url(settings.REDIS_URL, socket_connect_timeout=self.timeout)
+        await self._redis.ping()
+        return {}
+
+
+_monitor: Optional[MonitorDependencias] = None
+_lock_monitor = threading.Lock()
+
+
+def iniciar_monitor() -> MonitorDependencias:
+    """Arranca (una vez por proceso) el monitor compartido; iniciar el hilo no abre conexiones"""
+    global _monitor
+    with _lock_monitor:
+        if _monitor is None:
+            _monitor = MonitorDependencias()
+        if not _monitor.activo:
+            _monitor.iniciar()
+        return _monitor
+
+
+# Alias en inglés para compatibilidad
+DependencyMonitor = MonitorDependencias
@@ -0,0 +1,293 @@
+"""
+Cola de trabajos en segundo plano respaldada por la base de datos.
+Sin broker externo: los trabajos son filas de `jobs` que un conjunto de hilos
+(arrancado con la app ASGI o con `run_jobs`) reclama con un UPDATE condicional
+(status='pending' -> 'running'), de modo que varios procesos pueden compartir
+la cola. Cada tipo de trabajo es una función registrada con @tarea que recibe
+un ContextoTrabajo para informar progreso y atender la cancelación.
+"""
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from ..models import Trabajo
+
+logger = logging.getLogger(__name__)
+
+# tipo -> (función, intentos máximos)
+_TAREAS: Dict[str, tuple] = {}
+# Despierta a los hilos del proceso en cuanto se encola algo (sin esperar al sondeo)
+_despertar = threading.Event()
+
+
+def tarea(tipo: str, max_intentos: int = 3):
+    """Registra `funcion(contexto, params) -> resultado JSON` como tipo de trabajo"""
+    def registrar(funcion: Callable[['ContextoTrabajo', Dict[str, Any]], Any]):
+        _TAREAS[tipo] = (funcion, max_intentos)
+        return funcion
+    return registrar
+
+
+class TrabajoCancelado(Exception):
+    """Se lanza dentro de una tarea cuando se ha pedido su cancelación"""
+
+
+class TrabajoFallido(Exception):
+    """Error definitivo (datos inválidos, diagrama inexistente): no se reintenta"""
+
+
+class ContextoTrabajo:
+    """Canal entre una tarea en curso y su fila: progreso, latido y cancelación"""
+
+    # Escrituras de progreso como mucho cada tantos segundos
+    INTERVALO = 0.5
+
+    def __init__(self, trabajo: Trabajo):
+        self.trabajo_id = trabajo.id
+        self.intento = trabajo.attempts
+        # Estado reanudable entre reintentos (se persiste en `result` mientras corre)
+        self.estado: Dict[str, Any] = dict(trabajo.result or {})
+        self._ultimo = 0.0
+
+    def progreso(self, fraccion: float, mensaje: str = '', forzar: bool = False, **estado):
+        """Guarda progreso (0..1) y estado; lanza TrabajoCancelado si se pidió cancelar"""
+        self.estado.update(estado)
+        ahora = time.monotonic()
+        if not forzar and ahora - self._ultimo < self.INTERVALO:
+            return
+        self._ultimo = ahora
+        Trabajo.objects.filter(id=self.trabajo_id).update(
+            progress=min(max(fraccion, 0.0), 1.0), message=mensaje[:255],
+            result=self.estado or None, heartbeat_at=timezone.now(),
+        )
+        self.comprobar_cancelacion()
+
+    def comprobar_cancelacion(self):
+        if Trabajo.objects.filter(id=self.trabajo_id, cancel_requested=True).exists():
+            raise TrabajoCancelado()
+
+
+class _Latido:
+    """Hilo que renueva heartbeat_at mientras la tarea corre, aunque no informe progreso.
+
+    Sin él, una tarea que bloquea más de JOBS_STALE_AFTER (duplicar, layout, purga)
+    parecería huérfana y otro worker la ejecutaría por segunda vez.
+    """
+
+    def __init__(self, trabajo: Trabajo, intervalo: float):
+        self.trabajo_id = trabajo.id
+        self.worker = trabajo.worker
+        self.intervalo = intervalo
+        self._parar = threading.Event()
+        self._hilo = threading.Thread(target=self._bucle, name=f'latido-{trabajo.id}', daemon=True)
+
+    def __enter__(self):
+        self._hilo.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._parar.set()
+        self._hilo.join()
+
+    def _bucle(self):
+        try:
+            while not self._parar.wait(self.intervalo):
+                try:
+                    Trabajo.objects.filter(id=self.trabajo_id, status='running', worker=self.worker).update(
+                        heartbeat_at=timezone.now())
+                except Exception as e:
+                    logger.warning(f"[trabajos] latido fallido id={self.trabajo_id}: {e}")
+        finally:
+            # Conexión propia del hilo
+            connection.close()
+
+
+class ServicioTrabajos:
+    """Encola, reclama, ejecuta y cancela trabajos"""
+
+    def __init__(self):
+        self.backoff = getattr(settings, 'JOBS_RETRY_BACKOFF', 2.0)
+        self.backoff_max = getattr(settings, 'JOBS_RETRY_BACKOFF_MAX', 300.0)
+        self.caducidad = getattr(settings, 'JOBS_STALE_AFTER', 300)
+
+    def encolar(self, tipo: str, params: Optional[Dict[str, Any]] = None, diagrama_id=None,
+                usuario=None, max_intentos: Optional[int] = None) -> Trabajo:
+        if tipo not in _TAREAS:
+            raise ValueError(f"Tipo de trabajo desconocido '{tipo}'")
+        trabajo = Trabajo.objects.create(
+            kind=tipo, params=params or {}, diagram_id=diagrama_id,
+            created_by=usuario if usuario is not None and usuario.is_authenticated else None,
+            max_attempts=max_intentos or _TAREAS[tipo][1],
+        )
+        transaction.on_commit(_despertar.set)
+        logger.info(f"[trabajos] encolado id={trabajo.id} tipo={tipo}")
+        return trabajo
+
+    def obtener(self, trabajo_id) -> Optional[Trabajo]:
+        return Trabajo.objects.filter(id=trabajo_id).first()
+
+    def cancelar(self, trabajo_id) -> Optional[Trabajo]:
+        """Un pendiente se cancela al instante; uno en curso, en su siguiente progreso()"""
+        if not Trabajo.objects.filter(id=trabajo_id, status='pending').update(
+                status='cancelled', cancel_requested=True, finished_at=timezone.now()):
+            Trabajo.objects.filter(id=trabajo_id, status='running').update(cancel_requested=True)
+        return self.obtener(trabajo_id)
+
+    def reclamar(self, worker: str) -> Optional[Trabajo]:
+        """Toma el siguiente trabajo listo; el UPDATE condicional evita que dos hilos tomen el mismo"""
+        candidatos = (Trabajo.objects.filter(status='pending', run_after__lte=timezone.now())
+                      .order_by('run_after', 'created_at').values_list('id', flat=True)[:5])
+        for trabajo_id in candidatos:
+            ahora = timezone.now()
+            if Trabajo.objects.filter(id=trabajo_id, status='pending').update(
+                    status='running', worker=worker, attempts=F('attempts') + 1,
+                    started_at=ahora, heartbeat_at=ahora):
+                return Trabajo.objects.get(id=trabajo_id)
+        return None
+
+    def ejecutar(self, trabajo: Trabajo):
+        """Ejecuta un trabajo ya reclamado y deja su fila en el estado siguiente"""
+        funcion, _ = _TAREAS.get(trabajo.kind, (None, 0))
+        contexto = ContextoTrabajo(trabajo)
+        t0 = time.perf_counter()
+        try:
+            if funcion is None:
+                raise TrabajoFallido(f"Tipo de trabajo desconocido '{trabajo.kind}'")
+            # Latido varias veces por periodo de caducidad, independiente de progreso()
+            with _Latido(trabajo, max(1.0, self.caducidad / 3)):
+                resultado = funcion(contexto, trabajo.params)
+        except TrabajoCancelado:
+            self._terminar(trabajo, 'cancelled', result=contexto.estado or None)
+            logger.info(f"[trabajos] cancelado id={trabajo.id} tipo={trabajo.kind}")
+        except TrabajoFallido as e:
+            self._terminar(trabajo, 'failed', error=str(e), result=contexto.estado or None)
+            logger.warning(f"[trabajos] fallido id={trabajo.id} tipo={trabajo.kind}: {e}")
+        except Exception as e:
+            if trabajo.attempts < trabajo.max_attempts:
+                espera = min(self.backoff * 2 ** (trabajo.attempts - 1), self.backoff_max)
+                Trabajo.objects.filter(id=trabajo.id, status='running').update(
+                    status='pending', error=str(e), worker='', result=contexto.estado or None,
+                    run_after=timezone.now() + timedelta(seconds=espera),
+                )
+                logger.warning(f"[trabajos] reintento id={trabajo.id} intento={trabajo.attempts} "
+                               f"espera={espera:.0f}s error={e}")
+            else:
+                self._terminar(trabajo, 'failed', error=str(e), result=contexto.estado or None)
+                logger.error(f"[trabajos] fallido id={trabajo.id} tipo={trabajo.kind}: {e}", exc_info=True)
+        else:
+            self._terminar(trabajo, 'succeeded', result=resultado, progress=1.0, error='')
+            logger.info(f"[trabajos] completado id={trabajo.id} tipo={trabajo.kind} "
+                        f"ms={(time.perf_counter() - t0) * 1000:.1f}")
+
+    def _terminar(self, trabajo: Trabajo, estado: str, **campos):
+        Trabajo.objects.filter(id=trabajo.id, status='running').update(
+            status=estado, finished_at=timezone.now(), heartbeat_at=timezone.now(), **campos
+        )
+
+    def recuperar_huerfanos(self) -> int:
+        """Devuelve a la cola los trabajos 'running' sin latido (proceso caído a mitad)"""
+        limite = timezone.now() - timedelta(seconds=self.caducidad)
+        huerfanos = Trabajo.objects.filter(status='running', heartbeat_at__lt=limite)
+        fallidos = huerfanos.filter(attempts__gte=F('max_attempts')).update(
+            status='failed', error='Worker perdido', finished_at=timezone.now())
+        recuperados = huerfanos.update(status='pending', worker='', run_after=timezone.now())
+        if fallidos or recuperados:
+            logger.warning(f"[trabajos] huérfanos recuperados={recuperados} fallidos={fallidos}")
+        return recuperados
+
+    def estadisticas(self) -> Dict[str, Any]:
+        por_estado = dict(Trabajo.objects.values_list('status').annotate(n=Count('id')).order_by())
+        return {
+            'counts': {estado: por_estado.get(estado, 0) for estado, _ in Trabajo.STATUSES},
+            'kinds': sorted(_TAREAS),
+            'workers': _ejecutor.hilos if _ejecutor is not None and _ejecutor.activo else 0,
+        }
+
+
+class EjecutorTrabajos:
+    """Conjunto de hilos que sondean la cola y ejecutan trabajos"""
+
+    def __init__(self, hilos: Optional[int] = None, intervalo: Optional[float] = None):
+        self.hilos = hilos or getattr(settings, 'JOBS_WORKERS', 2)
+        self.intervalo = intervalo or getattr(settings, 'JOBS_POLL_INTERVAL', 1.0)
+        self.servicio = ServicioTrabajos()
+        self._parar = threading.Event()
+        self._hilos: List[threading.Thread] = []
+        self.prefijo = f'{socket.gethostname()}:{os.getpid()}'
+
+    @property
+    def activo(self) -> bool:
+        return any(h.is_alive() for h in self._hilos)
+
+    def iniciar(self):
+        for n in range(self.hilos):
+            hilo = threading.Thread(target=self._bucle, args=(f'{self.prefijo}:{n}', n == 0),
+                                    name=f'trabajos-{n}', daemon=True)
+            hilo.start()
+            self._hilos.append(hilo)
+        logger.info(f"[trabajos] ejecutor iniciado hilos={self.hilos} intervalo={self.intervalo}s")
+
+    def detener(self, espera: Optional[float] = None):
+        self._parar.set()
+        _despertar.set()
+        for hilo in self._hilos:
+            hilo.join(espera)
+
+    def procesar_pendientes(self, worker: Optional[str] = None) -> int:
+        """Ejecuta trabajos hasta vaciar la cola de listos; devuelve cuántos procesó"""
+        procesados = 0
+        while not self._parar.is_set():
+            trabajo = self.servicio.reclamar(worker or f'{self.prefijo}:0')
+            if trabajo is None:
+                break
+            self.servicio.ejecutar(trabajo)
+            procesados += 1
+        return procesados
+
+    def _bucle(self, worker: str, vigilante: bool):
+        ultimo_barrido = 0.0
+        while not self._parar.is_set():
+            try:
+                close_old_connections()
+                # Un solo hilo por proceso barre los huérfanos
+                if vigilante and time.monotonic() - ultimo_barrido > self.servicio.caducidad / 2:
+                    self.servicio.recuperar_huerfanos()
+                    ultimo_barrido = time.monotonic()
+                if self.procesar_pendientes(worker):
+                    continue
+            except Exception as e:
+                logger.error(f"[trabajos] error en {worker}: {e}", exc_info=True)
+            finally:
+                connection.close()
+            _despertar.wait(self.intervalo)
+            _despertar.clear()
+
+
+_ejecutor: Optional[EjecutorTrabajos] = None
+_lock_ejecutor = threading.Lock()
+
+
+def iniciar_ejecutor(hilos: Optional[int] = None) -> EjecutorTrabajos:
+    """Arranca (una vez por proceso) el ejecutor compartido"""
+    global _ejecutor
+    with _lock_ejecutor:
+        if _ejecutor is None or not _ejecutor.activo:
+            _ejecutor = EjecutorTrabajos(hilos=hilos)
+            _ejecutor.iniciar()
+        return _ejecutor
+
+
+# Alias en inglés para compatibilidad
+JobService = ServicioTrabajos
+JobRunner = EjecutorTrabajos
+JobCancelled = TrabajoCancelado
+JobFailed = TrabajoFallido
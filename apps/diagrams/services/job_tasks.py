@@ -0,0 +1,108 @@
+"""
+Tipos de trabajo en segundo plano para las operaciones pesadas de diagramas.
+Cada tarea recibe (contexto, params) y devuelve un resultado serializable a JSON;
+los archivos generados o subidos viven en JOBS_DIR.
+"""
+import os
+from typing import Any, Dict
+
+from django.conf import settings
+
+from ..models import Diagrama
+from .diagram_service import ServicioDiagrama
+from .export_service import ServicioExportacion
+from .job_service import ContextoTrabajo, TrabajoFallido, tarea
+from .layout_service import ServicioLayout
+from .purge_service import ServicioPurga
+
+
+def ruta_trabajo(nombre: str) -> str:
+    """Ruta de un archivo de trabajo dentro de JOBS_DIR (se crea si no existe)"""
+    directorio = str(getattr(settings, 'JOBS_DIR', os.path.join(settings.MEDIA_ROOT, 'jobs')))
+    os.makedirs(directorio, exist_ok=True)
+    return os.path.join(directorio, os.path.basename(nombre))
+
+
+@tarea('diagram.duplicate')
+def duplicar(contexto: ContextoTrabajo, params: Dict[str, Any]) -> Dict[str, Any]:
+    contexto.progreso(0.0, 'Copiando diagrama', forzar=True)
+    duplicado = ServicioDiagrama().duplicar_diagrama(params['diagram_id'])
+    if duplicado is None:
+        raise TrabajoFallido('Diagram not found')
+    return {
+        'diagram_id': str(duplicado.id),
+        'classes': duplicado.classes.count(),
+        'relationships': duplicado.relationships.count(),
+    }
+
+
+@tarea('diagram.layout')
+def layout(contexto: ContextoTrabajo, params: Dict[str, Any]) -> Dict[str, Any]:
+    params = dict(params)
+    diagrama_id = params.pop('diagram_id')
+    if not Diagrama.objects.filter(id=diagrama_id).exists():
+        raise TrabajoFallido('Diagram not found')
+    contexto.progreso(0.0, 'Calculando posiciones', forzar=True)
+    try:
+        clases, resultado = ServicioLayout().aplicar(diagrama_id, **params)
+    except ValueError as e:
+        raise TrabajoFallido(str(e))
+    # Las posiciones se leen del diagrama; el resultado solo lleva el resumen
+    return {
+        'mode': params.get('modo', 'force'),
+        'iterations': resultado.iteraciones,
+        'converged': resultado.convergio,
+        'deadline_reached': resultado.deadline_alcanzado,
+        'elapsed_ms': round(resultado.ms, 1),
+        'updated': len(clases),
+        **resultado.extra,
+    }
+
+
+@tarea('diagrams.export')
+def exportar(contexto: ContextoTrabajo, params: Dict[str, Any]) -> Dict[str, Any]:
+    ids = params.get('ids') or None
+    total = Diagrama.objects.filter(id__in=ids).count() if ids else Diagrama.objects.count()
+    ruta = ruta_trabajo(f'{contexto.trabajo_id}.ndjson')
+    lineas = diagramas = 0
+    with open(ruta, 'w', encoding='utf-8') as f:
+        for linea in ServicioExportacion().exportar(ids):
+            f.write(linea)
+            lineas += 1
+            if linea.startswith('{"model":"diagram"'):
+                diagramas += 1
+            if lineas % 1000 == 0:
+                contexto.progreso(diagramas / max(total, 1), f'{lineas} líneas')
+    return {'file': os.path.basename(ruta), 'diagrams': diagramas, 'lines': lineas, 'bytes': os.path.getsize(ruta)}
+
+
+@tarea('diagrams.import')
+def importar(contexto: ContextoTrabajo, params: Dict[str, Any]) -> Dict[str, Any]:
+    ruta = ruta_trabajo(params['file'])
+    if not os.path.exists(ruta):
+        raise TrabajoFallido(f"No existe el archivo {params['file']}")
+    with open(ruta, encoding='utf-8') as f:
+        total = sum(1 for _ in f)
+    # Un reintento continúa desde la última línea volcada
+    saltar = contexto.estado.get('line', 0)
+    with open(ruta, encoding='utf-8') as f:
+        try:
+            totales = ServicioExportacion().importar(
+                f, batch_size=params.get('batch_size', 5000), saltar=saltar,
+                on_checkpoint=lambda linea: contexto.progreso(linea / max(total, 1), f'Línea {linea}',
+                                                              forzar=True, line=linea),
+            )
+        except ValueError as e:
+            raise TrabajoFallido(str(e))
+    os.remove(ruta)
+    return {'lines': total, 'resumed_from': saltar, 'rows': totales}
+
+
+@tarea('diagrams.purge', max_intentos=5)
+def purgar(contexto: ContextoTrabajo, params: Dict[str, Any]) -> Dict[str, Any]:
+    resultados = ServicioPurga().purgar_pendientes(limite=params.get('limit'))
+    errores = [r for r in resultados if 'error' in r]
+    if errores:
+        # Se reintenta con espera: los ya purgados no vuelven a aparecer como pendientes
+        raise RuntimeError(f"{len(errores)} diagramas sin purgar: {errores[0]['error']}")
+    return {'purged': resultados}
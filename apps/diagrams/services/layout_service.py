@@ -0,0 +1,291 @@
+"""
+Servicio de auto-layout de diagramas de clases.
+Dos modos: dirigido por fuerzas (Fruchterman-Reingold vectorizado con NumPy)
+y por capas, que ubica a los padres de herencia sobre sus hijos.
+"""
+import logging
+import time
+from collections import defaultdict, deque
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from django.db import transaction
+from django.utils import timezone
+
+from ..models import EntidadClase, Relacion
+from .graph_index import ServicioGrafo
+
+logger = logging.getLogger(__name__)
+
+MODOS = ('force', 'layered')
+
+# Memoria máxima (en pares) por bloque de repulsión: bloque x n x 2 floats
+_PARES_POR_BLOQUE = 2_000_000
+# Por encima de este tamaño la repulsión lejana se aproxima por celdas
+_UMBRAL_APROXIMACION = 1000
+# Nodos promedio por celda en la aproximación
+_NODOS_POR_CELDA = 12
+
+
+@dataclass
+class ResultadoLayout:
+    """Posiciones calculadas y métricas de la ejecución"""
+    posiciones: np.ndarray
+    iteraciones: int = 0
+    convergio: bool = False
+    deadline_alcanzado: bool = False
+    ms: float = 0.0
+    extra: Dict = field(default_factory=dict)
+
+
+def _posiciones_enteras(pos: np.ndarray, margen: int = 50) -> np.ndarray:
+    """Desplaza al cuadrante positivo y redondea a enteros"""
+    if len(pos) == 0:
+        return pos.astype(np.int64)
+    pos = pos - pos.min(axis=0) + margen
+    return np.rint(pos).astype(np.int64)
+
+
+def _repulsion_exacta(pos: np.ndarray, k2: float) -> np.ndarray:
+    """Repulsión k²/d entre todos los pares, por bloques de filas"""
+    n = len(pos)
+    bloque = max(1, _PARES_POR_BLOQUE // n)
+    desplazamiento = np.zeros_like(pos)
+    for i0 in range(0, n, bloque):
+        delta = pos[i0:i0 + bloque, None, :] - pos[None, :, :]
+        d2 = np.einsum('ijk,ijk->ij', delta, delta)
+        d2 += 0.01
+        desplazamiento[i0:i0 + bloque] += np.einsum('ijk,ij->ik', delta, k2 / d2)
+    return desplazamiento
+
+
+def _repulsion_por_celdas(pos: np.ndarray, k2: float) -> np.ndarray:
+    """Repulsión aproximada: exacta con las celdas vecinas, por centroides con las lejanas"""
+    n = len(pos)
+    g = max(2, int(np.ceil(np.sqrt(n / _NODOS_POR_CELDA))))
+    minimo = pos.min(axis=0)
+    tamano = (pos.max(axis=0) - minimo) / g + 1e-9
+    celda_xy = np.minimum(((pos - minimo) / tamano).astype(np.int64), g - 1)
+    celda = celda_xy[:, 0] * g + celda_xy[:, 1]
+    total_celdas = g * g
+
+    masa = np.bincount(celda, minlength=total_celdas).astype(np.float64)
+    centro = np.stack([
+        np.bincount(celda, weights=pos[:, 0], minlength=total_celdas),
+        np.bincount(celda, weights=pos[:, 1], minlength=total_celdas),
+    ], axis=1)
+    ocupadas = masa > 0
+    centro[ocupadas] /= masa[ocupadas, None]
+
+    # Campo lejano: cada nodo contra los centroides de celdas no adyacentes
+    cx = np.arange(total_celdas) // g
+    cy = np.arange(total_celdas) % g
+    lejos = ((np.abs(celda_xy[:, 0, None] - cx[None, :]) > 1)
+             | (np.abs(celda_xy[:, 1, None] - cy[None, :]) > 1))
+    delta = pos[:, None, :] - centro[None, :, :]
+    d2 = np.einsum('ijk,ijk->ij', delta, delta) + 0.01
+    desplazamiento = np.einsum('ijk,ij->ik', delta, (k2 / d2) * masa[None, :] * lejos)
+
+    # Campo cercano: exacto dentro del bloque 3x3 de celdas
+    orden = np.argsort(celda, kind='stable')
+    inicios = np.searchsorted(celda[orden], np.arange(total_celdas + 1))
+    for c in np.flatnonzero(ocupadas):
+        propios = orden[inicios[c]:inicios[c + 1]]
+        x, y = divmod(int(c), g)
+        vecinos = np.concatenate([
+            orden[inicios[vx * g + vy]:inicios[vx * g + vy + 1]]
+            for vx in range(max(0, x - 1), min(g, x + 2))
+            for vy in range(max(0, y - 1), min(g, y + 2))
+        ])
+        delta = pos[propios, None, :] - pos[None, vecinos, :]
+        d2 = np.einsum('ijk,ijk->ij', delta, delta) + 0.01
+        desplazamiento[propios] += np.einsum('ijk,ij->ik', delta, k2 / d2)
+    return desplazamiento
+
+
+def layout_fuerzas(n: int, aristas: np.ndarray, espaciado: float = 250.0, iteraciones: int = 300,
+                   deadline_ms: float = 5000.0, semilla: int = 0) -> ResultadoLayout:
+    """Fruchterman-Reingold vectorizado con atracción por aristas.
+
+    La repulsión es exacta hasta _UMBRAL_APROXIMACION nodos y aproximada por
+    celdas por encima. `aristas` es un array (m, 2) de índices de nodos.
+    """
+    t0 = time.perf_counter()
+    limite = t0 + deadline_ms / 1000.0
+    rnd = np.random.default_rng(semilla)
+    if n == 0:
+        return ResultadoLayout(np.zeros((0, 2)), convergio=True)
+
+    # Arranque en cuadrícula con ruido: converge mucho antes que uno aleatorio
+    columnas = max(1, int(np.ceil(np.sqrt(n))))
+    indices = np.arange(n)
+    pos = np.stack([(indices % columnas) * espaciado, (indices // columnas) * espaciado], axis=1).astype(np.float64)
+    pos += rnd.uniform(-espaciado / 4, espaciado / 4, size=pos.shape)
+
+    k = espaciado
+    k2 = k * k
+    # Paso máximo inicial de un espaciado: el arranque ya es una cuadrícula razonable
+    temperatura = espaciado
+    enfriamiento = temperatura / max(1, iteraciones)
+    repulsion = _repulsion_exacta if n <= _UMBRAL_APROXIMACION else _repulsion_por_celdas
+    origen = aristas[:, 0] if len(aristas) else np.zeros(0, dtype=np.int64)
+    destino = aristas[:, 1] if len(aristas) else np.zeros(0, dtype=np.int64)
+
+    resultado = ResultadoLayout(pos)
+    for it in range(iteraciones):
+        desplazamiento = repulsion(pos, k2)
+        # Atracción d²/k a lo largo de las aristas
+        if len(origen):
+            delta = pos[origen] - pos[destino]
+            d = np.sqrt(np.einsum('ij,ij->i', delta, delta)) + 0.01
+            fuerza = (delta * (d / k)[:, None])
+            np.add.at(desplazamiento, origen, -fuerza)
+            np.add.at(desplazamiento, destino, fuerza)
+
+        largo = np.sqrt(np.einsum('ij,ij->i', desplazamiento, desplazamiento)) + 1e-9
+        paso = np.minimum(largo, temperatura)
+        pos += desplazamiento * (paso / largo)[:, None]
+        temperatura = max(temperatura - enfriamiento, 1.0)
+        resultado.iteraciones = it + 1
+
+        if paso.max() < 0.5:
+            resultado.convergio = True
+            break
+        if time.perf_counter() > limite:
+            resultado.deadline_alcanzado = True
+            break
+
+    resultado.posiciones = _posiciones_enteras(pos)
+    resultado.ms = (time.perf_counter() - t0) * 1000
+    return resultado
+
+
+def layout_capas(n: int, herencias: List[Tuple[int, int]], aristas: List[Tuple[int, int]],
+                 espaciado_x: float = 260.0, espaciado_y: float = 200.0, barridos: int = 4,
+                 ancho_maximo: Optional[int] = None, deadline_ms: float = 5000.0) -> ResultadoLayout:
+    """Layout por capas: cada padre de herencia queda en una capa superior a sus hijos.
+
+    `herencias` son pares (hijo, padre). Las capas se ordenan con la heurística del
+    baricentro usando todas las aristas; las capas demasiado anchas se parten en filas.
+    """
+    t0 = time.perf_counter()
+    limite = t0 + deadline_ms / 1000.0
+    hijos = defaultdict(list)
+    grado_entrada = [0] * n  # padres pendientes
+    for hijo, padre in herencias:
+        if hijo != padre:
+            hijos[padre].append(hijo)
+            grado_entrada[hijo] += 1
+
+    # Capa = camino más largo desde una raíz (Kahn); los nodos en ciclos quedan al final
+    capa = [0] * n
+    cola = deque(i for i in range(n) if grado_entrada[i] == 0)
+    while cola:
+        nodo = cola.popleft()
+        for h in hijos[nodo]:
+            capa[h] = max(capa[h], capa[nodo] + 1)
+            grado_entrada[h] -= 1
+            if grado_entrada[h] == 0:
+                cola.append(h)
+    en_ciclo = [i for i in range(n) if grado_entrada[i] > 0]
+    if en_ciclo:
+        ultima = max(capa) + 1 if n else 0
+        for i in en_ciclo:
+            capa[i] = ultima
+
+    capas: Dict[int, List[int]] = defaultdict(list)
+    for i in range(n):
+        capas[capa[i]].append(i)
+
+    vecinos = defaultdict(list)
+    for a, b in list(aristas) + list(herencias):
+        vecinos[a].append(b)
+        vecinos[b].append(a)
+
+    # Baricentro: ordenar cada capa por la posición media de sus vecinos
+    orden = {i: 0.0 for i in range(n)}
+    for niveles in capas.values():
+        for idx, nodo in enumerate(niveles):
+            orden[nodo] = float(idx)
+    barridos_hechos = 0
+    for _ in range(barridos):
+        if time.perf_counter() > limite:
+            break
+        for nivel in sorted(capas):
+            nodos = capas[nivel]
+            nodos.sort(key=lambda v: (sum(orden[u] for u in vecinos[v]) / len(vecinos[v])) if vecinos[v] else orden[v])
+            for idx, nodo in enumerate(nodos):
+                orden[nodo] = float(idx)
+        barridos_hechos += 1
+
+    ancho = ancho_maximo or max(8, int(np.ceil(np.sqrt(n) * 2)))
+    pos = np.zeros((n, 2), dtype=np.float64)
+    fila_base = 0
+    for nivel in sorted(capas):
+        nodos = capas[nivel]
+        filas = max(1, int(np.ceil(len(nodos) / ancho)))
+        for idx, nodo in enumerate(nodos):
+            fila, columna = divmod(idx, ancho)
+            en_fila = min(ancho, len(nodos) - fila * ancho)
+            # Centrar cada fila respecto del ancho máximo
+            desfase = (ancho - en_fila) / 2
+            pos[nodo] = ((columna + desfase) * espaciado_x, (fila_base + fila) * espaciado_y)
+        fila_base += filas
+
+    return ResultadoLayout(
+        _posiciones_enteras(pos),
+        iteraciones=barridos_hechos,
+        convergio=True,
+        deadline_alcanzado=time.perf_counter() > limite,
+        ms=(time.perf_counter() - t0) * 1000,
+        extra={'layers': len(capas), 'nodes_in_cycles': len(en_ciclo)},
+    )
+
+
+class ServicioLayout:
+    """Calcula y persiste posiciones de las clases de un diagrama"""
+
+    def calcular(self, diagrama_id: str, modo: str = 'force', iteraciones: int = 300,
+                 deadline_ms: float = 5000.0, espaciado: float = 250.0) -> Tuple[List[str], ResultadoLayout]:
+        """Calcula el layout; devuelve los ids de clase en el orden de las posiciones"""
+        if modo not in MODOS:
+            raise ValueError(f"Modo de layout desconocido '{modo}', opciones: {', '.join(MODOS)}")
+        ids = [str(i) for i in EntidadClase.objects.filter(diagram_id=diagrama_id)
+               .order_by('created_at', 'id').values_list('id', flat=True)]
+        indice = {cid: i for i, cid in enumerate(ids)}
+        herencias, asociaciones = [], []
+        for desde, hasta, tipo in (Relacion.objects.filter(diagram_id=diagrama_id)
+                                   .values_list('from_class_id', 'to_class_id', 'relationship_type')):
+            a, b = indice.get(str(desde)), indice.get(str(hasta))
+            if a is None or b is None:
+                continue
+            (herencias if tipo == 'inheritance' else asociaciones).append((a, b))
+
+        if modo == 'layered':
+            resultado = layout_capas(len(ids), herencias, asociaciones, espaciado_x=espaciado,
+                                     espaciado_y=espaciado * 0.8, deadline_ms=deadline_ms)
+        else:
+            aristas = np.array(herencias + asociaciones, dtype=np.int64).reshape(-1, 2)
+            resultado = layout_fuerzas(len(ids), aristas, espaciado=espaciado,
+                                       iteraciones=iteraciones, deadline_ms=deadline_ms)
+        logger.debug(f"[layout] id={diagrama_id} modo={modo} n={len(ids)} it={resultado.iteraciones} "
+                     f"ms={resultado.ms:.1f}")
+        return ids, resultado
+
+    def aplicar(self, diagrama_id: str, **opciones) -> Tuple[List[Dict], ResultadoLayout]:
+        """Calcula el layout y lo escribe con un bulk_update"""
+        ids, resultado = self.calcular(diagrama_id, **opciones)
+        ahora = timezone.now()
+        clases = [
+            EntidadClase(id=cid, position_x=int(x), position_y=int(y), updated_at=ahora)
+            for cid, (x, y) in zip(ids, resultado.posiciones.tolist())
+        ]
+        with transaction.atomic():
+            EntidadClase.objects.bulk_update(clases, ['position_x', 'position_y', 'updated_at'], batch_size=500)
+            ServicioGrafo().sin_cambios_de_grafo(diagrama_id)
+        return [{'id': c.id, 'position': {'x': c.position_x, 'y': c.position_y}} for c in clases], resultado
+
+
+# Alias en inglés para compatibilidad
+LayoutService = ServicioLayout
@@ -0,0 +1,160 @@
+"""
+Borrado rápido de diagramas grandes.
+`marcar` oculta el diagrama al instante (deleted_at); `purgar` elimina después
+sus filas hijas con DELETE por lotes en orden de dependencias (atributos,
+relaciones, clases y por último el diagrama), cada lote en su propia
+transacción. El progreso es el propio estado de la base de datos: si el
+proceso cae a mitad, la siguiente purga continúa donde quedó.
+"""
+import logging
+import threading
+import time
+from typing import Dict, List, Optional
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from ..models import AtributoClase, Diagrama, EntidadClase, Relacion
+from ..repositories import DiagramRepository
+
+logger = logging.getLogger(__name__)
+
+
+def _tabla(modelo) -> str:
+    return connection.ops.quote_name(modelo._meta.db_table)
+
+
+def _pasos() -> List[tuple]:
+    """(nombre, DELETE de hasta %s filas del diagrama %s) en orden de dependencias"""
+    atributos, clases, relaciones = _tabla(AtributoClase), _tabla(EntidadClase), _tabla(Relacion)
+    clases_del_diagrama = f'SELECT id FROM {clases} WHERE diagram_id = %(d)s'
+    return [
+        ('attributes',
+         f'DELETE FROM {atributos} WHERE id IN (SELECT id FROM {atributos} '
+         f'WHERE class_entity_id IN ({clases_del_diagrama}) LIMIT %(n)s)'),
+        # También las de otros diagramas que apunten a estas clases (referencias colgantes)
+        ('relationships',
+         f'DELETE FROM {relaciones} WHERE id IN (SELECT id FROM {relaciones} WHERE diagram_id = %(d)s '
+         f'OR from_class_id IN ({clases_del_diagrama}) OR to_class_id IN ({clases_del_diagrama}) LIMIT %(n)s)'),
+        ('classes',
+         f'DELETE FROM {clases} WHERE id IN (SELECT id FROM {clases} WHERE diagram_id = %(d)s LIMIT %(n)s)'),
+    ]
+
+
+class ServicioPurga:
+    """Marca diagramas como borrados y purga sus filas por lotes"""
+
+    # Métricas del proceso (compartidas por todas las instancias)
+    metricas: Dict[str, float] = {
+        'marked': 0,
+        'purged': 0,
+        'batches': 0,
+        'rows_attributes': 0,
+        'rows_relationships': 0,
+        'rows_classes': 0,
+        'errors': 0,
+        'last_purge_ms': 0.0,
+    }
+    _lock_metricas = threading.Lock()
+    # Una sola purga en segundo plano por proceso
+    _hilo: Optional[threading.Thread] = None
+    _lock_hilo = threading.Lock()
+
+    def __init__(self, batch_size: Optional[int] = None):
+        self.batch_size = batch_size or getattr(settings, 'DIAGRAM_PURGE_BATCH', 2000)
+        self.repositorio_diagrama = DiagramRepository()
+
+    def _sumar(self, **valores):
+        with self._lock_metricas:
+            for clave, valor in valores.items():
+                self.metricas[clave] += valor
+
+    def marcar(self, diagrama_id: str) -> bool:
+        """Oculta el diagrama de todas las lecturas; la purga queda pendiente"""
+        if not self.repositorio_diagrama.delete(diagrama_id):
+            return False
+        self._sumar(marked=1)
+        modo = getattr(settings, 'DIAGRAM_PURGE_MODE', 'background')
+        if modo == 'background':
+            transaction.on_commit(self.purgar_en_segundo_plano)
+        elif modo == 'jobs':
+            transaction.on_commit(self._encolar_purga)
+        return True
+
+    def _encolar_purga(self):
+        from .job_service import ServicioTrabajos
+        ServicioTrabajos().encolar('diagrams.purge')
+
+    def pendientes(self) -> List[str]:
+        return [str(i) for i in Diagrama.todos.filter(deleted_at__isnull=False)
+                .order_by('deleted_at').values_list('id', flat=True)]
+
+    def purgar_diagrama(self, diagrama_id: str) -> Dict[str, int]:
+        """Borra por lotes las filas de un diagrama marcado; devuelve filas borradas por tabla"""
+        campo = Diagrama._meta.get_field('id')
+        params = {'d': campo.get_db_prep_value(campo.to_python(diagrama_id), connection), 'n': self.batch_size}
+        borradas = {nombre: 0 for nombre, _ in _pasos()}
+        t0 = time.perf_counter()
+        for nombre, sql in _pasos():
+            while True:
+                with transaction.atomic(), connection.cursor() as cursor:
+                    cursor.execute(sql, params)
+                    filas = cursor.rowcount
+                borradas[nombre] += filas
+                self._sumar(batches=1, **{f'rows_{nombre}': filas})
+                if filas < self.batch_size:
+                    break
+        # El diagrama solo se elimina si sigue marcado (no se purga uno restaurado)
+        Diagrama.todos.filter(id=diagrama_id, deleted_at__isnull=False).delete()
+        ms = (time.perf_counter() - t0) * 1000
+        self._sumar(purged=1)
+        with self._lock_metricas:
+            self.metricas['last_purge_ms'] = round(ms, 1)
+        logger.info(f"[purga] id={diagrama_id} filas={borradas} ms={ms:.1f}")
+        return borradas
+
+    def purgar_pendientes(self, limite: Optional[int] = None) -> List[Dict]:
+        """Purga los diagramas marcados, del más antiguo al más reciente"""
+        resultados = []
+        for diagrama_id in self.pendientes()[:limite]:
+            try:
+                resultados.append({'id': diagrama_id, 'rows': self.purgar_diagrama(diagrama_id)})
+            except Exception as e:
+                self._sumar(errors=1)
+                logger.error(f"[purga] error id={diagrama_id}: {e}", exc_info=True)
+                resultados.append({'id': diagrama_id, 'error': str(e)})
+        return resultados
+
+    def purgar_en_segundo_plano(self):
+        """Lanza un hilo de purga si no hay otro en curso en este proceso"""
+        with self._lock_hilo:
+            if ServicioPurga._hilo is not None and ServicioPurga._hilo.is_alive():
+                return
+            ServicioPurga._hilo = threading.Thread(target=self._ejecutar_hilo, name='purga-diagramas', daemon=True)
+            ServicioPurga._hilo.start()
+
+    def _ejecutar_hilo(self):
+        try:
+            # Diagramas marcados mientras corría la pasada anterior
+            while self.pendientes():
+                if not any('error' not in r for r in self.purgar_pendientes()):
+                    break
+        except Exception as e:
+            self._sumar(errors=1)
+            logger.error(f"[purga] hilo detenido: {e}", exc_info=True)
+        finally:
+            connection.close()
+
+    def estado(self) -> Dict:
+        with self._lock_metricas:
+            metricas = dict(self.metricas)
+        return {
+            'pending': Diagrama.todos.filter(deleted_at__isnull=False).count(),
+            'running': ServicioPurga._hilo is not None and ServicioPurga._hilo.is_alive(),
+            'batch_size': self.batch_size,
+            'metrics': metricas,
+        }
+
+
+# Alias en inglés para compatibilidad
+PurgeService = ServicioPurga
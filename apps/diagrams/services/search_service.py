@@ -0,0 +1,324 @@
+"""
+Búsqueda de texto indexada sobre diagramas, clases y atributos.
+PostgreSQL: índices GIN con pg_trgm sobre las columnas de nombre.
+SQLite: tablas FTS5 (tokenizador trigram) de contenido externo, mantenidas por triggers
+en cada INSERT/UPDATE/DELETE, también los de bulk_create y la importación en SQL crudo.
+Los atributos en línea (class_entities.attributes_inline) tienen su propia tabla FTS5 en SQLite
+y un índice GIN sobre la lista de nombres en PostgreSQL.
+Las reconstrucciones de tabla de SQLite (VACUUM, algunos ALTER) requieren `rebuild_search_index`.
+"""
+import logging
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.db import DatabaseError, connection as conexion_por_defecto, transaction
+
+from ..models.atributo_en_linea import EN_LINEA, modo_almacenamiento
+
+logger = logging.getLogger(__name__)
+
+TIPOS = ('diagram', 'class', 'attribute')
+MIN_TRIGRAMA = 3
+
+# tabla FTS -> (tabla de contenido, columnas indexadas)
+_FTS = {
+    'search_diagrams': ('diagrams', ['name', 'description']),
+    'search_classes': ('class_entities', ['name']),
+    'search_attributes': ('class_attributes', ['name']),
+}
+_GIN = {
+    'diagrams_name_trgm': ('diagrams', 'name'),
+    'diagrams_description_trgm': ('diagrams', 'description'),
+    'class_entities_name_trgm': ('class_entities', 'name'),
+    'class_attributes_name_trgm': ('class_attributes', 'name'),
+    # Nombres de los atributos en línea como texto JSON ('["id", "precio"]'): preselecciona las clases
+    'class_entities_attributes_inline_trgm': ('class_entities', "(jsonb_path_query_array(attributes_inline, '$[*][0]')::text)"),
+}
+# Una fila por entrada de attributes_inline; rowid = rowid de la clase << 16 + posición en la lista,
+# así los triggers borran las entradas de una clase por rango de rowid
+_FTS_EN_LINEA = 'search_attributes_inline'
+_INSERTAR_EN_LINEA = (
+    "INSERT INTO search_attributes_inline(rowid, name, attr_id) "
+    "SELECT ({c}.rowid << 16) + j.key, json_extract(j.value, '$[0]'), json_extract(j.value, '$[3]') "
+    "FROM {origen}json_each({c}.attributes_inline) j WHERE j.key < 65536"
+)
+
+
+def _sentencias_sqlite() -> List[str]:
+    sentencias = []
+    for fts, (tabla, columnas) in _FTS.items():
+        cols = ', '.join(columnas)
+        nuevos = ', '.join(f'new.{c}' for c in columnas)
+        viejos = ', '.join(f'old.{c}' for c in columnas)
+        borrar = f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.rowid, {viejos});"
+        insertar = f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.rowid, {nuevos});"
+        sentencias += [
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({cols}, content='{tabla}', "
+            f"content_rowid='rowid', tokenize='trigram')",
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {tabla} BEGIN {insertar} END",
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {tabla} BEGIN {borrar} END",
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {cols} ON {tabla} BEGIN {borrar} {insertar} END",
+        ]
+    fts = _FTS_EN_LINEA
+    borrar = f"DELETE FROM {fts} WHERE rowid BETWEEN (old.rowid << 16) AND (old.rowid << 16) + 65535;"
+    insertar = _INSERTAR_EN_LINEA.format(c='new', origen='') + ';'
+    sentencias += [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(name, attr_id UNINDEXED, tokenize='trigram')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON class_entities BEGIN {insertar} END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON class_entities BEGIN {borrar} END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF attributes_inline ON class_entities "
+        f"BEGIN {borrar} {insertar} END",
+    ]
+    return sentencias
+
+
+def instalar_indice(conexion=None, reconstruir: bool = False) -> bool:
+    """Crea (idempotente) el índice del motor actual; devuelve True si hubo que reconstruirlo.
+
+    En SQLite, si faltaban triggers (tabla recreada por una migración) el índice
+    puede haber quedado desfasado y se reconstruye desde las tablas de contenido.
+    """
+    conexion = conexion or conexion_por_defecto
+    with conexion.cursor() as cursor:
+        if conexion.vendor == 'sqlite':
+            cursor.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'search\\_%' ESCAPE '\\'")
+            incompleto = cursor.fetchone()[0] < 3 * (len(_FTS) + 1)
+            for sentencia in _sentencias_sqlite():
+                cursor.execute(sentencia)
+            if reconstruir or incompleto:
+                for fts in _FTS:
+                    cursor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+                # Tabla FTS5 normal (no de contenido externo): se vacía y se vuelve a llenar
+                cursor.execute(f'DELETE FROM {_FTS_EN_LINEA}')
+                cursor.execute(_INSERTAR_EN_LINEA.format(c='c', origen='class_entities c, '))
+                return True
+            return False
+        if conexion.vendor == 'postgresql':
+            try:
+                with transaction.atomic(using=conexion.alias):
+                    cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+            except DatabaseError as e:
+                # Sin permisos para la extensión: la búsqueda cae a ILIKE sin índice
+                logger.warning(f"[busqueda] pg_trgm no disponible: {e}")
+                return False
+            for indice, (tabla, columna) in _GIN.items():
+                cursor.execute(f'CREATE INDEX IF NOT EXISTS {indice} ON {tabla} USING gin ({columna} gin_trgm_ops)')
+            if reconstruir:
+                for indice in _GIN:
+                    cursor.execute(f'REINDEX INDEX {indice}')
+                return True
+    return False
+
+
+def desinstalar_indice(conexion=None):
+    """Elimina tablas FTS/triggers (SQLite) o índices GIN (PostgreSQL)"""
+    conexion = conexion or conexion_por_defecto
+    with conexion.cursor() as cursor:
+        if conexion.vendor == 'sqlite':
+            for fts in [*_FTS, _FTS_EN_LINEA]:
+                for sufijo in ('ai', 'ad', 'au'):
+                    cursor.execute(f'DROP TRIGGER IF EXISTS {fts}_{sufijo}')
+                cursor.execute(f'DROP TABLE IF EXISTS {fts}')
+        elif conexion.vendor == 'postgresql':
+            for indice in _GIN:
+                cursor.execute(f'DROP INDEX IF EXISTS {indice}')
+
+
+def _pg_trgm_disponible() -> bool:
+    with conexion_por_defecto.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        return cursor.fetchone() is not None
+
+
+def _select(tipo: str, tabla: str, clase: Optional[str], puntuacion: str,
+            columna_id: Optional[str] = None, columna_nombre: Optional[str] = None) -> str:
+    """Columnas comunes de cada rama del UNION (todas con alias: cualquiera puede ir primero)"""
+    clase_id = f'{clase}.id' if clase else 'NULL'
+    clase_nombre = f'{clase}.name' if clase else 'NULL'
+    columna_id = columna_id or f'{tabla}.id'
+    columna_nombre = columna_nombre or f'{tabla}.name'
+    return (f"'{tipo}' AS kind, {columna_id} AS id, {columna_nombre} AS name, d.id AS diagram_id, "
+            f"d.name AS diagram_name, {clase_id} AS class_id, {clase_nombre} AS class_name, {puntuacion} AS score")
+
+
+def _patron_like(texto: str) -> str:
+    return '%' + texto.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+
+def _uuid(valor) -> str:
+    # SQLite guarda los UUID como hex sin guiones
+    return str(valor if isinstance(valor, uuid.UUID) else uuid.UUID(str(valor)))
+
+
+class ServicioBusqueda:
+    """Búsqueda clasificada y paginada, limitada a los diagramas visibles para el usuario"""
+
+    def buscar(self, texto: str, usuario=None, tipos: Optional[List[str]] = None, solo_propios: bool = False,
+               pagina: int = 1, tamano: int = 20) -> Dict[str, Any]:
+        texto = (texto or '').strip()
+        tipos = [t for t in (tipos or TIPOS) if t in TIPOS]
+        if not texto or not tipos:
+            return {'count': 0, 'page': pagina, 'page_size': tamano, 'results': []}
+
+        alcance, params_alcance = self._alcance(usuario, solo_propios)
+        if conexion_por_defecto.vendor == 'sqlite':
+            partes = self._consultas_sqlite(texto, tipos)
+        elif conexion_por_defecto.vendor == 'postgresql' and _pg_trgm_disponible():
+            partes = self._consultas_postgres(texto, tipos)
+        else:
+            partes = self._consultas_like(texto, tipos)
+
+        if 'attribute' in tipos and modo_almacenamiento() == EN_LINEA:
+            partes += self._consultas_en_linea(texto)
+
+        selects, params = [], []
+        for sql, params_parte in partes:
+            selects.append(f'{sql} AND {alcance}')
+            params += params_parte + params_alcance
+        union = ' UNION ALL '.join(selects)
+        with conexion_por_defecto.cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM ({union}) t', params)
+            total = cursor.fetchone()[0]
+            cursor.execute(
+                f'SELECT * FROM ({union}) t ORDER BY score DESC, name LIMIT %s OFFSET %s',
+                params + [tamano, (pagina - 1) * tamano],
+            )
+            filas = cursor.fetchall()
+        return {
+            'count': total,
+            'page': pagina,
+            'page_size': tamano,
+            'results': [self._resultado(fila) for fila in filas],
+        }
+
+    def _alcance(self, usuario, solo_propios: bool) -> Tuple[str, List[Any]]:
+        """Propios + públicos si hay sesión; públicos + sin propietario si es anónimo"""
+        autenticado = usuario is not None and usuario.is_authenticated
+        # Los diagramas marcados para borrado desaparecen antes de que se purguen sus filas
+        if solo_propios and autenticado:
+            return 'd.deleted_at IS NULL AND d.created_by_id = %s', [usuario.id]
+        if autenticado:
+            return 'd.deleted_at IS NULL AND (d.is_public = %s OR d.created_by_id = %s)', [True, usuario.id]
+        return 'd.deleted_at IS NULL AND (d.is_public = %s OR d.created_by_id IS NULL)', [True]
+
+    def _consultas_sqlite(self, texto: str, tipos: List[str]) -> List[Tuple[str, List[Any]]]:
+        if len(texto) < MIN_TRIGRAMA:
+            # El tokenizador trigram no indexa términos de menos de 3 caracteres
+            return self._consultas_like(texto, tipos)
+        frase = '"' + texto.replace('"', '""') + '"'
+        # bm25 es negativo (menor = mejor); la coincidencia exacta del nombre va primero
+        exacta = 'CASE WHEN LOWER({c}) = LOWER(%s) THEN 100 ELSE 0 END'
+        consultas = {
+            'diagram': (f"SELECT {_select('diagram', 'd', None, exacta.format(c='d.name') + ' - bm25(search_diagrams)')} FROM search_diagrams "
+                        "JOIN diagrams d ON d.rowid = search_diagrams.rowid WHERE search_diagrams MATCH %s"),
+            'class': (f"SELECT {_select('class', 'c', 'c', exacta.format(c='c.name') + ' - bm25(search_classes)')} FROM search_classes "
+                      "JOIN class_entities c ON c.rowid = search_classes.rowid "
+                      "JOIN diagrams d ON d.id = c.diagram_id WHERE search_classes MATCH %s"),
+            'attribute': (f"SELECT {_select('attribute', 'a', 'c', exacta.format(c='a.name') + ' - bm25(search_attributes)')} FROM search_attributes "
+                          "JOIN class_attributes a ON a.rowid = search_attributes.rowid "
+                          "JOIN class_entities c ON c.id = a.class_entity_id "
+                          "JOIN diagrams d ON d.id = c.diagram_id WHERE search_attributes MATCH %s"),
+        }
+        return [(consultas[t], [texto, frase]) for t in tipos]
+
+    def _consultas_postgres(self, texto: str, tipos: List[str]) -> List[Tuple[str, List[Any]]]:
+        """ILIKE y el operador % usan los índices GIN gin_trgm_ops; se ordena por similitud"""
+        patron = _patron_like(texto)
+
+        def puntuacion(columna):
+            return (f"(similarity({columna}, %s) + CASE WHEN lower({columna}) = lower(%s) THEN 1 "
+                    f"WHEN {columna} ILIKE %s THEN 0.5 ELSE 0 END)")
+
+        def condicion(columna):
+            return f'({columna} ILIKE %s OR {columna} %% %s)'
+
+        # Parámetros: puntuación (texto, texto, patrón) + condición (patrón, texto)
+        p = [texto, texto, patron, patron, texto]
+        puntuacion_diagrama = f"GREATEST({puntuacion('d.name')}, {puntuacion('d.description')})"
+        consultas = {
+            'diagram': (f"SELECT {_select('diagram', 'd', None, puntuacion_diagrama)} "
+                        f"FROM diagrams d WHERE ({condicion('d.name')} OR {condicion('d.description')})",
+                        p[:3] + p[:3] + p[3:] + p[3:]),
+            'class': (f"SELECT {_select('class', 'c', 'c', puntuacion('c.name'))} "
+                      f"FROM class_entities c JOIN diagrams d ON d.id = c.diagram_id WHERE {condicion('c.name')}", p),
+            'attribute': (f"SELECT {_select('attribute', 'a', 'c', puntuacion('a.name'))} "
+                          f"FROM class_attributes a JOIN class_entities c ON c.id = a.class_entity_id "
+                          f"JOIN diagrams d ON d.id = c.diagram_id WHERE {condicion('a.name')}", p),
+        }
+        return [consultas[t] for t in tipos]
+
+    def _consultas_like(self, texto: str, tipos: List[str]) -> List[Tuple[str, List[Any]]]:
+        """Subcadena sin índice: términos cortos o motores sin trigramas; coincidencia exacta primero"""
+        patron = _patron_like(texto)
+        like = "LOWER({c}) LIKE LOWER(%s) ESCAPE '\\'"
+        exacta = 'CASE WHEN LOWER({c}) = LOWER(%s) THEN 1 ELSE 0 END'
+        consultas = {
+            'diagram': (f"SELECT {_select('diagram', 'd', None, exacta.format(c='d.name'))} FROM diagrams d "
+                        f"WHERE ({like.format(c='d.name')} OR {like.format(c='d.description')})",
+                        [texto, patron, patron]),
+            'class': (f"SELECT {_select('class', 'c', 'c', exacta.format(c='c.name'))} "
+                      f"FROM class_entities c JOIN diagrams d ON d.id = c.diagram_id "
+                      f"WHERE {like.format(c='c.name')}", [texto, patron]),
+            'attribute': (f"SELECT {_select('attribute', 'a', 'c', exacta.format(c='a.name'))} "
+                          f"FROM class_attributes a JOIN class_entities c ON c.id = a.class_entity_id "
+                          f"JOIN diagrams d ON d.id = c.diagram_id WHERE {like.format(c='a.name')}", [texto, patron]),
+        }
+        return [consultas[t] for t in tipos]
+
+    def _consultas_en_linea(self, texto: str) -> List[Tuple[str, List[Any]]]:
+        """Atributos en línea (CLASS_ATTRIBUTE_STORAGE='inline').
+
+        SQLite: tabla FTS5 search_attributes_inline (una fila por entrada); los términos de menos
+        de 3 caracteres recorren la lista JSON de cada clase, como `_consultas_like`.
+        PostgreSQL: el índice GIN sobre los nombres preselecciona las clases y luego se filtra
+        entrada a entrada. Otros motores no buscan atributos en línea.
+        """
+        patron = _patron_like(texto)
+        if conexion_por_defecto.vendor == 'sqlite':
+            if len(texto) >= MIN_TRIGRAMA:
+                fts = _FTS_EN_LINEA
+                frase = '"' + texto.replace('"', '""') + '"'
+                exacta = f'CASE WHEN LOWER({fts}.name) = LOWER(%s) THEN 100 ELSE 0 END - bm25({fts})'
+                return [(f"SELECT {_select('attribute', fts, 'c', exacta, f'{fts}.attr_id')} FROM {fts} "
+                         f"JOIN class_entities c ON c.rowid = ({fts}.rowid >> 16) "
+                         f"JOIN diagrams d ON d.id = c.diagram_id WHERE {fts} MATCH %s",
+                         [texto, frase])]
+            nombre, id_ = "json_extract(j.value, '$[0]')", "json_extract(j.value, '$[3]')"
+            exacta = f'CASE WHEN LOWER({nombre}) = LOWER(%s) THEN 100 ELSE 0 END'
+            return [(f"SELECT {_select('attribute', 'j', 'c', exacta, id_, nombre)} "
+                     f"FROM class_entities c JOIN json_each(c.attributes_inline) j "
+                     f"JOIN diagrams d ON d.id = c.diagram_id "
+                     f"WHERE c.attributes_inline IS NOT NULL AND LOWER({nombre}) LIKE LOWER(%s) ESCAPE '\\'",
+                     [texto, patron])]
+        if conexion_por_defecto.vendor == 'postgresql':
+            nombre = '(j.v ->> 0)'
+            exacta = f'CASE WHEN lower({nombre}) = lower(%s) THEN 1 ELSE 0 END'
+            condicion, params = f'{nombre} ILIKE %s', [texto, patron]
+            if not any(c in texto for c in '"\\') and texto.isprintable():
+                # Mismo patrón sobre la expresión indexada; el texto JSON escapa comillas,
+                # barras y caracteres de control, así que esos términos no pasan por el índice
+                lista = "(jsonb_path_query_array(c.attributes_inline, '$[*][0]')::text)"
+                condicion, params = f'{lista} ILIKE %s AND {condicion}', [texto, patron, patron]
+            return [(f"SELECT {_select('attribute', 'j', 'c', exacta, '(j.v ->> 3)::uuid', nombre)} "
+                     f"FROM class_entities c CROSS JOIN LATERAL jsonb_array_elements(c.attributes_inline) j(v) "
+                     f"JOIN diagrams d ON d.id = c.diagram_id "
+                     f"WHERE c.attributes_inline IS NOT NULL AND {condicion}",
+                     params)]
+        return []
+
+    def _resultado(self, fila) -> Dict[str, Any]:
+        tipo, id_, nombre, diagrama_id, diagrama_nombre, clase_id, clase_nombre, score = fila
+        resultado = {
+            'kind': tipo,
+            'id': _uuid(id_),
+            'name': nombre,
+            'score': round(float(score or 0), 6),
+            'diagram': {'id': _uuid(diagrama_id), 'name': diagrama_nombre},
+        }
+        if tipo == 'attribute':
+            resultado['class'] = {'id': _uuid(clase_id), 'name': clase_nombre}
+        return resultado
+
+
+# Alias en inglés para compatibilidad
+SearchService = ServicioBusqueda
@@ -0,0 +1,166 @@
+"""
+Motor de validación UML incremental.
+Usa el índice de grafo cacheado (herencia, nombres, clases existentes) como estado
+por diagrama: cada escritura revisa solo las entidades que toca y la validación
+completa se ejecuta bajo demanda.
+"""
+import logging
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Collection, Dict, List, Optional, Sequence, Tuple
+
+from django.db.models import F, Q
+
+from ..models import Relacion
+from .graph_index import HERENCIA, IndiceGrafo, ServicioGrafo
+
+logger = logging.getLogger(__name__)
+
+ERROR = 'error'
+AVISO = 'warning'
+
+# código -> severidad; los errores rechazan la escritura (o la fila, en escrituras masivas)
+REGLAS = {
+    'inheritance_cycle': ERROR,
+    'self_composition': ERROR,
+    'dangling_reference': ERROR,
+    # unique (from_class, to_class, relationship_type) en la BD
+    'duplicate_relationship': ERROR,
+    # Además de la regla, la BD tiene unique (diagram, name): se detecta antes del IntegrityError
+    'duplicate_class_name': ERROR,
+}
+
+
+@dataclass
+class Diagnostico:
+    """Resultado de una regla sobre una entidad"""
+    code: str
+    message: str
+    entity: str
+    ids: List[str] = field(default_factory=list)
+    # Posición en el payload para escrituras masivas (relationships[3])
+    ref: Optional[str] = None
+    # Otras entradas del mismo payload implicadas (aún sin id en la BD)
+    refs: List[str] = field(default_factory=list)
+
+    @property
+    def severity(self) -> str:
+        return REGLAS[self.code]
+
+    def as_dict(self) -> Dict:
+        datos = asdict(self)
+        datos['severity'] = self.severity
+        if self.ref is None:
+            datos.pop('ref')
+        if not self.refs:
+            datos.pop('refs')
+        return datos
+
+
+def hay_errores(diagnosticos: Sequence[Diagnostico]) -> bool:
+    return any(d.severity == ERROR for d in diagnosticos)
+
+
+class ServicioValidacion:
+    """Reglas de validación por entidad y validación completa del diagrama"""
+
+    def __init__(self):
+        self.grafo = ServicioGrafo()
+
+    def validar_relacion(self, indice: IndiceGrafo, desde: Optional[str], hasta: Optional[str], tipo: str,
+                         ref: Optional[str] = None, rel_id: Optional[str] = None,
+                         pendientes: Collection[str] = ()) -> List[Diagnostico]:
+        """Reglas de una relación nueva o editada (`rel_id`) contra el estado actual.
+
+        `pendientes`: claves del índice que son entradas del payload aún no guardadas; se
+        informan en `refs` y no en `ids`.
+        """
+        faltantes = [c for c in (desde, hasta) if not c or c not in indice.nodos]
+        if faltantes:
+            return [Diagnostico('dangling_reference', 'La relación apunta a clases inexistentes en el diagrama',
+                                'relationship', [str(c) for c in faltantes if c], ref)]
+        diagnosticos = []
+        repetidas = [rid for rid, otra in indice.salientes.get(desde, {}).get(tipo, {}).items()
+                     if otra == hasta and rid != rel_id]
+        if repetidas:
+            diagnosticos.append(Diagnostico('duplicate_relationship', 'Ya existe una relación igual', 'relationship',
+                                            [r for r in repetidas if r not in pendientes], ref,
+                                            [r for r in repetidas if r in pendientes]))
+        if tipo == 'composition' and desde == hasta:
+            diagnosticos.append(Diagnostico('self_composition', 'Una clase no puede componerse a sí misma',
+                                            'relationship', [desde], ref))
+        # desde hereda de hasta: hay ciclo si hasta ya llega a desde subiendo por herencia
+        if tipo == HERENCIA and indice.alcanza(hasta, desde):
+            diagnosticos.append(Diagnostico('inheritance_cycle', 'La herencia formaría un ciclo',
+                                            'relationship', [desde, hasta], ref))
+        return diagnosticos
+
+    def validar_nombre_clase(self, indice: IndiceGrafo, nombre: str, clase_id: Optional[str] = None,
+                             ref: Optional[str] = None) -> List[Diagnostico]:
+        otras = indice.por_nombre.get(nombre, set()) - {str(clase_id)}
+        if not otras:
+            return []
+        return [Diagnostico('duplicate_class_name', f"Ya existe una clase llamada '{nombre}'",
+                            'class', sorted(otras), ref)]
+
+    def filtrar_relaciones(self, indice: IndiceGrafo, candidatas: Sequence[Tuple[Optional[str], Optional[str], str]],
+                           diagnosticos: List[Diagnostico]) -> List[int]:
+        """Valida relaciones de una escritura masiva sobre `indice` (que se va completando).
+
+        Devuelve las posiciones aceptadas; las rechazadas quedan en `diagnosticos`.
+        """
+        aceptadas = []
+        # Las aceptadas entran al índice con su posición como clave: sin id todavía
+        pendientes = set()
+        for posicion, (desde, hasta, tipo) in enumerate(candidatas):
+            ref = f'relationships[{posicion}]'
+            encontrados = self.validar_relacion(indice, desde, hasta, tipo, ref=ref, pendientes=pendientes)
+            diagnosticos.extend(encontrados)
+            if hay_errores(encontrados):
+                continue
+            indice.agregar(ref, desde, hasta, tipo)
+            pendientes.add(ref)
+            aceptadas.append(posicion)
+        return aceptadas
+
+    def validar_diagrama(self, diagrama_id: str) -> Optional[Dict]:
+        """Validación completa bajo demanda; None si el diagrama no existe"""
+        t0 = time.perf_counter()
+        indice = self.grafo.obtener_indice(diagrama_id)
+        if indice is None:
+            return None
+        diagnosticos: List[Diagnostico] = []
+
+        for ciclo in indice.ciclos_herencia():
+            diagnosticos.append(Diagnostico('inheritance_cycle', 'Ciclo de herencia', 'class', ciclo))
+        for rel_id, (desde, hasta, tipo) in indice.aristas.items():
+            if tipo == 'composition' and desde == hasta:
+                diagnosticos.append(Diagnostico('self_composition', 'Una clase no puede componerse a sí misma',
+                                                'relationship', [rel_id]))
+        for nombre, clases in indice.por_nombre.items():
+            if len(clases) > 1:
+                diagnosticos.append(Diagnostico('duplicate_class_name', f"Nombre de clase repetido '{nombre}'",
+                                                'class', sorted(clases)))
+        # Relaciones cuyas clases pertenecen a otro diagrama (el índice no las distingue)
+        colgantes = (Relacion.objects.filter(diagram_id=diagrama_id)
+                     .filter(~Q(from_class__diagram_id=F('diagram_id')) | ~Q(to_class__diagram_id=F('diagram_id')))
+                     .values_list('id', flat=True))
+        for rel_id in colgantes:
+            diagnosticos.append(Diagnostico('dangling_reference', 'La relación apunta a clases de otro diagrama',
+                                            'relationship', [str(rel_id)]))
+
+        ms = (time.perf_counter() - t0) * 1000
+        logger.debug(f"[validacion] completa id={diagrama_id} diagnosticos={len(diagnosticos)} ms={ms:.1f}")
+        return {
+            'revision': indice.revision,
+            'valid': not hay_errores(diagnosticos),
+            'classes': len(indice.nodos),
+            'relationships': len(indice.aristas),
+            'diagnostics': [d.as_dict() for d in diagnosticos],
+            'elapsed_ms': round(ms, 1),
+        }
+
+
+# Alias en inglés para compatibilidad
+ValidationService = ServicioValidacion
+Diagnostic = Diagnostico
@@ -0,0 +1,154 @@
+"""
+Servicio de consultas por viewport.
+Devuelve solo las clases cuya posición cae dentro de un rectángulo del lienzo
+(índice (diagram, position_x, position_y)), sus atributos y las relaciones que
+las tocan, para que el cliente cargue el diagrama por partes al desplazarse.
+"""
+import logging
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from ..models import AtributoClase, EntidadClase, Relacion
+from ..models.atributo_en_linea import desempaquetar
+from ..repositories.diagrama_repository import RepositorioDiagrama
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Rectangulo:
+    """Rectángulo del lienzo en coordenadas de posición de clase (esquinas inclusivas)"""
+    x0: int
+    y0: int
+    x1: int
+    y1: int
+
+    @classmethod
+    def desde_parametros(cls, params, padding: int = 0) -> 'Rectangulo':
+        """Construir desde x0,y0,x1,y1 (o x,y,width,height) ampliado por `padding`"""
+        try:
+            if 'width' in params or 'height' in params:
+                x0, y0 = int(params['x']), int(params['y'])
+                x1, y1 = x0 + int(params['width']), y0 + int(params['height'])
+            else:
+                x0, y0, x1, y1 = (int(params[k]) for k in ('x0', 'y0', 'x1', 'y1'))
+        except KeyError as e:
+            raise ValueError(f'Falta el parámetro {e.args[0]}')
+        except (TypeError, ValueError):
+            raise ValueError('Las coordenadas deben ser enteros')
+        if x1 < x0 or y1 < y0:
+            raise ValueError('El rectángulo está invertido (x1 < x0 o y1 < y0)')
+        if padding < 0:
+            raise ValueError('padding no puede ser negativo')
+        return cls(x0 - padding, y0 - padding, x1 + padding, y1 + padding)
+
+    def as_dict(self) -> Dict:
+        return {'x0': self.x0, 'y0': self.y0, 'x1': self.x1, 'y1': self.y1}
+
+
+def _leer_cursor(cursor: Optional[str]) -> Optional[Tuple[int, str]]:
+    """El cursor es 'position_x:id' de la última clase de la página anterior"""
+    if not cursor:
+        return None
+    x, _, clase_id = cursor.partition(':')
+    try:
+        return int(x), clase_id
+    except ValueError:
+        raise ValueError('cursor inválido')
+
+
+class ServicioViewport:
+    """Lectura parcial de un diagrama acotada a un rectángulo del lienzo"""
+
+    def __init__(self):
+        self.repo_diagrama = RepositorioDiagrama()
+
+    def consultar(self, diagrama_id: str, rect: Rectangulo, limite: int = 1000, cursor: Optional[str] = None,
+                  con_atributos: bool = True) -> Optional[Dict]:
+        """Clases dentro de `rect` (paginadas por cursor), sus atributos y relaciones.
+
+        Las relaciones cuyo otro extremo queda fuera de la página se devuelven igual;
+        ese extremo va en `external_classes` (id, nombre, posición) para poder dibujar
+        la línea. None si el diagrama no existe.
+        """
+        t0 = time.perf_counter()
+        revision = self.repo_diagrama.get_revision(diagrama_id)
+        if revision is None:
+            return None
+
+        consulta = EntidadClase.objects.filter(
+            diagram_id=diagrama_id,
+            position_x__gte=rect.x0, position_x__lte=rect.x1,
+            position_y__gte=rect.y0, position_y__lte=rect.y1,
+        )
+        desde = _leer_cursor(cursor)
+        if desde:
+            x, clase_id = desde
+            consulta = consulta.filter(position_x__gte=x).exclude(position_x=x, id__lte=clase_id)
+        # Una fila de más indica si hay otra página
+        columnas = ['id', 'name', 'position_x', 'position_y'] + (['attributes_inline'] if con_atributos else [])
+        filas = list(consulta.order_by('position_x', 'id').values(*columnas)[:limite + 1])
+        siguiente = None
+        if len(filas) > limite:
+            filas = filas[:limite]
+            ultima = filas[-1]
+            siguiente = f"{ultima['position_x']}:{ultima['id']}"
+
+        ids = [f['id'] for f in filas]
+        clases = {
+            f['id']: {'id': str(f['id']), 'name': f['name'],
+                      'position': {'x': f['position_x'], 'y': f['position_y']}}
+            for f in filas
+        }
+        if con_atributos:
+            # Los atributos en línea llegan con la fila de la clase; solo las clases en filas consultan aparte
+            en_filas = []
+            for f in filas:
+                if f['attributes_inline'] is None:
+                    en_filas.append(f['id'])
+                clases[f['id']]['attributes'] = [
+                    {'id': str(a.id), 'name': a.name, 'data_type': a.data_type, 'visibility': a.visibility}
+                    for a in desempaquetar(f['id'], f['attributes_inline'] or [])
+                ]
+            if en_filas:
+                for a in (AtributoClase.objects.filter(class_entity_id__in=en_filas).order_by('created_at')
+                          .values('id', 'class_entity_id', 'name', 'data_type', 'visibility')):
+                    clases[a.pop('class_entity_id')]['attributes'].append({**a, 'id': str(a['id'])})
+
+        relaciones, externas = self._relaciones(ids) if ids else ([], [])
+        ms = (time.perf_counter() - t0) * 1000
+        logger.debug(f"[viewport] id={diagrama_id} clases={len(ids)} relaciones={len(relaciones)} ms={ms:.1f}")
+        return {
+            'revision': revision,
+            'bbox': rect.as_dict(),
+            'classes': list(clases.values()),
+            'relationships': relaciones,
+            'external_classes': externas,
+            'next_cursor': siguiente,
+        }
+
+    def _relaciones(self, ids: List) -> Tuple[List[Dict], List[Dict]]:
+        """Relaciones con algún extremo en `ids` y los extremos que quedan fuera"""
+        relaciones = []
+        fuera = set()
+        en_pagina = set(ids)
+        filas = (Relacion.objects.filter(from_class_id__in=ids)
+                 .union(Relacion.objects.filter(to_class_id__in=ids))
+                 .values_list('id', 'from_class_id', 'to_class_id', 'relationship_type',
+                              'cardinality_from', 'cardinality_to'))
+        for rel_id, desde, hasta, tipo, card_desde, card_hasta in filas:
+            relaciones.append({
+                'id': str(rel_id), 'from_class': str(desde), 'to_class': str(hasta),
+                'relationship_type': tipo, 'cardinality': {'from': card_desde, 'to': card_hasta},
+            })
+            fuera.update(c for c in (desde, hasta) if c not in en_pagina)
+        externas = [
+            {'id': str(c['id']), 'name': c['name'], 'position': {'x': c['position_x'], 'y': c['position_y']}}
+            for c in EntidadClase.objects.filter(id__in=fuera).values('id', 'name', 'position_x', 'position_y')
+        ] if fuera else []
+        return relaciones, externas
+
+
+# Alias en inglés para compatibilidad
+ViewportService = ServicioViewport
@@ -1,16 +1,34 @@
 
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import DiagramViewSet, ClassEntityViewSet, RelationshipViewSet
-from .views.health_views import health_check, test_endpoint
+from .views import (
+    DiagramViewSet, ClassEntityViewSet, RelationshipViewSet, DiagramClassViewSet, DiagramRelationshipViewSet,
+    JobViewSet,
+)
+from .views.health_views import (
+    compression_stats, health_check, liveness, profile_detail, profiles, readiness, realtime_stats, test_endpoint,
+    traces,
+)
 
 router = DefaultRouter()
 router.register(r'diagrams', DiagramViewSet)
 router.register(r'classes', ClassEntityViewSet)
 router.register(r'relationships', RelationshipViewSet)
+router.register(r'jobs', JobViewSet, basename='job')
+# Rutas anidadas por diagrama (querysets acotados y paginados)
+router.register(r'diagrams/(?P<diagram_pk>[^/.]+)/classes', DiagramClassViewSet, basename='diagram-classes')
+router.register(r'diagrams/(?P<diagram_pk>[^/.]+)/relationships', DiagramRelationshipViewSet,
+                basename='diagram-relationships')
 
 urlpatterns = [
     path('', include(router.urls)),
     path('health/', health_check, name='health-check'),
+    path('health/live/', liveness, name='health-live'),
+    path('health/ready/', readiness, name='health-ready'),
+    path('health/realtime/', realtime_stats, name='health-realtime'),
+    path('health/compression/', compression_stats, name='health-compression'),
+    path('health/traces/', traces, name='health-traces'),
+    path('health/profiles/', profiles, name='health-profiles'),
+    path('health/profiles/<str:profile_id>/', profile_detail, name='health-profile-detail'),
     path('test/', test_endpoint, name='test-endpoint'),
 ]
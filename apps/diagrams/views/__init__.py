@@ -2,8 +2,9 @@
 Views module for diagram management
 """
 from .diagram_viewset import DiagramViewSet
-from .class_entity_viewset import ClassEntityViewSet  
-from .relationship_viewset import RelationshipViewSet
+from .class_entity_viewset import ClassEntityViewSet, DiagramClassViewSet
+from .relationship_viewset import RelationshipViewSet, DiagramRelationshipViewSet
+from .job_viewset import JobViewSet
 
 # Legacy aliases
 VistaConjuntoDiagramas = DiagramViewSet
@@ -14,6 +15,9 @@ __all__ = [
     'DiagramViewSet',
     'ClassEntityViewSet', 
     'RelationshipViewSet',
+    'DiagramClassViewSet',
+    'DiagramRelationshipViewSet',
+    'JobViewSet',
     'VistaConjuntoDiagramas',
     'VistaConjuntoEntidadesClase',
     'VistaConjuntoRelaciones'
@@ -1,20 +1,63 @@
 """
 ViewSet para entidades de clase
 """
-from rest_framework import viewsets, status
+from rest_framework import serializers, viewsets, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound
 from rest_framework.response import Response
 
 from ..models import EntidadClase
+from ..repositories import RepositorioAtributos
 from ..serializers import SerializadorEntidadClase, SerializadorAtributoClase
-from ..services import ClassEntityService
+from ..services import ClassEntityService, ServicioGrafo, ServicioValidacion
+from ..services.validation_service import hay_errores
+from .pagination import PaginacionDiagrama, PaginacionOpcional, RutaDiagramaMixin
 
 
 class ClassEntityViewSet(viewsets.ModelViewSet):
     """Conjunto de vistas para operaciones CRUD de entidades de clase"""
-    queryset = EntidadClase.objects.all()
+    # Las clases de diagramas marcados para borrado quedan ocultas hasta su purga
+    queryset = EntidadClase.objects.filter(diagram__deleted_at__isnull=True)
     serializer_class = SerializadorEntidadClase
+    pagination_class = PaginacionOpcional
     service = ClassEntityService()
+    servicio_grafo = ServicioGrafo()
+    servicio_validacion = ServicioValidacion()
+    diagnosticos = ()
+
+    def get_queryset(self):
+        # Prefetch de las filas de atributos solo si no viajan en la propia clase
+        return super().get_queryset().prefetch_related(*RepositorioAtributos().prefetch())
+
+    def update(self, request, *args, **kwargs):
+        respuesta = super().update(request, *args, **kwargs)
+        respuesta.data['diagnostics'] = [d.as_dict() for d in self.diagnosticos]
+        return respuesta
+
+    def perform_create(self, serializer):
+        clase = serializer.save()
+        if clase.diagram_id:
+            self.servicio_grafo.clase_guardada(clase.diagram_id, clase.id, clase.name)
+
+    def perform_update(self, serializer):
+        instancia = serializer.instance
+        nombre = serializer.validated_data.get('name', instancia.name)
+        if instancia.diagram_id and nombre != instancia.name:
+            # Solo se revisa el nombre de la clase tocada
+            indice = self.servicio_grafo.obtener_indice(instancia.diagram_id)
+            diagnosticos = self.servicio_validacion.validar_nombre_clase(indice, nombre, instancia.id)
+            if hay_errores(diagnosticos):
+                raise serializers.ValidationError({'diagnostics': [d.as_dict() for d in diagnosticos]})
+            self.diagnosticos = diagnosticos
+        clase = serializer.save()
+        if clase.diagram_id:
+            self.servicio_grafo.clase_guardada(clase.diagram_id, clase.id, clase.name)
+
+    def perform_destroy(self, instance):
+        diagrama_id, clase_id = instance.diagram_id, instance.id
+        instance.delete()
+        if diagrama_id:
+            self.servicio_grafo.clase_eliminada(diagrama_id, clase_id)
 
     @action(detail=True, methods=['post'])
     def agregar_atributo(self, request, pk=None):
@@ -42,5 +85,36 @@ class ClassEntityViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
 
+class DiagramClassViewSet(RutaDiagramaMixin, ClassEntityViewSet):
+    """Clases de un diagrama: /diagrams/{diagram_pk}/classes/ (listado paginado con atributos)"""
+    pagination_class = PaginacionDiagrama
+
+    @classmethod
+    def get_extra_actions(cls):
+        # Atributos y posición siguen en /classes/{id}/...; aquí solo CRUD
+        return []
+
+    def get_queryset(self):
+        return (EntidadClase.objects.filter(diagram_id=self.kwargs['diagram_pk'], diagram__deleted_at__isnull=True)
+                .prefetch_related(*RepositorioAtributos().prefetch()).order_by('name'))
+
+    def perform_create(self, serializer):
+        diagrama_id = self.kwargs['diagram_pk']
+        indice = self.servicio_grafo.obtener_indice(diagrama_id)
+        if indice is None:
+            raise NotFound('Diagram not found')
+        nombre = serializer.validated_data.get('name')
+        diagnosticos = self.servicio_validacion.validar_nombre_clase(indice, nombre)
+        if hay_errores(diagnosticos):
+            raise serializers.ValidationError({'diagnostics': [d.as_dict() for d in diagnosticos]})
+        posicion = self.request.data.get('position') or {}
+        try:
+            x, y = int(posicion.get('x', 0)), int(posicion.get('y', 0))
+        except (AttributeError, TypeError, ValueError):
+            raise serializers.ValidationError({'position': 'position debe ser {x, y} enteros'})
+        clase = serializer.save(diagram_id=diagrama_id, position_x=x, position_y=y)
+        self.servicio_grafo.clase_guardada(diagrama_id, clase.id, clase.name)
+
+
 # Legacy alias
 VistaConjuntoEntidadesClase = ClassEntityViewSet
\ No newline at end of file
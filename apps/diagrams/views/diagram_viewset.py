@@ -4,15 +4,27 @@ ViewSet para diagramas
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from django.db.models import Prefetch
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
 from django.conf import settings
 import logging
 import os
+import uuid
 
-from ..models import Diagrama, EntidadClase
+from diagram_backend.tracing import tramo_actual, traza, trazado
+
+from ..models import Diagrama, EntidadClase, Relacion
+from ..repositories import RepositorioAtributos
 from ..serializers import SerializadorDiagrama, SerializadorCrearDiagrama
-from ..services import ServicioDiagrama
+from ..services import (
+    OperacionInvalida, Rectangulo, ServicioBusqueda, ServicioDiagrama, ServicioExportacion, ServicioGrafo,
+    ServicioLayout, ServicioOperaciones, ServicioPurga, ServicioTrabajos, ServicioValidacion, ServicioViewport,
+    iniciar_monitor,
+)
+from ..services.job_tasks import ruta_trabajo
+from .job_viewset import respuesta_aceptada
 
 logger = logging.getLogger(__name__)
 
@@ -25,40 +37,62 @@ class DiagramViewSet(viewsets.ModelViewSet):
     queryset = Diagrama.objects.all()
     serializer_class = SerializadorDiagrama
     servicio = ServicioDiagrama()
+    servicio_layout = ServicioLayout()
+    servicio_grafo = ServicioGrafo()
+    servicio_validacion = ServicioValidacion()
+    servicio_busqueda = ServicioBusqueda()
+    servicio_viewport = ServicioViewport()
+    servicio_operaciones = ServicioOperaciones()
+    servicio_trabajos = ServicioTrabajos()
+
+    def _en_segundo_plano(self, request) -> bool:
+        """?async=1 o `Prefer: respond-async`: la acción se encola y responde 202 con el id del trabajo"""
+        return (request.query_params.get('async') in ('1', 'true')
+                or 'respond-async' in request.headers.get('Prefer', ''))
 
     def get_queryset(self):
         """Optimiza las consultas al recuperar diagramas para reducir la latencia en refresh.
 
         Prefetch de:
-          - classes + attributes
+          - classes + attributes (solo classes con CLASS_ATTRIBUTE_STORAGE='inline')
           - relationships y sus from/to (select_related)
         """
         return (Diagrama.objects
-                .prefetch_related('classes__attributes')
-                .prefetch_related('relationships__from_class', 'relationships__to_class'))
+                .prefetch_related('classes', *RepositorioAtributos().prefetch('classes__'))
+                .prefetch_related(Prefetch(
+                    'relationships',
+                    # Las clases de cada extremo solo aportan id y nombre: sin decodificar sus atributos
+                    queryset=Relacion.objects.select_related('from_class', 'to_class')
+                    .defer('from_class__attributes_inline', 'to_class__attributes_inline'),
+                )))
 
     def get_serializer_class(self):
         if self.action == 'create':
             return SerializadorCrearDiagrama
         return SerializadorDiagrama
 
+    @trazado('DiagramViewSet.create')
     def create(self, request):
         """Crear un nuevo diagrama"""
         try:
-            import time
             from django.db import connection
-            t0 = time.perf_counter()
             logger.info(f"[diagrama.crear] inicio campos={list(request.data.keys())}")
             
             serializador = self.get_serializer(data=request.data)
-            serializador.is_valid(raise_exception=True)
+            with traza('serializer.validate'):
+                serializador.is_valid(raise_exception=True)
             
-            diagrama = self.servicio.crear_diagrama(serializador.validated_data)
-            serializador_respuesta = SerializadorDiagrama(diagrama)
-            dt = (time.perf_counter() - t0) * 1000
-            logger.info(f"[diagrama.crear] ok id={diagrama.id} ms={dt:.1f}")
+            diagnosticos = []
+            diagrama = self.servicio.crear_diagrama(serializador.validated_data, diagnosticos)
+            # Releer con prefetch para no serializar clase por clase
+            diagrama = self.servicio.obtener_diagrama_con_detalles(diagrama.id)
+            with traza('serializer.data'):
+                datos = SerializadorDiagrama(diagrama).data
+            datos['diagnostics'] = [d.as_dict() for d in diagnosticos]
+            tramo_actual().anotar(diagram_id=str(diagrama.id), diagnostics=len(diagnosticos))
+            logger.info(f"[diagrama.crear] ok id={diagrama.id} diagnosticos={len(diagnosticos)}")
             connection.close()
-            return Response(serializador_respuesta.data, status=status.HTTP_201_CREATED)
+            return Response(datos, status=status.HTTP_201_CREATED)
             
         except Exception as e:
             from django.db import connection
@@ -69,12 +103,11 @@ class DiagramViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    @trazado('DiagramViewSet.retrieve')
     def retrieve(self, request, pk=None):
         """Obtener diagrama con detalles"""
         try:
-            import time
             from django.db import connection
-            t0 = time.perf_counter()
             logger.debug(f"[diagrama.obtener] id={pk}")
             
             diagrama = self.servicio.obtener_diagrama_con_detalles(pk)
@@ -85,11 +118,11 @@ class DiagramViewSet(viewsets.ModelViewSet):
                     status=status.HTTP_404_NOT_FOUND
                 )
             
-            serializador = SerializadorDiagrama(diagrama)
-            dt = (time.perf_counter() - t0) * 1000
-            logger.debug(f"[diagrama.obtener] ok id={pk} ms={dt:.1f}")
+            with traza('serializer.data'):
+                datos = SerializadorDiagrama(diagrama).data
+            logger.debug(f"[diagrama.obtener] ok id={pk}")
             connection.close()
-            return Response(serializador.data)
+            return Response(datos)
             
         except Exception as e:
             from django.db import connection
@@ -100,6 +133,7 @@ class DiagramViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    @trazado('DiagramViewSet.update')
     def update(self, request, pk=None, partial=False):
         """Actualizar diagrama"""
         try:
@@ -119,9 +153,14 @@ class DiagramViewSet(viewsets.ModelViewSet):
             
             # Actualización directa usando el servicio, evitando el serializer
             try:
-                diagrama = self.servicio.actualizar_diagrama(pk, request.data)
-                serializador_respuesta = self.get_serializer(diagrama)
-                return Response(serializador_respuesta.data)
+                diagnosticos = []
+                self.servicio.actualizar_diagrama(pk, request.data, diagnosticos)
+                # Releer con prefetch: serializar la instancia del servicio consulta atributos por clase
+                diagrama = self.servicio.obtener_diagrama_con_detalles(pk)
+                with traza('serializer.data'):
+                    datos = self.get_serializer(diagrama).data
+                datos['diagnostics'] = [d.as_dict() for d in diagnosticos]
+                return Response(datos)
             except Exception as e:
                 logger.error(f"Error en servicio: {str(e)}", exc_info=True)
                 return Response(
@@ -136,6 +175,7 @@ class DiagramViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    @trazado('DiagramViewSet.destroy')
     def destroy(self, request, pk=None):
         """Eliminar diagrama"""
         try:
@@ -151,25 +191,19 @@ class DiagramViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['get'])
     def health_check(self, request):
-        """Verificar estado del servidor y base de datos"""
+        """Verificar estado del servidor y base de datos (según la última comprobación en segundo plano)"""
         try:
-            from django.db import connections
-            
-            # Verificar conexión a base de datos
-            db_status = {}
-            for alias in connections:
-                try:
-                    connection = connections[alias]
-                    with connection.cursor() as cursor:
-                        cursor.execute("SELECT 1")
-                        cursor.fetchone()
-                        db_status[alias] = "OK"
-                except Exception as e:
-                    db_status[alias] = f"ERROR: {str(e)}"
-                finally:
-                    if connection.connection is not None:
-                        connection.close()
-            
+            # Sin abrir conexiones aquí: la comprobación la hace el monitor de dependencias
+            estado = iniciar_monitor().estado()
+            bd = estado['dependencies'].get('database')
+            if bd is None:
+                db_status = {}
+            elif bd['ok'] and not bd['stale']:
+                db_status = {alias: v for alias, v in bd['aliases'].items() if isinstance(v, str)}
+            else:
+                error = bd['error'] or f"comprobación de hace {bd['age_s']:.0f}s"
+                db_status = {alias: f'ERROR: {error}' for alias in settings.DATABASES}
+
             # Información básica del sistema
             info = {
                 'status': 'OK',
@@ -194,44 +228,213 @@ class DiagramViewSet(viewsets.ModelViewSet):
         finally:
             pass
 
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """Exportar diagramas como NDJSON en streaming (?ids=a,b para filtrar; ?async=1 genera un archivo)"""
+        ids = [i for i in request.query_params.get('ids', '').split(',') if i.strip()]
+        if self._en_segundo_plano(request):
+            trabajo = self.servicio_trabajos.encolar('diagrams.export', {'ids': ids}, usuario=request.user)
+            return respuesta_aceptada(request, trabajo)
+        exportador = ServicioExportacion()
+        # Bajo ASGI un iterador síncrono se consumiría entero en memoria
+        if hasattr(request._request, 'scope'):
+            contenido = exportador.exportar_async(ids or None)
+        else:
+            contenido = exportador.exportar(ids or None)
+        respuesta = StreamingHttpResponse(contenido, content_type='application/x-ndjson')
+        respuesta['Content-Disposition'] = 'attachment; filename="diagrams.ndjson"'
+        return respuesta
+
+    @action(detail=False, methods=['post'], url_path='import')
+    def importar(self, request):
+        """Importar NDJSON (campo `file` multipart o el cuerpo tal cual) como trabajo en segundo plano"""
+        archivo = request.FILES.get('file') if request.content_type.startswith('multipart/') else None
+        nombre = f'import-{uuid.uuid4()}.ndjson'
+        with open(ruta_trabajo(nombre), 'wb') as destino:
+            if archivo is not None:
+                for bloque in archivo.chunks():
+                    destino.write(bloque)
+            else:
+                destino.write(request.body)
+        if not os.path.getsize(ruta_trabajo(nombre)):
+            os.remove(ruta_trabajo(nombre))
+            return Response({'error': 'Empty import'}, status=status.HTTP_400_BAD_REQUEST)
+        trabajo = self.servicio_trabajos.encolar('diagrams.import', {'file': nombre}, usuario=request.user)
+        return respuesta_aceptada(request, trabajo)
+
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """Buscar diagramas, clases y atributos (?q=&types=class,attribute&mine=1&page=&page_size=)"""
+        params = request.query_params
+        try:
+            pagina = max(1, int(params.get('page', 1)))
+            tamano = min(max(1, int(params.get('page_size', 20))), 100)
+        except ValueError:
+            return Response({'error': 'page y page_size deben ser enteros'}, status=status.HTTP_400_BAD_REQUEST)
+        tipos = [t for t in params.get('types', '').split(',') if t.strip()] or None
+        return Response(self.servicio_busqueda.buscar(
+            params.get('q', ''), usuario=request.user, tipos=tipos,
+            solo_propios=params.get('mine') in ('1', 'true'), pagina=pagina, tamano=tamano,
+        ))
+
+    @action(detail=False, methods=['get', 'post'])
+    def purge(self, request):
+        """Estado de la purga de diagramas borrados (GET) o purga inmediata (POST, opcional {"id": ...})"""
+        servicio = ServicioPurga()
+        if request.method == 'GET':
+            return Response(servicio.estado())
+        diagrama_id = request.data.get('id')
+        if diagrama_id:
+            if str(diagrama_id) not in servicio.pendientes():
+                return Response({'error': 'Diagram not pending purge'}, status=status.HTTP_404_NOT_FOUND)
+            resultados = [{'id': str(diagrama_id), 'rows': servicio.purgar_diagrama(diagrama_id)}]
+        else:
+            resultados = servicio.purgar_pendientes(limite=request.data.get('limit'))
+        return Response({'purged': resultados, **servicio.estado()})
+
+    @action(detail=True, methods=['get'])
+    def viewport(self, request, pk=None):
+        """Clases dentro de un rectángulo del lienzo y sus relaciones
+
+        ?x0=&y0=&x1=&y1= (o x,y,width,height) &padding=&limit=&cursor=&attributes=0
+        """
+        params = request.query_params
+        try:
+            rect = Rectangulo.desde_parametros(params, padding=int(params.get('padding', 0)))
+            limite = min(max(1, int(params.get('limit', 1000))), 5000)
+            resultado = self.servicio_viewport.consultar(
+                pk, rect, limite=limite, cursor=params.get('cursor'),
+                con_atributos=params.get('attributes') not in ('0', 'false'),
+            )
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if resultado is None:
+            return Response({'error': 'Diagram not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(resultado)
+
     @action(detail=True, methods=['post'])
-    def duplicar(self, request, pk=None):
-        """Duplicar un diagrama"""
-        original = get_object_or_404(Diagrama, pk=pk)
-
-        # Crear datos duplicados
-        datos_duplicado = {
-            'name': f"{original.name} (Copia)",
-            'description': original.description,
-            'is_public': False,
-            'classes': [],
-            'relationships': []
-        }
+    def operations(self, request, pk=None):
+        """Aplicar una lista ordenada de operaciones en una transacción
 
-        # Copiar clases
-        for clase in original.classes.all():
-            datos_clase = {
-                'name': clase.name,
-                'position': {'x': clase.position_x, 'y': clase.position_y},
-                'attributes': [attr.name for attr in clase.attributes.all()]
-            }
-            datos_duplicado['classes'].append(datos_clase)
-
-        # Copiar relaciones
-        for relacion in original.relationships.all():
-            datos_rel = {
-                'from': relacion.from_class.name,
-                'to': relacion.to_class.name,
-                'type': relacion.relationship_type,
-                'cardinality': {
-                    'from': relacion.cardinality_from,
-                    'to': relacion.cardinality_to
-                }
+        {"operations": [{"op": "add_class", "ref": "a", "name": ...}, {"op": "add_attribute", "class_id": "a", ...}]}
+        Si alguna falla no se escribe nada y se responde el resultado por operación.
+        """
+        try:
+            resultado = self.servicio_operaciones.aplicar(pk, request.data.get('operations'))
+        except OperacionInvalida as e:
+            codigo = status.HTTP_409_CONFLICT if e.conflicto else status.HTTP_400_BAD_REQUEST
+            return Response({'error': str(e), 'results': e.resultados}, status=codigo)
+        if resultado is None:
+            return Response({'error': 'Diagram not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(resultado)
+
+    @action(detail=True, methods=['post'])
+    def layout(self, request, pk=None):
+        """Calcular posiciones en el servidor (mode: force | layered) y guardarlas"""
+        diagrama = get_object_or_404(Diagrama.objects.only('id'), pk=pk)
+        try:
+            opciones = {
+                'modo': request.data.get('mode', 'force'),
+                'iteraciones': min(int(request.data.get('iterations', 300)), 2000),
+                'deadline_ms': min(float(request.data.get('deadline_ms', 5000)), 30000),
+                'espaciado': float(request.data.get('spacing', 250)),
             }
-            datos_duplicado['relationships'].append(datos_rel)
+            if self._en_segundo_plano(request):
+                trabajo = self.servicio_trabajos.encolar(
+                    'diagram.layout', {'diagram_id': str(diagrama.id), **opciones},
+                    diagrama_id=diagrama.id, usuario=request.user)
+                return respuesta_aceptada(request, trabajo)
+            clases, resultado = self.servicio_layout.aplicar(str(diagrama.id), **opciones)
+        except (TypeError, ValueError) as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            'mode': opciones['modo'],
+            'iterations': resultado.iteraciones,
+            'converged': resultado.convergio,
+            'deadline_reached': resultado.deadline_alcanzado,
+            'elapsed_ms': round(resultado.ms, 1),
+            'updated': len(clases),
+            'classes': clases,
+            **resultado.extra,
+        })
+
+    @action(detail=True, methods=['get'])
+    def validate(self, request, pk=None):
+        """Validación completa del diagrama bajo demanda"""
+        resultado = self.servicio_validacion.validar_diagrama(pk)
+        if resultado is None:
+            return Response({'error': 'Diagram not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(resultado)
+
+    def _indice_y_clase(self, pk, requiere_clase=True):
+        """Índice vigente y class_id validado; devuelve (indice, clase, respuesta_error)"""
+        indice = self.servicio_grafo.obtener_indice(pk)
+        if indice is None:
+            return None, None, Response({'error': 'Diagram not found'}, status=status.HTTP_404_NOT_FOUND)
+        clase = self.request.query_params.get('class_id', '')
+        if requiere_clase and clase not in indice.nodos:
+            return None, None, Response({'error': 'class_id no pertenece al diagrama'},
+                                        status=status.HTTP_404_NOT_FOUND)
+        return indice, clase, None
+
+    @action(detail=True, methods=['get'], url_path='graph/neighbors')
+    def grafo_vecinos(self, request, pk=None):
+        """Vecinos directos de una clase (?class_id=&direction=out|in|both&type=)"""
+        indice, clase, error = self._indice_y_clase(pk)
+        if error:
+            return error
+        direccion = request.query_params.get('direction', 'both')
+        if direccion not in ('out', 'in', 'both'):
+            return Response({'error': 'direction debe ser out, in o both'}, status=status.HTTP_400_BAD_REQUEST)
+        vecinos = indice.vecinos(clase, direccion, request.query_params.get('type') or None)
+        return Response({'revision': indice.revision, 'class_id': clase, 'neighbors': vecinos})
+
+    @action(detail=True, methods=['get'], url_path='graph/ancestors')
+    def grafo_ancestros(self, request, pk=None):
+        """Superclases transitivas de una clase (?class_id=)"""
+        indice, clase, error = self._indice_y_clase(pk)
+        if error:
+            return error
+        return Response({'revision': indice.revision, 'class_id': clase, 'ancestors': indice.ancestros(clase)})
+
+    @action(detail=True, methods=['get'], url_path='graph/descendants')
+    def grafo_descendientes(self, request, pk=None):
+        """Subclases transitivas de una clase (?class_id=)"""
+        indice, clase, error = self._indice_y_clase(pk)
+        if error:
+            return error
+        return Response({'revision': indice.revision, 'class_id': clase,
+                         'descendants': indice.descendientes(clase)})
+
+    @action(detail=True, methods=['get'], url_path='graph/components')
+    def grafo_componentes(self, request, pk=None):
+        """Componentes conexas del diagrama, de mayor a menor"""
+        indice, _, error = self._indice_y_clase(pk, requiere_clase=False)
+        if error:
+            return error
+        return Response({'revision': indice.revision, 'components': indice.componentes()})
+
+    @action(detail=True, methods=['get'], url_path='graph/cycles')
+    def grafo_ciclos(self, request, pk=None):
+        """Ciclos de herencia (cada uno como lista de class_id)"""
+        indice, _, error = self._indice_y_clase(pk, requiere_clase=False)
+        if error:
+            return error
+        return Response({'revision': indice.revision, 'cycles': indice.ciclos_herencia()})
+
+    @action(detail=True, methods=['post'])
+    def duplicar(self, request, pk=None):
+        """Duplicar un diagrama (?async=1 para encolarlo)"""
+        if self._en_segundo_plano(request):
+            original = get_object_or_404(Diagrama.objects.only('id'), pk=pk)
+            trabajo = self.servicio_trabajos.encolar('diagram.duplicate', {'diagram_id': str(original.id)},
+                                                     diagrama_id=original.id, usuario=request.user)
+            return respuesta_aceptada(request, trabajo)
 
-        # Crear duplicado
-        duplicado = self.servicio.crear_diagrama(datos_duplicado)
+        duplicado = self.servicio.duplicar_diagrama(pk)
+        if duplicado is None:
+            return Response({'error': 'Diagrama no encontrado'}, status=status.HTTP_404_NOT_FOUND)
+        duplicado = self.servicio.obtener_diagrama_con_detalles(duplicado.id)
         serializador = SerializadorDiagrama(duplicado)
         return Response(serializador.data, status=status.HTTP_201_CREATED)
 
@@ -247,7 +450,7 @@ class DiagramViewSet(viewsets.ModelViewSet):
                     'id': cls.id,
                     'name': cls.name,
                     'position': {'x': cls.position_x, 'y': cls.position_y},
-                    'attributes': [attr.name for attr in cls.attributes.all()]
+                    'attributes': [attr.name for attr in cls.lista_atributos]
                 }
                 for cls in diagrama.classes.all()
             ],
@@ -310,7 +513,7 @@ class DiagramViewSet(viewsets.ModelViewSet):
                 'id': str(cls.id),
                 'name': cls.name,
                 'position': {'x': cls.position_x, 'y': cls.position_y},
-                'attributes': [attr.name for attr in cls.attributes.all()]
+                'attributes': [attr.name for attr in cls.lista_atributos]
             })
         
         relations_data = []
@@ -361,6 +564,8 @@ class DiagramViewSet(viewsets.ModelViewSet):
         # Cargar solo las clases necesarias pertenecientes al diagrama
         clases = EntidadClase.objects.filter(diagram=diagrama, id__in=list(updates.keys()))
         modificadas = []
+        cambiadas = []
+        ahora = timezone.now()
         for cls in clases:
             new_pos = updates.get(str(cls.id)) or updates.get(cls.id)
             if new_pos:
@@ -368,11 +573,16 @@ class DiagramViewSet(viewsets.ModelViewSet):
                 cls.position_x = new_pos['x']
                 cls.position_y = new_pos['y']
                 if changed:
-                    cls.save(update_fields=['position_x', 'position_y', 'updated_at'])
+                    cls.updated_at = ahora
+                    cambiadas.append(cls)
                 modificadas.append({
                     'id': str(cls.id),
                     'position': {'x': cls.position_x, 'y': cls.position_y}
                 })
+        # Un UPDATE por lote en lugar de un save() por clase
+        if cambiadas:
+            EntidadClase.objects.bulk_update(cambiadas, ['position_x', 'position_y', 'updated_at'], batch_size=500)
+            self.servicio_grafo.sin_cambios_de_grafo(diagrama.id)
 
         return Response({'updated': len(modificadas), 'classes': modificadas})
 
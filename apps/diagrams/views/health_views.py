@@ -1,9 +1,15 @@
-from django.http import JsonResponse
+from django.http import FileResponse, JsonResponse
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_exempt
 from django.utils import timezone
+from django.conf import settings
 import json
 
+from diagram_backend import compresion, profiling, tracing
+from ..realtime import obtener_historial
+from ..services.health_service import iniciar_monitor
+from ..realtime.limites import ESTADISTICAS as ESTADISTICAS_LIMITES
+
 @csrf_exempt
 @require_http_methods(["GET"])
 def health_check(request):
@@ -14,6 +20,83 @@ def health_check(request):
         'timestamp': str(timezone.now())
     })
 
+@csrf_exempt
+@require_http_methods(["GET", "HEAD"])
+def liveness(request):
+    """Sonda de vida: el proceso atiende requests (no toca ninguna dependencia)"""
+    return JsonResponse({'status': 'ok'})
+
+@csrf_exempt
+@require_http_methods(["GET", "HEAD"])
+def readiness(request):
+    """Sonda de disponibilidad: última instantánea del monitor de dependencias (503 si no está listo)"""
+    estado = iniciar_monitor().estado()
+    return JsonResponse({'status': 'ready' if estado['ready'] else 'not_ready', **estado},
+                        status=200 if estado['ready'] else 503)
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def realtime_stats(request):
+    """Tiempo real en este proceso: reanudación de sesiones y control de inundación"""
+    historial = obtener_historial()
+    return JsonResponse({
+        'resume': historial.estadisticas() if historial is not None else None,
+        'rate_limit': dict(ESTADISTICAS_LIMITES),
+        'timestamp': str(timezone.now()),
+    })
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def compression_stats(request):
+    """Compresión de respuestas en este proceso: ratio, CPU por MB y aciertos de la cache"""
+    return JsonResponse({**compresion.estadisticas(), 'timestamp': str(timezone.now())})
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def traces(request):
+    """Trazas recientes de este proceso (?limit=&name=&min_ms=); solo con TRACING_ENDPOINT"""
+    if not getattr(settings, 'TRACING_ENDPOINT', settings.DEBUG):
+        return JsonResponse({'error': 'No encontrado'}, status=404)
+    try:
+        limite = min(int(request.GET.get('limit', 50)), 500)
+        min_ms = float(request.GET.get('min_ms', 0))
+    except ValueError:
+        return JsonResponse({'error': 'limit y min_ms deben ser numéricos'}, status=400)
+    return JsonResponse({
+        'stats': tracing.estadisticas(),
+        'traces': tracing.trazas_recientes(limite, request.GET.get('name', ''), min_ms),
+        'timestamp': str(timezone.now()),
+    })
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def profiles(request):
+    """Perfiles guardados por PerformanceMiddleware (staff o cabecera X-Profile-Token con token vigente)"""
+    if not profiling.autorizado(request):
+        return JsonResponse({'error': 'No autorizado'}, status=403)
+    return JsonResponse({
+        'stats': dict(profiling.ESTADISTICAS),
+        'profiles': profiling.listar(),
+        'timestamp': str(timezone.now()),
+    })
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def profile_detail(request, profile_id):
+    """Metadatos de un perfil (consultas, funciones más costosas); ?download=1 devuelve el .prof"""
+    if not profiling.autorizado(request):
+        return JsonResponse({'error': 'No autorizado'}, status=403)
+    if request.GET.get('download') in ('1', 'true'):
+        ruta = profiling.ruta_perfil(profile_id)
+        if ruta is None:
+            return JsonResponse({'error': 'Perfil no encontrado'}, status=404)
+        return FileResponse(open(ruta, 'rb'), as_attachment=True, filename=f'{profile_id}.prof',
+                            content_type='application/octet-stream')
+    datos = profiling.leer(profile_id)
+    if datos is None:
+        return JsonResponse({'error': 'Perfil no encontrado'}, status=404)
+    return JsonResponse(datos)
+
 @csrf_exempt
 @require_http_methods(["GET", "POST"])
 def test_endpoint(request):
@@ -0,0 +1,71 @@
+"""
+ViewSet para trabajos en segundo plano
+"""
+import os
+
+from django.http import FileResponse
+from rest_framework import status, viewsets
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from rest_framework.reverse import reverse
+
+from ..models import Trabajo
+from ..serializers import SerializadorTrabajo
+from ..services import ServicioTrabajos
+from ..services.job_tasks import ruta_trabajo
+from .pagination import PaginacionDiagrama
+
+
+def respuesta_aceptada(request, trabajo: Trabajo) -> Response:
+    """202 con el id del trabajo y la URL donde consultar su estado"""
+    url = reverse('job-detail', args=[trabajo.id], request=request)
+    return Response(
+        {'job_id': str(trabajo.id), 'kind': trabajo.kind, 'status': trabajo.status, 'status_url': url},
+        status=status.HTTP_202_ACCEPTED, headers={'Location': url},
+    )
+
+
+class JobViewSet(viewsets.ReadOnlyModelViewSet):
+    """Estado, cancelación y descarga de trabajos (?status=&kind=&diagram=)"""
+    queryset = Trabajo.objects.all()
+    serializer_class = SerializadorTrabajo
+    pagination_class = PaginacionDiagrama
+    servicio = ServicioTrabajos()
+
+    def get_queryset(self):
+        queryset = Trabajo.objects.order_by('-created_at')
+        params = self.request.query_params
+        if params.get('status'):
+            queryset = queryset.filter(status=params['status'])
+        if params.get('kind'):
+            queryset = queryset.filter(kind=params['kind'])
+        if params.get('diagram'):
+            queryset = queryset.filter(diagram_id=params['diagram'])
+        return queryset
+
+    @action(detail=True, methods=['post'])
+    def cancel(self, request, pk=None):
+        """Cancelar: inmediato si está pendiente, en el siguiente punto de progreso si está en curso"""
+        trabajo = self.get_object()
+        if trabajo.status in Trabajo.TERMINALES:
+            return Response({'error': f'Job already {trabajo.status}'}, status=status.HTTP_409_CONFLICT)
+        return Response(self.get_serializer(self.servicio.cancelar(trabajo.id)).data)
+
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        """Archivo generado por el trabajo (p. ej. exportación NDJSON)"""
+        trabajo = self.get_object()
+        nombre = (trabajo.result or {}).get('file') if trabajo.status == 'succeeded' else None
+        if not nombre or not os.path.exists(ruta_trabajo(nombre)):
+            return Response({'error': 'Job has no file to download'}, status=status.HTTP_404_NOT_FOUND)
+        return FileResponse(open(ruta_trabajo(nombre), 'rb'), as_attachment=True, filename=nombre,
+                            content_type='application/x-ndjson')
+
+    @action(detail=False, methods=['get'])
+    def stats(self, request):
+        """Trabajos por estado, tipos registrados e hilos activos en este proceso"""
+        return Response(self.servicio.estadisticas())
+
+
+# Alias en español
+VistaConjuntoTrabajos = JobViewSet
@@ -0,0 +1,47 @@
+"""
+Paginación de los listados anidados por diagrama
+"""
+import uuid
+
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+
+
+class PaginacionDiagrama(PageNumberPagination):
+    """?page=&page_size= (como la búsqueda), hasta 1000 elementos por página"""
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+
+class PaginacionOpcional(PaginacionDiagrama):
+    """Listados planos (/classes/, /relationships/): paginan solo si se pide ?page= o ?page_size=.
+
+    Sin parámetros devuelven la lista completa como antes (los clientes existentes esperan una lista).
+    """
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.page_query_param not in request.query_params and \
+                self.page_size_query_param not in request.query_params:
+            return None
+        # Orden estable entre páginas (por clave primaria, indexada)
+        if not queryset.ordered:
+            queryset = queryset.order_by('pk')
+        return super().paginate_queryset(queryset, request, view)
+
+
+class RutaDiagramaMixin:
+    """Rutas /diagrams/{diagram_pk}/...: 404 si diagram_pk no es un UUID (antes de cualquier consulta)"""
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        try:
+            self.kwargs['diagram_pk'] = str(uuid.UUID(str(self.kwargs.get('diagram_pk'))))
+        except ValueError:
+            raise NotFound('Diagram not found')
+
+
+# Alias en inglés para compatibilidad
+DiagramPagination = PaginacionDiagrama
+OptionalPagination = PaginacionOpcional
+DiagramRouteMixin = RutaDiagramaMixin
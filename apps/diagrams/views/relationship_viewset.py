@@ -1,17 +1,150 @@
 """
 ViewSet para relaciones
 """
-from rest_framework import viewsets
+from django.db import transaction
+from rest_framework import serializers, status, viewsets
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
 
 from ..models import Relacion
-from ..serializers import SerializadorRelacion
+from ..serializers import SerializadorRelacion, SerializadorRelacionDiagrama
+from ..services import ServicioGrafo, ServicioValidacion
+from ..services.validation_service import hay_errores
+from .pagination import PaginacionDiagrama, PaginacionOpcional, RutaDiagramaMixin
 
 
 class RelationshipViewSet(viewsets.ModelViewSet):
     """Conjunto de vistas para operaciones CRUD de relaciones"""
-    queryset = Relacion.objects.all()
+    queryset = Relacion.objects.filter(diagram__deleted_at__isnull=True)
     serializer_class = SerializadorRelacion
+    pagination_class = PaginacionOpcional
+    servicio_grafo = ServicioGrafo()
+    servicio_validacion = ServicioValidacion()
+    diagnosticos = ()
+
+    def _validar(self, diagrama_id, desde, hasta, tipo, rel_id=None, indice=None):
+        """Reglas de la relación tocada (ids de clase); los errores responden 400 con los diagnósticos"""
+        indice = indice or self.servicio_grafo.obtener_indice(diagrama_id)
+        diagnosticos = self.servicio_validacion.validar_relacion(
+            indice, str(desde), str(hasta), tipo, rel_id=str(rel_id) if rel_id else None)
+        if hay_errores(diagnosticos):
+            raise serializers.ValidationError({'diagnostics': [d.as_dict() for d in diagnosticos]})
+        self.diagnosticos = diagnosticos
+
+    def create(self, request, *args, **kwargs):
+        respuesta = super().create(request, *args, **kwargs)
+        respuesta.data['diagnostics'] = [d.as_dict() for d in self.diagnosticos]
+        return respuesta
+
+    def update(self, request, *args, **kwargs):
+        respuesta = super().update(request, *args, **kwargs)
+        respuesta.data['diagnostics'] = [d.as_dict() for d in self.diagnosticos]
+        return respuesta
+
+    # Cada escritura incrementa la revisión del diagrama y ajusta el índice de grafo
+    def perform_create(self, serializer):
+        # El serializador no expone `diagram`: se toma de la clase origen
+        datos = serializer.validated_data
+        desde = datos['from_class']
+        self._validar(desde.diagram_id, desde.id, datos['to_class'].id, datos.get('relationship_type', 'association'))
+        relacion = serializer.save(diagram_id=desde.diagram_id)
+        self.servicio_grafo.relacion_guardada(relacion)
+
+    def perform_update(self, serializer):
+        instancia, datos = serializer.instance, serializer.validated_data
+        self._validar(
+            instancia.diagram_id,
+            datos['from_class'].id if 'from_class' in datos else instancia.from_class_id,
+            datos['to_class'].id if 'to_class' in datos else instancia.to_class_id,
+            datos.get('relationship_type', instancia.relationship_type),
+            rel_id=instancia.id,
+        )
+        relacion = serializer.save()
+        self.servicio_grafo.relacion_guardada(relacion)
+
+    def perform_destroy(self, instance):
+        diagrama_id, relacion_id = instance.diagram_id, instance.id
+        instance.delete()
+        self.servicio_grafo.relacion_eliminada(diagrama_id, relacion_id)
+
+
+class DiagramRelationshipViewSet(RutaDiagramaMixin, RelationshipViewSet):
+    """Relaciones de un diagrama: /diagrams/{diagram_pk}/relationships/
+
+    Listado paginado; las referencias a clases se validan contra el índice del
+    diagrama (sin una consulta por campo) y un POST con una lista crea en bloque.
+    """
+    serializer_class = SerializadorRelacionDiagrama
+    pagination_class = PaginacionDiagrama
+    _indice = None
+
+    def get_queryset(self):
+        return Relacion.objects.filter(diagram_id=self.kwargs['diagram_pk'], diagram__deleted_at__isnull=True).order_by('created_at', 'id')
+
+    @property
+    def indice(self):
+        """Índice del diagrama (clases y aristas), cargado una vez por petición"""
+        if self._indice is None:
+            self._indice = self.servicio_grafo.obtener_indice(self.kwargs['diagram_pk'])
+            if self._indice is None:
+                raise NotFound('Diagram not found')
+        return self._indice
+
+    def get_serializer_context(self):
+        contexto = super().get_serializer_context()
+        if self.request is not None and self.request.method not in ('GET', 'HEAD', 'OPTIONS', 'DELETE'):
+            contexto['clases'] = self.indice.nodos
+        return contexto
+
+    def create(self, request, *args, **kwargs):
+        if not isinstance(request.data, list):
+            return super().create(request, *args, **kwargs)
+        serializer = self.get_serializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        relaciones, diagnosticos = self._crear_en_bloque(serializer.validated_data)
+        datos = self.get_serializer(relaciones, many=True).data
+        return Response({'created': len(relaciones), 'results': datos,
+                         'diagnostics': [d.as_dict() for d in diagnosticos]}, status=status.HTTP_201_CREATED)
+
+    def _crear_en_bloque(self, filas):
+        """Todas o ninguna: reglas sobre una copia del índice, un bulk_create y una revisión"""
+        diagrama_id = self.kwargs['diagram_pk']
+        candidatas = [(str(f['from_class_id']), str(f['to_class_id']), f.get('relationship_type', 'association'))
+                      for f in filas]
+        diagnosticos = []
+        self.servicio_validacion.filtrar_relaciones(self.indice.copiar(), candidatas, diagnosticos)
+        if hay_errores(diagnosticos):
+            raise serializers.ValidationError({'diagnostics': [d.as_dict() for d in diagnosticos]})
+        relaciones = [Relacion(diagram_id=diagrama_id, **fila) for fila in filas]
+        with transaction.atomic():
+            Relacion.objects.bulk_create(relaciones, batch_size=500)
+            self.servicio_grafo.lote_aplicado(diagrama_id, [
+                (lambda indice, r=r: indice.agregar(str(r.id), str(r.from_class_id), str(r.to_class_id),
+                                                    r.relationship_type))
+                for r in relaciones
+            ])
+        return relaciones, diagnosticos
+
+    def perform_create(self, serializer):
+        datos = serializer.validated_data
+        diagrama_id = self.kwargs['diagram_pk']
+        self._validar(diagrama_id, datos['from_class_id'], datos['to_class_id'],
+                      datos.get('relationship_type', 'association'), indice=self.indice)
+        relacion = serializer.save(diagram_id=diagrama_id)
+        self.servicio_grafo.relacion_guardada(relacion)
+
+    def perform_update(self, serializer):
+        instancia, datos = serializer.instance, serializer.validated_data
+        self._validar(
+            instancia.diagram_id,
+            datos.get('from_class_id', instancia.from_class_id),
+            datos.get('to_class_id', instancia.to_class_id),
+            datos.get('relationship_type', instancia.relationship_type),
+            rel_id=instancia.id, indice=self.indice,
+        )
+        relacion = serializer.save()
+        self.servicio_grafo.relacion_guardada(relacion)
 
 
 # Legacy alias
-VistaConjuntoRelaciones = RelationshipViewSet
\ No newline at end of file
+VistaConjuntoRelaciones = RelationshipViewSet
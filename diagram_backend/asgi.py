@@ -10,6 +10,17 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'diagram_backend.settings')
 
 django_app = get_asgi_application()
 
+# Hilos de la cola de trabajos en este proceso (alternativa: `manage.py run_jobs`)
+from django.conf import settings  # noqa: E402
+if settings.JOBS_AUTOSTART:
+	from apps.diagrams.services.job_service import iniciar_ejecutor  # noqa: E402
+	iniciar_ejecutor()
+
+# Estado de dependencias para health/ready/ (se refresca en segundo plano, no en cada sonda)
+if settings.HEALTH_MONITOR_AUTOSTART:
+	from apps.diagrams.services.health_service import iniciar_monitor  # noqa: E402
+	iniciar_monitor()
+
 # Unificamos HTTP (Django) + WebSockets (Channels)
 application = ProtocolTypeRouter({
 	'http': django_app,
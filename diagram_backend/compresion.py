@@ -0,0 +1,216 @@
+"""
+Compresión de respuestas de la API (gzip y brotli) negociada con Accept-Encoding.
+
+Solo se comprimen respuestas no streaming de tipos textuales (JSON, NDJSON, texto)
+a partir de COMPRESSION_MIN_BYTES; los estáticos los sirve WhiteNoise ya
+comprimidos. Brotli se usa si el paquete ``brotli`` está instalado; si no, gzip.
+
+Los cuerpos grandes (desde COMPRESSION_CACHE_MIN_BYTES, p. ej. el GET de un
+diagrama de miles de clases) se guardan ya comprimidos en una LRU en memoria
+indexada por el hash del cuerpo: la misma instantánea servida otra vez solo
+cuesta calcular el hash (blake2b, decenas de veces más rápido que gzip), sin
+riesgo de servir una versión antigua porque cualquier cambio cambia el hash.
+"""
+import gzip
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from django.conf import settings
+from django.http import HttpRequest, HttpResponse
+from django.utils.cache import patch_vary_headers
+
+from .tracing import traza
+
+BROTLI, GZIP = 'br', 'gzip'
+TIPOS_COMPRIMIBLES = ('application/json', 'application/x-ndjson', 'application/javascript', 'text/')
+
+ESTADISTICAS: Dict[str, Any] = {
+    'skipped_small': 0, 'not_accepted': 0,
+    GZIP: {'responses': 0, 'cache_hits': 0, 'bytes_in': 0, 'bytes_out': 0, 'bytes_compressed': 0, 'cpu_ms': 0.0},
+    BROTLI: {'responses': 0, 'cache_hits': 0, 'bytes_in': 0, 'bytes_out': 0, 'bytes_compressed': 0, 'cpu_ms': 0.0},
+}
+
+_brotli_modulo: Any = False
+
+
+def _brotli():
+    """Módulo brotli, o None si no está instalado (entonces solo se ofrece gzip)"""
+    global _brotli_modulo
+    if _brotli_modulo is False:
+        try:
+            import brotli  # opcional: Content-Encoding br
+            _brotli_modulo = brotli
+        except ImportError:
+            _brotli_modulo = None
+    return _brotli_modulo
+
+
+def negociar(accept_encoding: str) -> Optional[str]:
+    """Codificación preferida por el cliente entre las disponibles (a igual q, brotli antes que gzip)"""
+    if not accept_encoding:
+        return None
+    pesos: Dict[str, float] = {}
+    for parte in accept_encoding.split(','):
+        nombre, _, parametros = parte.strip().partition(';')
+        q = 1.0
+        parametro = parametros.strip()
+        if parametro.startswith('q='):
+            try:
+                q = float(parametro[2:])
+            except ValueError:
+                q = 0.0
+        pesos[nombre.strip().lower()] = q
+    disponibles = ([BROTLI] if _brotli() is not None else []) + [GZIP]
+    comodin = pesos.get('*', 0.0)
+    mejor, mejor_q = None, 0.0
+    for codificacion in disponibles:
+        q = pesos.get(codificacion, comodin)
+        if q > mejor_q:
+            mejor, mejor_q = codificacion, q
+    return mejor
+
+
+def comprimir(datos: bytes, codificacion: str) -> bytes:
+    if codificacion == BROTLI:
+        return _brotli().compress(datos, quality=getattr(settings, 'COMPRESSION_BROTLI_QUALITY', 5))
+    # mtime=0: la misma entrada da los mismos bytes (ETag débil estable)
+    return gzip.compress(datos, compresslevel=getattr(settings, 'COMPRESSION_GZIP_LEVEL', 6), mtime=0)
+
+
+class CacheComprimidos:
+    """LRU en proceso de cuerpos ya comprimidos, indexada por (hash del cuerpo, codificación)"""
+
+    def __init__(self, capacidad_bytes: int):
+        self.capacidad_bytes = capacidad_bytes
+        self.bytes = 0
+        self._entradas: 'OrderedDict[Tuple[bytes, str], bytes]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obtener(self, clave: Tuple[bytes, str]) -> Optional[bytes]:
+        with self._lock:
+            datos = self._entradas.get(clave)
+            if datos is not None:
+                self._entradas.move_to_end(clave)
+            return datos
+
+    def guardar(self, clave: Tuple[bytes, str], datos: bytes):
+        if len(datos) > self.capacidad_bytes:
+            return
+        with self._lock:
+            if clave in self._entradas:
+                return
+            self._entradas[clave] = datos
+            self.bytes += len(datos)
+            while self.bytes > self.capacidad_bytes:
+                _, expulsado = self._entradas.popitem(last=False)
+                self.bytes -= len(expulsado)
+
+    def vaciar(self):
+        with self._lock:
+            self._entradas.clear()
+            self.bytes = 0
+
+    def estado(self) -> Dict[str, int]:
+        with self._lock:
+            return {'entries': len(self._entradas), 'bytes': self.bytes, 'capacity_bytes': self.capacidad_bytes}
+
+
+_cache: Optional[CacheComprimidos] = None
+
+
+def cache_comprimidos() -> CacheComprimidos:
+    global _cache
+    if _cache is None:
+        _cache = CacheComprimidos(getattr(settings, 'COMPRESSION_CACHE_BYTES', 32 * 1024 * 1024))
+    return _cache
+
+
+def comprimir_cuerpo(datos: bytes, codificacion: str) -> Tuple[bytes, bool]:
+    """Cuerpo comprimido y si salió de la cache (solo se cachean los cuerpos grandes)"""
+    cacheable = len(datos) >= getattr(settings, 'COMPRESSION_CACHE_MIN_BYTES', 64 * 1024)
+    if cacheable:
+        clave = (hashlib.blake2b(datos, digest_size=16).digest(), codificacion)
+        comprimido = cache_comprimidos().obtener(clave)
+        if comprimido is not None:
+            return comprimido, True
+    cpu0 = time.thread_time()
+    comprimido = comprimir(datos, codificacion)
+    ESTADISTICAS[codificacion]['cpu_ms'] += (time.thread_time() - cpu0) * 1000
+    ESTADISTICAS[codificacion]['bytes_compressed'] += len(datos)
+    if cacheable:
+        cache_comprimidos().guardar(clave, comprimido)
+    return comprimido, False
+
+
+def comprimir_respuesta(request: HttpRequest, response: HttpResponse) -> HttpResponse:
+    """Comprime la respuesta si el tipo, el tamaño y Accept-Encoding lo permiten"""
+    if (response.streaming or response.has_header('Content-Encoding')
+            or not 200 <= response.status_code < 300 or response.status_code == 204):
+        return response
+    tipo = response.get('Content-Type', '').split(';', 1)[0].strip().lower()
+    if not tipo.startswith(TIPOS_COMPRIMIBLES):
+        return response
+    datos = response.content
+    if len(datos) < getattr(settings, 'COMPRESSION_MIN_BYTES', 1024):
+        ESTADISTICAS['skipped_small'] += 1
+        return response
+    # A partir de aquí la representación depende de Accept-Encoding (también para las caches intermedias)
+    patch_vary_headers(response, ('Accept-Encoding',))
+    codificacion = negociar(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+    if codificacion is None:
+        ESTADISTICAS['not_accepted'] += 1
+        return response
+    with traza('compresion', encoding=codificacion, bytes_in=len(datos)) as tramo:
+        comprimido, en_cache = comprimir_cuerpo(datos, codificacion)
+        tramo.anotar(bytes_out=len(comprimido), cache_hit=en_cache)
+    if len(comprimido) >= len(datos):
+        return response
+    contadores = ESTADISTICAS[codificacion]
+    contadores['responses'] += 1
+    contadores['cache_hits'] += en_cache
+    contadores['bytes_in'] += len(datos)
+    contadores['bytes_out'] += len(comprimido)
+    response.content = comprimido
+    response['Content-Length'] = str(len(comprimido))
+    response['Content-Encoding'] = codificacion
+    etag = response.get('ETag')
+    if etag and etag.startswith('"'):
+        response['ETag'] = 'W/' + etag
+    return response
+
+
+def estadisticas() -> Dict[str, Any]:
+    """Contadores del proceso con ratio medio y coste de CPU por MB de entrada"""
+    resultado: Dict[str, Any] = {
+        'skipped_small': ESTADISTICAS['skipped_small'],
+        'not_accepted': ESTADISTICAS['not_accepted'],
+        'brotli_available': _brotli() is not None,
+        'cache': cache_comprimidos().estado(),
+    }
+    for codificacion in (GZIP, BROTLI):
+        c = dict(ESTADISTICAS[codificacion])
+        c['ratio'] = round(c['bytes_in'] / c['bytes_out'], 2) if c['bytes_out'] else None
+        c['cpu_ms'] = round(c['cpu_ms'], 3)
+        c['cpu_ms_per_mb'] = round(c['cpu_ms'] / (c['bytes_compressed'] / 1e6), 3) if c['bytes_compressed'] else None
+        resultado[codificacion] = c
+    return resultado
+
+
+class CompresionMiddleware:
+    """Comprime las respuestas de la API según Accept-Encoding (ver módulo)"""
+
+    def __init__(self, get_response: Callable):
+        self.get_response = get_response
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        response = self.get_response(request)
+        if not getattr(settings, 'COMPRESSION_ENABLED', True):
+            return response
+        return comprimir_respuesta(request, response)
+
+
+# Alias en inglés para compatibilidad
+CompressionMiddleware = CompresionMiddleware
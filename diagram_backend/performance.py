@@ -4,6 +4,9 @@ import os
 from typing import Callable
 from django.http import HttpRequest, HttpResponse
 
+from . import profiling
+from .tracing import iniciar_traza
+
 logger = logging.getLogger(__name__)
 
 SLOW_THRESHOLD_MS = float(os.environ.get("PERF_SLOW_MS", "800"))  # Ajustable vía env PERF_SLOW_MS
@@ -11,14 +14,26 @@ SLOW_THRESHOLD_MS = float(os.environ.get("PERF_SLOW_MS", "800"))  # Ajustable v
 class PerformanceMiddleware:
     """Middleware simple para loguear duración de requests.
     Registra toda request y destaca las lentas (>SLOW_THRESHOLD_MS).
-    Ajusta el umbral exportando PERF_SLOW_MS (en ms)."""
+    Ajusta el umbral exportando PERF_SLOW_MS (en ms).
+    También abre la traza raíz de la request (muestreada, o forzada con `X-Trace: 1`)
+    y la perfila con cProfile cuando se pide o sale en el muestreo (ver profiling.py)."""
     def __init__(self, get_response: Callable):
         self.get_response = get_response
 
     def __call__(self, request: HttpRequest) -> HttpResponse:
         start = time.perf_counter()
+        response = None
         try:
-            response = self.get_response(request)
+            forzar = request.headers.get('X-Trace') == '1'
+            with iniciar_traza(f'http {request.method}', forzar=forzar, path=request.path) as tramo:
+                razon = profiling.motivo(request)
+                if razon is None:
+                    response = self.get_response(request)
+                else:
+                    response = profiling.capturar(request, self.get_response, razon, SLOW_THRESHOLD_MS)
+                if tramo.id is not None:
+                    tramo.anotar(status=response.status_code)
+                    response['X-Trace-Id'] = tramo.traza.id
             return response
         finally:
             dt_ms = (time.perf_counter() - start) * 1000
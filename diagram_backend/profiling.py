@@ -0,0 +1,267 @@
+"""
+Perfiles de requests bajo demanda (cProfile) para PerformanceMiddleware.
+
+Una request se perfila si:
+
+- trae un token firmado en la cabecera ``X-Profile`` (o en ``?profile=<token>``);
+  el token se obtiene con ``manage.py profile_token`` y caduca a los
+  PERF_PROFILE_TOKEN_TTL segundos;
+- o la pide un usuario staff con ``?profile=1``;
+- o sale en el muestreo PERF_PROFILE_SAMPLE: en ese caso el perfil solo se guarda
+  si la request superó PERF_SLOW_MS (así se capturan las lentas sin saber de
+  antemano cuáles serán).
+
+Cada perfil se guarda en PERF_PROFILE_DIR como ``<id>.prof`` (pstats, se abre con
+snakeviz o ``python -m pstats``) y ``<id>.json`` con la request, los tiempos, las
+consultas SQL y las funciones más costosas. Se conservan como mucho
+PERF_PROFILE_KEEP perfiles y ninguno más antiguo que PERF_PROFILE_MAX_AGE.
+Un solo perfil a la vez por proceso: el resto de requests sigue sin perfilar.
+"""
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import random
+import threading
+import time
+import uuid
+from contextlib import ExitStack
+from typing import Any, Callable, Dict, List, Optional
+
+from django.conf import settings
+from django.core import signing
+from django.http import HttpRequest, HttpResponse
+
+from .tracing import tramo_actual
+
+logger = logging.getLogger(__name__)
+
+SAL = 'diagram_backend.profiling'
+MANUAL, STAFF, MUESTRA = 'token', 'staff', 'slow-sample'
+# Consultas y funciones que se guardan en los metadatos
+MAX_CONSULTAS = 20
+MAX_FUNCIONES = 30
+
+_ocupado = threading.Lock()
+ESTADISTICAS: Dict[str, int] = {'captured': 0, 'kept': 0, 'discarded_fast': 0, 'skipped_busy': 0, 'pruned': 0}
+
+
+def directorio() -> str:
+    return str(getattr(settings, 'PERF_PROFILE_DIR', '') or os.path.join(settings.MEDIA_ROOT, 'profiles'))
+
+
+def emitir_token() -> str:
+    """Token firmado con SECRET_KEY que habilita perfilar requests hasta que caduque"""
+    return signing.TimestampSigner(salt=SAL).sign(uuid.uuid4().hex)
+
+
+def token_valido(valor: str) -> bool:
+    if not valor:
+        return False
+    try:
+        signing.TimestampSigner(salt=SAL).unsign(valor, max_age=getattr(settings, 'PERF_PROFILE_TOKEN_TTL', 3600))
+        return True
+    except signing.BadSignature:
+        return False
+
+
+def es_staff(request: HttpRequest) -> bool:
+    """Usuario staff de la sesión (el middleware corre antes de AuthenticationMiddleware)"""
+    usuario = getattr(request, 'user', None)
+    if usuario is None and hasattr(request, 'session'):
+        from django.contrib.auth import get_user
+        usuario = get_user(request)
+    return bool(usuario is not None and usuario.is_authenticated and usuario.is_staff)
+
+
+def autorizado(request: HttpRequest) -> bool:
+    """Acceso a los perfiles guardados: staff o token vigente en `X-Profile-Token`
+
+    Es otra cabecera que `X-Profile` para que consultar los perfiles no genere perfiles nuevos.
+    """
+    return token_valido(request.META.get('HTTP_X_PROFILE_TOKEN', '')) or es_staff(request)
+
+
+def motivo(request: HttpRequest) -> Optional[str]:
+    """Por qué perfilar esta request, o None (lo habitual: sin coste adicional)"""
+    # Lecturas de META sin parsear la query: es el camino de todas las requests
+    cabecera = request.META.get('HTTP_X_PROFILE')
+    parametro = request.GET.get('profile') if 'profile=' in request.META.get('QUERY_STRING', '') else None
+    if cabecera or parametro:
+        if token_valido(cabecera or parametro):
+            return MANUAL
+        if parametro == '1' and es_staff(request):
+            return STAFF
+        logger.warning(f"[perf][profile] solicitud sin autorización {request.method} {request.path}")
+    tasa = getattr(settings, 'PERF_PROFILE_SAMPLE', 0.0)
+    if tasa > 0.0 and random.random() < tasa:
+        return MUESTRA
+    return None
+
+
+class _Consultas:
+    """execute_wrapper que mide cada consulta SQL ejecutada durante el perfil"""
+
+    def __init__(self, alias: str, registro: List[Dict[str, Any]]):
+        self.alias = alias
+        self.registro = registro
+
+    def __call__(self, execute, sql, params, many, context):
+        t0 = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.registro.append({'alias': self.alias, 'sql': sql, 'ms': (time.perf_counter() - t0) * 1000,
+                                  'many': many})
+
+
+def capturar(request: HttpRequest, get_response: Callable, razon: str, umbral_ms: float) -> HttpResponse:
+    """Ejecuta la request con cProfile y guarda el perfil (las de muestreo, solo si fueron lentas)"""
+    if not _ocupado.acquire(blocking=False):
+        ESTADISTICAS['skipped_busy'] += 1
+        return get_response(request)
+    from django.db import connections
+
+    consultas: List[Dict[str, Any]] = []
+    tramo = tramo_actual()
+    perfil = cProfile.Profile()
+    try:
+        with ExitStack() as pila:
+            for conexion in connections.all():
+                pila.enter_context(conexion.execute_wrapper(_Consultas(conexion.alias, consultas)))
+            t0, cpu0 = time.perf_counter(), time.thread_time()
+            perfil.enable()
+            try:
+                response = get_response(request)
+            finally:
+                perfil.disable()
+                dt_ms = (time.perf_counter() - t0) * 1000
+                cpu_ms = (time.thread_time() - cpu0) * 1000
+        ESTADISTICAS['captured'] += 1
+        if razon == MUESTRA and dt_ms <= umbral_ms:
+            ESTADISTICAS['discarded_fast'] += 1
+            return response
+        perfil_id = guardar(perfil, {
+            'trigger': razon,
+            'method': request.method,
+            'path': request.path,
+            'query': {k: v for k, v in request.GET.items() if k != 'profile'},
+            'status': response.status_code,
+            'duration_ms': round(dt_ms, 3),
+            'cpu_ms': round(cpu_ms, 3),
+            'trace_id': tramo.traza.id if tramo.id is not None else None,
+        }, consultas)
+        if perfil_id and razon != MUESTRA:
+            response['X-Profile-Id'] = perfil_id
+        return response
+    finally:
+        _ocupado.release()
+
+
+def _resumen_consultas(consultas: List[Dict[str, Any]]) -> Dict[str, Any]:
+    repetidas: Dict[str, int] = {}
+    for c in consultas:
+        repetidas[c['sql']] = repetidas.get(c['sql'], 0) + 1
+    return {
+        'count': len(consultas),
+        'total_ms': round(sum(c['ms'] for c in consultas), 3),
+        # La misma SQL muchas veces suele ser un N+1
+        'repeated': sorted(({'sql': sql[:500], 'count': n} for sql, n in repetidas.items() if n > 1),
+                           key=lambda r: -r['count'])[:MAX_CONSULTAS],
+        'slowest': [{**c, 'sql': c['sql'][:500], 'ms': round(c['ms'], 3)}
+                    for c in sorted(consultas, key=lambda c: -c['ms'])[:MAX_CONSULTAS]],
+    }
+
+
+def _funciones(perfil: cProfile.Profile) -> List[Dict[str, Any]]:
+    estadisticas = pstats.Stats(perfil, stream=io.StringIO())
+    filas = []
+    for (fichero, linea, funcion), (_, llamadas, propio, acumulado, _) in estadisticas.stats.items():
+        filas.append({'function': f'{fichero}:{linea}({funcion})', 'calls': llamadas,
+                      'tottime_ms': round(propio * 1000, 3), 'cumtime_ms': round(acumulado * 1000, 3)})
+    return sorted(filas, key=lambda f: -f['cumtime_ms'])[:MAX_FUNCIONES]
+
+
+def guardar(perfil: cProfile.Profile, metadatos: Dict[str, Any], consultas: List[Dict[str, Any]]) -> Optional[str]:
+    """Escribe <id>.prof y <id>.json en PERF_PROFILE_DIR y aplica la retención"""
+    carpeta = directorio()
+    perfil_id = f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    try:
+        os.makedirs(carpeta, exist_ok=True)
+        perfil.dump_stats(os.path.join(carpeta, f'{perfil_id}.prof'))
+        with open(os.path.join(carpeta, f'{perfil_id}.json'), 'w', encoding='utf-8') as f:
+            json.dump({'id': perfil_id, 'timestamp': time.time(), 'pid': os.getpid(), **metadatos,
+                       'queries': _resumen_consultas(consultas), 'functions': _funciones(perfil)},
+                      f, default=str)
+    except OSError as e:
+        logger.warning(f"[perf][profile] no se pudo guardar el perfil en {carpeta}: {e}")
+        return None
+    ESTADISTICAS['kept'] += 1
+    logger.info(f"[perf][profile] {perfil_id} {metadatos['method']} {metadatos['path']} "
+                f"{metadatos['duration_ms']:.1f}ms consultas={len(consultas)} motivo={metadatos['trigger']}")
+    podar()
+    return perfil_id
+
+
+def _guardados(carpeta: str) -> List[str]:
+    try:
+        nombres = os.listdir(carpeta)
+    except FileNotFoundError:
+        return []
+    # El id empieza por la fecha: orden alfabético = orden cronológico
+    return sorted(n[:-5] for n in nombres if n.endswith('.json'))
+
+
+def podar():
+    """Retención: como mucho PERF_PROFILE_KEEP perfiles y ninguno anterior a PERF_PROFILE_MAX_AGE"""
+    carpeta = directorio()
+    ids = _guardados(carpeta)
+    maximo = getattr(settings, 'PERF_PROFILE_KEEP', 50)
+    limite = time.time() - getattr(settings, 'PERF_PROFILE_MAX_AGE', 7 * 24 * 3600)
+    sobrantes = ids[:max(0, len(ids) - maximo)]
+    for perfil_id in ids[len(sobrantes):]:
+        try:
+            if os.path.getmtime(os.path.join(carpeta, f'{perfil_id}.json')) < limite:
+                sobrantes.append(perfil_id)
+        except OSError:
+            continue
+    for perfil_id in sobrantes:
+        for extension in ('.json', '.prof'):
+            try:
+                os.remove(os.path.join(carpeta, f'{perfil_id}{extension}'))
+            except FileNotFoundError:
+                pass
+        ESTADISTICAS['pruned'] += 1
+
+
+def listar() -> List[Dict[str, Any]]:
+    """Metadatos resumidos de los perfiles guardados (más recientes primero)"""
+    resultado = []
+    for perfil_id in reversed(_guardados(directorio())):
+        datos = leer(perfil_id)
+        if datos is not None:
+            resultado.append({k: datos.get(k) for k in ('id', 'timestamp', 'trigger', 'method', 'path', 'status',
+                                                          'duration_ms', 'cpu_ms', 'trace_id')}
+                             | {'queries': datos.get('queries', {}).get('count')})
+    return resultado
+
+
+def leer(perfil_id: str) -> Optional[Dict[str, Any]]:
+    ruta = ruta_perfil(perfil_id, '.json')
+    if ruta is None:
+        return None
+    try:
+        with open(ruta, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def ruta_perfil(perfil_id: str, extension: str = '.prof') -> Optional[str]:
+    """Ruta del fichero del perfil, o None si no existe o el id no es válido"""
+    if not perfil_id or os.path.basename(perfil_id) != perfil_id or perfil_id.startswith('.'):
+        return None
+    ruta = os.path.join(directorio(), f'{perfil_id}{extension}')
+    return ruta if os.path.exists(ruta) else None
@@ -39,6 +39,7 @@ MIDDLEWARE = [
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'diagram_backend.performance.PerformanceMiddleware',
+    'diagram_backend.compresion.CompresionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -142,6 +143,13 @@ else:
             'BACKEND': 'channels.layers.InMemoryChannelLayer'
         }
     }
+# Fan-out de salas: 'group' (group_send, un mensaje por socket) o 'node'
+# (una suscripción pub/sub por sala y proceso, reparto local en memoria)
+COLLAB_FANOUT_MODE = config('COLLAB_FANOUT_MODE', default='group')
+# Gestión de interés: tamaño de celda de la rejilla espacial y margen (px) que se
+# suma a la posición de una clase para cubrir su caja al cruzarla con los viewports
+COLLAB_INTEREST_CELL = config('COLLAB_INTEREST_CELL', default=512, cast=int)
+COLLAB_INTEREST_MARGIN = config('COLLAB_INTEREST_MARGIN', default=300, cast=int)
 ############################################
 # Logging
 ############################################
@@ -175,4 +183,96 @@ LOGGING = {
         }
     }
 }
-DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
\ No newline at end of file
+DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+# Índice de grafo de relaciones: diagramas cacheados por proceso (LRU)
+GRAPH_INDEX_CACHE_SIZE = config('GRAPH_INDEX_CACHE_SIZE', default=128, cast=int)
+# Borrado de diagramas: se marcan al instante y sus filas se purgan por lotes
+# ('background' = hilo tras el commit, 'jobs' = cola de trabajos, 'manual' = comando purge_deleted_diagrams)
+DIAGRAM_PURGE_MODE = config('DIAGRAM_PURGE_MODE', default='background')
+DIAGRAM_PURGE_BATCH = config('DIAGRAM_PURGE_BATCH', default=2000, cast=int)
+# Trabajos en segundo plano (cola en la base de datos, sin broker)
+# JOBS_AUTOSTART arranca los hilos con la app ASGI; si no, `manage.py run_jobs`
+JOBS_AUTOSTART = config('JOBS_AUTOSTART', default=True, cast=bool)
+JOBS_WORKERS = config('JOBS_WORKERS', default=2, cast=int)
+JOBS_POLL_INTERVAL = config('JOBS_POLL_INTERVAL', default=1.0, cast=float)
+JOBS_RETRY_BACKOFF = config('JOBS_RETRY_BACKOFF', default=2.0, cast=float)
+JOBS_STALE_AFTER = config('JOBS_STALE_AFTER', default=300, cast=int)
+JOBS_DIR = config('JOBS_DIR', default=str(MEDIA_ROOT / 'jobs'))
+# Secuencia por sala y fusión de ediciones concurrentes (realtime/secuencia.py); opcional porque
+# cambia el protocolo: trama 'sequence' al conectar y seq/epoch en cada evento difundido.
+# Con Redis el estado de fusión se comparte entre procesos y caduca tras COLLAB_OPLOG_TTL s
+COLLAB_SEQUENCING = config('COLLAB_SEQUENCING', default=False, cast=bool)
+COLLAB_OPLOG_TTL = config('COLLAB_OPLOG_TTL', default=86400, cast=int)
+# Reanudación de sesiones (realtime/historial.py): eventos recientes por sala que se reponen a un
+# cliente que reconecta con ?last_seq=&epoch=; límites por sala y totales del proceso.
+# Opcional como la secuencia (de la que depende): cambia el handshake y ocupa memoria por proceso
+COLLAB_RESUME = config('COLLAB_RESUME', default=False, cast=bool)
+COLLAB_RESUME_EVENTS = config('COLLAB_RESUME_EVENTS', default=512, cast=int)
+COLLAB_RESUME_ROOM_BYTES = config('COLLAB_RESUME_ROOM_BYTES', default=256 * 1024, cast=int)
+COLLAB_RESUME_TOTAL_BYTES = config('COLLAB_RESUME_TOTAL_BYTES', default=64 * 1024 * 1024, cast=int)
+# Control de inundación (realtime/limites.py): (tokens/s, ráfaga) por clase de evento; las cubetas
+# de sala se comparten entre procesos cuando hay Redis. Opcional: rechaza ediciones estructurales
+# por encima del límite con un aviso 'throttled' que el cliente debe manejar (formato en limites.py)
+COLLAB_RATE_LIMIT = config('COLLAB_RATE_LIMIT', default=False, cast=bool)
+COLLAB_RATE_CONNECTION = {'geometry': (30, 60), 'structural': (10, 30), 'control': (5, 20)}
+COLLAB_RATE_ROOM = {'geometry': (300, 600), 'structural': (60, 120), 'control': (50, 200)}
+# Trazas por tramos (diagram_backend/tracing.py): fracción de requests/mensajes WebSocket que se trazan
+# (0 = desactivado; `X-Trace: 1` fuerza una request), búfer circular que lee health/traces/ y
+# fichero JSONL opcional con cada traza terminada
+TRACING_SAMPLE_RATE = config('TRACING_SAMPLE_RATE', default=0.0, cast=float)
+TRACING_BUFFER = config('TRACING_BUFFER', default=200, cast=int)
+TRACING_MAX_SPANS = config('TRACING_MAX_SPANS', default=500, cast=int)
+TRACING_FILE = config('TRACING_FILE', default='')
+TRACING_ENDPOINT = config('TRACING_ENDPOINT', default=DEBUG, cast=bool)
+# Perfiles de requests (diagram_backend/profiling.py): `X-Profile: <token de manage.py profile_token>`
+# o `?profile=1` para staff; PERF_PROFILE_SAMPLE perfila esa fracción y guarda solo las > PERF_SLOW_MS
+PERF_PROFILE_DIR = config('PERF_PROFILE_DIR', default=str(MEDIA_ROOT / 'profiles'))
+PERF_PROFILE_SAMPLE = config('PERF_PROFILE_SAMPLE', default=0.0, cast=float)
+PERF_PROFILE_KEEP = config('PERF_PROFILE_KEEP', default=50, cast=int)
+PERF_PROFILE_MAX_AGE = config('PERF_PROFILE_MAX_AGE', default=7 * 24 * 3600, cast=int)
+PERF_PROFILE_TOKEN_TTL = config('PERF_PROFILE_TOKEN_TTL', default=3600, cast=int)
+# Sondas (services/health_service.py): health/live/ no toca dependencias; health/ready/ lee el estado
+# que un hilo de fondo refresca cada HEALTH_REFRESH_INTERVAL s (BD, capa de canales, caché, Redis).
+# Una comprobación más antigua que HEALTH_MAX_STALENESS s cuenta como fallida
+HEALTH_MONITOR_AUTOSTART = config('HEALTH_MONITOR_AUTOSTART', default=True, cast=bool)
+HEALTH_REFRESH_INTERVAL = config('HEALTH_REFRESH_INTERVAL', default=5.0, cast=float)
+HEALTH_MAX_STALENESS = config('HEALTH_MAX_STALENESS', default=30.0, cast=float)
+HEALTH_CHECK_TIMEOUT = config('HEALTH_CHECK_TIMEOUT', default=2.0, cast=float)
+# SQLite de alta concurrencia (diagram_backend/sqlite_concurrente/) para instalaciones de un nodo sin
+# DATABASE_URL: WAL, synchronous=NORMAL, mmap, busy timeout y caché en cada conexión; los atomic usan
+# BEGIN IMMEDIATE y todas las escrituras del proceso pasan por una cola FIFO (sin "database is locked")
+SQLITE_CONCURRENT = config('SQLITE_CONCURRENT', default=False, cast=bool)
+SQLITE_BUSY_TIMEOUT = config('SQLITE_BUSY_TIMEOUT', default=10.0, cast=float)
+SQLITE_MMAP_SIZE = config('SQLITE_MMAP_SIZE', default=256 * 1024 * 1024, cast=int)
+SQLITE_CACHE_KB = config('SQLITE_CACHE_KB', default=64 * 1024, cast=int)
+if SQLITE_CONCURRENT and DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+    DATABASES['default']['ENGINE'] = 'diagram_backend.sqlite_concurrente'
+    DATABASES['default']['OPTIONS'] = {
+        **DATABASES['default'].get('OPTIONS', {}),
+        'timeout': SQLITE_BUSY_TIMEOUT,
+        'transaction_mode': 'IMMEDIATE',
+        'init_command': (
+            'PRAGMA journal_mode=WAL;'
+            'PRAGMA synchronous=NORMAL;'
+            f'PRAGMA mmap_size={SQLITE_MMAP_SIZE};'
+            f'PRAGMA busy_timeout={int(SQLITE_BUSY_TIMEOUT * 1000)};'
+            f'PRAGMA cache_size=-{SQLITE_CACHE_KB};'
+            'PRAGMA temp_store=MEMORY'
+        ),
+    }
+# Compresión de respuestas de la API (diagram_backend/compresion.py): gzip/brotli según Accept-Encoding
+# desde COMPRESSION_MIN_BYTES; los cuerpos desde COMPRESSION_CACHE_MIN_BYTES se guardan ya comprimidos
+# (LRU de COMPRESSION_CACHE_BYTES por proceso) y se sirven sin volver a comprimir
+COMPRESSION_ENABLED = config('COMPRESSION_ENABLED', default=True, cast=bool)
+COMPRESSION_MIN_BYTES = config('COMPRESSION_MIN_BYTES', default=1024, cast=int)
+COMPRESSION_GZIP_LEVEL = config('COMPRESSION_GZIP_LEVEL', default=6, cast=int)
+COMPRESSION_BROTLI_QUALITY = config('COMPRESSION_BROTLI_QUALITY', default=5, cast=int)
+COMPRESSION_CACHE_MIN_BYTES = config('COMPRESSION_CACHE_MIN_BYTES', default=64 * 1024, cast=int)
+COMPRESSION_CACHE_BYTES = config('COMPRESSION_CACHE_BYTES', default=32 * 1024 * 1024, cast=int)
+# Almacenamiento de atributos de clase: 'rows' (una fila por atributo en class_attributes) o 'inline'
+# (lista compacta en la columna JSON class_entities.attributes_inline, sin JOIN ni prefetch al leer).
+# Decide el formato de las clases nuevas y las consultas de lectura; las existentes se convierten con
+# `manage.py migrate_attribute_storage --to inline|rows` (cada clase conserva el suyo hasta entonces).
+# La búsqueda de atributos en línea usa su propio índice (FTS5 search_attributes_inline en SQLite, GIN
+# sobre los nombres en PostgreSQL); los términos de menos de 3 caracteres recorren el JSON sin índice
+CLASS_ATTRIBUTE_STORAGE = config('CLASS_ATTRIBUTE_STORAGE', default='rows')
@@ -0,0 +1,8 @@
+"""
+Backend SQLite para despliegues de un solo nodo con muchas peticiones concurrentes.
+
+Se activa con SQLITE_CONCURRENT (ver settings.py): ENGINE pasa a
+``diagram_backend.sqlite_concurrente`` y cada conexión nueva aplica WAL,
+``synchronous=NORMAL``, ``mmap_size``, ``busy_timeout`` y ``cache_size``.
+Las escrituras del proceso pasan por una cola única (ver base.py).
+"""
@@ -0,0 +1,141 @@
+"""
+DatabaseWrapper de SQLite con una cola de escritores por proceso.
+
+SQLite admite un solo escritor a la vez. Con WAL los lectores no esperan a nadie,
+pero dos escritores que compiten acaban en "database is locked": una transacción
+diferida que leyó y luego quiere escribir no puede esperar al busy_timeout si otro
+escritor confirmó entre medias. Aquí:
+
+- los bloques ``atomic`` empiezan con ``BEGIN IMMEDIATE`` (OPTIONS transaction_mode)
+  y solo después de obtener turno en la cola del proceso;
+- las escrituras sueltas en autocommit (``save()`` sin herencia, ``update()``...)
+  toman turno solo durante la sentencia;
+- las lecturas fuera de transacción no pasan por la cola.
+
+La cola es FIFO: los escritores entran por orden de llegada, así una ráfaga de
+autoguardados no deja sin turno a nadie. Entre procesos (serve_asgi con varios
+workers) sigue mandando el busy_timeout de SQLite, que ya no se ve desbordado por
+los hilos de cada proceso.
+"""
+import threading
+import time
+from collections import deque
+from typing import Any, Dict
+
+from django.db.backends.sqlite3 import base
+from django.db.utils import OperationalError
+
+# Primeras palabras de las sentencias que escriben
+ESCRITURAS = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE', 'CREATE', 'DROP', 'ALTER')
+
+
+class ColaEscritura:
+    """Turno de escritura FIFO: el que lo suelta se lo cede directamente al primero que espera"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._espera: deque = deque()
+        self._ocupada = False
+        self._desde = 0.0
+        self.estadisticas: Dict[str, Any] = {
+            'acquired': 0, 'waited': 0, 'timeouts': 0, 'wait_ms_total': 0.0, 'wait_ms_max': 0.0,
+            'held_ms_max': 0.0,
+        }
+
+    def adquirir(self, timeout: float):
+        with self._lock:
+            if not self._ocupada and not self._espera:
+                self._tomar()
+                return
+            turno = threading.Event()
+            self._espera.append(turno)
+        t0 = time.perf_counter()
+        if not turno.wait(timeout):
+            with self._lock:
+                if not turno.is_set():
+                    self._espera.remove(turno)
+                    self.estadisticas['timeouts'] += 1
+                    raise OperationalError(f'database is locked (cola de escritura: {timeout}s sin turno)')
+        # liberar() ya nos cedió el turno
+        espera_ms = (time.perf_counter() - t0) * 1000
+        with self._lock:
+            self.estadisticas['waited'] += 1
+            self.estadisticas['wait_ms_total'] += espera_ms
+            self.estadisticas['wait_ms_max'] = max(self.estadisticas['wait_ms_max'], espera_ms)
+
+    def _tomar(self):
+        self._ocupada = True
+        self._desde = time.perf_counter()
+        self.estadisticas['acquired'] += 1
+
+    def liberar(self):
+        with self._lock:
+            retenido_ms = (time.perf_counter() - self._desde) * 1000
+            self.estadisticas['held_ms_max'] = max(self.estadisticas['held_ms_max'], retenido_ms)
+            self._ocupada = False
+            if self._espera:
+                # Nadie puede colarse entre medias: el turno pasa ocupado al siguiente
+                self._tomar()
+                self._espera.popleft().set()
+
+    def estado(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self.estadisticas, 'waiting': len(self._espera), 'busy': self._ocupada}
+
+
+# Una cola por fichero de base de datos y proceso
+_colas: Dict[str, ColaEscritura] = {}
+_lock_colas = threading.Lock()
+
+
+def cola_para(nombre: str) -> ColaEscritura:
+    with _lock_colas:
+        cola = _colas.get(nombre)
+        if cola is None:
+            cola = _colas[nombre] = ColaEscritura()
+        return cola
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cola_escritura = cola_para(str(self.settings_dict['NAME']))
+        self.espera_maxima = float(self.settings_dict.get('OPTIONS', {}).get('timeout', 5.0))
+        self._con_turno = False
+        # Primero de la lista: envuelve a los execute_wrapper que se añadan después (trazas, perfiles)
+        self.execute_wrappers.insert(0, self._escritura_suelta)
+
+    def _escritura_suelta(self, execute, sql, params, many, context):
+        if self.in_atomic_block or self._con_turno or not sql.lstrip()[:7].upper().startswith(ESCRITURAS):
+            return execute(sql, params, many, context)
+        self.cola_escritura.adquirir(self.espera_maxima)
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.cola_escritura.liberar()
+
+    def _start_transaction_under_autocommit(self):
+        self.cola_escritura.adquirir(self.espera_maxima)
+        self._con_turno = True
+        try:
+            super()._start_transaction_under_autocommit()
+        except BaseException:
+            self._soltar_turno()
+            raise
+
+    def _set_autocommit(self, autocommit):
+        super()._set_autocommit(autocommit)
+        if autocommit:
+            # Fin de la transacción (commit o rollback): pasa el turno antes de los on_commit
+            self._soltar_turno()
+
+    def _close(self):
+        try:
+            super()._close()
+        finally:
+            self._soltar_turno()
+
+    def _soltar_turno(self):
+        if self._con_turno:
+            self._con_turno = False
+            self.cola_escritura.liberar()
@@ -0,0 +1,269 @@
+"""
+Trazas ligeras por tramos (spans) entre vistas, servicios, repositorios y el consumidor WebSocket.
+
+Una traza empieza en un punto de entrada (``iniciar_traza``: la petición HTTP en
+PerformanceMiddleware, cada mensaje en CollaborationConsumer) y solo se registra
+si sale en el muestreo (TRACING_SAMPLE_RATE) o se fuerza con la cabecera
+``X-Trace: 1``. Dentro de ella, ``traza()`` (context manager) y ``@trazado``
+(decorador) abren tramos hijos. El tramo actual viaja en un ContextVar, así que
+la jerarquía se conserva a través de sync_to_async / database_sync_to_async
+(copian el contexto al hilo) y entre corrutinas de la misma tarea.
+
+Sin traza activa un tramo cuesta una lectura del ContextVar; con el muestreo a 0
+tampoco se sortea nada en los puntos de entrada. Las trazas terminadas van a un
+búfer circular en memoria (lo lee ``health/traces/``) y, con TRACING_FILE, se
+añaden como JSON por línea a ese fichero.
+"""
+import functools
+import inspect
+import json
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Tramo abierto en el contexto actual (None: no hay traza muestreada)
+_actual: ContextVar[Optional['Tramo']] = ContextVar('tramo_actual', default=None)
+
+
+class _Config:
+    """Ajustes leídos de settings la primera vez que se usan (asgi.py importa antes de configurar Django)"""
+
+    def __init__(self):
+        self.tasa = float(getattr(settings, 'TRACING_SAMPLE_RATE', 0.0))
+        self.max_tramos = int(getattr(settings, 'TRACING_MAX_SPANS', 500))
+        self.fichero = getattr(settings, 'TRACING_FILE', '') or ''
+        self.trazas: deque = deque(maxlen=int(getattr(settings, 'TRACING_BUFFER', 200)))
+
+
+_config: Optional[_Config] = None
+_lock = threading.Lock()
+_salida = None
+ESTADISTICAS: Dict[str, int] = {'started': 0, 'forced': 0, 'recorded': 0, 'dropped_spans': 0, 'exported': 0}
+
+
+def configuracion() -> _Config:
+    global _config
+    if _config is None:
+        _config = _Config()
+    return _config
+
+
+def reconfigurar():
+    """Vuelve a leer settings (p. ej. tras cambiar TRACING_SAMPLE_RATE en caliente o en un comando)"""
+    global _config, _salida
+    with _lock:
+        if _salida is not None:
+            _salida.close()
+            _salida = None
+        _config = None
+
+
+class _Traza:
+    __slots__ = ('id', 'nombre', 'inicio', 'inicio_reloj', 'tramos', 'descartados', 'terminada')
+
+    def __init__(self, nombre: str):
+        self.id = uuid.uuid4().hex
+        self.nombre = nombre
+        self.inicio = time.perf_counter()
+        self.inicio_reloj = time.time()
+        self.tramos: List[Dict[str, Any]] = []
+        self.descartados = 0
+        # Las tareas creadas dentro de la traza heredan el contexto y pueden seguir vivas al cerrarla
+        self.terminada = False
+
+
+class Tramo:
+    """Tramo con nombre, atributos y duración; se abre y cierra como context manager"""
+
+    __slots__ = ('traza', 'id', 'padre', 'nombre', 'atributos', 'inicio', '_token')
+
+    def __init__(self, traza: _Traza, nombre: str, padre: Optional['Tramo'], atributos: Dict[str, Any]):
+        self.traza = traza
+        self.id = uuid.uuid4().hex[:16]
+        self.padre = padre
+        self.nombre = nombre
+        self.atributos = atributos
+
+    def anotar(self, **atributos):
+        """Añade atributos conocidos después de abrir el tramo (tamaños, resultados...)"""
+        self.atributos.update(atributos)
+
+    def __enter__(self) -> 'Tramo':
+        self.inicio = time.perf_counter()
+        self._token = _actual.set(self)
+        return self
+
+    def __exit__(self, tipo, error, tb):
+        fin = time.perf_counter()
+        _actual.reset(self._token)
+        traza = self.traza
+        registro = {
+            'span_id': self.id,
+            'parent_id': self.padre.id if self.padre is not None else None,
+            'name': self.nombre,
+            'start_ms': round((self.inicio - traza.inicio) * 1000, 3),
+            'duration_ms': round((fin - self.inicio) * 1000, 3),
+        }
+        if self.atributos:
+            registro['attributes'] = self.atributos
+        if error is not None:
+            registro['error'] = f'{tipo.__name__}: {error}'
+        # Los hijos pueden terminar en otro hilo (sync_to_async): append es atómico con el GIL
+        if len(traza.tramos) < configuracion().max_tramos:
+            traza.tramos.append(registro)
+        else:
+            traza.descartados += 1
+        if self.padre is None:
+            _terminar(traza, fin)
+        return False
+
+
+class _TramoNulo:
+    """Tramo que no mide nada: se devuelve sin traza activa o fuera del muestreo"""
+
+    __slots__ = ()
+    id = None
+
+    def anotar(self, **atributos):
+        pass
+
+    def __enter__(self) -> '_TramoNulo':
+        return self
+
+    def __exit__(self, tipo, error, tb):
+        return False
+
+
+TRAMO_NULO = _TramoNulo()
+
+
+def iniciar_traza(nombre: str, forzar: bool = False, **atributos):
+    """Tramo raíz de un punto de entrada: registra una traza nueva si sale en el muestreo o se fuerza"""
+    padre = _actual.get()
+    if padre is not None and not padre.traza.terminada:
+        # Entrada anidada (p. ej. una vista llamada desde otra traza): es un tramo más
+        return Tramo(padre.traza, nombre, padre, atributos)
+    tasa = (_config or configuracion()).tasa
+    if not forzar and (tasa <= 0.0 or (tasa < 1.0 and random.random() >= tasa)):
+        return TRAMO_NULO
+    ESTADISTICAS['started'] += 1
+    if forzar:
+        ESTADISTICAS['forced'] += 1
+    return Tramo(_Traza(nombre), nombre, None, atributos)
+
+
+def traza(nombre: str, **atributos):
+    """Tramo hijo del actual; sin traza muestreada en curso no mide nada"""
+    padre = _actual.get()
+    if padre is None or padre.traza.terminada:
+        return TRAMO_NULO
+    return Tramo(padre.traza, nombre, padre, atributos)
+
+
+def trazado(nombre: Optional[str] = None):
+    """Decorador: envuelve cada llamada (función o corrutina) en un tramo ``traza(nombre)``"""
+
+    def decorador(func: Callable):
+        etiqueta = nombre or func.__qualname__
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def envoltura_asincrona(*args, **kwargs):
+                padre = _actual.get()
+                if padre is None or padre.traza.terminada:
+                    return await func(*args, **kwargs)
+                with Tramo(padre.traza, etiqueta, padre, {}):
+                    return await func(*args, **kwargs)
+            return envoltura_asincrona
+
+        @functools.wraps(func)
+        def envoltura(*args, **kwargs):
+            padre = _actual.get()
+            if padre is None or padre.traza.terminada:
+                return func(*args, **kwargs)
+            with Tramo(padre.traza, etiqueta, padre, {}):
+                return func(*args, **kwargs)
+        return envoltura
+
+    return decorador
+
+
+def tramo_actual():
+    """Tramo abierto en este contexto (TRAMO_NULO si no hay traza muestreada)"""
+    tramo = _actual.get()
+    return tramo if tramo is not None and not tramo.traza.terminada else TRAMO_NULO
+
+
+def _terminar(traza: _Traza, fin: float):
+    traza.terminada = True
+    config = configuracion()
+    registro = {
+        'trace_id': traza.id,
+        'name': traza.nombre,
+        'timestamp': traza.inicio_reloj,
+        'duration_ms': round((fin - traza.inicio) * 1000, 3),
+        'spans': sorted(traza.tramos, key=lambda t: t['start_ms']),
+        'dropped_spans': traza.descartados,
+    }
+    config.trazas.append(registro)
+    ESTADISTICAS['recorded'] += 1
+    ESTADISTICAS['dropped_spans'] += traza.descartados
+    if config.fichero:
+        _exportar(config.fichero, registro)
+
+
+def _exportar(ruta: str, registro: Dict[str, Any]):
+    """Añade la traza al fichero JSONL (una línea por traza; se abre una vez por proceso)"""
+    global _salida
+    linea = json.dumps({**registro, 'pid': os.getpid()}, default=str) + '\n'
+    try:
+        with _lock:
+            if _salida is None:
+                _salida = open(ruta, 'a', encoding='utf-8')
+            _salida.write(linea)
+            _salida.flush()
+        ESTADISTICAS['exported'] += 1
+    except OSError as e:
+        logger.warning(f"[tracing] no se pudo escribir en {ruta}: {e}")
+
+
+def trazas_recientes(limite: int = 50, nombre: str = '', min_ms: float = 0.0) -> List[Dict[str, Any]]:
+    """Últimas trazas del búfer (más recientes primero), filtradas por prefijo de nombre y duración"""
+    resultado = []
+    for registro in reversed(list(configuracion().trazas)):
+        if nombre and not registro['name'].startswith(nombre):
+            continue
+        if registro['duration_ms'] < min_ms:
+            continue
+        resultado.append(registro)
+        if len(resultado) >= limite:
+            break
+    return resultado
+
+
+def estadisticas() -> Dict[str, Any]:
+    config = configuracion()
+    return {
+        **ESTADISTICAS,
+        'sample_rate': config.tasa,
+        'buffered': len(config.trazas),
+        'buffer_size': config.trazas.maxlen,
+        'max_spans': config.max_tramos,
+        'file': config.fichero or None,
+    }
+
+
+# Alias en inglés para compatibilidad
+start_trace = iniciar_traza
+span = traza
+traced = trazado
@@ -1,7 +1,16 @@
 #!/usr/bin/env bash
 set -euo pipefail
 
-echo "[startup] Using Daphne ASGI server"
 # Azure normalmente expone el puerto 8000 dentro del contenedor/app
 PORT_ENV=${PORT:-8000}
+# ASGI_WORKERS > 1: varios procesos Daphne en el mismo puerto (manage.py serve_asgi);
+# requiere Redis (CHANNELS_ENABLE_REDIS + REDIS_URL) para compartir las salas entre procesos.
+# Variable propia y no WEB_CONCURRENCY: muchos buildpacks la fijan solos y sin Redis el
+# arranque fallaría donde antes corría un solo proceso
+WORKERS=${ASGI_WORKERS:-1}
+if [ "$WORKERS" -gt 1 ]; then
+  echo "[startup] Using $WORKERS Daphne workers (serve_asgi)"
+  exec python manage.py serve_asgi --workers "$WORKERS" --bind 0.0.0.0 --port "$PORT_ENV"
+fi
+echo "[startup] Using Daphne ASGI server"
 exec daphne -b 0.0.0.0 -p "$PORT_ENV" diagram_backend.asgi:application